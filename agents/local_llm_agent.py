@@ -5,16 +5,54 @@ Ollama、llama.cpp、その他のローカルLLMとのインターフェース
 クラウドに依存しない自律的なコード修正を実現する。
 """
 
+import asyncio
 import requests
 import json
 import subprocess
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Set, Callable, Tuple, Awaitable, TypeVar
 from dataclasses import dataclass
 from enum import Enum
 import logging
 
+import aiohttp
+
+from tools.llm_response_cache import LLMResponseCache, get_llm_response_cache
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+# 修正プロンプトの固定プレフィックス（KVキャッシュ再利用のため毎回同一にする）
+FIX_PROMPT_PREFIX = """You are an expert code debugger. Fix the error described at the end of this prompt.
+
+**Instructions:**
+1. Analyze the error and identify the root cause
+2. Provide the complete fixed code
+3. Explain what was wrong and how you fixed it
+4. Rate your confidence in the fix (0.0-1.0)
+
+**Response Format (JSON):**
+```json
+{
+  "analysis": "Root cause analysis",
+  "fixed_code": "Complete fixed code here",
+  "explanation": "What was changed and why",
+  "confidence": 0.8,
+  "changes": [
+    {"line": 10, "old": "old code", "new": "new code", "reason": "why changed"}
+  ]
+}
+```
+
+Provide only the JSON response, no additional text.
+"""
+
+
+class LLMRequestCancelled(Exception):
+    """cancel_pending()/close() によってLLMリクエストがキャンセルされた"""
+
 
 class LocalLLMProvider(Enum):
     """ローカルLLMプロバイダー"""
@@ -34,6 +72,160 @@ class LocalLLMConfig:
     temperature: float = 0.7
     max_tokens: int = 4000
     context_window: int = 8192
+    # HTTP接続プール設定
+    connect_timeout: float = 5.0
+    max_connections: int = 20
+    max_connections_per_host: int = 4
+    keepalive_timeout: float = 30.0
+    # ストリーミング設定
+    stream: bool = False
+    stream_early_stop: bool = True
+    # プロンプトキャッシュ／モデル常駐設定
+    prompt_cache: bool = True
+    keep_alive: str = "30m"  # Ollama: モデルをメモリに保持する時間
+    llama_cpp_slot: Optional[int] = None  # llama.cpp: 固定するスロットID
+
+
+class StreamCompletionDetector:
+    """
+    ストリーミング応答の早期完了検出器
+    
+    トークンを逐次受け取り、修正結果として使える応答が揃った時点で完了と判定する。
+    - JSON: 閉じたオブジェクトが json.loads で読めて "fixed_code" を含む場合
+    - コード: 閉じた python のコードブロック
+    それ以外（説明文中の {...} や他言語のコードブロック）では止めずに読み続ける。
+    JSON文字列内やコードブロック内の括弧・バッククォートは無視する。
+    """
+    
+    CODE_FENCE_LANGS = ("python", "py")
+    
+    def __init__(self):
+        self.buffer = ""
+        self.kind: Optional[str] = None  # "json" | "code"
+        self._pos = 0
+        self._mode = "text"  # text | fence_header | fence | json
+        self._ticks = 0
+        self._fence_lang = ""
+        self._fence_body_started = False
+        self._json_start = 0
+        self._json_parent = "text"  # JSONを読み終えた（不採用だった）後に戻るモード
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._end = 0
+    
+    @property
+    def done(self) -> bool:
+        return self.kind is not None
+    
+    def feed(self, chunk: str) -> bool:
+        """
+        チャンクを追加して走査
+        
+        Returns:
+            完了を検出したかどうか
+        """
+        if self.done:
+            return True
+        
+        self.buffer += chunk
+        
+        while self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            i = self._pos
+            self._pos += 1
+            
+            if self._mode == "json":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch == "{":
+                    self._depth += 1
+                elif ch == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        if self._is_fix_json(self.buffer[self._json_start:i + 1]):
+                            self.kind = "json"
+                            self._end = i + 1
+                            return True
+                        self._mode = self._json_parent
+            
+            elif self._mode == "fence_header":
+                if ch == "\n":
+                    self._mode = "fence"
+                    self._fence_body_started = False
+                else:
+                    self._fence_lang += ch
+            
+            elif self._mode == "fence":
+                if ch == "`":
+                    self._ticks += 1
+                    if self._ticks == 3:
+                        self._ticks = 0
+                        if self._fence_lang.strip().lower() in self.CODE_FENCE_LANGS:
+                            self.kind = "code"
+                            self._end = i + 1
+                            return True
+                        self._mode = "text"
+                    continue
+                self._ticks = 0
+                
+                if not self._fence_body_started and not ch.isspace():
+                    self._fence_body_started = True
+                    if ch == "{" and self._fence_lang.strip().lower() in ("json", ""):
+                        self._start_json(i)
+            
+            else:  # text
+                if ch == "`":
+                    self._ticks += 1
+                    continue
+                if self._ticks >= 3:
+                    self._mode = "fence_header"
+                    self._fence_lang = ""
+                    self._ticks = 0
+                    # 現在の文字をヘッダーとして再処理
+                    self._pos = i
+                    continue
+                self._ticks = 0
+                
+                if ch == "{":
+                    self._start_json(i)
+        
+        return False
+    
+    def _start_json(self, index: int):
+        self._json_parent = self._mode
+        self._mode = "json"
+        self._json_start = index
+        self._depth = 1
+        self._in_string = False
+        self._escape = False
+    
+    @staticmethod
+    def _is_fix_json(text: str) -> bool:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and "fixed_code" in data
+    
+    def result(self) -> str:
+        """
+        パーサー（_parse_fix_response）向けのテキストを返す
+        
+        JSONはフェンスで包み、既存の ```json パターンで確実に抽出できるようにする。
+        """
+        if self.kind == "json":
+            return f"```json\n{self.buffer[self._json_start:self._end]}\n```"
+        if self.kind == "code":
+            return self.buffer[:self._end]
+        return self.buffer
 
 
 class LocalLLMAgent:
@@ -48,10 +240,15 @@ class LocalLLMAgent:
     5. エラーハンドリングとフォールバック
     """
     
-    def __init__(self, config: Optional[LocalLLMConfig] = None):
+    def __init__(self,
+                 config: Optional[LocalLLMConfig] = None,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 response_cache: Optional[LLMResponseCache] = None):
         """
         Args:
             config: ローカルLLM設定
+            progress_callback: ストリーミング進捗の通知先（ダッシュボード等）
+            response_cache: LLM応答キャッシュ（省略時はプロセス共有キャッシュ）
         """
         self.config = config or LocalLLMConfig(
             provider=LocalLLMProvider.OLLAMA,
@@ -59,6 +256,18 @@ class LocalLLMAgent:
             endpoint="http://localhost:11434"
         )
         
+        # 共有HTTPセッション（遅延生成、イベントループごとに1つ）
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Set[asyncio.Task] = set()
+        
+        # ストリーミング進捗（ダッシュボードからポーリング可能）
+        self.progress_callback = progress_callback
+        self.stream_progress: Dict[str, Any] = {}
+        
+        # 同一プロンプトの再問い合わせを省略する応答キャッシュ
+        self.response_cache = response_cache or get_llm_response_cache()
+        
         # 接続確認
         self.is_available = self._check_availability()
         
@@ -95,6 +304,134 @@ class LocalLLMAgent:
             logger.debug(f"Availability check failed: {e}")
             return False
     
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """キープアライブ付きの共有HTTPセッションを取得"""
+        loop = asyncio.get_running_loop()
+        
+        if (self._session is None or self._session.closed
+                or self._session_loop is not loop):
+            connector = aiohttp.TCPConnector(
+                limit=self.config.max_connections,
+                limit_per_host=self.config.max_connections_per_host,
+                keepalive_timeout=self.config.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=self.config.timeout,
+                    connect=self.config.connect_timeout
+                )
+            )
+            self._session_loop = loop
+        
+        return self._session
+    
+    async def _request_json(self,
+                            method: str,
+                            path: str,
+                            payload: Optional[Dict[str, Any]] = None,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        共有セッションでJSONリクエストを送信
+        
+        Args:
+            method: HTTPメソッド
+            path: エンドポイントからの相対パス
+            payload: リクエストボディ
+            timeout: このリクエストのみのタイムアウト（秒）
+        
+        Returns:
+            応答JSON
+        """
+        return await self._run_request(
+            self._send_json(method, path, payload, timeout)
+        )
+    
+    async def _send_json(self,
+                         method: str,
+                         path: str,
+                         payload: Optional[Dict[str, Any]],
+                         timeout: Optional[float]) -> Dict[str, Any]:
+        """_request_json の本体（子タスク内で実行される）"""
+        session = await self._get_session()
+        request_timeout = None
+        if timeout is not None:
+            request_timeout = aiohttp.ClientTimeout(
+                total=timeout,
+                connect=self.config.connect_timeout
+            )
+        
+        async with session.request(
+            method,
+            f"{self.config.endpoint}{path}",
+            json=payload,
+            timeout=request_timeout
+        ) as response:
+            if response.status != 200:
+                text = await response.text()
+                raise Exception(f"HTTP {response.status}: {text}")
+            return await response.json(content_type=None)
+    
+    async def _run_request(self, coro: Awaitable[T]) -> T:
+        """
+        LLMリクエストを専用の子タスクで実行する
+        
+        cancel_pending() がキャンセルするのはこの子タスクだけで、
+        呼び出し元のタスク（ワークフロー全体）には影響しない。
+        
+        Raises:
+            LLMRequestCancelled: cancel_pending()/close() でキャンセルされた場合
+        """
+        task = asyncio.ensure_future(coro)
+        self._inflight.add(task)
+        
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # 呼び出し元自身がキャンセルされた場合はそのまま伝播させる
+            caller = asyncio.current_task()
+            if caller is not None and caller.cancelling():
+                raise
+            raise LLMRequestCancelled(
+                f"{self.config.provider.value} request was cancelled"
+            ) from None
+        finally:
+            self._inflight.discard(task)
+    
+    def cancel_pending(self) -> int:
+        """
+        実行中のLLMリクエストをキャンセル
+        
+        待機中の呼び出し元には LLMRequestCancelled が送出される。
+        
+        Returns:
+            キャンセルしたリクエスト数
+        """
+        cancelled = 0
+        for task in list(self._inflight):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        return cancelled
+    
+    async def close(self):
+        """実行中のリクエストをキャンセルし、共有HTTPセッションを閉じる"""
+        loop = asyncio.get_running_loop()
+        pending = [task for task in self._inflight if task.get_loop() is loop]
+        self.cancel_pending()
+        if pending:
+            await asyncio.wait(pending)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
     async def generate_fix(self, 
                           error_context: Dict[str, Any],
                           file_content: str,
@@ -109,6 +446,9 @@ class LocalLLMAgent:
         
         Returns:
             修正結果（fixed_code, explanation, confidence）
+        
+        Raises:
+            LLMRequestCancelled: cancel_pending()/close() でキャンセルされた場合
         """
         if not self.is_available:
             return {
@@ -134,6 +474,8 @@ class LocalLLMAgent:
                 "changes": parsed.get("changes", [])
             }
             
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Failed to generate fix: {e}")
             return {
@@ -151,8 +493,9 @@ class LocalLLMAgent:
         stack_trace = error_context.get("stack_trace", "")
         line_number = error_context.get("line_number")
         
-        prompt = f"""You are an expert code debugger. Fix the following error in the code.
-
+        # 固定の指示部を先頭に置き、可変部（エラー・コード）を後ろに並べる。
+        # これによりOllama/llama.cppのKVキャッシュで共通プレフィックスが再利用される。
+        prompt = f"""{FIX_PROMPT_PREFIX}
 **Error Information:**
 - Type: {error_type}
 - Message: {error_message}
@@ -167,31 +510,93 @@ class LocalLLMAgent:
 **Current Code:**
 ```python
 {file_content}
-```
-
-**Instructions:**
-1. Analyze the error and identify the root cause
-2. Provide the complete fixed code
-3. Explain what was wrong and how you fixed it
-4. Rate your confidence in the fix (0.0-1.0)
-
-**Response Format (JSON):**
-```json
-{{
-  "analysis": "Root cause analysis",
-  "fixed_code": "Complete fixed code here",
-  "explanation": "What was changed and why",
-  "confidence": 0.8,
-  "changes": [
-    {{"line": 10, "old": "old code", "new": "new code", "reason": "why changed"}}
-  ]
-}}
-```
-
-Provide only the JSON response, no additional text."""
+```"""
         
         return prompt
     
+    def _apply_cache_options(self, payload: Dict[str, Any]):
+        """プロバイダー別のKVキャッシュ／常駐オプションを付与"""
+        if not self.config.prompt_cache:
+            if self.config.provider == LocalLLMProvider.LLAMA_CPP:
+                payload["cache_prompt"] = False
+            return
+        
+        if self.config.provider == LocalLLMProvider.OLLAMA:
+            payload["keep_alive"] = self.config.keep_alive
+        elif self.config.provider == LocalLLMProvider.LLAMA_CPP:
+            payload["cache_prompt"] = True
+            if self.config.llama_cpp_slot is not None:
+                payload["id_slot"] = self.config.llama_cpp_slot
+    
+    async def warm_up(self) -> bool:
+        """
+        モデルをロードし、修正プロンプトの固定プレフィックスを事前評価する
+        
+        Returns:
+            成功したかどうか
+        """
+        if not self.is_available:
+            return False
+        
+        try:
+            if self.config.provider == LocalLLMProvider.OLLAMA:
+                payload = {
+                    "model": self.config.model_name,
+                    "prompt": FIX_PROMPT_PREFIX,
+                    "options": {
+                        "num_predict": 1,
+                        "num_ctx": self.config.context_window
+                    },
+                    "stream": False
+                }
+                self._apply_cache_options(payload)
+                await self._request_json("POST", "/api/generate", payload)
+            
+            elif self.config.provider == LocalLLMProvider.LLAMA_CPP:
+                payload = {
+                    "prompt": FIX_PROMPT_PREFIX,
+                    "n_predict": 0,
+                    "stream": False
+                }
+                self._apply_cache_options(payload)
+                await self._request_json("POST", "/completion", payload)
+            
+            else:
+                return False
+            
+            logger.info(f"Warmed up {self.config.provider.value} "
+                       f"(model={self.config.model_name})")
+            return True
+            
+        except LLMRequestCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}")
+            return False
+    
+    async def _query_llm_cached(self,
+                                prompt: str,
+                                bypass_cache: bool = False) -> Tuple[str, str, bool]:
+        """
+        応答キャッシュを経由してLLMに問い合わせ
+        
+        Returns:
+            (応答テキスト, キャッシュキー, キャッシュヒットかどうか)
+        """
+        provider = self.config.provider.value
+        key = self.response_cache.make_key(
+            provider, self.config.model_name, self.config.temperature, prompt
+        )
+        
+        if not bypass_cache:
+            cached = self.response_cache.get(
+                provider, self.config.model_name, self.config.temperature, prompt
+            )
+            if cached is not None:
+                return cached, key, True
+        
+        return await self._query_llm(prompt), key, False
+    
     async def _query_llm(self, prompt: str) -> str:
         """LLMに問い合わせ"""
         if self.config.provider == LocalLLMProvider.OLLAMA:
@@ -203,8 +608,6 @@ Provide only the JSON response, no additional text."""
     
     async def _query_ollama(self, prompt: str) -> str:
         """Ollamaに問い合わせ"""
-        url = f"{self.config.endpoint}/api/generate"
-        
         payload = {
             "model": self.config.model_name,
             "prompt": prompt,
@@ -213,56 +616,141 @@ Provide only the JSON response, no additional text."""
                 "num_predict": self.config.max_tokens,
                 "num_ctx": self.config.context_window
             },
-            "stream": False
+            "stream": self.config.stream
         }
+        self._apply_cache_options(payload)
         
         try:
-            response = requests.post(
-                url,
-                json=payload,
-                timeout=self.config.timeout
-            )
+            if self.config.stream:
+                return await self._stream_generation("/api/generate", payload)
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "")
-            else:
-                raise Exception(f"Ollama returned status {response.status_code}: {response.text}")
+            result = await self._request_json("POST", "/api/generate", payload)
+            return result.get("response", "")
                 
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             raise Exception(f"Ollama request timed out after {self.config.timeout}s")
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Ollama request failed: {e}")
     
     async def _query_llama_cpp(self, prompt: str) -> str:
         """llama.cppサーバーに問い合わせ"""
-        url = f"{self.config.endpoint}/completion"
-        
         payload = {
             "prompt": prompt,
             "temperature": self.config.temperature,
             "n_predict": self.config.max_tokens,
-            "stop": ["```\n\n", "###"]
+            "stop": ["```\n\n", "###"],
+            "stream": self.config.stream
         }
+        self._apply_cache_options(payload)
         
         try:
-            response = requests.post(
-                url,
-                json=payload,
-                timeout=self.config.timeout
-            )
+            if self.config.stream:
+                return await self._stream_generation("/completion", payload)
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("content", "")
-            else:
-                raise Exception(f"llama.cpp returned status {response.status_code}")
+            result = await self._request_json("POST", "/completion", payload)
+            return result.get("content", "")
                 
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             raise Exception(f"llama.cpp request timed out after {self.config.timeout}s")
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             raise Exception(f"llama.cpp request failed: {e}")
     
+    async def _stream_generation(self, path: str, payload: Dict[str, Any]) -> str:
+        """
+        ストリーミング生成を逐次処理
+        
+        OllamaのNDJSON（{"response": ..., "done": ...}）と
+        llama.cppのSSE（data: {"content": ..., "stop": ...}）の両方に対応する。
+        使用可能なJSON/コードブロックが揃った時点で接続を切り、生成を打ち切る。
+        """
+        return await self._run_request(self._consume_stream(path, payload))
+    
+    async def _consume_stream(self, path: str, payload: Dict[str, Any]) -> str:
+        """_stream_generation の本体（子タスク内で実行される）"""
+        session = await self._get_session()
+        detector = StreamCompletionDetector()
+        started = time.time()
+        chunks = 0
+        early_stop = False
+        
+        async with session.post(
+            f"{self.config.endpoint}{path}",
+            json=payload
+        ) as response:
+            if response.status != 200:
+                text = await response.text()
+                raise Exception(f"HTTP {response.status}: {text}")
+            
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                if line.startswith("data:"):
+                    line = line[5:].strip()
+                    if line == "[DONE]":
+                        break
+                
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                
+                if data.get("error"):
+                    raise Exception(data["error"])
+                
+                token = data.get("response", data.get("content", ""))
+                chunks += 1
+                detector.feed(token)
+                
+                finished = bool(data.get("done") or data.get("stop"))
+                self._report_progress(
+                    started, chunks, len(detector.buffer), finished
+                )
+                
+                if finished:
+                    break
+                
+                if self.config.stream_early_stop and detector.done:
+                    # 接続を閉じるとサーバー側の生成も中断される
+                    early_stop = True
+                    response.close()
+                    break
+        
+        self._report_progress(
+            started, chunks, len(detector.buffer), True, early_stop=early_stop
+        )
+        
+        if detector.done:
+            return detector.result()
+        return detector.buffer
+    
+    def _report_progress(self,
+                         started: float,
+                         chunks: int,
+                         chars: int,
+                         done: bool,
+                         early_stop: bool = False):
+        """ストリーミング進捗を更新して通知"""
+        self.stream_progress = {
+            "provider": self.config.provider.value,
+            "model": self.config.model_name,
+            "chunks": chunks,
+            "chars": chars,
+            "elapsed": time.time() - started,
+            "done": done,
+            "early_stop": early_stop
+        }
+        
+        if self.progress_callback:
+            try:
+                self.progress_callback(self.stream_progress)
+            except Exception as e:
+                logger.debug(f"Progress callback failed: {e}")
+    
     def _parse_fix_response(self, response: str) -> Dict[str, Any]:
         """LLM応答を解析"""
         try:
@@ -323,13 +811,17 @@ Provide only the JSON response, no additional text."""
         
         return [m.strip() for m in matches if m.strip()]
     
-    def generate_code_review(self, code: str, context: str = "") -> Dict[str, Any]:
+    async def generate_code_review(self,
+                                   code: str,
+                                   context: str = "",
+                                   bypass_cache: bool = False) -> Dict[str, Any]:
         """
         コードレビューを生成
         
         Args:
             code: レビュー対象のコード
             context: コンテキスト情報
+            bypass_cache: 応答キャッシュを使わずに問い合わせる
         
         Returns:
             レビュー結果
@@ -365,33 +857,30 @@ Provide only the JSON response, no additional text."""
 ```"""
         
         try:
-            response = requests.post(
-                f"{self.config.endpoint}/api/generate",
-                json={
-                    "model": self.config.model_name,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=self.config.timeout
+            review_text, cache_key, cache_hit = await self._query_llm_cached(
+                prompt, bypass_cache
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                review_text = result.get("response", "")
-                
-                # 応答を解析
-                json_match = self._extract_json(review_text)
-                if json_match:
-                    return {
-                        "success": True,
-                        "review": json.loads(json_match)
-                    }
+            # 応答を解析
+            json_match = self._extract_json(review_text)
+            if json_match:
+                review = json.loads(json_match)
+                if not cache_hit:
+                    self._store_response(prompt, review_text, bypass_cache)
+                return {
+                    "success": True,
+                    "review": review,
+                    "cache_hit": cache_hit,
+                    "cache_key": cache_key
+                }
             
             return {
                 "success": False,
                 "error": "Failed to parse review"
             }
             
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Code review failed: {e}")
             return {
@@ -399,13 +888,17 @@ Provide only the JSON response, no additional text."""
                 "error": str(e)
             }
     
-    def suggest_refactoring(self, code: str, goal: str) -> Dict[str, Any]:
+    async def suggest_refactoring(self,
+                                  code: str,
+                                  goal: str,
+                                  bypass_cache: bool = False) -> Dict[str, Any]:
         """
         リファクタリングを提案
         
         Args:
             code: 対象コード
             goal: リファクタリングの目標
+            bypass_cache: 応答キャッシュを使わずに問い合わせる
         
         Returns:
             リファクタリング提案
@@ -437,32 +930,29 @@ Provide only the JSON response, no additional text."""
 ```"""
         
         try:
-            response = requests.post(
-                f"{self.config.endpoint}/api/generate",
-                json={
-                    "model": self.config.model_name,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=self.config.timeout
+            refactor_text, cache_key, cache_hit = await self._query_llm_cached(
+                prompt, bypass_cache
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                refactor_text = result.get("response", "")
-                
-                json_match = self._extract_json(refactor_text)
-                if json_match:
-                    return {
-                        "success": True,
-                        "refactoring": json.loads(json_match)
-                    }
+            json_match = self._extract_json(refactor_text)
+            if json_match:
+                refactoring = json.loads(json_match)
+                if not cache_hit:
+                    self._store_response(prompt, refactor_text, bypass_cache)
+                return {
+                    "success": True,
+                    "refactoring": refactoring,
+                    "cache_hit": cache_hit,
+                    "cache_key": cache_key
+                }
             
             return {
                 "success": False,
                 "error": "Failed to parse refactoring"
             }
             
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Refactoring failed: {e}")
             return {
@@ -470,30 +960,40 @@ Provide only the JSON response, no additional text."""
                 "error": str(e)
             }
     
-    def list_available_models(self) -> List[str]:
+    def _store_response(self, prompt: str, response: str, bypass_cache: bool = False):
+        """解析に成功した応答をキャッシュに保存"""
+        try:
+            self.response_cache.put(
+                self.config.provider.value,
+                self.config.model_name,
+                self.config.temperature,
+                prompt,
+                response,
+                bypass=bypass_cache
+            )
+        except Exception as e:
+            logger.debug(f"Failed to cache response: {e}")
+    
+    async def list_available_models(self) -> List[str]:
         """利用可能なモデル一覧を取得"""
         if not self.is_available:
             return []
         
         try:
             if self.config.provider == LocalLLMProvider.OLLAMA:
-                response = requests.get(
-                    f"{self.config.endpoint}/api/tags",
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    models = data.get("models", [])
-                    return [m.get("name") for m in models]
+                data = await self._request_json("GET", "/api/tags", timeout=5)
+                models = data.get("models", [])
+                return [m.get("name") for m in models]
             
             return []
             
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Failed to list models: {e}")
             return []
     
-    def pull_model(self, model_name: str) -> bool:
+    async def pull_model(self, model_name: str) -> bool:
         """
         モデルをダウンロード（Ollama）
         
@@ -510,16 +1010,20 @@ Provide only the JSON response, no additional text."""
         try:
             logger.info(f"Pulling model: {model_name}")
             
-            response = requests.post(
+            session = await self._get_session()
+            
+            async with session.post(
                 f"{self.config.endpoint}/api/pull",
                 json={"name": model_name},
-                stream=True,
-                timeout=600  # 10分
-            )
-            
-            if response.status_code == 200:
+                timeout=aiohttp.ClientTimeout(total=600)  # 10分
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Pull failed with status {response.status}")
+                    return False
+                
                 # ストリーミング応答を処理
-                for line in response.iter_lines():
+                async for line in response.content:
+                    line = line.strip()
                     if line:
                         data = json.loads(line)
                         status = data.get("status")
@@ -530,37 +1034,33 @@ Provide only the JSON response, no additional text."""
                         if data.get("error"):
                             logger.error(f"Pull error: {data['error']}")
                             return False
-                
-                logger.info(f"Successfully pulled model: {model_name}")
-                return True
-            else:
-                logger.error(f"Pull failed with status {response.status_code}")
-                return False
+            
+            logger.info(f"Successfully pulled model: {model_name}")
+            return True
                 
         except Exception as e:
             logger.error(f"Failed to pull model: {e}")
             return False
     
-    def get_model_info(self) -> Dict[str, Any]:
+    async def get_model_info(self) -> Dict[str, Any]:
         """現在のモデル情報を取得"""
         if not self.is_available:
             return {"available": False}
         
         try:
             if self.config.provider == LocalLLMProvider.OLLAMA:
-                response = requests.post(
-                    f"{self.config.endpoint}/api/show",
-                    json={"name": self.config.model_name},
+                details = await self._request_json(
+                    "POST",
+                    "/api/show",
+                    {"name": self.config.model_name},
                     timeout=5
                 )
-                
-                if response.status_code == 200:
-                    return {
-                        "available": True,
-                        "provider": self.config.provider.value,
-                        "model": self.config.model_name,
-                        "details": response.json()
-                    }
+                return {
+                    "available": True,
+                    "provider": self.config.provider.value,
+                    "model": self.config.model_name,
+                    "details": details
+                }
             
             return {
                 "available": True,
@@ -568,6 +1068,8 @@ Provide only the JSON response, no additional text."""
                 "model": self.config.model_name
             }
             
+        except LLMRequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Failed to get model info: {e}")
             return {"available": False, "error": str(e)}
@@ -575,7 +1077,6 @@ Provide only the JSON response, no additional text."""
 
 # 使用例
 if __name__ == "__main__":
-    import asyncio
     logging.basicConfig(level=logging.INFO)
     
     # ローカルLLMエージェントを作成
@@ -593,17 +1094,6 @@ if __name__ == "__main__":
         print("\n   Or install and run Ollama from: https://ollama.ai")
         exit(1)
     
-    # 利用可能なモデル一覧
-    print("\n=== Available Models ===")
-    models = agent.list_available_models()
-    for model in models:
-        print(f"- {model}")
-    
-    # モデル情報
-    print("\n=== Model Info ===")
-    info = agent.get_model_info()
-    print(json.dumps(info, indent=2))
-    
     # サンプルエラーコンテキスト
     error_context = {
         "error_type": "NameError",
@@ -625,6 +1115,17 @@ def main():
     
     # 修正を生成
     async def test_fix():
+        # 利用可能なモデル一覧
+        print("\n=== Available Models ===")
+        models = await agent.list_available_models()
+        for model in models:
+            print(f"- {model}")
+        
+        # モデル情報
+        print("\n=== Model Info ===")
+        info = await agent.get_model_info()
+        print(json.dumps(info, indent=2))
+        
         print("\n=== Generating Fix ===")
         result = await agent.generate_fix(
             error_context=error_context,
@@ -638,5 +1139,7 @@ def main():
             print(f"\nFixed Code:\n{result['fixed_code']}")
         else:
             print(f"\n❌ Fix failed: {result['error']}")
+        
+        await agent.close()
     
     asyncio.run(test_fix())
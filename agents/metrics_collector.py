@@ -15,6 +15,14 @@ from collections import defaultdict, Counter
 from enum import Enum
 import logging
 
+from tools.resource_accounting import (
+    TaskResourceTracker,
+    TaskResourceUsage,
+    activate_tracker,
+    deactivate_tracker,
+    track_wait,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -85,6 +93,7 @@ class MetricsCollectorAgent:
     3. エージェント別パフォーマンス分析
     4. 日次/週次/月次レポート生成
     5. ダッシュボード用データ生成
+    6. タスク単位のリソース計測（ロール別・タスクタイプ別）
     """
     
     def __init__(self, storage_dir: str = ".metrics"):
@@ -116,6 +125,13 @@ class MetricsCollectorAgent:
         # タスク実行中のトラッキング
         self.active_tasks: Dict[str, datetime] = {}
         
+        # タスク単位のリソース計測
+        self._resource_trackers: Dict[str, Tuple[TaskResourceTracker, Any]] = {}
+        self.resource_stats: Dict[str, Dict[str, Dict[str, Any]]] = {
+            "role": defaultdict(self._new_resource_stats),
+            "task_type": defaultdict(self._new_resource_stats)
+        }
+        
         logger.info(f"MetricsCollectorAgent initialized (storage_dir={storage_dir})")
     
     def record_metric(self, 
@@ -143,11 +159,27 @@ class MetricsCollectorAgent:
         self.metrics.append(entry)
         logger.debug(f"Recorded metric: {name}={value} {tags}")
     
-    def start_task(self, task_id: str, agent_name: str):
-        """タスク開始を記録"""
+    def start_task(self,
+                  task_id: str,
+                  agent_name: str,
+                  task_type: Optional[str] = None,
+                  role: Optional[str] = None):
+        """
+        タスク開始を記録
+        
+        Args:
+            task_id: タスクID
+            agent_name: 実行エージェント名
+            task_type: タスクタイプ（content / acf / plugin など）
+            role: 担当ロール（省略時は agent_name）
+        """
         self.active_tasks[task_id] = datetime.now()
         self.agent_stats[agent_name]["tasks_processed"] += 1
         
+        # 以降このコンテキストでの待ち時間・CPU時間をこのタスクに帰属させる
+        tracker = TaskResourceTracker(task_id, role or agent_name, task_type or "unknown")
+        self._resource_trackers[task_id] = (tracker, activate_tracker(tracker))
+        
         self.record_metric(
             name="task_started",
             value=1,
@@ -185,6 +217,9 @@ class MetricsCollectorAgent:
         if error_type:
             self.error_stats[error_type] += 1
         
+        # リソース消費量を確定
+        usage = self._finish_resource_tracking(task_id)
+        
         # メトリクスを記録
         self.record_metric(
             name="task_duration",
@@ -208,8 +243,113 @@ class MetricsCollectorAgent:
             }
         )
         
+        if usage is not None:
+            self._record_resource_usage(usage, agent_name)
+        
         logger.debug(f"Task ended: {task_id} (success={success}, duration={duration:.2f}s)")
     
+    # ========================================
+    # リソース計測
+    # ========================================
+    
+    @staticmethod
+    def _new_resource_stats() -> Dict[str, Any]:
+        return {
+            "tasks": 0,
+            "wall_time": 0.0,
+            "cpu_time": 0.0,
+            "subprocess_cpu": 0.0,
+            "peak_rss_delta": 0,
+            "max_peak_rss_delta": 0,
+            "rss_delta": 0,
+            "overlapped_tasks": 0,
+            "waits": defaultdict(float)
+        }
+    
+    def track_wait(self, category: str):
+        """
+        待ち時間を計測するコンテキストマネージャ
+        
+        with collector.track_wait("llm"):
+            response = await client.complete(...)
+        """
+        return track_wait(category)
+    
+    def _finish_resource_tracking(self, task_id: str) -> Optional[TaskResourceUsage]:
+        entry = self._resource_trackers.pop(task_id, None)
+        if entry is None:
+            return None
+        tracker, token = entry
+        deactivate_tracker(token)
+        return tracker.finish()
+    
+    def _record_resource_usage(self, usage: TaskResourceUsage, agent_name: str):
+        """ロール別・タスクタイプ別に集計してメトリクスを記録"""
+        for group, key in (("role", usage.role), ("task_type", usage.task_type)):
+            stats = self.resource_stats[group][key]
+            stats["tasks"] += 1
+            stats["wall_time"] += usage.wall_time
+            stats["cpu_time"] += usage.cpu_time
+            stats["subprocess_cpu"] += usage.subprocess_cpu
+            stats["peak_rss_delta"] += usage.peak_rss_delta
+            stats["max_peak_rss_delta"] = max(stats["max_peak_rss_delta"], usage.peak_rss_delta)
+            stats["rss_delta"] += usage.rss_delta or 0
+            stats["overlapped_tasks"] += int(usage.overlapped)
+            for category, seconds in usage.waits.items():
+                stats["waits"][category] += seconds
+        
+        tags = {
+            "agent": agent_name,
+            "task_id": usage.task_id,
+            "role": usage.role,
+            "task_type": usage.task_type
+        }
+        self.record_metric("task_cpu_time", usage.cpu_time, MetricType.TIMER, tags)
+        self.record_metric("task_subprocess_cpu", usage.subprocess_cpu, MetricType.TIMER, tags)
+        self.record_metric("task_peak_rss_delta", usage.peak_rss_delta, MetricType.GAUGE, tags)
+        for category, seconds in usage.waits.items():
+            self.record_metric("task_wait_time", seconds, MetricType.TIMER,
+                               {**tags, "category": category})
+    
+    def get_resource_breakdown(self, group_by: str = "task_type") -> List[Dict[str, Any]]:
+        """
+        リソース消費量の内訳を取得
+        
+        Args:
+            group_by: "task_type" または "role"
+        
+        Returns:
+            CPU時間（自プロセス＋子プロセス）の多い順に並べた集計
+        """
+        if group_by not in self.resource_stats:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        
+        breakdown = []
+        for key, stats in self.resource_stats[group_by].items():
+            tasks = stats["tasks"] or 1
+            total_cpu = stats["cpu_time"] + stats["subprocess_cpu"]
+            waits = dict(stats["waits"])
+            breakdown.append({
+                group_by: key,
+                "tasks": stats["tasks"],
+                "total_cpu_time": round(total_cpu, 4),
+                "cpu_time": round(stats["cpu_time"], 4),
+                "subprocess_cpu": round(stats["subprocess_cpu"], 4),
+                "wall_time": round(stats["wall_time"], 4),
+                "avg_wall_time": round(stats["wall_time"] / tasks, 4),
+                "avg_cpu_time": round(total_cpu / tasks, 4),
+                "avg_peak_rss_delta": int(stats["peak_rss_delta"] / tasks),
+                "max_peak_rss_delta": stats["max_peak_rss_delta"],
+                "avg_rss_delta": int(stats["rss_delta"] / tasks),
+                "waits": {category: round(seconds, 4) for category, seconds in waits.items()},
+                "wait_ratio": round(sum(waits.values()) / stats["wall_time"], 4)
+                              if stats["wall_time"] > 0 else 0.0,
+                "overlapped_tasks": stats["overlapped_tasks"]
+            })
+        
+        breakdown.sort(key=lambda item: (item["total_cpu_time"], item["wall_time"]), reverse=True)
+        return breakdown
+    
     def record_fix_attempt(self,
                           fix_type: str,
                           success: bool,
@@ -463,6 +603,10 @@ class MetricsCollectorAgent:
                     for fix_type, stats in self.fix_stats.items()
                 }
             },
+            "resources": {
+                "by_task_type": self.get_resource_breakdown("task_type"),
+                "by_role": self.get_resource_breakdown("role")
+            },
             "active_tasks": len(self.active_tasks),
             "generated_at": now.isoformat()
         }
@@ -486,6 +630,10 @@ class MetricsCollectorAgent:
             "agent_stats": dict(self.agent_stats),
             "error_stats": dict(self.error_stats),
             "fix_stats": dict(self.fix_stats),
+            "resource_stats": {
+                group: {key: {**stats, "waits": dict(stats["waits"])} for key, stats in groups.items()}
+                for group, groups in self.resource_stats.items()
+            },
             "exported_at": datetime.now().isoformat()
         }
         
@@ -516,6 +664,15 @@ class MetricsCollectorAgent:
         self.agent_stats.update(data.get("agent_stats", {}))
         self.error_stats.update(data.get("error_stats", {}))
         self.fix_stats.update(data.get("fix_stats", {}))
+        for group, groups in data.get("resource_stats", {}).items():
+            if group not in self.resource_stats:
+                continue
+            for key, stats in groups.items():
+                self.resource_stats[group][key] = {
+                    **self._new_resource_stats(),
+                    **stats,
+                    "waits": defaultdict(float, stats.get("waits", {}))
+                }
         
         logger.info(f"Metrics imported from {filepath}")
     
@@ -585,12 +742,13 @@ if __name__ == "__main__":
     collector = MetricsCollectorAgent()
     
     # タスク実行をシミュレート
-    collector.start_task("task-1", "LocalFixAgent")
+    collector.start_task("task-1", "LocalFixAgent", task_type="content")
     import time
-    time.sleep(0.5)
+    with collector.track_wait("llm"):
+        time.sleep(0.5)
     collector.end_task("task-1", "LocalFixAgent", success=True)
     
-    collector.start_task("task-2", "CloudFixAgent")
+    collector.start_task("task-2", "CloudFixAgent", task_type="acf")
     time.sleep(1.0)
     collector.end_task("task-2", "CloudFixAgent", success=False, error_type="SyntaxError")
     
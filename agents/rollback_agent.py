@@ -6,19 +6,77 @@ RollbackAgent - 高度なロールバック管理エージェント
 """
 
 import os
+import sys
+import bisect
 import shutil
 import hashlib
 import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Set
+from typing import Dict, Any, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 import logging
 import subprocess
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# ハッシュ計算・コピー時の読み込み単位
+CHUNK_SIZE = 1024 * 1024
+
+# 記録時刻からこの範囲内に更新されたファイルは (size, mtime) が同じでも信用しない
+# （mtime の粒度が粗いファイルシステムでは、直後の同サイズの編集で mtime が変わらない）
+_RACY_WINDOW_NS = 2 * 10**9
+
+# Linux の FICLONE ioctl（Btrfs / XFS / OCFS2 などで copy-on-write 複製）
+_FICLONE = 0x40049409
+
+
+def hash_file(file_path) -> Tuple[str, int]:
+    """
+    ファイル全体をメモリに載せずにSHA-256を計算
+    
+    Returns:
+        (content_hash, file_size)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def reflink_file(src, dst) -> bool:
+    """
+    reflink（copy-on-write 複製）でファイルを複製
+    
+    ファイルシステムが対応していない場合は dst を残さず False を返す。
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+
 
 class RollbackScope(Enum):
     """ロールバックスコープ"""
@@ -37,15 +95,208 @@ class RollbackReason(Enum):
     DEPENDENCY_ISSUE = "dependency_issue"
 
 
+class BlobStore:
+    """
+    SHA-256をキーとするコンテンツアドレス型のブロブストア
+    
+    同一内容のファイルは1つのブロブを共有し、参照カウントが0になった時点で削除される。
+    """
+    
+    def __init__(self, root: Path, compress: bool = False, compress_level: int = 1):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.compress = compress
+        self.compress_level = compress_level
+        self.refcounts: Dict[str, int] = {}
+        
+        # reflink の可否（None: 未判定）。一度失敗したら以後は通常コピー
+        self.reflink_supported: Optional[bool] = None
+        self._tmp_dir = self.root / "tmp"
+        self._tmp_dir.mkdir(exist_ok=True)
+    
+    def _path(self, content_hash: str, compressed: bool) -> Path:
+        suffix = ".z" if compressed else ""
+        return self.root / content_hash[:2] / f"{content_hash[2:]}{suffix}"
+    
+    def locate(self, content_hash: str) -> Optional[Path]:
+        """ブロブの実ファイルパスを返す（圧縮・非圧縮どちらでも）"""
+        for compressed in (self.compress, not self.compress):
+            path = self._path(content_hash, compressed)
+            if path.exists():
+                return path
+        return None
+    
+    def has(self, content_hash: str) -> bool:
+        return self.locate(content_hash) is not None
+    
+    def put(self, data: bytes, content_hash: Optional[str] = None) -> str:
+        """データを保存してハッシュを返す（既存なら書き込まない）"""
+        content_hash = content_hash or hashlib.sha256(data).hexdigest()
+        
+        if not self.has(content_hash):
+            path = self._path(content_hash, self.compress)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            payload = zlib.compress(data, self.compress_level) if self.compress else data
+            
+            tmp_path = self._tmp_path()
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            self._commit_tmp(tmp_path, content_hash, self.compress)
+        
+        return content_hash
+    
+    def put_file(self, file_path) -> Tuple[str, int]:
+        """
+        ファイルをストリーミングで保存（スレッドセーフ）
+        
+        非圧縮ストアで reflink が使える場合は複製してから複製側をハッシュするため、
+        読み込みは1回で済み、複製中にファイルが変更されても内容とハッシュが食い違わない。
+        
+        Returns:
+            (content_hash, file_size)
+        """
+        if not self.compress and self.reflink_supported is not False:
+            tmp_path = self._tmp_path()
+            if self._reflink(file_path, tmp_path):
+                content_hash, size = hash_file(tmp_path)
+                self._commit_tmp(tmp_path, content_hash, False)
+                return content_hash, size
+        
+        # 小さいファイルは一度に読んだほうが速い
+        if os.path.getsize(file_path) <= CHUNK_SIZE:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            return self.put(data), len(data)
+        
+        # 既存ブロブと同一なら書き込まない
+        content_hash, size = hash_file(file_path)
+        if self.has(content_hash):
+            return content_hash, size
+        
+        # 読みながらハッシュし直して書き込む（途中で変更されても整合する）
+        tmp_path = self._tmp_path()
+        digest = hashlib.sha256()
+        size = 0
+        compressor = zlib.compressobj(self.compress_level) if self.compress else None
+        try:
+            with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    dst.write(compressor.compress(chunk) if compressor else chunk)
+                if compressor:
+                    dst.write(compressor.flush())
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        
+        content_hash = digest.hexdigest()
+        self._commit_tmp(tmp_path, content_hash, self.compress)
+        return content_hash, size
+    
+    def materialize(self, content_hash: str, dest) -> None:
+        """ブロブの内容を dest に書き出す（reflink → 通常コピー → 展開の順）"""
+        path = self.locate(content_hash)
+        if path is None:
+            raise FileNotFoundError(f"Blob not found: {content_hash}")
+        
+        if path.suffix != ".z":
+            if self.reflink_supported is not False and self._reflink(path, dest):
+                return
+            shutil.copyfile(path, dest)
+            return
+        
+        decompressor = zlib.decompressobj()
+        with open(path, 'rb') as src, open(dest, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(decompressor.decompress(chunk))
+            dst.write(decompressor.flush())
+    
+    def _reflink(self, src, dst) -> bool:
+        ok = reflink_file(src, dst)
+        if self.reflink_supported is None or not ok:
+            self.reflink_supported = ok
+        return ok
+    
+    def _tmp_path(self) -> Path:
+        return self._tmp_dir / f"{os.getpid()}_{threading.get_ident()}"
+    
+    def _commit_tmp(self, tmp_path: Path, content_hash: str, compressed: bool):
+        """一時ファイルをブロブとして確定（既に存在すれば破棄）"""
+        if self.has(content_hash):
+            tmp_path.unlink(missing_ok=True)
+            return
+        path = self._path(content_hash, compressed)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+    
+    def read(self, content_hash: str) -> bytes:
+        """ブロブを読み込む"""
+        path = self.locate(content_hash)
+        if path is None:
+            raise FileNotFoundError(f"Blob not found: {content_hash}")
+        
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        return zlib.decompress(data) if path.suffix == ".z" else data
+    
+    def incref(self, content_hash: str):
+        self.refcounts[content_hash] = self.refcounts.get(content_hash, 0) + 1
+    
+    def decref(self, content_hash: str) -> bool:
+        """
+        参照カウントを減らし、0になったブロブを削除
+        
+        Returns:
+            ブロブを削除したかどうか
+        """
+        count = self.refcounts.get(content_hash, 0) - 1
+        if count > 0:
+            self.refcounts[content_hash] = count
+            return False
+        
+        self.refcounts.pop(content_hash, None)
+        path = self.locate(content_hash)
+        if path is not None:
+            path.unlink()
+            return True
+        return False
+    
+    def disk_usage(self) -> int:
+        """ブロブの合計サイズ（バイト）"""
+        return sum(
+            p.stat().st_size for p in self.root.glob("*/*")
+            if p.is_file() and p.parent != self._tmp_dir
+        )
+
+
 @dataclass
 class FileSnapshot:
-    """ファイルスナップショット"""
+    """
+    ファイルスナップショット
+    
+    内容はブロブストアに置き、rollback等で必要になった時に読み込む。
+    """
     file_path: str
-    content: str
     content_hash: str
     timestamp: datetime
     backup_path: str
     metadata: Dict[str, Any] = field(default_factory=dict)
+    store: Optional[BlobStore] = field(default=None, repr=False, compare=False)
+    
+    def read_bytes(self) -> bytes:
+        """スナップショット時点の内容（バイト列）を取得"""
+        if self.store is not None and self.store.has(self.content_hash):
+            return self.store.read(self.content_hash)
+        # ブロブストア導入前の形式（スナップショットごとの丸ごとコピー）
+        with open(self.backup_path, 'rb') as f:
+            return f.read()
+    
+    @property
+    def content(self) -> str:
+        """スナップショット時点の内容（テキスト）"""
+        return self.read_bytes().decode('utf-8', errors='replace')
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -116,18 +367,40 @@ class RollbackAgent:
     def __init__(self, 
                  backup_dir: str = ".rollback_backup",
                  max_snapshots: int = 100,
-                 auto_rollback_enabled: bool = True):
+                 auto_rollback_enabled: bool = True,
+                 compress_backups: bool = False,
+                 max_workers: Optional[int] = None,
+                 journal_compact_threshold: int = 500):
         self.backup_dir = Path(backup_dir)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
         self.max_snapshots = max_snapshots
         self.auto_rollback_enabled = auto_rollback_enabled
         
+        # 内容をSHA-256で重複排除して保存するブロブストア
+        self.blob_store = BlobStore(self.backup_dir / "blobs", compress=compress_backups)
+        
+        # スナップショット・復元の並列数（I/O待ちが主なのでCPU数より多めにする）
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        
+        # スナップショット作成時に未変更ファイルの再読込を省くキャッシュ
+        # path -> (size, mtime_ns, hash, 記録時刻ns)。ロールバックでは使わない
+        self._stat_cache: Dict[str, Tuple[int, int, str, int]] = {}
+        
         # ロールバックポイントの管理
         self.rollback_points: Dict[str, RollbackPoint] = {}
         self.rollback_history: List[RollbackResult] = []
         
-        # メタデータファイル
+        # 時刻・タグのインデックス（(timestamp, id) の昇順リスト）
+        self._time_index: List[Tuple[datetime, str]] = []
+        self._tag_index: Dict[str, List[Tuple[datetime, str]]] = {}
+        
+        # メタデータは追記型のJSONLジャーナルに記録し、肥大化したら圧縮する
+        self.journal_file = self.backup_dir / "rollback_journal.jsonl"
+        self.journal_compact_threshold = journal_compact_threshold
+        self._journal_records = 0
+        
+        # 旧形式のメタデータファイル（読み込み時にジャーナルへ移行）
         self.metadata_file = self.backup_dir / "rollback_metadata.json"
         
         # 起動時にメタデータを読み込む
@@ -153,44 +426,11 @@ class RollbackAgent:
         snapshot_id = f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
         snapshots = []
         
-        for file_path in file_paths:
-            if not os.path.exists(file_path):
-                logger.warning(f"File not found: {file_path}")
-                continue
-            
-            try:
-                # ファイル内容を読み込む
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # ハッシュを計算
-                content_hash = hashlib.sha256(content.encode()).hexdigest()
-                
-                # バックアップファイルパスを生成
-                backup_path = self.backup_dir / f"{snapshot_id}_{Path(file_path).name}"
-                
-                # バックアップファイルに保存
-                with open(backup_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                # スナップショットを作成
-                snapshot = FileSnapshot(
-                    file_path=file_path,
-                    content=content,
-                    content_hash=content_hash,
-                    timestamp=datetime.now(),
-                    backup_path=str(backup_path),
-                    metadata={
-                        "file_size": len(content),
-                        "line_count": content.count('\n') + 1
-                    }
-                )
+        # ハッシュ計算とブロブ書き込みは並列に行い、参照カウントはここでまとめて更新する
+        for snapshot in self._map_parallel(self._snapshot_file, file_paths):
+            if snapshot is not None:
+                self.blob_store.incref(snapshot.content_hash)
                 snapshots.append(snapshot)
-                
-                logger.debug(f"Created snapshot for {file_path}")
-                
-            except Exception as e:
-                logger.error(f"Failed to create snapshot for {file_path}: {e}")
         
         # Git コミットハッシュを取得（可能なら）
         commit_hash = self._get_current_commit_hash()
@@ -206,8 +446,8 @@ class RollbackAgent:
         )
         
         # 保存
-        self.rollback_points[snapshot_id] = rollback_point
-        self._save_metadata()
+        self._add_point(rollback_point)
+        self._append_journal({"op": "add_point", "point": rollback_point.to_dict()})
         
         # 古いスナップショットを削除
         self._cleanup_old_snapshots()
@@ -216,6 +456,136 @@ class RollbackAgent:
         
         return snapshot_id
     
+    def _snapshot_file(self, file_path: str) -> Optional[FileSnapshot]:
+        """1ファイル分のスナップショットを作成（ワーカースレッドで実行）"""
+        if not os.path.exists(file_path):
+            logger.warning(f"File not found: {file_path}")
+            return None
+        
+        try:
+            # 内容をブロブストアに保存（同一内容なら参照のみ）
+            content_hash, file_size = self._store_file(file_path)
+            
+            snapshot = FileSnapshot(
+                file_path=file_path,
+                content_hash=content_hash,
+                timestamp=datetime.now(),
+                backup_path=str(self.blob_store.locate(content_hash)),
+                metadata={"file_size": file_size},
+                store=self.blob_store
+            )
+            logger.debug(f"Created snapshot for {file_path}")
+            return snapshot
+            
+        except Exception as e:
+            logger.error(f"Failed to create snapshot for {file_path}: {e}")
+            return None
+    
+    def _map_parallel(self, func, items: List[Any]) -> List[Any]:
+        """順序を保ったまま items に func を並列適用"""
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+    
+    def _store_file(self, file_path: str) -> Tuple[str, int]:
+        """
+        ファイルをブロブストアに保存
+        
+        サイズと更新時刻が前回と同じで、ブロブも残っていれば読み込みを省略する。
+        記録時刻の直前・直後に更新されたファイル（racy）は読み直す。
+        
+        Returns:
+            (content_hash, file_size)
+        """
+        stat = os.stat(file_path)
+        cached = self._stat_cache.get(file_path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns) \
+                and stat.st_mtime_ns < cached[3] - _RACY_WINDOW_NS \
+                and self.blob_store.has(cached[2]):
+            return cached[2], stat.st_size
+        
+        content_hash, file_size = self.blob_store.put_file(file_path)
+        self._remember_stat(file_path, stat, content_hash)
+        return content_hash, file_size
+    
+    def _remember_stat(self, file_path: str, stat: os.stat_result, content_hash: str):
+        self._stat_cache[file_path] = (stat.st_size, stat.st_mtime_ns, content_hash, time.time_ns())
+    
+    def _current_hash(self, file_path: str) -> str:
+        """
+        現在のファイル内容のハッシュ（ロールバック・影響分析用）
+        
+        (size, mtime) が同じでも内容が変わっている場合があるため、常に読んで計算する。
+        """
+        return hash_file(file_path)[0]
+    
+    def _restore_file(self, snapshot: FileSnapshot):
+        """
+        スナップショットの内容を一時ファイル経由でアトミックに書き戻す
+        
+        同じディレクトリに一時ファイルを作って fsync してから rename するため、
+        途中で失敗しても対象ファイルが中途半端な内容になることはない。
+        """
+        target = Path(snapshot.file_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.rollback{os.getpid()}_{threading.get_ident()}")
+        
+        try:
+            if self.blob_store.has(snapshot.content_hash):
+                self.blob_store.materialize(snapshot.content_hash, tmp_path)
+            else:
+                # ブロブストア導入前の形式
+                shutil.copyfile(snapshot.backup_path, tmp_path)
+            
+            if target.exists():
+                shutil.copymode(target, tmp_path)
+            
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        
+        self._remember_stat(snapshot.file_path, os.stat(target), snapshot.content_hash)
+    
+    def _rollback_file(self, snapshot: FileSnapshot, dry_run: bool) -> Optional[bool]:
+        """
+        1ファイル分の復元（ワーカースレッドで実行）
+        
+        Returns:
+            True: 復元済み（または復元対象）, False: 失敗, None: 対象外（ドライランで差分なし）
+        """
+        try:
+            if dry_run:
+                # ドライランモード: 影響分析のみ
+                if not os.path.exists(snapshot.file_path):
+                    logger.warning(f"[DRY RUN] File not found: {snapshot.file_path}")
+                    return False
+                if self._current_hash(snapshot.file_path) == snapshot.content_hash:
+                    return None
+                logger.debug(f"[DRY RUN] Would restore: {snapshot.file_path}")
+                return True
+            
+            if os.path.exists(snapshot.file_path):
+                # 既にスナップショットと同じ内容なら書き込み不要
+                if self._current_hash(snapshot.file_path) == snapshot.content_hash:
+                    return True
+                
+                # まず現在の状態をバックアップ
+                self._create_emergency_backup(snapshot.file_path)
+            
+            self._restore_file(snapshot)
+            logger.info(f"Restored: {snapshot.file_path}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to restore {snapshot.file_path}: {e}")
+            return False
+    
     def rollback(self, 
                 rollback_point_id: str,
                 reason: RollbackReason = RollbackReason.MANUAL_REQUEST,
@@ -248,39 +618,15 @@ class RollbackAgent:
         
         logger.info(f"Starting rollback to {rollback_point_id} (dry_run={dry_run})")
         
-        for snapshot in rollback_point.snapshots:
-            try:
-                if dry_run:
-                    # ドライランモード: 影響分析のみ
-                    if os.path.exists(snapshot.file_path):
-                        with open(snapshot.file_path, 'r', encoding='utf-8') as f:
-                            current_content = f.read()
-                        
-                        if current_content != snapshot.content:
-                            files_restored.append(snapshot.file_path)
-                            logger.debug(f"[DRY RUN] Would restore: {snapshot.file_path}")
-                    else:
-                        files_failed.append(snapshot.file_path)
-                        logger.warning(f"[DRY RUN] File not found: {snapshot.file_path}")
-                else:
-                    # 実際にファイルを復元
-                    # まず現在の状態をバックアップ
-                    if os.path.exists(snapshot.file_path):
-                        self._create_emergency_backup(snapshot.file_path)
-                    
-                    # 親ディレクトリを作成
-                    Path(snapshot.file_path).parent.mkdir(parents=True, exist_ok=True)
-                    
-                    # ファイルを復元
-                    with open(snapshot.file_path, 'w', encoding='utf-8') as f:
-                        f.write(snapshot.content)
-                    
-                    files_restored.append(snapshot.file_path)
-                    logger.info(f"Restored: {snapshot.file_path}")
-                    
-            except Exception as e:
+        outcomes = self._map_parallel(
+            lambda snapshot: self._rollback_file(snapshot, dry_run),
+            rollback_point.snapshots
+        )
+        for snapshot, outcome in zip(rollback_point.snapshots, outcomes):
+            if outcome is True:
+                files_restored.append(snapshot.file_path)
+            elif outcome is False:
                 files_failed.append(snapshot.file_path)
-                logger.error(f"Failed to restore {snapshot.file_path}: {e}")
         
         # 結果を作成
         result = RollbackResult(
@@ -296,7 +642,7 @@ class RollbackAgent:
         # 履歴に記録
         if not dry_run:
             self.rollback_history.append(result)
-            self._save_metadata()
+            self._append_journal({"op": "history", "result": result.to_dict()})
         
         logger.info(f"Rollback completed: {len(files_restored)} restored, {len(files_failed)} failed")
         
@@ -326,11 +672,14 @@ class RollbackAgent:
                 error_message="No rollback points available"
             )
         
-        # 最も近いロールバックポイントを見つける
-        closest_point = min(
-            self.rollback_points.values(),
-            key=lambda p: abs((p.timestamp - target_time).total_seconds())
+        # 最も近いロールバックポイントを二分探索で見つける
+        index = bisect.bisect_left(self._time_index, (target_time, ""))
+        candidates = self._time_index[max(0, index - 1):index + 1]
+        _, closest_id = min(
+            candidates,
+            key=lambda entry: abs((entry[0] - target_time).total_seconds())
         )
+        closest_point = self.rollback_points[closest_id]
         
         logger.info(f"Rolling back to closest point: {closest_point.id} "
                    f"(target={target_time}, actual={closest_point.timestamp})")
@@ -406,12 +755,10 @@ class RollbackAgent:
                 continue
             
             try:
-                with open(snapshot.file_path, 'r', encoding='utf-8') as f:
-                    current_content = f.read()
-                
-                if current_content != snapshot.content:
-                    current_lines = current_content.count('\n') + 1
-                    snapshot_lines = snapshot.content.count('\n') + 1
+                if self._current_hash(snapshot.file_path) != snapshot.content_hash:
+                    with open(snapshot.file_path, 'rb') as f:
+                        current_lines = f.read().count(b'\n') + 1
+                    snapshot_lines = snapshot.read_bytes().count(b'\n') + 1
                     
                     changes.append({
                         "file": snapshot.file_path,
@@ -492,17 +839,16 @@ class RollbackAgent:
         Returns:
             ロールバックポイントのリスト
         """
-        points = list(self.rollback_points.values())
-        
-        # タグでフィルタリング
+        # インデックスは時刻の昇順なので末尾から limit 件だけ取り出す
         if tags:
-            points = [p for p in points if any(tag in p.tags for tag in tags)]
-        
-        # 時刻でソート（新しい順）
-        points.sort(key=lambda p: p.timestamp, reverse=True)
+            entries = set()
+            for tag in tags:
+                entries.update(self._tag_index.get(tag, [])[-limit:])
+            entries = sorted(entries, reverse=True)[:limit]
+        else:
+            entries = self._time_index[::-1][:limit]
         
-        # 制限を適用
-        points = points[:limit]
+        points = [self.rollback_points[point_id] for _, point_id in entries]
         
         return [
             {
@@ -523,17 +869,20 @@ class RollbackAgent:
         
         rollback_point = self.rollback_points[rollback_point_id]
         
-        # バックアップファイルを削除
+        # ブロブの参照を外し、どこからも参照されなくなったものを削除
         for snapshot in rollback_point.snapshots:
             try:
-                if os.path.exists(snapshot.backup_path):
+                if self.blob_store.has(snapshot.content_hash):
+                    self.blob_store.decref(snapshot.content_hash)
+                elif os.path.exists(snapshot.backup_path):
+                    # ブロブストア導入前の形式
                     os.remove(snapshot.backup_path)
             except Exception as e:
                 logger.warning(f"Failed to delete backup file: {e}")
         
         # ロールバックポイントを削除
-        del self.rollback_points[rollback_point_id]
-        self._save_metadata()
+        self._remove_point(rollback_point_id)
+        self._append_journal({"op": "delete_point", "id": rollback_point_id})
         
         logger.info(f"Deleted rollback point: {rollback_point_id}")
         
@@ -557,7 +906,7 @@ class RollbackAgent:
     
     def _create_emergency_backup(self, file_path: str):
         """緊急バックアップを作成"""
-        emergency_backup = self.backup_dir / f"emergency_{Path(file_path).name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        emergency_backup = self.backup_dir / f"emergency_{Path(file_path).name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
         shutil.copy2(file_path, emergency_backup)
         logger.debug(f"Created emergency backup: {emergency_backup}")
     
@@ -566,71 +915,167 @@ class RollbackAgent:
         if len(self.rollback_points) <= self.max_snapshots:
             return
         
-        # 古い順にソート
-        sorted_points = sorted(
-            self.rollback_points.values(),
-            key=lambda p: p.timestamp
-        )
+        # 削除する数を計算（インデックスは古い順）
+        to_delete = len(self.rollback_points) - self.max_snapshots
         
-        # 削除する数を計算
-        to_delete = len(sorted_points) - self.max_snapshots
-        
-        for point in sorted_points[:to_delete]:
-            self.delete_rollback_point(point.id)
-        
-        logger.info(f"Cleaned up {to_delete} old snapshots")
-    
-    def _save_metadata(self):
-        """メタデータをファイルに保存"""
-        metadata = {
-            "rollback_points": {
-                point_id: point.to_dict()
-                for point_id, point in self.rollback_points.items()
-            },
-            "rollback_history": [
-                result.to_dict()
-                for result in self.rollback_history[-100:]  # 最新100件のみ
-            ]
-        }
+        # 参照カウントが0になったブロブだけが実際に削除される
+        for _, point_id in self._time_index[:to_delete]:
+            self.delete_rollback_point(point_id)
         
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        logger.info(f"Cleaned up {to_delete} old snapshots "
+                   f"(blobs={len(self.blob_store.refcounts)})")
+    
+    def _add_point(self, point: RollbackPoint):
+        """ロールバックポイントを登録してインデックスを更新"""
+        if point.id in self.rollback_points:
+            self._remove_point(point.id)
+        
+        self.rollback_points[point.id] = point
+        entry = (point.timestamp, point.id)
+        bisect.insort(self._time_index, entry)
+        for tag in set(point.tags):
+            bisect.insort(self._tag_index.setdefault(tag, []), entry)
+    
+    def _remove_point(self, point_id: str) -> Optional[RollbackPoint]:
+        """ロールバックポイントを登録解除してインデックスを更新"""
+        point = self.rollback_points.pop(point_id, None)
+        if point is None:
+            return None
+        
+        entry = (point.timestamp, point.id)
+        for index_list in [self._time_index] + [self._tag_index.get(t, []) for t in set(point.tags)]:
+            position = bisect.bisect_left(index_list, entry)
+            if position < len(index_list) and index_list[position] == entry:
+                del index_list[position]
+        for tag in set(point.tags):
+            if not self._tag_index.get(tag):
+                self._tag_index.pop(tag, None)
+        return point
+    
+    def _append_journal(self, record: Dict[str, Any]):
+        """ジャーナルに1レコード追記し、必要なら圧縮する"""
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_records += 1
+        
+        # 生きているレコード数の2倍を超えたら圧縮
+        live_records = len(self.rollback_points) + min(len(self.rollback_history), 100)
+        if self._journal_records > max(self.journal_compact_threshold, 2 * live_records):
+            self.compact_journal()
+    
+    def compact_journal(self):
+        """現在の状態だけを含むジャーナルに書き直す（一時ファイル経由で置き換え）"""
+        tmp_path = self.journal_file.with_name(self.journal_file.name + ".tmp")
+        records = 0
+        
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for _, point_id in self._time_index:
+                record = {"op": "add_point", "point": self.rollback_points[point_id].to_dict()}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                records += 1
+            for result in self.rollback_history[-100:]:  # 最新100件のみ
+                record = {"op": "history", "result": result.to_dict()}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                records += 1
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(tmp_path, self.journal_file)
+        self._journal_records = records
+        logger.debug(f"Compacted rollback journal ({records} records)")
+    
+    def _point_from_dict(self, point_data: Dict[str, Any]) -> RollbackPoint:
+        snapshots = [
+            FileSnapshot(
+                file_path=s["file_path"],
+                content_hash=s["content_hash"],
+                timestamp=datetime.fromisoformat(s["timestamp"]),
+                backup_path=s["backup_path"],
+                metadata=s.get("metadata", {}),
+                store=self.blob_store  # 内容は必要時にブロブから読み込む
+            )
+            for s in point_data["snapshots"]
+        ]
+        
+        return RollbackPoint(
+            id=point_data["id"],
+            timestamp=datetime.fromisoformat(point_data["timestamp"]),
+            snapshots=snapshots,
+            commit_hash=point_data.get("commit_hash"),
+            description=point_data.get("description", ""),
+            tags=point_data.get("tags", [])
+        )
+    
+    @staticmethod
+    def _result_from_dict(data: Dict[str, Any]) -> RollbackResult:
+        return RollbackResult(
+            success=data["success"],
+            rollback_point_id=data["rollback_point_id"],
+            files_restored=data.get("files_restored", []),
+            files_failed=data.get("files_failed", []),
+            reason=RollbackReason(data["reason"]),
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            error_message=data.get("error_message")
+        )
     
     def _load_metadata(self):
-        """メタデータをファイルから読み込む"""
-        if not self.metadata_file.exists():
+        """ジャーナル（または旧形式のメタデータ）を読み込む"""
+        if self.journal_file.exists():
+            self._replay_journal()
+        elif self.metadata_file.exists():
+            self._load_legacy_metadata()
+        else:
             return
         
+        # 参照カウントは生きているポイントから数え直す
+        for point in self.rollback_points.values():
+            for snapshot in point.snapshots:
+                self.blob_store.incref(snapshot.content_hash)
+        
+        logger.info(f"Loaded {len(self.rollback_points)} rollback points from metadata")
+    
+    def _replay_journal(self):
+        """ジャーナルを先頭から再生して状態を復元"""
+        broken = False
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                self._journal_records += 1
+                try:
+                    record = json.loads(line)
+                    op = record.get("op")
+                    if op == "add_point":
+                        self._add_point(self._point_from_dict(record["point"]))
+                    elif op == "delete_point":
+                        self._remove_point(record["id"])
+                    elif op == "history":
+                        self.rollback_history.append(self._result_from_dict(record["result"]))
+                except Exception as e:
+                    # 書き込み途中で停止した末尾行などは読み飛ばす
+                    logger.warning(f"Skipping broken journal record at line {line_number}: {e}")
+                    broken = True
+        
+        self.rollback_history = self.rollback_history[-100:]
+        
+        # 壊れた行の後ろに追記しないよう、正常な状態で書き直しておく
+        if broken:
+            self.compact_journal()
+    
+    def _load_legacy_metadata(self):
+        """旧形式の rollback_metadata.json を読み込み、ジャーナルへ移行"""
         try:
             with open(self.metadata_file, 'r', encoding='utf-8') as f:
                 metadata = json.load(f)
             
-            # ロールバックポイントを復元
-            for point_id, point_data in metadata.get("rollback_points", {}).items():
-                snapshots = [
-                    FileSnapshot(
-                        file_path=s["file_path"],
-                        content="",  # 内容はバックアップファイルから読み込む
-                        content_hash=s["content_hash"],
-                        timestamp=datetime.fromisoformat(s["timestamp"]),
-                        backup_path=s["backup_path"],
-                        metadata=s.get("metadata", {})
-                    )
-                    for s in point_data["snapshots"]
-                ]
-                
-                rollback_point = RollbackPoint(
-                    id=point_data["id"],
-                    timestamp=datetime.fromisoformat(point_data["timestamp"]),
-                    snapshots=snapshots,
-                    commit_hash=point_data.get("commit_hash"),
-                    description=point_data.get("description", ""),
-                    tags=point_data.get("tags", [])
-                )
-                
-                self.rollback_points[point_id] = rollback_point
+            for point_data in metadata.get("rollback_points", {}).values():
+                self._add_point(self._point_from_dict(point_data))
+            for result_data in metadata.get("rollback_history", []):
+                self.rollback_history.append(self._result_from_dict(result_data))
             
-            logger.info(f"Loaded {len(self.rollback_points)} rollback points from metadata")
+            self.compact_journal()
+            os.replace(self.metadata_file, self.metadata_file.with_suffix(".json.migrated"))
+            logger.info("Migrated rollback metadata to journal")
             
         except Exception as e:
             logger.error(f"Failed to load metadata: {e}")
@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 """Claude API 自動対話システム（カスタム指示対応）"""
 import os
-import anthropic
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 
+from tools.cloud_llm_client import get_cloud_llm_client
+
 load_dotenv()
 
 class AutoClaudeSystem:
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = get_cloud_llm_client()
+        self.api_key = os.getenv('ANTHROPIC_API_KEY')
         self.model = "claude-sonnet-4-20250514"
         self.log_file = Path('logs/claude_conversation.log')
         self.log_file.parent.mkdir(exist_ok=True)
@@ -33,13 +35,16 @@ class AutoClaudeSystem:
         preview = prompt[:200] + "..." if len(prompt) > 200 else prompt
         self.log(f"プロンプト: {preview}")
         
-        message = self.client.messages.create(
+        message = self.client.complete_sync(
+            provider="anthropic",
             model=self.model,
+            prompt=prompt,
             max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
+            temperature=1.0,
+            api_key=self.api_key
         )
         
-        response = message.content[0].text
+        response = message.text
         
         self.log("")
         self.log("=" * 70)
@@ -5,14 +5,27 @@ import time
 import json
 import re
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from playwright.async_api import Page
 import logging
 
 from configuration.config_utils import ErrorHandler, FileNameGenerator
+from browser_control.generation_watcher import count_responses, wait_for_generation_complete
+from browser_control.response_extractor import ExtractionCandidate, ExtractionStrategy, ResponseExtractor
 
 logger = logging.getLogger(__name__)
 
+# ユーザープロンプトに含まれる文字列（応答候補にあればプロンプトの混入とみなす）
+PROMPT_MARKERS = ('あなたは経験豊富な', '【あなたの役割】', '【執筆依頼】')
+
+# Gemini応答抽出のセレクタ戦略（優先順）
+GEMINI_RESPONSE_STRATEGIES = [
+    ExtractionStrategy("方法1", '[data-message-author="model"]'),
+    ExtractionStrategy("方法2", '[class*="markdown"]', pick="longest"),
+    ExtractionStrategy("方法3", '[class*="message"]', min_length=101, exclude=PROMPT_MARKERS),
+]
+
+
 class AIChatAgent:
     """AIサービス（Gemini/DeepSeek）との対話を担当"""
     
@@ -20,6 +33,10 @@ class AIChatAgent:
         self.page = page
         self.service = service.lower()
         self.credentials = credentials or {}
+        # 送信直前の応答ノード数（生成完了検出で新しい応答の開始を判定する）
+        self._baseline_response_count = -1
+        # 採用されたセレクタを覚えて次回の抽出で先に試す
+        self._gemini_extractor = ResponseExtractor(GEMINI_RESPONSE_STRATEGIES)
     
     async def navigate_to_gemini(self) -> None:
         """Geminiサイトにアクセス（クラッシュ検知強化版）"""
@@ -269,6 +286,14 @@ class AIChatAgent:
         except Exception as e:
             ErrorHandler.log_error(e, "チャットモード確認")
     
+    def response_baseline(self) -> int:
+        """送信前の応答ノード数（-1 なら未取得、または前回の待機で使用済み）"""
+        return self._baseline_response_count
+    
+    def reset_response_baseline(self):
+        """生成待機が終わったら基準を捨てる（次の待機で前回の応答を完了と誤認しないため）"""
+        self._baseline_response_count = -1
+    
     async def send_prompt(self, prompt: str) -> None:
         """プロンプトを入力して送信（サービス自動判別版）"""
         try:
@@ -277,6 +302,8 @@ class AIChatAgent:
             await self.ensure_normal_chat_mode()
             logger.info(f"プロンプトを送信中: {prompt[:50]}...")
             
+            self._baseline_response_count = await count_responses(self.page, self.service)
+            
             if self.service == "deepseek":
                 await self.send_prompt_deepseek(prompt)
             else:
@@ -521,12 +548,41 @@ class AIChatAgent:
         await self.page.wait_for_timeout(3000)
     
     async def wait_for_text_generation(self, max_wait: int = 120) -> bool:
-        """テキスト生成完了まで待機"""
+        """
+        テキスト生成完了まで待機
+        
+        ページ内の MutationObserver で完了を待ち、使えない場合だけ
+        ボタン状態のポーリングに切り替える
+        """
         try:
             if not self.page:
                 return False
             logger.info("テキスト生成を待機中...")
             start_time = time.time()
+            
+            result = await wait_for_generation_complete(
+                self.page, max_wait, self.service, self.response_baseline()
+            )
+            if result is not None:
+                if result["status"] == "timeout":
+                    logger.warning(f"⏰ タイムアウト（{max_wait}秒）")
+                    return False
+                logger.info(
+                    f"✅ テキスト生成完了を検出（{result['status']}, "
+                    f"{result['length']}文字, {result['elapsed']:.1f}秒）"
+                )
+                return True
+            
+            return await self._poll_text_generation(max_wait, start_time)
+        except Exception as e:
+            ErrorHandler.log_error(e, "テキスト生成待機")
+            return False
+        finally:
+            self.reset_response_baseline()
+    
+    async def _poll_text_generation(self, max_wait: int, start_time: float) -> bool:
+        """ボタン状態のポーリングで生成完了を待つ（イベント駆動の検出が使えない場合）"""
+        try:
             check_interval = 2
             await self.page.wait_for_timeout(5000)
             while time.time() - start_time < max_wait:
@@ -616,130 +672,29 @@ class AIChatAgent:
             logger.info("★★★ Geminiテキスト抽出開始 ★★★")
             logger.info("=" * 60)
             
-            all_results = {}
+            # 全方法を1回の evaluate で実行し、優先順位とコード完全性で採用を決める
+            result = await self._gemini_extractor.extract(self.page, self._choose_gemini_candidate)
+            for candidate in result.candidates:
+                logger.info(f"{candidate.name}結果: {candidate.length}文字")
             
-            # 方法1: モデルメッセージのデータ属性から取得
-            try:
-                method1_text = await self.page.evaluate('''() => {
-                    const modelMessages = document.querySelectorAll('[data-message-author="model"]');
-                    if (modelMessages.length === 0) return null;
-                    
-                    const latestMessage = modelMessages[modelMessages.length - 1];
-                    return latestMessage.innerText || latestMessage.textContent || '';
-                }''')
-                all_results['方法1'] = method1_text
-                logger.info(f"方法1結果: {len(method1_text) if method1_text else 0}文字")
-            except Exception as e:
-                logger.debug(f"方法1失敗: {e}")
-                all_results['方法1'] = None
-
-            # 方法2: マークダウンコンテンツから取得
-            try:
-                method2_text = await self.page.evaluate('''() => {
-                    const markdownContainers = document.querySelectorAll('[class*="markdown"]');
-                    if (markdownContainers.length === 0) return null;
-                    
-                    let longest = '';
-                    for (const container of markdownContainers) {
-                        const text = container.innerText || container.textContent || '';
-                        if (text.length > longest.length) {
-                            longest = text;
-                        }
-                    }
-                    return longest;
-                }''')
-                all_results['方法2'] = method2_text
-                logger.info(f"方法2結果: {len(method2_text) if method2_text else 0}文字")
-            except Exception as e:
-                logger.debug(f"方法2失敗: {e}")
-                all_results['方法2'] = None
-
-            # 方法3: メッセージクラスから取得
-            try:
-                method3_text = await self.page.evaluate('''() => {
-                    const messages = document.querySelectorAll('[class*="message"]');
-                    if (messages.length === 0) return null;
-                    
-                    let modelTexts = [];
-                    for (const msg of messages) {
-                        const text = msg.innerText || msg.textContent || '';
-                        // ユーザーメッセージを除外（短いまたは特定のパターン）
-                        if (text.length > 100 && 
-                            !text.includes('あなたは経験豊富な') &&
-                            !text.includes('【あなたの役割】') &&
-                            !text.includes('【執筆依頼】')) {
-                            modelTexts.push(text);
-                        }
-                    }
-                    return modelTexts.length > 0 ? modelTexts[modelTexts.length - 1] : null;
-                }''')
-                all_results['方法3'] = method3_text
-                logger.info(f"方法3結果: {len(method3_text) if method3_text else 0}文字")
-            except Exception as e:
-                logger.debug(f"方法3失敗: {e}")
-                all_results['方法3'] = None
-            
-            # 優先順位で選択（コード完全性検証を緩和）
-            priority_order = ['方法1', '方法2', '方法3']
-            best_result = None
-            best_method = None
-            
-            for method in priority_order:
-                if method in all_results and all_results[method] and len(all_results[method]) > 100:
-                    text = all_results[method]
-                    
-                    # プロンプトが混入していないか最終チェック
-                    if ('あなたは経験豊富な' in text or 
-                        '【あなたの役割】' in text or
-                        '【執筆依頼】' in text):
-                        logger.warning(f"{method}にプロンプトが混入 - スキップ")
-                        continue
-                    
-                    # コードブロック検証（緩和版）
-                    validation_result = self._validate_code_block_completeness_enhanced(text)
-                    
-                    if validation_result['is_complete']:
-                        logger.info(f"✅ {method}: 完全な応答を検出")
-                        best_result = text.strip()
-                        best_method = method
-                        break
-                    else:
-                        # 不完全でも長文の場合は警告を出して採用する
-                        if len(text) > 1500:  # 長文の場合は許容
-                            logger.warning(f"⚠️ {method}: 不完全だが長文のため採用 - {validation_result['reason']}")
-                            best_result = text.strip()
-                            best_method = method
-                            break
-                        else:
-                            logger.warning(f"⚠️ {method}: 不完全な応答 - {validation_result['reason']}")
-            
-            if best_result:
-                logger.info(f"\n🎯 採用: {best_method} ({len(best_result)}文字)")
+            if result.winner is not None:
+                best_result = result.winner.text.strip()
+                source = "記録済みセレクタ" if result.from_cache else "全方法"
+                logger.info(f"\n🎯 採用: {result.winner.name} ({len(best_result)}文字, {source})")
                 logger.info(f"先頭200文字:\n{best_result[:200]}")
                 return best_result
             
             # すべて失敗した場合でも、最長のテキストを返す（最終手段）
-            fallback_text = None
-            for method in priority_order:
-                if method in all_results and all_results[method] and len(all_results[method]) > 500:
-                    fallback_text = all_results[method]
-                    logger.warning(f"⚠️ フォールバック採用: {method} ({len(fallback_text)}文字)")
-                    break
-            
-            if fallback_text:
-                return fallback_text.strip()
+            for candidate in result.candidates:
+                if candidate.length > 500:
+                    logger.warning(f"⚠️ フォールバック採用: {candidate.name} ({candidate.length}文字)")
+                    return candidate.text.strip()
             
             # 本当に何も取得できない場合
             logger.error("\n❌ 全方法失敗 - Geminiの応答が取得できませんでした")
             
-            # デバッグ用: ページの構造を確認
-            page_structure = await self.page.evaluate('''() => {
-                return {
-                    messageCount: document.querySelectorAll('[class*="message"]').length,
-                    modelMessages: document.querySelectorAll('[data-message-author="model"]').length,
-                    markdownContainers: document.querySelectorAll('[class*="markdown"]').length
-                };
-            }''')
+            # デバッグ用: ページの構造を確認（各セレクタに一致したノード数）
+            page_structure = {c.name: c.matched for c in result.candidates}
             logger.info(f"ページ構造: {page_structure}")
             
             return None
@@ -750,6 +705,36 @@ class AIChatAgent:
             logger.error(traceback.format_exc())
             return None
         
+    def _choose_gemini_candidate(self, candidates: List[ExtractionCandidate]) -> Optional[ExtractionCandidate]:
+        """
+        Gemini応答の候補から採用するものを選ぶ（優先順位順）
+        
+        プロンプトが混入した候補は除外し、コードブロックが完全なもの、
+        または不完全でも長文のものを採用する
+        """
+        for candidate in candidates:
+            if candidate.length <= 100:
+                continue
+            text = candidate.text
+            
+            # プロンプトが混入していないか最終チェック
+            if any(marker in text for marker in PROMPT_MARKERS):
+                logger.warning(f"{candidate.name}にプロンプトが混入 - スキップ")
+                continue
+            
+            # コードブロック検証（緩和版）
+            validation_result = self._validate_code_block_completeness_enhanced(text)
+            
+            if validation_result['is_complete']:
+                logger.info(f"✅ {candidate.name}: 完全な応答を検出")
+                return candidate
+            # 不完全でも長文の場合は警告を出して採用する
+            if len(text) > 1500:
+                logger.warning(f"⚠️ {candidate.name}: 不完全だが長文のため採用 - {validation_result['reason']}")
+                return candidate
+            logger.warning(f"⚠️ {candidate.name}: 不完全な応答 - {validation_result['reason']}")
+        return None
+    
     def _validate_code_block_completeness_enhanced(self, text: str) -> Dict:
         """
         コードブロックの完全性を検証(緩和版 - 専門文書・長文対応強化)
@@ -9,18 +9,33 @@ from browser_control.browser_lifecycle import BrowserLifecycleManager
 from browser_control.brower_cookie_and_session import CookieSessionManager  # ファイル名修正
 from browser_control.browser_ai_chat_agent import AIChatAgent
 from browser_control.browser_wp_session_manager import WPSessionManager
+from browser_control.browser_page_pool import BrowserPagePool, PageLease, current_lease
+from browser_control.generation_watcher import latest_response_text, wait_for_generation_complete
+from browser_control.response_extractor import ExtractionStrategy, ResponseExtractor, select_longest
 from configuration.config_utils import config, ErrorHandler
+from tools.resource_accounting import WAIT_BROWSER, waits_on
 
 logger = logging.getLogger(__name__)
 
+# 応答抽出のセレクタ戦略（優先順）
+RESPONSE_STRATEGIES = [
+    ExtractionStrategy("method1", 'div.model-response-text'),
+    ExtractionStrategy("method2", 'div.markdown-container'),
+    ExtractionStrategy("method3", 'div.message-content', min_length=101, exclude=('model-response',), ignore_case=True),
+    ExtractionStrategy("method4", '[data-test-id*="conversation-turn"]'),
+]
+
+
 class BrowserController:
     """ブラウザ制御ファサードクラス"""
     
-    def __init__(self, download_folder: Path, mode: str = "image", service: str = "google", credentials: Dict = None):
+    def __init__(self, download_folder: Path, mode: str = "image", service: str = "google",
+                 credentials: Dict = None, pool_size: Optional[int] = None):
         self.download_folder = download_folder
         self.mode = mode
         self.service = service.lower()
         self.credentials = credentials or {}
+        self.pool_size = pool_size or config.BROWSER_POOL_SIZE
         
         # 設定ファイルのパス
         self.cookies_file = Path(config.COOKIES_FILE) if config.COOKIES_FILE else None
@@ -30,8 +45,10 @@ class BrowserController:
         # マネージャーの初期化（setup_browserで完全初期化）
         self.lifecycle_manager: Optional[BrowserLifecycleManager] = None
         self.session_manager: Optional[CookieSessionManager] = None
-        self.ai_agent: Optional[AIChatAgent] = None
+        self._ai_agent: Optional[AIChatAgent] = None
         self.wp_manager: Optional[WPSessionManager] = None
+        self._page_pool: Optional[BrowserPagePool] = None
+        self._response_extractor = ResponseExtractor(RESPONSE_STRATEGIES)
     
     async def setup_browser(self) -> None:
         """ブラウザのセットアップ - すべてのマネージャーを初期化"""
@@ -73,10 +90,31 @@ class BrowserController:
     def context(self):
         return self.lifecycle_manager.context if self.lifecycle_manager else None
     
+    def _leased(self) -> Optional[PageLease]:
+        """現在のタスクがこのコントローラのプールから借りているページ"""
+        lease = current_lease()
+        if lease is not None and self._page_pool is not None and lease.pool is self._page_pool:
+            return lease
+        return None
+    
     @property
     def page(self):
+        lease = self._leased()
+        if lease is not None:
+            return lease.page
         return self.lifecycle_manager.page if self.lifecycle_manager else None
     
+    @property
+    def ai_agent(self) -> Optional[AIChatAgent]:
+        lease = self._leased()
+        if lease is not None:
+            return lease.ai_agent
+        return self._ai_agent
+    
+    @ai_agent.setter
+    def ai_agent(self, agent: Optional[AIChatAgent]):
+        self._ai_agent = agent
+    
     @property
     def wp_page(self):
         return self.wp_manager.wp_page if self.wp_manager else None
@@ -86,27 +124,34 @@ class BrowserController:
         return self.wp_manager.is_logged_in if self.wp_manager else False
     
     # AIチャット関連メソッドの委譲
+    @waits_on(WAIT_BROWSER)
     async def navigate_to_gemini(self) -> None:
         """Geminiにナビゲート - AIエージェントに委譲"""
         if not self.ai_agent:
             raise Exception("AIエージェントが初期化されていません")
         await self.ai_agent.navigate_to_gemini()
     
+    @waits_on(WAIT_BROWSER)
     async def navigate_to_deepseek(self) -> None:
         """DeepSeekにナビゲート - AIエージェントに委譲"""
         if not self.ai_agent:
             raise Exception("AIエージェントが初期化されていません")
         await self.ai_agent.navigate_to_deepseek()
     
+    @waits_on(WAIT_BROWSER)
     async def send_prompt(self, prompt: str) -> None:
         """プロンプト送信 - AIエージェントに委譲"""
         if not self.ai_agent:
             raise Exception("AIエージェントが初期化されていません")
         await self.ai_agent.send_prompt(prompt)
     
+    @waits_on(WAIT_BROWSER)
     async def wait_for_text_generation(self, max_wait: int = 180) -> bool:
         """
         テキスト生成完了を待機（強化版）
+        
+        ページ内の MutationObserver で完了を待ち、使えない場合は
+        テキスト長が安定するまでポーリングする
             
         Args:
             max_wait: 最大待機時間（秒）
@@ -118,6 +163,19 @@ class BrowserController:
             logger.info(f"⏱️ テキスト生成待機開始（最大{max_wait}秒）")
                 
             start_time = asyncio.get_event_loop().time()
+            
+            if self.page:
+                baseline = self.ai_agent.response_baseline() if self.ai_agent else -1
+                result = await wait_for_generation_complete(self.page, max_wait, self.service, baseline)
+                if result is not None:
+                    if result["status"] == "timeout":
+                        logger.warning(f"⏱️ タイムアウト（{max_wait}秒）")
+                        return False
+                    logger.info(
+                        f"✅ 生成完了（{result['length']}文字、{result['elapsed']:.1f}秒、{result['status']}）"
+                    )
+                    return True
+            
             check_interval = 2.0  # 2秒ごとにチェック
             last_length = 0
             stable_count = 0
@@ -158,7 +216,17 @@ class BrowserController:
         except Exception as e:
             logger.error(f"❌ 待機エラー: {e}")
             return False
+        finally:
+            if self.ai_agent:
+                self.ai_agent.reset_response_baseline()
+    
+    async def _get_current_text_quick(self) -> str:
+        """最新の応答テキストを1回の evaluate で取得（生成待機のポーリング用）"""
+        if not self.page:
+            return ""
+        return await latest_response_text(self.page, self.service)
     
+    @waits_on(WAIT_BROWSER)
     async def extract_latest_text_response(self, allow_partial: bool = True) -> Optional[str]:
         """
         最新のテキスト応答を抽出（強化版）
@@ -174,86 +242,28 @@ class BrowserController:
             logger.info("★★★ Gemini応答抽出開始（強化版） ★★★")
             logger.info("="*60)
             
-            results = {}
-            
-            # ============================================================
-            # === 方法1: model-response-text クラス ===
-            # ============================================================
-            try:
-                message_divs = await self.page.query_selector_all('div.model-response-text')
-                if message_divs:
-                    last_message = message_divs[-1]
-                    text1 = await last_message.inner_text()
-                    if text1 and len(text1) > 100:
-                        results['method1'] = text1
-                        logger.info(f"✅ 方法1成功: {len(text1)}文字")
-            except Exception as e:
-                logger.warning(f"⚠️ 方法1失敗: {e}")
-            
-            # ============================================================
-            # === 方法2: markdown-container クラス ===
-            # ============================================================
-            try:
-                markdown_divs = await self.page.query_selector_all('div.markdown-container')
-                if markdown_divs:
-                    last_markdown = markdown_divs[-1]
-                    text2 = await last_markdown.inner_text()
-                    if text2 and len(text2) > 100:
-                        results['method2'] = text2
-                        logger.info(f"✅ 方法2成功: {len(text2)}文字")
-            except Exception as e:
-                logger.warning(f"⚠️ 方法2失敗: {e}")
-            
-            # ============================================================
-            # === 方法3: message-content クラス ===
-            # ============================================================
-            try:
-                content_divs = await self.page.query_selector_all('div.message-content')
-                if content_divs:
-                    # 最後のメッセージコンテンツ
-                    for div in reversed(content_divs):
-                        text3 = await div.inner_text()
-                        if text3 and len(text3) > 100 and 'model-response' not in text3.lower():
-                            results['method3'] = text3
-                            logger.info(f"✅ 方法3成功: {len(text3)}文字")
-                            break
-            except Exception as e:
-                logger.warning(f"⚠️ 方法3失敗: {e}")
-            
-            # ============================================================
-            # === 方法4: data-test-id 属性 ===
-            # ============================================================
-            try:
-                test_divs = await self.page.query_selector_all('[data-test-id*="conversation-turn"]')
-                if test_divs:
-                    last_turn = test_divs[-1]
-                    text4 = await last_turn.inner_text()
-                    if text4 and len(text4) > 100:
-                        results['method4'] = text4
-                        logger.info(f"✅ 方法4成功: {len(text4)}文字")
-            except Exception as e:
-                logger.warning(f"⚠️ 方法4失敗: {e}")
+            # 全戦略を1回の evaluate で実行し、4方法のうち最長の候補を採用
+            # （最長を選ぶので記録済みセレクタだけを先に試す近道は使わない）
+            result = await self._response_extractor.extract(
+                self.page, select_longest(100), use_preferred=False
+            )
+            for candidate in result.candidates:
+                if candidate.error:
+                    logger.warning(f"⚠️ {candidate.name}失敗: {candidate.error}")
+                elif candidate.length > 100:
+                    logger.info(f"✅ {candidate.name}成功: {candidate.length}文字")
             
-            # ============================================================
-            # === 結果選択（最長のものを選択） ===
-            # ============================================================
-            if not results:
+            if result.winner is None:
                 logger.error("❌ 全方法失敗 - 応答が取得できませんでした")
                 
-                # デバッグ情報
-                try:
-                    page_content = await self.page.content()
-                    logger.info(f"📄 ページ長: {len(page_content)}文字")
-                except:
-                    pass
+                # デバッグ情報（各セレクタに一致したノード数）
+                matched = {c.name: c.matched for c in result.candidates}
+                logger.info(f"📄 一致ノード数: {matched}")
                 
                 return None
             
-            # 最も長いテキストを選択
-            best_method = max(results.items(), key=lambda x: len(x[1]))
-            selected_text = best_method[1]
-            
-            logger.info(f"✅ 最適結果選択: {best_method[0]} ({len(selected_text)}文字)")
+            selected_text = result.winner.text
+            logger.info(f"✅ 最適結果選択: {result.winner.name} ({len(selected_text)}文字)")
             
             # ============================================================
             # === 品質チェック（緩和版） ===
@@ -305,12 +315,46 @@ class BrowserController:
             logger.error(traceback.format_exc())
             return None
     
+    @waits_on(WAIT_BROWSER)
     async def send_prompt_and_wait(self, prompt: str, max_wait: int = 120) -> bool:
         """プロンプト送信と待機 - AIエージェントに委譲"""
         if not self.ai_agent:
             raise Exception("AIエージェントが初期化されていません")
         return await self.ai_agent.send_prompt_and_wait(prompt, max_wait)
     
+    # ページプール
+    def get_page_pool(self) -> BrowserPagePool:
+        """
+        チャットタブのプールを取得（初回呼び出し時に作成）
+        
+        プールのページは同じコンテキストを共有するのでログイン状態も共有される。
+        lease_page() のブロック内では page / ai_agent / send_prompt などが
+        借りたタブに対して動作する。
+        """
+        if self._page_pool is None:
+            if not self.lifecycle_manager or not self.lifecycle_manager.context:
+                raise Exception("ブラウザが初期化されていません")
+            self._page_pool = BrowserPagePool(
+                page_factory=self.lifecycle_manager.new_page,
+                agent_factory=lambda page: AIChatAgent(
+                    page=page, service=self.service, credentials=self.credentials
+                ),
+                prepare=self._prepare_pooled_page,
+                max_pages=self.pool_size
+            )
+        return self._page_pool
+    
+    def lease_page(self, task_id: Optional[str] = None, timeout: Optional[float] = None):
+        """タスク用のタブを借りる（async with で使用）"""
+        return self.get_page_pool().lease(task_id, timeout)
+    
+    async def _prepare_pooled_page(self, lease: PageLease) -> None:
+        """プールの新しいタブをチャット画面に移動"""
+        if self.service == "deepseek":
+            await lease.ai_agent.navigate_to_deepseek()
+        else:
+            await lease.ai_agent.navigate_to_gemini()
+    
     # クッキー管理の委譲
     async def save_cookies(self) -> None:
         """クッキー保存 - セッションマネージャーに委譲"""
@@ -351,6 +395,11 @@ class BrowserController:
         if self.wp_manager:
             await self.wp_manager.close_wp_session()
         
+        # プールのタブを閉じる
+        if self._page_pool:
+            await self._page_pool.close()
+            self._page_pool = None
+        
         # メインのブラウザリソースをクリーンアップ
         if self.lifecycle_manager:
             await self.lifecycle_manager.cleanup()
@@ -12,6 +12,28 @@ from configuration.config_utils import config, ErrorHandler
 
 logger = logging.getLogger(__name__)
 
+# 自動化検出を回避するスクリプト（全ページ共通）
+STEALTH_INIT_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => false,
+    });
+    window.navigator.chrome = {
+        runtime: {},
+    };
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5],
+    });
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['ja-JP', 'ja', 'en-US', 'en'],
+    });
+"""
+
 class BrowserLifecycleManager:
     """ブラウザの起動・終了・生存管理を担当"""
     
@@ -82,29 +104,7 @@ class BrowserLifecycleManager:
             logger.info("✅ ブラウザ生存確認完了")
             
             # 自動化検出を回避
-            await self.page.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => false,
-                });
-                window.navigator.chrome = {
-                    runtime: {},
-                };
-                const originalQuery = window.navigator.permissions.query;
-                window.navigator.permissions.query = (parameters) => (
-                    parameters.name === 'notifications' ?
-                        Promise.resolve({ state: Notification.permission }) :
-                        originalQuery(parameters)
-                );
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [1, 2, 3, 4, 5],
-                });
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['ja-JP', 'ja', 'en-US', 'en'],
-                });
-            """)
-            
-            self.page.set_default_timeout(config.PAGE_TIMEOUT)
-            self.page.set_default_navigation_timeout(config.PAGE_TIMEOUT)
+            await self._configure_page(self.page)
             
             logger.info("="*60)
             logger.info("✅ ブラウザ起動完了")
@@ -122,6 +122,24 @@ class BrowserLifecycleManager:
             await self._cleanup_existing_browser_processes()
             raise Exception(f"ブラウザ起動に失敗しました: {str(e)}")
     
+    async def new_page(self) -> Page:
+        """
+        同じコンテキスト（ログイン済みプロファイル）に設定済みのページを追加
+        
+        ページプールが追加のタブを作るときに使う
+        """
+        if not self.context:
+            raise Exception("ブラウザコンテキストが初期化されていません")
+        page = await self.context.new_page()
+        await self._configure_page(page)
+        return page
+    
+    async def _configure_page(self, page: Page) -> None:
+        """自動化検出の回避とタイムアウトを設定"""
+        await page.add_init_script(STEALTH_INIT_SCRIPT)
+        page.set_default_timeout(config.PAGE_TIMEOUT)
+        page.set_default_navigation_timeout(config.PAGE_TIMEOUT)
+    
     async def _is_browser_alive(self) -> bool:
         """ブラウザが生きているか確認"""
         try:
@@ -0,0 +1,252 @@
+# browser_page_pool.py
+"""ブラウザページプール（ログイン済みプロファイルを共有する複数タブ）"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from playwright.async_api import Page
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PageLease:
+    """タスクに貸し出したページ"""
+    page: Page
+    ai_agent: Any
+    page_id: int
+    created_at: float = field(default_factory=time.monotonic)
+    uses: int = 0
+    task_id: Optional[str] = None
+    acquired_at: float = 0.0
+    pool: Optional["BrowserPagePool"] = field(default=None, repr=False)
+
+
+# 現在のタスクが借りているページ（asyncio のタスクごとに独立）
+_current_lease: contextvars.ContextVar[Optional[PageLease]] = \
+    contextvars.ContextVar("current_page_lease", default=None)
+
+
+def current_lease() -> Optional[PageLease]:
+    return _current_lease.get()
+
+
+class BrowserPagePool:
+    """
+    ページプール
+
+    同じブラウザコンテキストのページを最大 max_pages 枚まで作り、
+    タスクごとに1枚ずつ貸し出す。
+    - 上限に達している間 acquire は空きが出るまで待つ
+    - 貸し出し前に生存確認し、閉じた・応答しないページは作り直す
+    - 使用回数・経過時間が上限を超えたページは返却時に閉じる
+    - lease() の中では BrowserController.page / ai_agent が借りたページを指す
+    """
+
+    def __init__(
+        self,
+        page_factory: Callable[[], Awaitable[Page]],
+        agent_factory: Callable[[Page], Any],
+        prepare: Optional[Callable[[PageLease], Awaitable[None]]] = None,
+        max_pages: int = 3,
+        max_uses_per_page: int = 50,
+        max_page_age: float = 3600.0,
+        health_check_timeout: float = 5.0
+    ):
+        """
+        初期化
+
+        Args:
+            page_factory: 設定済みの新しいページを作る関数
+            agent_factory: ページ用の AIChatAgent を作る関数
+            prepare: 新しいページの準備（チャット画面への移動など）
+            max_pages: 同時に貸し出すページ数の上限
+            max_uses_per_page: 1ページを使い回す回数の上限
+            max_page_age: 1ページを使い回す時間の上限（秒）
+            health_check_timeout: 生存確認のタイムアウト（秒）
+        """
+        self.page_factory = page_factory
+        self.agent_factory = agent_factory
+        self.prepare = prepare
+        self.max_pages = max_pages
+        self.max_uses_per_page = max_uses_per_page
+        self.max_page_age = max_page_age
+        self.health_check_timeout = health_check_timeout
+
+        self._semaphore = asyncio.Semaphore(max_pages)
+        self._idle: Deque[PageLease] = deque()
+        self._in_use: Dict[int, PageLease] = {}
+        self._page_ids = itertools.count(1)
+        self._closed = False
+
+        self.stats = {
+            "acquired": 0,
+            "released": 0,
+            "created": 0,
+            "recycled": 0,
+            "health_failures": 0,
+            "wait_time": 0.0,
+            "peak_in_use": 0
+        }
+
+        logger.info(f"✅ BrowserPagePool 初期化完了 (最大{max_pages}ページ)")
+
+    # ========================================
+    # 貸し出し・返却
+    # ========================================
+
+    async def acquire(self, task_id: Optional[str] = None, timeout: Optional[float] = None) -> PageLease:
+        """
+        ページを借りる（上限に達していれば空くまで待つ）
+
+        Args:
+            task_id: 借りるタスクのID（ログ用）
+            timeout: 待ち時間の上限（秒、None で無制限）
+        """
+        if self._closed:
+            raise RuntimeError("ページプールは終了しています")
+
+        started = time.perf_counter()
+        if timeout is None:
+            await self._semaphore.acquire()
+        else:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        self.stats["wait_time"] += time.perf_counter() - started
+
+        try:
+            lease = await self._checkout()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        lease.uses += 1
+        lease.task_id = task_id
+        lease.acquired_at = time.monotonic()
+        self._in_use[lease.page_id] = lease
+
+        self.stats["acquired"] += 1
+        self.stats["peak_in_use"] = max(self.stats["peak_in_use"], len(self._in_use))
+        logger.info(f"📑 ページ貸出: #{lease.page_id} → {task_id} ({len(self._in_use)}/{self.max_pages})")
+        return lease
+
+    async def release(self, lease: PageLease, healthy: bool = True):
+        """
+        ページを返す
+
+        Args:
+            lease: acquire で得たページ
+            healthy: False なら再利用せずに閉じる（タスクが異常終了した場合など）
+        """
+        if self._in_use.pop(lease.page_id, None) is None:
+            return
+
+        try:
+            if healthy and not self._closed and not self._expired(lease):
+                self._idle.append(lease)
+            else:
+                await self._discard(lease)
+        finally:
+            self.stats["released"] += 1
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def lease(self, task_id: Optional[str] = None, timeout: Optional[float] = None) -> AsyncIterator[PageLease]:
+        """
+        ページを借りて、ブロック内では現在のタスクのページとして扱う
+
+        例外で抜けた場合はページの状態が不明なので作り直す
+        """
+        lease = await self.acquire(task_id, timeout)
+        token = _current_lease.set(lease)
+        healthy = False
+        try:
+            yield lease
+            healthy = True
+        finally:
+            _current_lease.reset(token)
+            await self.release(lease, healthy=healthy)
+
+    # ========================================
+    # 内部処理
+    # ========================================
+
+    async def _checkout(self) -> PageLease:
+        """空きページを取り出す（なければ作る）"""
+        while self._idle:
+            # 直近に使ったページから使う（表示・キャッシュが温まっている）
+            lease = self._idle.pop()
+            if self._expired(lease):
+                await self._discard(lease)
+                continue
+            if await self._is_healthy(lease.page):
+                return lease
+            self.stats["health_failures"] += 1
+            logger.warning(f"⚠️ ページ #{lease.page_id} が応答しません - 作り直します")
+            await self._discard(lease)
+        return await self._create()
+
+    async def _create(self) -> PageLease:
+        page = await self.page_factory()
+        lease = PageLease(
+            page=page,
+            ai_agent=self.agent_factory(page),
+            page_id=next(self._page_ids),
+            pool=self
+        )
+        if self.prepare is not None:
+            try:
+                await self.prepare(lease)
+            except BaseException:
+                await self._close_page(page)
+                raise
+        self.stats["created"] += 1
+        logger.info(f"📑 ページ作成: #{lease.page_id}")
+        return lease
+
+    def _expired(self, lease: PageLease) -> bool:
+        return (
+            lease.uses >= self.max_uses_per_page
+            or time.monotonic() - lease.created_at > self.max_page_age
+        )
+
+    async def _is_healthy(self, page: Page) -> bool:
+        try:
+            if page.is_closed():
+                return False
+            result = await asyncio.wait_for(page.evaluate("1 + 1"), self.health_check_timeout)
+            return result == 2
+        except Exception:
+            return False
+
+    async def _discard(self, lease: PageLease):
+        self.stats["recycled"] += 1
+        await self._close_page(lease.page)
+
+    @staticmethod
+    async def _close_page(page: Page):
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception as e:
+            logger.warning(f"⚠️ ページクローズ中の警告: {e}")
+
+    async def close(self):
+        """空きページを閉じる（貸出中のページは返却時に閉じる）"""
+        self._closed = True
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        return {
+            **self.stats,
+            "max_pages": self.max_pages,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use)
+        }
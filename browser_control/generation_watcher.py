@@ -0,0 +1,213 @@
+# generation_watcher.py
+"""
+テキスト生成完了の検出（イベント駆動）
+
+ページ内に MutationObserver を仕掛け、次のいずれかで完了とみなして
+Playwright の evaluate が待つ Promise を解決する:
+- 生成中に表示されていた停止ボタンが消え、短い整定時間だけ変化がない
+- 応答が始まった後、デバウンス時間のあいだ DOM の変化がない
+ポーリングのように一定間隔で問い合わせないため、完了から検出までの遅れが小さい。
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 応答ノードのセレクタ（サービス別）
+RESPONSE_SELECTORS = {
+    "google": [
+        '[data-message-author="model"]',
+        'model-response',
+        'div.model-response-text',
+        'div.markdown-container',
+    ],
+    "deepseek": [
+        'div.ds-markdown',
+        '[class*="markdown"]',
+    ],
+}
+
+# 生成中だけ表示される停止ボタンのセレクタ
+STOP_BUTTON_SELECTORS = [
+    'button[aria-label*="停止"]',
+    'button[aria-label*="Stop"]',
+    'button[aria-label*="stop"]',
+    '[data-test-id="stop-button"]',
+    'button.stop',
+]
+
+_COUNT_RESPONSES_SCRIPT = """
+(selectors) => document.querySelectorAll(selectors.join(',')).length
+"""
+
+_LATEST_RESPONSE_TEXT_SCRIPT = """
+(selectors) => {
+    const nodes = document.querySelectorAll(selectors.join(','));
+    if (nodes.length === 0) return '';
+    const last = nodes[nodes.length - 1];
+    return last.innerText || last.textContent || '';
+}
+"""
+
+_WAIT_FOR_COMPLETION_SCRIPT = """
+(opts) => new Promise((resolve) => {
+    const responseSelector = opts.responseSelectors.join(',');
+    const stopSelector = opts.stopSelectors.join(',');
+    const startedAt = performance.now();
+
+    const responses = () => document.querySelectorAll(responseSelector);
+    const latestLength = () => {
+        const nodes = responses();
+        if (nodes.length === 0) return 0;
+        const last = nodes[nodes.length - 1];
+        return (last.innerText || last.textContent || '').length;
+    };
+    const stopVisible = () => {
+        for (const el of document.querySelectorAll(stopSelector)) {
+            if (el.offsetParent !== null) return true;
+        }
+        return false;
+    };
+
+    const baselineCount = opts.baselineCount >= 0 ? opts.baselineCount : responses().length;
+    const baselineLength = opts.baselineCount >= 0 ? -1 : latestLength();
+
+    let started = false;
+    let stopSeen = false;
+    let lastMutation = performance.now();
+    let done = false;
+    let timer = null;
+    let observer = null;
+
+    const finish = (status) => {
+        if (done) return;
+        done = true;
+        if (observer) observer.disconnect();
+        if (timer) clearTimeout(timer);
+        resolve({
+            status: status,
+            length: latestLength(),
+            stopSeen: stopSeen,
+            elapsed: (performance.now() - startedAt) / 1000
+        });
+    };
+
+    const check = () => {
+        timer = null;
+        if (done) return;
+        const now = performance.now();
+        if (now - startedAt >= opts.timeoutMs) {
+            finish('timeout');
+            return;
+        }
+        const stop = stopVisible();
+        if (stop) stopSeen = true;
+        if (!started) {
+            const count = responses().length;
+            started = stop || count > baselineCount
+                || (baselineLength >= 0 && count > 0 && latestLength() !== baselineLength);
+        }
+        if (started && !stop) {
+            // 停止ボタンが消えた場合は短い整定時間、それ以外はデバウンス時間だけ静かなら完了
+            const quiet = stopSeen ? opts.settleMs : opts.debounceMs;
+            const idleFor = now - lastMutation;
+            if (idleFor >= quiet && latestLength() >= opts.minChars) {
+                finish(stopSeen ? 'stop_button_gone' : 'idle');
+                return;
+            }
+            schedule(Math.max(quiet - idleFor, 50));
+            return;
+        }
+        schedule(stopSeen ? opts.settleMs : opts.debounceMs);
+    };
+
+    const schedule = (delay) => {
+        if (timer) clearTimeout(timer);
+        const remaining = opts.timeoutMs - (performance.now() - startedAt);
+        timer = setTimeout(check, Math.max(0, Math.min(delay, remaining)));
+    };
+
+    // ストリーミング中は変化が多いので、変化時は時刻の記録（と停止ボタンの初回検出）だけにして
+    // 判定はタイマーで行う
+    observer = new MutationObserver(() => {
+        lastMutation = performance.now();
+        if (!stopSeen && stopVisible()) stopSeen = true;
+        if (timer === null) schedule(stopSeen ? opts.settleMs : opts.debounceMs);
+    });
+    observer.observe(document.body, {
+        childList: true,
+        subtree: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: ['disabled', 'aria-label', 'class', 'hidden']
+    });
+    check();
+})
+"""
+
+
+def response_selectors(service: str) -> list:
+    return RESPONSE_SELECTORS.get(service, RESPONSE_SELECTORS["google"])
+
+
+async def count_responses(page, service: str = "google") -> int:
+    """現在の応答ノード数（送信前に取得して、新しい応答の開始判定に使う）"""
+    try:
+        return await page.evaluate(_COUNT_RESPONSES_SCRIPT, response_selectors(service))
+    except Exception as e:
+        logger.debug(f"応答数の取得失敗: {e}")
+        return -1
+
+
+async def latest_response_text(page, service: str = "google") -> str:
+    """最新の応答ノードのテキスト（1回の evaluate）"""
+    return await page.evaluate(_LATEST_RESPONSE_TEXT_SCRIPT, response_selectors(service)) or ""
+
+
+async def wait_for_generation_complete(
+    page,
+    max_wait: float,
+    service: str = "google",
+    baseline_count: int = -1,
+    debounce: float = 1.5,
+    settle: float = 0.3,
+    min_chars: int = 1
+) -> Optional[Dict[str, Any]]:
+    """
+    MutationObserver で生成完了を待つ
+
+    Args:
+        page: Playwright のページ
+        max_wait: 最大待機時間（秒）
+        service: 応答ノードのセレクタを選ぶサービス名
+        baseline_count: 送信前の応答ノード数（-1 なら待機開始時の状態を基準にする）
+        debounce: 停止ボタンが見えない場合に完了とみなす無変化時間（秒）
+        settle: 停止ボタンが消えた後の整定時間（秒）
+        min_chars: 完了とみなす最小文字数
+
+    Returns:
+        {"status": "stop_button_gone" | "idle" | "timeout", "length", "stopSeen", "elapsed"}
+        ページ内で待てなかった場合（遷移・スクリプトエラーなど）は None
+    """
+    options = {
+        "responseSelectors": response_selectors(service),
+        "stopSelectors": STOP_BUTTON_SELECTORS,
+        "baselineCount": baseline_count if baseline_count is not None else -1,
+        "timeoutMs": int(max_wait * 1000),
+        "debounceMs": int(debounce * 1000),
+        "settleMs": int(settle * 1000),
+        "minChars": min_chars,
+    }
+    try:
+        # ページ内のタイムアウトが効かなかった場合の保険
+        return await asyncio.wait_for(
+            page.evaluate(_WAIT_FOR_COMPLETION_SCRIPT, options),
+            timeout=max_wait + 5
+        )
+    except asyncio.TimeoutError:
+        return {"status": "timeout", "length": 0, "stopSeen": False, "elapsed": max_wait}
+    except Exception as e:
+        logger.warning(f"⚠️ イベント駆動の完了検出に失敗 - ポーリングに切り替え: {e}")
+        return None
@@ -0,0 +1,224 @@
+# response_extractor.py
+"""
+応答テキストの抽出（1回の evaluate）
+
+複数のセレクタ戦略をページ内でまとめて実行し、各候補のテキストと長さを
+1往復で返す。どの候補を採用するかは Python 側で決め、採用された戦略を
+覚えておいて次回はその戦略を先に試す。
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExtractionStrategy:
+    """
+    セレクタ戦略
+
+    pick:
+        "last"    一致したノードを後ろから見て、条件を満たす最初のノード
+        "longest" 条件を満たすノードのうち最長のもの
+    min_length / exclude はページ内での絞り込み条件（exclude はノードのテキストに
+    含まれてはいけない文字列、ignore_case なら大文字小文字を区別しない）
+    """
+    name: str
+    selector: str
+    pick: str = "last"
+    min_length: int = 0
+    exclude: Sequence[str] = ()
+    ignore_case: bool = False
+
+    def to_js(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "selector": self.selector,
+            "pick": self.pick,
+            "minLength": self.min_length,
+            "exclude": [word.lower() for word in self.exclude] if self.ignore_case else list(self.exclude),
+            "ignoreCase": self.ignore_case,
+        }
+
+
+@dataclass
+class ExtractionCandidate:
+    """1つの戦略で得た候補"""
+    name: str
+    selector: str
+    text: str
+    length: int
+    matched: int
+    error: Optional[str] = None
+
+
+@dataclass
+class ExtractionResult:
+    """抽出結果（winner が None なら採用できる候補がなかった）"""
+    winner: Optional[ExtractionCandidate]
+    candidates: List[ExtractionCandidate] = field(default_factory=list)
+    from_cache: bool = False
+    round_trips: int = 1
+
+    @property
+    def text(self) -> Optional[str]:
+        return self.winner.text if self.winner else None
+
+
+# 戦略をページ内で順に実行する。preferred が指定され、その戦略で
+# preferredMinLength 以上のテキストが得られた場合は他の戦略を実行しない。
+_EXTRACT_SCRIPT = """
+(args) => {
+    const textOf = (el) => el.innerText || el.textContent || '';
+    const run = (s) => {
+        let nodes;
+        try {
+            nodes = document.querySelectorAll(s.selector);
+        } catch (e) {
+            return {name: s.name, selector: s.selector, text: '', length: 0, matched: 0, error: String(e)};
+        }
+        const accept = (text) => {
+            if (text.length < s.minLength) return false;
+            const haystack = s.ignoreCase ? text.toLowerCase() : text;
+            return !s.exclude.some((word) => haystack.includes(word));
+        };
+        let best = '';
+        if (s.pick === 'longest') {
+            for (const node of nodes) {
+                const text = textOf(node);
+                if (text.length > best.length && accept(text)) best = text;
+            }
+        } else {
+            for (let i = nodes.length - 1; i >= 0; i--) {
+                const text = textOf(nodes[i]);
+                if (accept(text)) {
+                    best = text;
+                    break;
+                }
+            }
+        }
+        return {name: s.name, selector: s.selector, text: best, length: best.length, matched: nodes.length, error: null};
+    };
+
+    if (args.preferred) {
+        const preferred = args.strategies.find((s) => s.name === args.preferred);
+        if (preferred) {
+            const result = run(preferred);
+            if (result.length >= args.preferredMinLength) return {cached: true, candidates: [result]};
+        }
+    }
+    return {cached: false, candidates: args.strategies.map(run)};
+}
+"""
+
+
+def select_longest(min_length: int = 0) -> Callable[[List[ExtractionCandidate]], Optional[ExtractionCandidate]]:
+    """最長の候補を採用する選択関数（min_length 以下の候補は採用しない）"""
+    def choose(candidates: List[ExtractionCandidate]) -> Optional[ExtractionCandidate]:
+        usable = [c for c in candidates if c.length > min_length]
+        return max(usable, key=lambda c: c.length) if usable else None
+    return choose
+
+
+class ResponseExtractor:
+    """
+    応答テキスト抽出
+
+    - 全戦略を1回の evaluate で実行し、候補をすべて Python 側に返す
+    - 採用された戦略を記録し、次回はページ内でその戦略だけを先に試す
+      （十分な長さのテキストが得られなければ同じ evaluate 内で全戦略に切り替わる）
+    - 記録した戦略の候補が選択関数に不採用とされた場合は、記録を消して全戦略で取り直す
+    - 全候補を比べる選択関数（最長の候補など）では use_preferred=False で先取りを使わない
+    """
+
+    def __init__(self, strategies: Sequence[ExtractionStrategy], cache_min_length: int = 100):
+        """
+        初期化
+
+        Args:
+            strategies: セレクタ戦略（優先順）
+            cache_min_length: 記録した戦略の結果をそのまま使う最小文字数
+        """
+        self.strategies = list(strategies)
+        self.cache_min_length = cache_min_length
+        self._strategies_js = [s.to_js() for s in self.strategies]
+        self.preferred: Optional[str] = None
+
+        self.stats = {
+            "extractions": 0,
+            "round_trips": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "failures": 0,
+            "wins": {}
+        }
+
+    async def extract(
+        self,
+        page,
+        choose: Optional[Callable[[List[ExtractionCandidate]], Optional[ExtractionCandidate]]] = None,
+        use_preferred: bool = True
+    ) -> ExtractionResult:
+        """
+        応答テキストを抽出
+
+        Args:
+            page: Playwright のページ
+            choose: 候補（戦略の優先順）から採用するものを選ぶ関数（省略時は最長）
+            use_preferred: 記録した戦略だけを先に試すか（False なら毎回全戦略の候補から選ぶ）
+
+        Returns:
+            ExtractionResult
+        """
+        choose = choose or select_longest()
+        self.stats["extractions"] += 1
+
+        preferred = self.preferred if use_preferred else None
+        candidates, cached = await self._evaluate(page, preferred)
+        round_trips = 1
+
+        if preferred is not None:
+            winner = choose(candidates) if cached else None
+            if winner is not None:
+                self.stats["cache_hits"] += 1
+                self._record(winner)
+                return ExtractionResult(winner, candidates, from_cache=True, round_trips=round_trips)
+            self.stats["cache_misses"] += 1
+            self.preferred = None
+            if cached:
+                # 記録した戦略の候補が不採用だった場合だけ取り直す
+                candidates, _ = await self._evaluate(page, None)
+                round_trips += 1
+
+        winner = choose(candidates)
+        if winner is None:
+            self.stats["failures"] += 1
+        else:
+            self._record(winner)
+        return ExtractionResult(winner, candidates, from_cache=False, round_trips=round_trips)
+
+    async def _evaluate(self, page, preferred: Optional[str]):
+        self.stats["round_trips"] += 1
+        raw = await page.evaluate(_EXTRACT_SCRIPT, {
+            "strategies": self._strategies_js,
+            "preferred": preferred,
+            "preferredMinLength": self.cache_min_length,
+        })
+        candidates = [ExtractionCandidate(**item) for item in raw["candidates"]]
+        return candidates, raw["cached"]
+
+    def _record(self, winner: ExtractionCandidate):
+        if winner.name != self.preferred:
+            logger.info(f"📌 抽出セレクタを記録: {winner.name} ({winner.selector})")
+        self.preferred = winner.name
+        wins = self.stats["wins"]
+        wins[winner.name] = wins.get(winner.name, 0) + 1
+
+    def reset(self):
+        """記録した戦略を消す（サイトの構造が変わった場合など）"""
+        self.preferred = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        return {**self.stats, "preferred": self.preferred}
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 """ブラウザを確実に初期化・管理する基盤クラス"""
 import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 from browser_control.browser_controller import BrowserController
+from browser_control.browser_page_pool import BrowserPagePool, PageLease
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,7 @@ class SafeBrowserManager:
     _instance: Optional['SafeBrowserManager'] = None
     _controller: Optional[BrowserController] = None
     _is_initialized: bool = False
+    _init_lock: Optional[asyncio.Lock] = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -23,10 +26,21 @@ class SafeBrowserManager:
     @classmethod
     async def get_controller(cls) -> BrowserController:
         if cls._controller is None or not cls._is_initialized:
-            logger.info("🚀 ブラウザ初期化中...")
-            await cls._initialize()
+            # 並列タスクから同時に呼ばれてもブラウザは1つだけ起動する
+            if cls._init_lock is None:
+                cls._init_lock = asyncio.Lock()
+            async with cls._init_lock:
+                if cls._controller is None or not cls._is_initialized:
+                    logger.info("🚀 ブラウザ初期化中...")
+                    await cls._initialize()
         return cls._controller
     
+    @classmethod
+    async def get_page_pool(cls) -> BrowserPagePool:
+        """ログイン済みプロファイルを共有するチャットタブのプール"""
+        controller = await cls.get_controller()
+        return controller.get_page_pool()
+    
     @classmethod
     async def _initialize(cls):
         try:
@@ -62,3 +76,10 @@ async def get_browser_controller() -> BrowserController:
 
 async def cleanup_browser():
     await SafeBrowserManager.cleanup()
+
+@asynccontextmanager
+async def lease_browser_page(task_id: Optional[str] = None) -> AsyncIterator[PageLease]:
+    """タスク用のチャットタブを借りる（ブロック内ではコントローラがこのタブを使う）"""
+    pool = await SafeBrowserManager.get_page_pool()
+    async with pool.lease(task_id) as lease:
+        yield lease
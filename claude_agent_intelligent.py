@@ -8,13 +8,14 @@
 import os
 import sys
 import subprocess
-import anthropic
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 import json
 import re
 
+from tools.cloud_llm_client import get_cloud_llm_client
+
 load_dotenv()
 
 class IntelligentClaudeAgent:
@@ -23,7 +24,8 @@ class IntelligentClaudeAgent:
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY が設定されていません")
         
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        # レート制限・接続再利用・リトライを共有するクライアント
+        self.client = get_cloud_llm_client()
         self.model = "claude-sonnet-4-20250514"
         self.max_iterations = max_iterations
         
@@ -63,14 +65,18 @@ class IntelligentClaudeAgent:
         self.log(f"送信: {user_message[:150]}...", "DEBUG")
         
         try:
-            message = self.client.messages.create(
+            message = self.client.complete_sync(
+                provider="anthropic",
                 model=self.model,
+                prompt=user_message,
                 max_tokens=3000,
-                messages=[{"role": "user", "content": user_message}]
+                temperature=1.0,
+                api_key=self.api_key
             )
             
-            response = message.content[0].text
-            self.log("📥 Claude応答受信", "CLAUDE")
+            response = message.text
+            self.log(f"📥 Claude応答受信 ({message.latency:.1f}秒, "
+                     f"{message.total_tokens}トークン, ${message.cost:.4f})", "CLAUDE")
             self.log(response[:500] + "..." if len(response) > 500 else response, "CLAUDE")
             self.log("=" * 70, "CLAUDE")
             
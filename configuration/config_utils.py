@@ -254,6 +254,7 @@ class Config:
         
     VIEWPORT_SIZE = {'width': 1024, 'height': 768}
     PAGE_TIMEOUT = 60000
+    BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '3'))  # 同時に使うチャットタブ数
     IMAGE_GENERATION_TIMEOUT = 180
     TEXT_GENERATION_TIMEOUT = 120
     
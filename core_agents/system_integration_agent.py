@@ -7,15 +7,22 @@
 import asyncio
 import logging
 import inspect
+import random
+import time
 import traceback
-from typing import Dict, Any, Optional, Callable
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Callable, Set
 from functools import wraps
 from datetime import datetime
 
-from data_models import ErrorContextModel, BugFixTask, create_bug_fix_task_from_exception
+from tools.error_handler_enhanced import compute_fingerprint
 
 logger = logging.getLogger(__name__)
 
+# フィンガープリントから除外するラッパー自身のフレーム
+# （初回は async_wrapper、リトライ時は _handle_wrapped_error で捕捉されるため）
+_WRAPPER_FRAMES = {"async_wrapper", "sync_wrapper", "_handle_wrapped_error"}
+
 
 class SystemIntegrationAgent:
     """
@@ -26,6 +33,14 @@ class SystemIntegrationAgent:
     - エラー自動検出とルーティング
     - 修正後のタスク再実行
     - システム間の状態同期
+    
+    ラッパーの成功パスは元メソッドを呼ぶだけで、エラー時の処理はすべて
+    _handle_wrapped_error 側で行う。自動修正はフィンガープリントごとに
+    1件だけバックグラウンドで実行し、修正中のエラーは修正の完了
+    （最大 fix_timeout 秒）を待ってからリトライする。修正が成功した直後の
+    1回だけは待たずにリトライし、それ以外はフルジッター付き指数バックオフで
+    待つ。同じエラーが短時間に storm_threshold 件を超えたら、修正の実行中を
+    除いてリトライせず即座に失敗させる。
     """
     
     def __init__(
@@ -34,7 +49,14 @@ class SystemIntegrationAgent:
         hybrid_fix_system=None,
         auto_fix_enabled: bool = True,
         auto_retry_enabled: bool = True,
-        max_retry_attempts: int = 3
+        max_retry_attempts: int = 3,
+        error_history_size: int = 200,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 30.0,
+        fix_cooldown: float = 300.0,
+        fix_timeout: float = 300.0,
+        storm_threshold: int = 20,
+        storm_window: float = 60.0
     ):
         """
         初期化
@@ -45,12 +67,25 @@ class SystemIntegrationAgent:
             auto_fix_enabled: 自動修正有効フラグ
             auto_retry_enabled: 自動リトライ有効フラグ
             max_retry_attempts: 最大リトライ回数
+            error_history_size: 保持するエラー履歴の件数
+            retry_base_delay: リトライ待機の基準秒数
+            retry_max_delay: リトライ待機の上限秒数
+            fix_cooldown: 同じフィンガープリントの自動修正を再実行しない期間（秒）
+            fix_timeout: リトライ前に実行中の自動修正の完了を待つ上限（秒）
+            storm_threshold: この件数を超えたらリトライせず即失敗させる
+            storm_window: エラーストーム判定の時間窓（秒）
         """
         self.ma_executor = ma_task_executor
         self.hybrid_system = hybrid_fix_system
         self.auto_fix_enabled = auto_fix_enabled
         self.auto_retry_enabled = auto_retry_enabled
         self.max_retry_attempts = max_retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.fix_cooldown = fix_cooldown
+        self.fix_timeout = fix_timeout
+        self.storm_threshold = storm_threshold
+        self.storm_window = storm_window
         
         # エラーフックのレジストリ
         self.error_hooks = {}
@@ -60,11 +95,20 @@ class SystemIntegrationAgent:
             "total_errors_caught": 0,
             "auto_fixed_errors": 0,
             "retry_successes": 0,
-            "integration_failures": 0
+            "integration_failures": 0,
+            "auto_fix_triggered": 0,
+            "auto_fix_deduplicated": 0,
+            "storm_fast_failures": 0
         }
         
-        # エラー発生履歴
-        self.error_history = []
+        # エラー発生履歴（直近 error_history_size 件）
+        self.error_history = deque(maxlen=error_history_size)
+        
+        # フィンガープリント別の状態
+        self._fix_tasks: Dict[str, asyncio.Task] = {}  # 実行中の自動修正
+        self._fix_results: "OrderedDict[str, tuple]" = OrderedDict()  # fp -> (完了時刻, 結果)
+        self._occurrences: "OrderedDict[str, deque]" = OrderedDict()  # fp -> 発生時刻
+        self._fresh_fixes: Set[str] = set()  # 修正成功後、まだリトライしていない fp
         
         logger.info("✅ SystemIntegrationAgent 初期化完了")
     
@@ -130,87 +174,224 @@ class SystemIntegrationAgent:
         original_method: Callable,
         method_name: str
     ) -> Callable:
-        """メソッドをエラーハンドラーでラップ"""
+        """
+        メソッドをエラーハンドラーでラップ
         
-        @wraps(original_method)
-        async def wrapper(*args, **kwargs):
-            retry_count = 0
-            last_error = None
-            
-            while retry_count <= self.max_retry_attempts:
+        コルーチン関数かどうかはラップ時に1回だけ判定する。同期メソッドは
+        同期のまま呼べるようにし、エラー時は記録と自動修正の起動だけ行って
+        再送出する（イベントループを止めるリトライ待機はしない）。
+        """
+        if inspect.iscoroutinefunction(original_method):
+            @wraps(original_method)
+            async def async_wrapper(*args, **kwargs):
                 try:
-                    # 元のメソッドを実行
-                    if inspect.iscoroutinefunction(original_method):
-                        result = await original_method(*args, **kwargs)
-                    else:
-                        result = original_method(*args, **kwargs)
-                    
-                    # 成功したらリトライカウントをリセット
-                    if retry_count > 0:
-                        self.stats["retry_successes"] += 1
-                        logger.info(f"✅ リトライ成功: {method_name} (試行{retry_count + 1}回目)")
-                    
-                    return result
-                
+                    return await original_method(*args, **kwargs)
                 except Exception as e:
-                    last_error = e
-                    self.stats["total_errors_caught"] += 1
-                    
-                    logger.error(
-                        f"❌ エラー捕捉: {method_name} "
-                        f"(試行{retry_count + 1}/{self.max_retry_attempts + 1})"
+                    return await self._handle_wrapped_error(
+                        original_method, method_name, args, kwargs, e
                     )
-                    logger.error(f"   エラー: {type(e).__name__}: {str(e)}")
-                    
-                    # タスク情報を取得
-                    task_id = self._extract_task_id(args, kwargs)
-                    file_path = self._extract_file_path(e)
-                    
-                    # エラー履歴に記録
-                    self.error_history.append({
-                        "timestamp": datetime.now().isoformat(),
-                        "method": method_name,
-                        "error_type": type(e).__name__,
-                        "error_message": str(e),
-                        "task_id": task_id,
-                        "retry_count": retry_count
-                    })
-                    
-                    # 自動修正を試行
-                    if self.auto_fix_enabled and self.hybrid_system:
-                        fix_result = await self._attempt_auto_fix(
-                            error=e,
-                            task_id=task_id,
-                            method_name=method_name,
-                            file_path=file_path
-                        )
-                        
-                        if fix_result and fix_result.get("success"):
-                            self.stats["auto_fixed_errors"] += 1
-                            logger.info(f"✅ 自動修正成功: {task_id}")
-                            
-                            # 自動リトライが有効な場合、修正後に再実行
-                            if self.auto_retry_enabled:
-                                retry_count += 1
-                                logger.info(f"🔄 タスク再実行: {task_id} (試行{retry_count + 1}回目)")
-                                await asyncio.sleep(2)  # 少し待機
-                                continue
-                    
-                    # リトライ判定
-                    if retry_count < self.max_retry_attempts and self.auto_retry_enabled:
-                        retry_count += 1
-                        logger.warning(f"🔄 リトライ: {method_name} (試行{retry_count + 1}回目)")
-                        await asyncio.sleep(5)  # リトライ前に待機
-                    else:
-                        # リトライ上限到達
-                        logger.error(f"❌ リトライ上限到達: {method_name}")
-                        raise
+            return async_wrapper
+        
+        @wraps(original_method)
+        def sync_wrapper(*args, **kwargs):
+            try:
+                return original_method(*args, **kwargs)
+            except Exception as e:
+                self._record_error(e, method_name, args, kwargs, retry_count=0)
+                raise
+        return sync_wrapper
+    
+    async def _handle_wrapped_error(
+        self,
+        original_method: Callable,
+        method_name: str,
+        args: tuple,
+        kwargs: dict,
+        error: Exception
+    ) -> Any:
+        """エラー発生後の処理（自動修正の起動・リトライ）"""
+        retry_count = 0
+        
+        while True:
+            fingerprint, fix_task = self._record_error(error, method_name, args, kwargs, retry_count)
+            
+            if not self.auto_retry_enabled or retry_count >= self.max_retry_attempts:
+                logger.error(f"❌ リトライ上限到達: {method_name}")
+                raise error
             
-            # すべてのリトライが失敗
-            if last_error:
-                raise last_error
+            # エラーストーム中は修正が実行中でない限りリトライしない
+            if self._is_storming(fingerprint) and fix_task is None:
+                self.stats["storm_fast_failures"] += 1
+                logger.warning(f"⚠️ エラーストームのためリトライ省略: {method_name}")
+                raise error
+            
+            retry_count += 1
+            
+            # 修正中なら（LLMの応答を含めて）修正の完了を待つ。待機はバックオフとは
+            # 別の fix_timeout で打ち切る
+            if fix_task is not None and not fix_task.done():
+                logger.warning(
+                    f"🔄 リトライ: {method_name} (試行{retry_count + 1}回目, "
+                    f"自動修正の完了を最大{self.fix_timeout:.0f}秒待機)"
+                )
+                await asyncio.wait({fix_task}, timeout=self.fix_timeout)
+                waited_fix = fix_task.done() and self._fix_succeeded(fingerprint)
+            else:
+                waited_fix = False
+            
+            # 修正完了直後の1回だけは待たずにリトライする（修正後も失敗し続けるならバックオフ）
+            if waited_fix or fingerprint in self._fresh_fixes:
+                self._fresh_fixes.discard(fingerprint)
+            else:
+                delay = self._retry_delay(retry_count, fingerprint)
+                logger.warning(
+                    f"🔄 リトライ: {method_name} (試行{retry_count + 1}回目, {delay:.1f}秒待機)"
+                )
+                await asyncio.sleep(delay)
+            
+            try:
+                result = await original_method(*args, **kwargs)
+            except Exception as e:
+                error = e
+                continue
+            
+            self.stats["retry_successes"] += 1
+            logger.info(f"✅ リトライ成功: {method_name} (試行{retry_count + 1}回目)")
+            return result
+    
+    def _record_error(
+        self,
+        error: Exception,
+        method_name: str,
+        args: tuple,
+        kwargs: dict,
+        retry_count: int
+    ) -> tuple:
+        """
+        エラーを記録し、必要なら自動修正を起動
+        
+        Returns:
+            (フィンガープリント, 実行中の自動修正タスク or None)
+        """
+        self.stats["total_errors_caught"] += 1
+        
+        # ソースを読まずにスタックを取得してフィンガープリントを計算
+        stack = traceback.StackSummary.extract(
+            traceback.walk_tb(error.__traceback__), lookup_lines=False
+        )
+        # 捕捉したラッパーのフレームは試行ごとに変わるので除く
+        stack = traceback.StackSummary.from_list([
+            frame for frame in stack
+            if not (frame.name in _WRAPPER_FRAMES and frame.filename == __file__)
+        ])
+        fingerprint = compute_fingerprint(type(error).__name__, str(error), stack)
+        self._note_occurrence(fingerprint)
         
-        return wrapper
+        task_id = self._extract_task_id(args, kwargs)
+        logger.error(
+            f"❌ エラー捕捉: {method_name} (試行{retry_count + 1}/{self.max_retry_attempts + 1}) "
+            f"{type(error).__name__}: {error}"
+        )
+        
+        self.error_history.append({
+            "timestamp": datetime.now().isoformat(),
+            "method": method_name,
+            "error_type": type(error).__name__,
+            "error_message": str(error),
+            "task_id": task_id,
+            "retry_count": retry_count,
+            "fingerprint": fingerprint
+        })
+        
+        fix_task = None
+        if self.auto_fix_enabled and self.hybrid_system:
+            file_path = stack[-1].filename if len(stack) else None
+            fix_task = self._trigger_auto_fix(fingerprint, error, task_id, method_name, file_path)
+        
+        return fingerprint, fix_task
+    
+    def _trigger_auto_fix(
+        self,
+        fingerprint: str,
+        error: Exception,
+        task_id: str,
+        method_name: str,
+        file_path: Optional[str]
+    ) -> Optional[asyncio.Task]:
+        """自動修正をバックグラウンドで起動（同じフィンガープリントは1件のみ）"""
+        running = self._fix_tasks.get(fingerprint)
+        if running is not None:
+            self.stats["auto_fix_deduplicated"] += 1
+            return running
+        
+        finished = self._fix_results.get(fingerprint)
+        if finished is not None and time.monotonic() - finished[0] < self.fix_cooldown:
+            self.stats["auto_fix_deduplicated"] += 1
+            return None
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        
+        self.stats["auto_fix_triggered"] += 1
+        task = loop.create_task(self._attempt_auto_fix(
+            error=error,
+            task_id=task_id,
+            method_name=method_name,
+            file_path=file_path
+        ))
+        self._fix_tasks[fingerprint] = task
+        task.add_done_callback(lambda t, fp=fingerprint: self._on_fix_done(fp, t))
+        return task
+    
+    def _on_fix_done(self, fingerprint: str, task: asyncio.Task):
+        self._fix_tasks.pop(fingerprint, None)
+        result = None if task.cancelled() else task.result()
+        
+        self._fix_results[fingerprint] = (time.monotonic(), result)
+        self._fix_results.move_to_end(fingerprint)
+        while len(self._fix_results) > 1000:
+            self._fix_results.popitem(last=False)
+        
+        if result and result.get("success"):
+            self._fresh_fixes.add(fingerprint)
+            self.stats["auto_fixed_errors"] += 1
+            logger.info(f"✅ 自動修正成功: {fingerprint}")
+    
+    def _fix_succeeded(self, fingerprint: str) -> bool:
+        finished = self._fix_results.get(fingerprint)
+        return bool(finished and finished[1] and finished[1].get("success"))
+    
+    def _note_occurrence(self, fingerprint: str):
+        """フィンガープリントの発生時刻を記録（時間窓外は捨てる）"""
+        now = time.monotonic()
+        times = self._occurrences.get(fingerprint)
+        if times is None:
+            times = deque()
+            self._occurrences[fingerprint] = times
+            if len(self._occurrences) > 1000:
+                self._occurrences.popitem(last=False)
+        else:
+            self._occurrences.move_to_end(fingerprint)
+        times.append(now)
+        while times and now - times[0] > self.storm_window:
+            times.popleft()
+    
+    def _is_storming(self, fingerprint: str) -> bool:
+        times = self._occurrences.get(fingerprint)
+        return bool(times) and len(times) > self.storm_threshold
+    
+    def _retry_delay(self, retry_count: int, fingerprint: str) -> float:
+        """
+        リトライ待機秒数（フルジッター付き指数バックオフ）
+        
+        同じエラーが多発しているほど上限を引き上げ、同時リトライを分散させる。
+        """
+        times = self._occurrences.get(fingerprint)
+        pressure = 1.0 + (len(times) / self.storm_threshold if times else 0.0)
+        ceiling = min(self.retry_max_delay, self.retry_base_delay * (2 ** (retry_count - 1)) * pressure)
+        return random.uniform(0, ceiling)
     
     async def _attempt_auto_fix(
         self,
@@ -337,18 +518,6 @@ class SystemIntegrationAgent:
         
         return f"Unknown-{datetime.now().strftime('%H%M%S')}"
     
-    def _extract_file_path(self, error: Exception) -> Optional[str]:
-        """エラーからファイルパスを抽出"""
-        try:
-            tb = traceback.extract_tb(error.__traceback__)
-            if tb:
-                # 最後のフレームからファイルパスを取得
-                return tb[-1].filename
-        except:
-            pass
-        
-        return None
-    
     def _infer_file_path(self, method_name: str) -> str:
         """メソッド名からファイルパスを推定"""
         # メソッド名からファイル名を推定
@@ -377,7 +546,8 @@ class SystemIntegrationAgent:
         return {
             **self.stats,
             "auto_fix_rate": auto_fix_rate,
-            "recent_errors": self.error_history[-10:]  # 直近10件
+            "auto_fixes_in_progress": len(self._fix_tasks),
+            "recent_errors": list(self.error_history)[-10:]  # 直近10件
         }
     
     def print_stats(self):
@@ -13,6 +13,15 @@ from datetime import datetime
 from pathlib import Path
 
 from data_models import BugFixTask, FixResult, ErrorContextModel
+from tools.cloud_llm_client import CloudLLMError, get_cloud_llm_client
+from tools.llm_response_cache import LLMResponseCache, get_llm_response_cache
+from tools.prompt_budget import (
+    ContextPiece,
+    PRIORITY_HISTORY,
+    TokenBudgetPromptBuilder,
+    error_context_pieces
+)
+from .patch_manager import PatchManager
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +43,11 @@ class CloudFixAgent:
         wp_tester=None,
         api_provider: str = "openai",  # openai, anthropic, google
         api_key: Optional[str] = None,
-        model_name: Optional[str] = None
+        model_name: Optional[str] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        bypass_response_cache: bool = False,
+        prompt_token_budget: int = 6000,
+        patch_manager: Optional[PatchManager] = None
     ):
         """
         初期化
@@ -45,6 +58,10 @@ class CloudFixAgent:
             api_provider: APIプロバイダー
             api_key: APIキー
             model_name: モデル名（省略時はデフォルト）
+            response_cache: LLM応答キャッシュ（省略時はプロセス共有キャッシュ）
+            bypass_response_cache: 応答キャッシュを使わずに毎回APIへ問い合わせる
+            prompt_token_budget: 修正プロンプトのトークン予算
+            patch_manager: 複数ファイルの修正を一括適用するPatchManager
         """
         self.cmd_monitor = command_monitor
         self.wp_tester = wp_tester
@@ -53,11 +70,22 @@ class CloudFixAgent:
         
         # モデル名の設定
         self.model_name = model_name or self._get_default_model()
+        self.temperature = 0.3
+        
+        # 応答キャッシュ
+        self.response_cache = response_cache or get_llm_response_cache()
+        self.bypass_response_cache = bypass_response_cache
+        self.prompt_token_budget = prompt_token_budget
         
         # バックアップディレクトリ
         self.backup_dir = Path("./backups/cloud_fix")
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
+        # 修正は全ファイルまとめて適用し、途中で失敗したら全て元に戻す
+        self.patch_manager = patch_manager or PatchManager(
+            backup_dir=str(self.backup_dir / "patches")
+        )
+        
         # 修正履歴
         self.fix_history = []
         
@@ -67,7 +95,10 @@ class CloudFixAgent:
             "successful_fixes": 0,
             "failed_fixes": 0,
             "total_api_calls": 0,
-            "total_tokens_used": 0
+            "total_tokens_used": 0,
+            "total_cost": 0.0,
+            "cache_hits": 0,
+            "prompt_tokens_saved": 0
         }
         
         # クライアント初期化
@@ -87,41 +118,16 @@ class CloudFixAgent:
     def _init_api_client(self):
         """APIクライアントを初期化"""
         # .env から API キーを読み込む
-        import os
         from dotenv import load_dotenv
         load_dotenv(override=True)
         
         # API キーが設定されていない場合は環境変数から取得
         if not self.api_key:
-            self.api_key = os.getenv('OPENAI_API_KEY')
-        
-        if self.api_provider == "openai":
-            try:
-                import openai
-                self.client = openai.OpenAI(api_key=self.api_key)
-                logger.info(f"✅ OpenAI API クライアント初期化完了 (model={self.model_name})")
-            except ImportError:
-                logger.error("❌ openai パッケージがインストールされていません")
-                self.client = None
-        
-        elif self.api_provider == "anthropic":
-            try:
-                import anthropic
-                self.client = anthropic.Anthropic(api_key=self.api_key)
-                logger.info(f"✅ Anthropic API クライアント初期化完了 (model={self.model_name})")
-            except ImportError:
-                logger.error("❌ anthropic パッケージがインストールされていません")
-                self.client = None
+            self.api_key = os.getenv(f"{self.api_provider.upper()}_API_KEY")
         
-        elif self.api_provider == "google":
-            try:
-                import google.generativeai as genai
-                genai.configure(api_key=self.api_key)
-                self.client = genai.GenerativeModel(self.model_name)
-                logger.info(f"✅ Google Gemini API クライアント初期化完了 (model={self.model_name})")
-            except ImportError:
-                logger.error("❌ google-generativeai パッケージがインストールされていません")
-                self.client = None
+        # 全エージェントでレート制限・接続を共有するクライアント
+        self.client = get_cloud_llm_client()
+        logger.info(f"✅ クラウドLLMクライアント初期化完了 (provider={self.api_provider}, model={self.model_name})")
     
     async def execute_bug_fix_task(self, bug_fix_task: BugFixTask) -> FixResult:
         """
@@ -144,7 +150,10 @@ class CloudFixAgent:
             self.stats["total_fixes"] += 1
             
             # 1. 詳細な修正プロンプトを構築
-            fix_prompt = self._build_detailed_fix_prompt(bug_fix_task.error_context)
+            fix_prompt = self._build_detailed_fix_prompt(
+                bug_fix_task.error_context,
+                bug_fix_task.target_files
+            )
             logger.info(f"📝 詳細プロンプト構築完了 ({len(fix_prompt)}文字)")
             
             # 2. クラウドAIに修正を依頼
@@ -173,6 +182,7 @@ class CloudFixAgent:
             apply_result = await self._apply_fix_code(modified_files, generated_code)
             
             if not apply_result['success']:
+                self.response_cache.invalidate(ai_result.get('cache_key'))
                 self.stats["failed_fixes"] += 1
                 return self._create_failed_result(
                     task_id,
@@ -190,6 +200,8 @@ class CloudFixAgent:
                     logger.warning(f"⚠️ テスト失敗: {test_result.get('error')}")
                     # バックアップから復元
                     await self._restore_from_backup(backup_path)
+                    # 失敗した修正を再利用しないようにキャッシュから除外
+                    self.response_cache.invalidate(ai_result.get('cache_key'))
                     self.stats["failed_fixes"] += 1
                     return self._create_failed_result(
                         task_id,
@@ -231,20 +243,27 @@ class CloudFixAgent:
             self.stats["failed_fixes"] += 1
             return self._create_failed_result(task_id, str(e), start_time)
     
-    def _build_detailed_fix_prompt(self, error_context: ErrorContextModel) -> str:
+    def _build_detailed_fix_prompt(
+        self,
+        error_context: ErrorContextModel,
+        target_files: Optional[List[str]] = None
+    ) -> str:
         """
         クラウドAI用の詳細なプロンプトを構築
         
+        コンテキスト要素を優先度順にトークン予算内へ詰める
+        
         Args:
             error_context: エラーコンテキスト
+            target_files: 修正対象ファイル（import抽出に使用）
             
         Returns:
             str: 詳細な修正プロンプト
         """
-        prompt_parts = []
+        builder = TokenBudgetPromptBuilder(self.prompt_token_budget)
         
         # システムプロンプト
-        prompt_parts.append("""あなたは熟練したPython開発者であり、エラー修正のエキスパートです。
+        builder.add_header("""あなたは熟練したPython開発者であり、エラー修正のエキスパートです。
 以下のエラーを分析し、最適な修正コードを生成してください。
 
 ## 出力形式
@@ -266,65 +285,41 @@ class CloudFixAgent:
 }
 ```
 """)
-        prompt_parts.append("")
-        
-        # エラー情報（詳細）
-        prompt_parts.append("=" * 60)
-        prompt_parts.append("【エラー情報】")
-        prompt_parts.append("=" * 60)
-        prompt_parts.append(f"エラータイプ: {error_context.error_type}")
-        prompt_parts.append(f"エラーメッセージ: {error_context.error_message}")
-        prompt_parts.append(f"深刻度: {error_context.severity.value}")
-        prompt_parts.append(f"カテゴリ: {error_context.error_category.value}")
-        prompt_parts.append(f"発生ファイル: {(error_context.error_location.file_path if error_context.error_location else "unknown")}:{(error_context.error_location.line_number if error_context.error_location else 0)}")
-        prompt_parts.append("")
+        builder.add_header("=" * 60)
+        builder.add_header("【エラー情報】")
+        builder.add_header("=" * 60)
+        builder.add_header(f"深刻度: {error_context.severity.value}")
+        builder.add_header(f"カテゴリ: {error_context.error_category.value}")
+        builder.add_header("")
         
-        # スタックトレース（全体）
-        if error_context.full_traceback:
-            prompt_parts.append("【完全なスタックトレース】")
-            prompt_parts.append("```python")
-            prompt_parts.append(error_context.full_traceback)
-            prompt_parts.append("```")
-            prompt_parts.append("")
+        builder.add_pieces(error_context_pieces(error_context, target_files))
         
-        # 周辺コード（詳細）
-        if error_context.surrounding_code:
-            prompt_parts.append("【周辺コード（前後10行）】")
-            prompt_parts.append("```python")
-            prompt_parts.append(error_context.surrounding_code)
-            prompt_parts.append("```")
-            prompt_parts.append("")
-        
-        # ローカル変数（全体）
-        if error_context.local_variables:
-            prompt_parts.append("【ローカル変数の状態】")
-            prompt_parts.append("```python")
-            for var_name, var_value in error_context.local_variables.items():
-                prompt_parts.append(f"{var_name} = {var_value}")
-            prompt_parts.append("```")
-            prompt_parts.append("")
+        # 過去の修正履歴（参考）
+        recent_fixes = [fix for fix in self.fix_history[-3:] if fix.get('success')]
+        if recent_fixes:
+            builder.add_piece(ContextPiece(
+                "fix_history",
+                "【過去の修正履歴（参考）】",
+                "\n".join(
+                    f"- {fix['task_id']}: 成功 (信頼度={fix.get('confidence', 'N/A')})"
+                    for fix in recent_fixes
+                ),
+                PRIORITY_HISTORY
+            ))
         
-        # コンテキスト情報
-        if hasattr(error_context, "context_info") and error_context.context_info:
-            prompt_parts.append("【追加コンテキスト】")
-            for key, value in getattr(error_context, "context_info", {}).items():
-                prompt_parts.append(f"- {key}: {value}")
-            prompt_parts.append("")
+        builder.add_footer("=" * 60)
+        builder.add_footer("上記の情報を基に、最適な修正コードをJSON形式で提供してください。")
+        builder.add_footer("=" * 60)
         
-        # 過去の修正履歴（参考）
-        if self.fix_history:
-            prompt_parts.append("【過去の修正履歴（参考）】")
-            recent_fixes = self.fix_history[-3:]  # 直近3件
-            for fix in recent_fixes:
-                if fix.get('success'):
-                    prompt_parts.append(f"- {fix['task_id']}: 成功 (信頼度={fix.get('confidence', 'N/A')})")
-            prompt_parts.append("")
+        prompt, report = builder.build()
         
-        prompt_parts.append("=" * 60)
-        prompt_parts.append("上記の情報を基に、最適な修正コードをJSON形式で提供してください。")
-        prompt_parts.append("=" * 60)
+        self.stats["prompt_tokens_saved"] += report["saved_tokens"]
+        logger.info(
+            f"📏 プロンプト予算: {report['used_tokens']}/{report['budget']}トークン "
+            f"(削減={report['saved_tokens']}, 切り詰め={report['truncated']}, 省略={report['dropped']})"
+        )
         
-        return "\n".join(prompt_parts)
+        return prompt
     
     async def _request_cloud_ai_fix(self, prompt: str) -> Dict[str, Any]:
         """
@@ -337,19 +332,38 @@ class CloudFixAgent:
             Dict: AI応答結果
         """
         try:
+            cached = self.response_cache.get(
+                self.api_provider, self.model_name, self.temperature, prompt,
+                bypass=self.bypass_response_cache
+            )
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                logger.info("⚡ クラウドAI応答キャッシュヒット")
+                return {
+                    **cached,
+                    "cache_hit": True,
+                    "cache_key": self.response_cache.make_key(
+                        self.api_provider, self.model_name, self.temperature, prompt
+                    )
+                }
+            
             self.stats["total_api_calls"] += 1
             
-            if self.api_provider == "openai":
-                return await self._request_openai(prompt)
-            elif self.api_provider == "anthropic":
-                return await self._request_anthropic(prompt)
-            elif self.api_provider == "google":
-                return await self._request_google(prompt)
-            else:
+            if self.api_provider not in ("openai", "anthropic", "google"):
                 return {
                     "success": False,
                     "error": f"未サポートのプロバイダー: {self.api_provider}"
                 }
+            
+            result = await self._request_provider(prompt)
+            
+            if result.get("success"):
+                result["cache_key"] = self.response_cache.put(
+                    self.api_provider, self.model_name, self.temperature, prompt, result,
+                    bypass=self.bypass_response_cache
+                )
+            
+            return result
                 
         except Exception as e:
             logger.error(f"❌ AI API呼び出しエラー: {e}", exc_info=True)
@@ -358,24 +372,24 @@ class CloudFixAgent:
                 "error": str(e)
             }
     
-    async def _request_openai(self, prompt: str) -> Dict[str, Any]:
-        """OpenAI APIにリクエスト"""
+    async def _request_provider(self, prompt: str) -> Dict[str, Any]:
+        """共有クライアント経由でプロバイダーにリクエスト"""
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.complete(
+                provider=self.api_provider,
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "あなたは熟練したPython開発者です。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
+                prompt=prompt,
+                system="あなたは熟練したPython開発者です。",
+                temperature=self.temperature,
+                max_tokens=4096,
+                json_mode=True,
+                api_key=self.api_key
             )
             
-            content = response.choices[0].message.content
-            self.stats["total_tokens_used"] += response.usage.total_tokens
+            self.stats["total_tokens_used"] += response.total_tokens
+            self.stats["total_cost"] += response.cost
             
-            result = json.loads(content)
+            result = json.loads(response.text)
             
             return {
                 "success": True,
@@ -384,70 +398,56 @@ class CloudFixAgent:
                 "confidence": result.get("confidence", 0.8),
                 "reasoning": result.get("reasoning", ""),
                 "analysis": result.get("analysis", ""),
-                "test_suggestions": result.get("test_suggestions", [])
+                "test_suggestions": result.get("test_suggestions", []),
+                "latency": response.latency
             }
             
-        except Exception as e:
-            logger.error(f"❌ OpenAI API エラー: {e}")
+        except CloudLLMError as e:
+            logger.error(f"❌ {self.api_provider} API エラー: {e}")
             return {"success": False, "error": str(e)}
+        except json.JSONDecodeError as e:
+            logger.error(f"❌ {self.api_provider} 応答のJSON解析エラー: {e}")
+            return {"success": False, "error": f"JSON解析エラー: {e}"}
     
-    async def _request_anthropic(self, prompt: str) -> Dict[str, Any]:
-        """Anthropic APIにリクエスト"""
-        try:
-            response = await asyncio.to_thread(
-                self.client.messages.create,
-                model=self.model_name,
-                max_tokens=4096,
-                temperature=0.3,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            content = response.content[0].text
-            self.stats["total_tokens_used"] += response.usage.input_tokens + response.usage.output_tokens
-            
-            result = json.loads(content)
-            
-            return {
-                "success": True,
-                "generated_code": result.get("modified_files", {}),
-                "modified_files": list(result.get("modified_files", {}).keys()),
-                "confidence": result.get("confidence", 0.8),
-                "reasoning": result.get("reasoning", ""),
-                "analysis": result.get("analysis", "")
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Anthropic API エラー: {e}")
-            return {"success": False, "error": str(e)}
+    async def generate_fix_candidate(self, bug_fix_task: BugFixTask) -> Dict[str, Any]:
+        """
+        修正候補を生成（ファイルには適用しない）
+        
+        LocalFixAgent の投機モードから呼ばれ、検証と適用は呼び出し側が行う。
+        
+        Returns:
+            Dict: success, patches（ファイルパス -> 新しい内容）, confidence, reasoning, cache_key
+        """
+        fix_prompt = self._build_detailed_fix_prompt(
+            bug_fix_task.error_context,
+            bug_fix_task.target_files
+        )
+        ai_result = await self._request_cloud_ai_fix(fix_prompt)
+        if not ai_result['success']:
+            return ai_result
+        
+        patches = self._build_patches(
+            ai_result.get('modified_files', bug_fix_task.target_files),
+            ai_result['generated_code']
+        )
+        return {
+            "success": bool(patches),
+            "patches": patches,
+            "confidence": ai_result.get('confidence', 0.0),
+            "reasoning": ai_result.get('reasoning', ''),
+            "cache_key": ai_result.get('cache_key')
+        }
     
-    async def _request_google(self, prompt: str) -> Dict[str, Any]:
-        """Google Gemini APIにリクエスト"""
-        try:
-            response = await asyncio.to_thread(
-                self.client.generate_content,
-                prompt,
-                generation_config={
-                    "temperature": 0.3,
-                    "response_mime_type": "application/json"
-                }
-            )
-            
-            content = response.text
-            result = json.loads(content)
-            
-            return {
-                "success": True,
-                "generated_code": result.get("modified_files", {}),
-                "modified_files": list(result.get("modified_files", {}).keys()),
-                "confidence": result.get("confidence", 0.8),
-                "reasoning": result.get("reasoning", "")
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Google Gemini API エラー: {e}")
-            return {"success": False, "error": str(e)}
+    @staticmethod
+    def _build_patches(modified_files: List[str], code: Any) -> Dict[str, str]:
+        """AI応答のコードを {ファイルパス: 新しい内容} に揃える"""
+        if isinstance(code, dict):
+            # 辞書形式（ファイルパス: コード）
+            return dict(code)
+        if modified_files and code:
+            # 単一コード
+            return {modified_files[0]: code}
+        return {}
     
     async def _create_backup(self, target_files: List[str]) -> Path:
         """バックアップを作成"""
@@ -464,22 +464,18 @@ class CloudFixAgent:
         return backup_subdir
     
     async def _apply_fix_code(self, modified_files: Dict[str, str], code: str) -> Dict[str, Any]:
-        """修正コードを適用"""
+        """修正コードを適用（複数ファイルは1トランザクションで適用）"""
         try:
-            if isinstance(code, dict):
-                # 辞書形式（ファイルパス: コード）
-                for file_path, file_code in code.items():
-                    target = Path(file_path)
-                    await asyncio.to_thread(target.write_text, file_code, encoding='utf-8')
+            patches = self._build_patches(modified_files, code)
+            if not patches:
+                return {"success": True}
+            
+            # バックアップは _create_backup で取得済み
+            result = await self.patch_manager.apply_patches(patches, backup=False)
+            if result["success"]:
+                for file_path in result.get("changed_files", []):
                     logger.info(f"✅ 修正適用: {file_path}")
-            else:
-                # 単一コード
-                if modified_files:
-                    target = Path(modified_files[0])
-                    await asyncio.to_thread(target.write_text, code, encoding='utf-8')
-                    logger.info(f"✅ 修正適用: {modified_files[0]}")
-            
-            return {"success": True}
+            return result
             
         except Exception as e:
             logger.error(f"❌ 修正コード適用エラー: {e}")
@@ -543,5 +539,6 @@ class CloudFixAgent:
             **self.stats,
             "success_rate": success_rate,
             "provider": self.api_provider,
-            "model": self.model_name
+            "model": self.model_name,
+            "client_metrics": self.client.get_metrics().get(self.api_provider, {})
         }
\ No newline at end of file
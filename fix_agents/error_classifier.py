@@ -4,15 +4,39 @@
 エラーの複雑度と種類を判定
 """
 
+import hashlib
 import logging
 import re
-from typing import Dict, Any, Optional
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Pattern, Tuple
 from enum import Enum
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
 
+# 複雑度要因の判定キーワード: (要因, キーワード, 大文字小文字を無視するか, 全キーワード必須か)
+FACTOR_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...], bool, bool], ...] = (
+    ("async_code", ("async ", "await "), False, False),
+    ("class_hierarchy", ("class ", "super()"), False, True),
+    ("external_dependency", ("import ", "from "), False, False),
+    ("database_operation", ("sql", "database", "db.", "cursor", "query"), True, False),
+    ("network_operation", ("http", "request", "socket", "api"), True, False),
+    ("file_operation", ("open(", "file", "read(", "write("), True, False),
+    ("concurrency", ("thread", "process", "lock", "queue"), True, False),
+)
+
+# スタックトレース中のファイル名
+_TRACEBACK_FILE_RE = re.compile(r'File "(.*?)"')
+
+# 既知パターンに無いエラータイプのカテゴリ推定（上から順に判定）
+_CATEGORY_FALLBACKS: Tuple[Tuple[Pattern, str], ...] = (
+    (re.compile(r"Import|Module"), "import"),
+    (re.compile(r"Syntax|Indent"), "syntax"),
+    (re.compile(r"Runtime"), "runtime"),
+)
+
+
 @dataclass
 class ErrorContextModel:
     """エラーコンテキストのデータモデル"""
@@ -52,9 +76,25 @@ class ErrorClassifier:
     - 信頼度スコアの算出
     """
     
-    def __init__(self):
-        """初期化"""
+    def __init__(self, cache_size: int = 4096):
+        """
+        初期化
+        
+        Args:
+            cache_size: 分類結果をメモ化する件数（0で無効）
+        """
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        
+        self.stats = {
+            "classifications": 0,
+            "cache_hits": 0,
+            "batch_calls": 0,
+            "batch_items": 0
+        }
+        
         self._init_classification_rules()
+        self._compile_dispatch_tables()
         logger.info("✅ ErrorClassifier 初期化完了")
     
     def _init_classification_rules(self):
@@ -98,6 +138,36 @@ class ErrorClassifier:
             "concurrency": 2.0,          # 並行処理
         }
     
+    def _compile_dispatch_tables(self):
+        """
+        分類に使う表と正規表現を事前に組み立てる
+        
+        - エラータイプ -> (カテゴリ, 基本スコア, 既知パターンか) を1回の辞書引きで得る
+        - 複雑度要因のキーワードは小文字化済みの表にし、コードの小文字化は1回だけ行う
+        
+        キーワードが短く数も少ないため、1つの正規表現にまとめるより
+        部分文字列検索（in）を並べる方が速い（scripts/benchmark_error_classifier.py）。
+        """
+        self._type_table: Dict[str, Tuple[ErrorCategory, float, bool]] = {}
+        for patterns, base_score in (
+            (self.complex_patterns, 2.0),
+            (self.medium_patterns, 1.0),
+            (self.simple_patterns, 0.3),
+        ):
+            for error_type, category in patterns.items():
+                self._type_table[error_type] = (category, base_score, True)
+        
+        # (要因, キーワード, 大文字小文字を無視するか, 全キーワード必須か)
+        self._factor_table: List[Tuple[str, Tuple[str, ...], bool, bool]] = [
+            (factor, tuple(k.lower() for k in keywords) if ignore_case else keywords,
+             ignore_case, require_all)
+            for factor, keywords, ignore_case, require_all in FACTOR_KEYWORDS
+        ]
+    
+    # ========================================
+    # 公開API
+    # ========================================
+    
     def classify(self, error_context: ErrorContextModel) -> Dict[str, Any]:
         """
         エラーを分類
@@ -108,39 +178,131 @@ class ErrorClassifier:
         Returns:
             Dict: 分類結果
         """
+        result = self._classify_cached(error_context)
+        
+        logger.info(
+            f"📊 エラー分類: {result['error_type']} → "
+            f"{result['category']}/{result['complexity']} "
+            f"(スコア={result['complexity_score']:.2f}, 信頼度={result['confidence']:.2f})"
+        )
+        
+        return result
+    
+    def classify_batch(self, error_contexts: Iterable[ErrorContextModel]) -> List[Dict[str, Any]]:
+        """
+        複数のエラーをまとめて分類
+        
+        同じフィンガープリントのエラーはメモ化により1回だけ分類し、ログは最後に
+        集計を1行だけ出す。
+        
+        Args:
+            error_contexts: エラーコンテキストのリスト
+            
+        Returns:
+            List[Dict]: 入力と同じ順の分類結果
+        """
+        results = [self._classify_cached(context) for context in error_contexts]
+        
+        self.stats["batch_calls"] += 1
+        self.stats["batch_items"] += len(results)
+        
+        if results:
+            summary = Counter(result["complexity"] for result in results)
+            logger.info(
+                f"📊 エラー一括分類: {len(results)}件 "
+                f"({', '.join(f'{k}={v}' for k, v in sorted(summary.items()))})"
+            )
+        
+        return results
+    
+    @staticmethod
+    def fingerprint(error_context: ErrorContextModel) -> str:
+        """
+        分類結果を決める入力のフィンガープリント
+        
+        分類に使う値（エラータイプ・メッセージの有無・周辺コード・
+        スタックトレース）だけから算出するので、一致すれば結果も一致する。
+        """
+        message = error_context.error_message or ""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (
+            error_context.error_type or "",
+            "1" if len(message) > 10 else "0",
+            error_context.surrounding_code or "",
+            error_context.full_traceback or "",
+        ):
+            data = part.encode("utf-8", errors="surrogatepass")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    def clear_cache(self):
+        self._cache.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        return {**self.stats, "cache_entries": len(self._cache)}
+    
+    # ========================================
+    # 分類処理
+    # ========================================
+    
+    def _classify_cached(self, error_context: ErrorContextModel) -> Dict[str, Any]:
+        """メモ化付きで分類（呼び出し側が変更しても影響しないようコピーを返す）"""
+        self.stats["classifications"] += 1
+        
+        if self.cache_size <= 0:
+            return self._classify_uncached(error_context)
+        
+        try:
+            key = self.fingerprint(error_context)
+        except Exception:
+            return self._classify_uncached(error_context)
+        
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            result = dict(cached)
+        else:
+            result = self._classify_uncached(error_context)
+            self._cache[key] = dict(result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        result["error_type"] = error_context.error_type
+        result["factors"] = list(result["factors"])
+        return result
+    
+    def _classify_uncached(self, error_context: ErrorContextModel) -> Dict[str, Any]:
         try:
             # 基本分類
             error_type = error_context.error_type
-            category = self._classify_category(error_type)
+            category, base_score, known = self._lookup_type(error_type)
             
             # 複雑度判定
-            complexity_score = self._calculate_complexity_score(error_context)
+            factors = self._identify_complexity_factors(error_context)
+            complexity_score = base_score
+            for factor in factors:
+                complexity_score *= self.complexity_factors.get(factor, 1.0)
             complexity = self._determine_complexity(complexity_score)
             
             # 信頼度計算
-            confidence = self._calculate_confidence(error_context, category, complexity)
+            confidence = self._calculate_confidence(error_context, category, complexity, known)
             
             # 推奨戦略
             recommended_strategy = self._recommend_strategy(complexity, confidence)
             
-            result = {
+            return {
                 "error_type": error_type,
                 "category": category.value,
                 "complexity": complexity.value,
                 "complexity_score": complexity_score,
                 "confidence": confidence,
                 "recommended_strategy": recommended_strategy,
-                "factors": self._identify_complexity_factors(error_context)
+                "factors": factors
             }
             
-            logger.info(
-                f"📊 エラー分類: {error_type} → "
-                f"{category.value}/{complexity.value} "
-                f"(スコア={complexity_score:.2f}, 信頼度={confidence:.2f})"
-            )
-            
-            return result
-            
         except Exception as e:
             logger.error(f"❌ エラー分類失敗: {e}", exc_info=True)
             
@@ -155,97 +317,67 @@ class ErrorClassifier:
                 "factors": []
             }
     
+    def _lookup_type(self, error_type: str) -> Tuple[ErrorCategory, float, bool]:
+        """エラータイプの (カテゴリ, 基本スコア, 既知パターンか)（未知のタイプも表に追加）"""
+        entry = self._type_table.get(error_type)
+        if entry is None:
+            category = ErrorCategory.UNKNOWN
+            for pattern, value in _CATEGORY_FALLBACKS:
+                if pattern.search(error_type or ""):
+                    category = ErrorCategory(value)
+                    break
+            entry = (category, 1.0, False)
+            if len(self._type_table) < 10000:
+                self._type_table[error_type] = entry
+        return entry
+    
     def _classify_category(self, error_type: str) -> ErrorCategory:
         """エラーカテゴリを分類"""
-        
-        # 単純パターンチェック
-        if error_type in self.simple_patterns:
-            return self.simple_patterns[error_type]
-        
-        # 中程度パターンチェック
-        if error_type in self.medium_patterns:
-            return self.medium_patterns[error_type]
-        
-        # 複雑パターンチェック
-        if error_type in self.complex_patterns:
-            return self.complex_patterns[error_type]
-        
-        # その他のパターンマッチング
-        if "Import" in error_type or "Module" in error_type:
-            return ErrorCategory.IMPORT
-        
-        if "Syntax" in error_type or "Indent" in error_type:
-            return ErrorCategory.SYNTAX
-        
-        if "Runtime" in error_type:
-            return ErrorCategory.RUNTIME
-        
-        # デフォルト
-        return ErrorCategory.UNKNOWN
+        return self._lookup_type(error_type)[0]
     
     def _calculate_complexity_score(self, error_context: ErrorContextModel) -> float:
         """複雑度スコアを計算"""
-        
-        base_score = 1.0
-        
-        # エラータイプによる基本スコア
-        if error_context.error_type in self.simple_patterns:
-            base_score = 0.3
-        elif error_context.error_type in self.medium_patterns:
-            base_score = 1.0
-        elif error_context.error_type in self.complex_patterns:
-            base_score = 2.0
-        
-        # 複雑度要因を適用
-        factors = self._identify_complexity_factors(error_context)
-        
-        for factor in factors:
-            weight = self.complexity_factors.get(factor, 1.0)
-            base_score *= weight
-        
+        base_score = self._lookup_type(error_context.error_type)[1]
+        for factor in self._identify_complexity_factors(error_context):
+            base_score *= self.complexity_factors.get(factor, 1.0)
         return base_score
     
     def _identify_complexity_factors(self, error_context: ErrorContextModel) -> list:
-        """複雑度要因を特定"""
+        """複雑度要因を特定（周辺コードのキーワードとスタックトレースのファイル数）"""
         factors = []
         
         # コンテキスト情報から判定
         code = error_context.surrounding_code or ""
         traceback = error_context.full_traceback or ""
         
-        # 非同期コード
-        if "async " in code or "await " in code:
-            factors.append("async_code")
-        
-        # クラス階層
-        if "class " in code and "super()" in code:
-            factors.append("class_hierarchy")
-        
-        # 外部依存関係
-        if "import " in code or "from " in code:
-            factors.append("external_dependency")
-        
-        # データベース操作
-        if any(db in code.lower() for db in ["sql", "database", "db.", "cursor", "query"]):
-            factors.append("database_operation")
-        
-        # ネットワーク操作
-        if any(net in code.lower() for net in ["http", "request", "socket", "api"]):
-            factors.append("network_operation")
-        
-        # ファイル操作
-        if any(file_op in code.lower() for file_op in ["open(", "file", "read(", "write("]):
-            factors.append("file_operation")
-        
-        # 並行処理
-        if any(conc in code.lower() for conc in ["thread", "process", "lock", "queue"]):
-            factors.append("concurrency")
-        
-        # 複数ファイル（スタックトレースから判定）
+        if code:
+            lowered = code.lower()
+            for factor, keywords, ignore_case, require_all in self._factor_table:
+                text = lowered if ignore_case else code
+                if require_all:
+                    matched = True
+                    for keyword in keywords:
+                        if keyword not in text:
+                            matched = False
+                            break
+                else:
+                    matched = False
+                    for keyword in keywords:
+                        if keyword in text:
+                            matched = True
+                            break
+                if matched:
+                    factors.append(factor)
+        
+        # 複数ファイル（スタックトレースから判定、2ファイル目が見つかれば十分）
         if traceback:
-            file_count = len(set(re.findall(r'File "(.*?)"', traceback)))
-            if file_count > 1:
-                factors.append("multi_file")
+            first_file = None
+            for match in _TRACEBACK_FILE_RE.finditer(traceback):
+                if first_file is None:
+                    first_file = match.group(1)
+                elif match.group(1) != first_file:
+                    factors.append("multi_file")
+                    break
         
         return factors
     
@@ -263,16 +395,17 @@ class ErrorClassifier:
         self, 
         error_context: ErrorContextModel,
         category: ErrorCategory,
-        complexity: ErrorComplexity
+        complexity: ErrorComplexity,
+        known: Optional[bool] = None
     ) -> float:
         """分類の信頼度を計算"""
         
         confidence = 0.5  # 基本値
         
         # エラータイプが既知パターンに一致する場合は高信頼度
-        if error_context.error_type in self.simple_patterns or \
-           error_context.error_type in self.medium_patterns or \
-           error_context.error_type in self.complex_patterns:
+        if known is None:
+            known = self._lookup_type(error_context.error_type)[2]
+        if known:
             confidence += 0.3
         
         # エラーメッセージが明確な場合
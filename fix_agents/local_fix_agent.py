@@ -7,15 +7,58 @@
 import asyncio
 import logging
 import re
-from typing import Dict, Any, List, Optional
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 
 from data_models import BugFixTask, FixResult, ErrorContextModel
+from tools.llm_response_cache import LLMResponseCache, get_llm_response_cache
+from tools.verification_engine import VerificationEngine
+
+from .patch_manager import PatchManager
 
 logger = logging.getLogger(__name__)
 
 
+# ルールベース修正で使う正規表現（メッセージ解析・コード書き換え）
+_CANNOT_IMPORT_RE = re.compile(r"cannot import name '(\w+)' from '([\w.]+)'")
+_NO_MODULE_RE = re.compile(r"No module named '([\w.]+)'")
+_NO_ATTRIBUTE_RE = re.compile(r"'(\w+)' object has no attribute '(\w+)'")
+_NOT_DEFINED_RE = re.compile(r"name '(\w+)' is not defined")
+_KEY_ERROR_RE = re.compile(r"KeyError: '(\w+)'")
+_FIRST_CALL_RE = re.compile(r'(\w+)\(')
+_CODE_BLOCK_RE = re.compile(r'```python\n(.*?)\n```', re.DOTALL)
+_SYNTAX_FIXES = (
+    (re.compile(r':\s*$'), ':  # Fixed missing colon'),
+    (re.compile(r'\)\s*$'), ')  # Fixed missing parenthesis'),
+    (re.compile(r']\s*$'), ']  # Fixed missing bracket'),
+)
+
+
+# 候補の生成元ごとの信頼度
+CANDIDATE_CONFIDENCE = {
+    "rule": 0.9,
+    "local_ai": 0.7,
+    "cloud": 0.8
+}
+
+
+@dataclass
+class FixCandidate:
+    """投機実行で生成した修正候補"""
+    source: str                   # rule / local_ai / cloud
+    patches: Dict[str, str]       # ファイルパス -> 新しい内容
+    confidence: float = 0.0
+    reasoning: str = ""
+    verified: bool = False
+    errors: List[str] = field(default_factory=list)
+    generation_time: float = 0.0
+    verification_time: float = 0.0
+    cache_key: Optional[str] = None  # AI応答のキャッシュキー（棄却時に無効化）
+
+
 class LocalFixAgent:
     """
     ローカル修正エージェント
@@ -32,7 +75,15 @@ class LocalFixAgent:
         command_monitor,
         wp_tester=None,
         use_local_ai: bool = True,
-        ai_chat_agent=None  # browser_ai_chat_agent経由でGemini/DeepSeek
+        ai_chat_agent=None,  # browser_ai_chat_agent経由でGemini/DeepSeek
+        response_cache: Optional[LLMResponseCache] = None,
+        bypass_response_cache: bool = False,
+        speculative: bool = False,
+        cloud_agent=None,
+        verification_engine: Optional[VerificationEngine] = None,
+        patch_manager: Optional[PatchManager] = None,
+        speculative_timeout: float = 300.0,
+        backup_dir: str = "./backups/local_fix"
     ):
         """
         初期化
@@ -42,14 +93,30 @@ class LocalFixAgent:
             wp_tester: WordPressTester
             use_local_ai: ローカルAI使用フラグ
             ai_chat_agent: AIチャットエージェント
+            response_cache: LLM応答キャッシュ（省略時はプロセス共有キャッシュ）
+            bypass_response_cache: 応答キャッシュを使わずに毎回AIへ問い合わせる
+            speculative: 投機モード（ルール・ローカルAI・クラウドの候補を同時に生成し、
+                一時コピー上で最初に検証を通った候補だけを適用する）
+            cloud_agent: 投機モードで候補を生成する CloudFixAgent
+            verification_engine: 候補の検証エンジン（省略時はカレントディレクトリを対象に作成）
+            patch_manager: 採用した候補の適用に使う PatchManager
+            speculative_timeout: 投機モード全体のタイムアウト（秒）
+            backup_dir: 修正前バックアップの保存先
         """
         self.cmd_monitor = command_monitor
         self.wp_tester = wp_tester
         self.use_local_ai = use_local_ai
         self.ai_chat = ai_chat_agent
+        self.response_cache = response_cache or get_llm_response_cache()
+        self.bypass_response_cache = bypass_response_cache
+        self.speculative = speculative
+        self.cloud_agent = cloud_agent
+        self.speculative_timeout = speculative_timeout
+        self._verifier = verification_engine
+        self._patch_manager = patch_manager
         
         # バックアップディレクトリ
-        self.backup_dir = Path("./backups/local_fix")
+        self.backup_dir = Path(backup_dir)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
         # 統計情報
@@ -58,13 +125,36 @@ class LocalFixAgent:
             "successful_fixes": 0,
             "failed_fixes": 0,
             "rule_based_fixes": 0,
-            "ai_based_fixes": 0
+            "ai_based_fixes": 0,
+            "ai_cache_hits": 0,
+            "speculative_runs": 0,
+            "speculative_candidates": 0,
+            "speculative_rejected": 0,
+            "speculative_discarded": 0,
+            "speculative_wins": {}
         }
         
         # ルールベース修正パターン
         self._init_fix_patterns()
         
-        logger.info(f"✅ LocalFixAgent 初期化完了 (AI使用={'有効' if use_local_ai else '無効'})")
+        logger.info(
+            f"✅ LocalFixAgent 初期化完了 (AI使用={'有効' if use_local_ai else '無効'}, "
+            f"投機モード={'有効' if speculative else '無効'})"
+        )
+    
+    @property
+    def verifier(self) -> VerificationEngine:
+        if self._verifier is None:
+            # 投機モードでは候補（ルール・ローカルAI・クラウド）を同時に検証するので
+            # インポートチェック用ワーカーも候補の数だけ用意する
+            self._verifier = VerificationEngine(import_workers=3 if self.speculative else 1)
+        return self._verifier
+    
+    @property
+    def patch_manager(self) -> PatchManager:
+        if self._patch_manager is None:
+            self._patch_manager = PatchManager(backup_dir=str(self.backup_dir / "patches"))
+        return self._patch_manager
     
     def _init_fix_patterns(self):
         """修正パターンを初期化"""
@@ -110,6 +200,9 @@ class LocalFixAgent:
             
             self.stats["total_fixes"] += 1
             
+            if self.speculative:
+                return await self._execute_speculative_fix(bug_fix_task, start_time)
+            
             error_context = bug_fix_task.error_context
             error_type = error_context.error_type
             
@@ -192,15 +285,12 @@ class LocalFixAgent:
     
     async def _try_rule_based_fix(self, bug_fix_task: BugFixTask) -> Dict[str, Any]:
         """ルールベース修正を試行"""
-        error_context = bug_fix_task.error_context
-        error_type = error_context.error_type
-        
-        fix_function = self.fix_patterns.get(error_type)
+        fix_function = self.fix_patterns.get(bug_fix_task.error_context.error_type)
         if not fix_function:
             return {"success": False, "error": "No fix pattern available"}
         
         try:
-            fixed_code = await fix_function(error_context)
+            fixed_code = await fix_function(bug_fix_task.error_context)
             
             if fixed_code:
                 # バックアップ作成
@@ -225,38 +315,277 @@ class LocalFixAgent:
         if not self.ai_chat:
             return {"success": False, "error": "AI agent not available"}
         
+        cache_key = None
         try:
-            # 修正プロンプト構築
-            prompt = self._build_fix_prompt(bug_fix_task.error_context)
-            
+            code, error, cache_key = await self._generate_ai_fix(bug_fix_task)
+            
+            if not code:
+                return {"success": False, "error": error}
+            
+            target = Path(bug_fix_task.target_files[0])
+            original = target.read_text(encoding='utf-8') if target.exists() else None
+            
+            # バックアップ作成
+            await self._create_backup(bug_fix_task.target_files)
+            
+            # 修正適用
+            await self._apply_fix(str(target), code)
+            
+            # 構文・インポートを検証し、通らなければ元に戻す
+            verification = await self.verifier.verify([str(target)], select_tests=False)
+            if not verification.success:
+                if original is not None:
+                    await self._apply_fix(str(target), original)
+                # 失敗した修正を再利用しないようにキャッシュから除外
+                self.response_cache.invalidate(cache_key)
+                logger.warning(f"⚠️ AI修正の検証失敗 - 元に戻しました: {verification.errors[:1]}")
+                return {"success": False, "error": f"Verification failed: {verification.errors[:1]}"}
+            
+            return {
+                "success": True,
+                "code": code,
+                "test_passed": True,
+                "confidence": 0.7,
+                "reasoning": "AI-generated fix"
+            }
+                
+        except Exception as e:
+            self.response_cache.invalidate(cache_key)
+            logger.error(f"❌ AI修正エラー: {e}")
+            return {"success": False, "error": str(e)}
+    
+    async def _generate_ai_fix(self, bug_fix_task: BugFixTask) -> Tuple[Optional[str], str, Optional[str]]:
+        """
+        ローカルAIに修正コードを生成させる（ファイルには書き込まない）
+        
+        Returns:
+            (修正コード, 失敗理由, 応答キャッシュのキー)
+            修正が検証・適用に失敗した場合、呼び出し側がキーを無効化する
+        """
+        # 修正プロンプト構築
+        prompt = self._build_fix_prompt(bug_fix_task.error_context)
+        model = getattr(self.ai_chat, "model_name", None)
+        
+        # 同一プロンプトの応答がキャッシュにあれば再利用
+        content = self.response_cache.get(
+            "ai_chat", model, None, prompt, bypass=self.bypass_response_cache
+        )
+        cache_hit = content is not None
+        
+        if cache_hit:
+            self.stats["ai_cache_hits"] += 1
+            logger.info("⚡ AI応答キャッシュヒット")
+        else:
             # AIに送信
             ai_response = await self.ai_chat.send_prompt_and_wait(prompt)
             
             if not ai_response or "error" in ai_response:
-                return {"success": False, "error": "AI response error"}
-            
-            # コードブロック抽出
-            code = self._extract_code_block(ai_response.get("content", ""))
+                return None, "AI response error", None
             
-            if code:
-                # バックアップ作成
-                await self._create_backup(bug_fix_task.target_files)
-                
-                # 修正適用
-                await self._apply_fix(bug_fix_task.target_files[0], code)
-                
-                return {
-                    "success": True,
-                    "code": code,
-                    "confidence": 0.7,
-                    "reasoning": "AI-generated fix"
-                }
-            else:
-                return {"success": False, "error": "No code block found in AI response"}
-                
+            content = ai_response.get("content", "")
+        
+        # コードブロック抽出
+        code = self._extract_code_block(content)
+        if not code:
+            return None, "No code block found in AI response", None
+        
+        if cache_hit:
+            cache_key = self.response_cache.make_key("ai_chat", model, None, prompt)
+        else:
+            cache_key = self.response_cache.put(
+                "ai_chat", model, None, prompt, content,
+                bypass=self.bypass_response_cache
+            )
+        return code, "", cache_key
+    
+    # ========================================
+    # 投機モード
+    # ========================================
+    
+    async def _execute_speculative_fix(self, bug_fix_task: BugFixTask, start_time: datetime) -> FixResult:
+        """
+        修正候補を同時に生成・検証し、最初に検証を通った候補だけを適用
+        
+        各候補は一時ディレクトリのコピー上で検証するため、作業ツリーには
+        検証済みの候補しか書き込まれない。採用が決まった時点で残りの
+        生成・検証はキャンセルする。
+        """
+        task_id = bug_fix_task.task_id
+        producers = self._candidate_producers(bug_fix_task)
+        
+        if not producers:
+            self.stats["failed_fixes"] += 1
+            return self._failed_result(task_id, start_time, "No applicable fix found locally")
+        
+        self.stats["speculative_runs"] += 1
+        logger.info(f"🔀 投機実行: {', '.join(source for source, _ in producers)}")
+        
+        # 候補の生成中にインポートチェック用ワーカーを起動しておく
+        self.verifier.warm_up(len(producers))
+        
+        tasks = [
+            asyncio.create_task(self._produce_and_verify(source, producer))
+            for source, producer in producers
+        ]
+        winner: Optional[FixCandidate] = None
+        errors: List[str] = []
+        
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=self.speculative_timeout):
+                candidate = await next_done
+                if candidate is None:
+                    continue
+                if candidate.verified:
+                    winner = candidate
+                    break
+                errors.extend(f"[{candidate.source}] {e}" for e in candidate.errors[:3])
+        except asyncio.TimeoutError:
+            errors.append(f"投機実行がタイムアウトしました ({self.speculative_timeout}秒)")
+        finally:
+            pending = [t for t in tasks if not t.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.stats["speculative_discarded"] += len(pending)
+        
+        if winner is None:
+            self.stats["failed_fixes"] += 1
+            logger.warning(f"⚠️ 検証を通った候補なし: {task_id}")
+            return self._failed_result(
+                task_id, start_time, "; ".join(errors) or "No applicable fix found locally"
+            )
+        
+        # 採用した候補だけを作業ツリーへ一括適用
+        apply_result = await self.patch_manager.apply_patches(winner.patches)
+        if not apply_result["success"]:
+            self.stats["failed_fixes"] += 1
+            return self._failed_result(
+                task_id, start_time, f"修正適用失敗: {apply_result.get('error')}"
+            )
+        
+        self.stats["successful_fixes"] += 1
+        if winner.source == "rule":
+            self.stats["rule_based_fixes"] += 1
+        elif winner.source == "local_ai":
+            self.stats["ai_based_fixes"] += 1
+        wins = self.stats["speculative_wins"]
+        wins[winner.source] = wins.get(winner.source, 0) + 1
+        
+        execution_time = (datetime.now() - start_time).total_seconds()
+        logger.info(
+            f"✅ 投機実行で採用: {winner.source} "
+            f"(生成{winner.generation_time:.2f}秒 + 検証{winner.verification_time:.2f}秒, "
+            f"合計{execution_time:.2f}秒)"
+        )
+        
+        return FixResult(
+            task_id=task_id,
+            success=True,
+            modified_files=list(winner.patches),
+            generated_code="\n\n".join(winner.patches.values()),
+            test_passed=True,
+            execution_time=execution_time,
+            confidence_score=winner.confidence,
+            reasoning=winner.reasoning or f"Speculative fix ({winner.source}) verified in sandbox"
+        )
+    
+    def _candidate_producers(
+        self,
+        bug_fix_task: BugFixTask
+    ) -> List[Tuple[str, Callable[[], Awaitable[Optional[FixCandidate]]]]]:
+        """このタスクで使える候補生成関数の一覧"""
+        producers = []
+        target_files = bug_fix_task.target_files
+        
+        if target_files and bug_fix_task.error_context.error_type in self.fix_patterns:
+            producers.append(("rule", lambda: self._rule_candidate(bug_fix_task)))
+        if target_files and self.use_local_ai and self.ai_chat:
+            producers.append(("local_ai", lambda: self._local_ai_candidate(bug_fix_task)))
+        if self.cloud_agent is not None:
+            producers.append(("cloud", lambda: self._cloud_candidate(bug_fix_task)))
+        return producers
+    
+    async def _produce_and_verify(
+        self,
+        source: str,
+        producer: Callable[[], Awaitable[Optional[FixCandidate]]]
+    ) -> Optional[FixCandidate]:
+        """候補を生成し、一時コピー上で検証"""
+        started = time.perf_counter()
+        try:
+            candidate = await producer()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"❌ AI修正エラー: {e}")
-            return {"success": False, "error": str(e)}
+            logger.warning(f"⚠️ 候補生成エラー ({source}): {e}")
+            return None
+        if candidate is None or not candidate.patches:
+            return None
+        
+        candidate.generation_time = time.perf_counter() - started
+        self.stats["speculative_candidates"] += 1
+        
+        result = await self.verifier.verify_candidate(candidate.patches)
+        candidate.verified = result.success
+        candidate.errors = result.errors
+        candidate.verification_time = result.duration
+        
+        if not candidate.verified:
+            self.stats["speculative_rejected"] += 1
+            if candidate.cache_key:
+                # 検証を通らなかった応答を再利用しないようにキャッシュから除外
+                cache = self.cloud_agent.response_cache if source == "cloud" else self.response_cache
+                cache.invalidate(candidate.cache_key)
+            logger.info(f"🚫 候補を棄却 ({source}): {result.errors[:1]}")
+        return candidate
+    
+    async def _rule_candidate(self, bug_fix_task: BugFixTask) -> Optional[FixCandidate]:
+        fix_function = self.fix_patterns[bug_fix_task.error_context.error_type]
+        code = await fix_function(bug_fix_task.error_context)
+        if not code:
+            return None
+        return FixCandidate(
+            source="rule",
+            patches={bug_fix_task.target_files[0]: code},
+            confidence=CANDIDATE_CONFIDENCE["rule"],
+            reasoning="Rule-based fix verified in sandbox"
+        )
+    
+    async def _local_ai_candidate(self, bug_fix_task: BugFixTask) -> Optional[FixCandidate]:
+        code, _, cache_key = await self._generate_ai_fix(bug_fix_task)
+        if not code:
+            return None
+        return FixCandidate(
+            source="local_ai",
+            patches={bug_fix_task.target_files[0]: code},
+            confidence=CANDIDATE_CONFIDENCE["local_ai"],
+            reasoning="AI-generated fix verified in sandbox",
+            cache_key=cache_key
+        )
+    
+    async def _cloud_candidate(self, bug_fix_task: BugFixTask) -> Optional[FixCandidate]:
+        result = await self.cloud_agent.generate_fix_candidate(bug_fix_task)
+        if not result.get("success") or not result.get("patches"):
+            return None
+        return FixCandidate(
+            source="cloud",
+            patches=result["patches"],
+            confidence=result.get("confidence") or CANDIDATE_CONFIDENCE["cloud"],
+            reasoning=result.get("reasoning", ""),
+            cache_key=result.get("cache_key")
+        )
+    
+    def _failed_result(self, task_id: str, start_time: datetime, error_message: str) -> FixResult:
+        return FixResult(
+            task_id=task_id,
+            success=False,
+            modified_files=[],
+            generated_code="",
+            test_passed=False,
+            execution_time=(datetime.now() - start_time).total_seconds(),
+            confidence_score=0.0,
+            error_message=error_message
+        )
     
     def _build_fix_prompt(self, error_context: ErrorContextModel) -> str:
         """修正プロンプトを構築"""
@@ -275,8 +604,7 @@ class LocalFixAgent:
     
     def _extract_code_block(self, text: str) -> Optional[str]:
         """テキストからコードブロックを抽出"""
-        pattern = r'```python\n(.*?)\n```'
-        match = re.search(pattern, text, re.DOTALL)
+        match = _CODE_BLOCK_RE.search(text)
         return match.group(1) if match else None
     
     # ========================================
@@ -288,7 +616,7 @@ class LocalFixAgent:
         error_msg = error_context.error_message
         
         # "cannot import name 'X' from 'Y'"パターン
-        match = re.search(r"cannot import name '(\w+)' from '([\w.]+)'", error_msg)
+        match = _CANNOT_IMPORT_RE.search(error_msg)
         if match:
             name, module = match.groups()
             
@@ -311,7 +639,7 @@ class LocalFixAgent:
         error_msg = error_context.error_message
         
         # "No module named 'X'"パターン
-        match = re.search(r"No module named '([\w.]+)'", error_msg)
+        match = _NO_MODULE_RE.search(error_msg)
         if match:
             module = match.group(1)
             
@@ -343,15 +671,9 @@ class LocalFixAgent:
             error_line = lines[line_no - 1]
             
             # よくある構文エラーパターン
-            fixes = [
-                (r':\s*$', ':  # Fixed missing colon'),
-                (r'\)\s*$', ')  # Fixed missing parenthesis'),
-                (r']\s*$', ']  # Fixed missing bracket'),
-            ]
-            
-            for pattern, replacement in fixes:
-                if re.search(pattern, error_line):
-                    lines[line_no - 1] = re.sub(pattern, replacement, error_line)
+            for pattern, replacement in _SYNTAX_FIXES:
+                if pattern.search(error_line):
+                    lines[line_no - 1] = pattern.sub(replacement, error_line)
                     return '\n'.join(lines)
         
         return None
@@ -370,7 +692,7 @@ class LocalFixAgent:
         error_msg = error_context.error_message
         
         # "'X' object has no attribute 'Y'"パターン
-        match = re.search(r"'(\w+)' object has no attribute '(\w+)'", error_msg)
+        match = _NO_ATTRIBUTE_RE.search(error_msg)
         if match:
             obj_type, attr = match.groups()
             
@@ -391,7 +713,7 @@ class LocalFixAgent:
         error_msg = error_context.error_message
         
         # "name 'X' is not defined"パターン
-        match = re.search(r"name '(\w+)' is not defined", error_msg)
+        match = _NOT_DEFINED_RE.search(error_msg)
         if match:
             var_name = match.group(1)
             
@@ -413,10 +735,9 @@ class LocalFixAgent:
         # NoneTypeエラーの場合
         if "NoneType" in error_context.error_message:
             # 最初の関数/メソッド呼び出しにNoneチェックを追加
-            pattern = r'(\w+)\('
             replacement = r'(\1 if \1 is not None else lambda *a, **k: None)('
             
-            fixed_code = re.sub(pattern, replacement, code, count=1)
+            fixed_code = _FIRST_CALL_RE.sub(replacement, code, count=1)
             
             return fixed_code if fixed_code != code else None
         
@@ -427,7 +748,7 @@ class LocalFixAgent:
         error_msg = error_context.error_message
         
         # KeyError: 'X'パターン
-        match = re.search(r"KeyError: '(\w+)'", error_msg)
+        match = _KEY_ERROR_RE.search(error_msg)
         if match:
             key = match.group(1)
             
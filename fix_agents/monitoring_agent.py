@@ -8,10 +8,16 @@ import asyncio
 import logging
 import psutil
 import os
+import threading
+import time
+from collections import deque
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from enum import Enum
 
+from tools.metrics_timeseries import MetricsTimeSeriesStore
+from tools.resource_accounting import record_rss_sample
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +29,155 @@ class HealthStatus(Enum):
     UNKNOWN = "unknown"
 
 
+class SystemSampler:
+    """
+    バックグラウンドでシステムメトリクスを採取するサンプラー
+    
+    専用スレッドが一定間隔で採取し、結果を新しい辞書として丸ごと差し替える。
+    読み手は参照を取得するだけなのでロック不要で、イベントループを止めない。
+    open_files() などの重いプローブは別の長い間隔で実行する。
+    """
+    
+    def __init__(
+        self,
+        interval: float = 1.0,
+        slow_interval: float = 30.0,
+        disk_path: str = '/'
+    ):
+        """
+        初期化
+        
+        Args:
+            interval: CPU・メモリ・ネットワークの採取間隔（秒）
+            slow_interval: ディスク・オープンファイル数の採取間隔（秒）
+            disk_path: ディスク使用率を測るパス
+        """
+        self.interval = interval
+        self.slow_interval = slow_interval
+        self.disk_path = disk_path
+        
+        self._process = psutil.Process(os.getpid())
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._slow: Dict[str, Any] = {}
+        self._last_slow_at = 0.0
+        self._last_net = None
+        
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        # cpu_percent(interval=None) は前回呼び出しからの差分を返すので初期化しておく
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+    
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """採取スレッドを開始"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="SystemSampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """採取スレッドを停止"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """最新のスナップショット（未採取ならNone）"""
+        return self._snapshot
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                logger.warning(f"⚠️ システムメトリクス採取エラー: {e}")
+            self._stop_event.wait(self.interval)
+    
+    def sample_once(self) -> Dict[str, Any]:
+        """1回分を採取してスナップショットを差し替える（ブロックしない）"""
+        now = time.monotonic()
+        
+        if now - self._last_slow_at >= self.slow_interval or not self._slow:
+            self._slow = self._sample_slow()
+            self._last_slow_at = now
+        
+        memory = psutil.virtual_memory()
+        net_io = psutil.net_io_counters()
+        
+        sent_rate = recv_rate = 0.0
+        if self._last_net is not None:
+            last_at, last_io = self._last_net
+            elapsed = max(now - last_at, 1e-6)
+            sent_rate = (net_io.bytes_sent - last_io.bytes_sent) / elapsed
+            recv_rate = (net_io.bytes_recv - last_io.bytes_recv) / elapsed
+        self._last_net = (now, net_io)
+        
+        with self._process.oneshot():
+            process_cpu = self._process.cpu_percent(interval=None)
+            memory_info = self._process.memory_info()
+            num_threads = self._process.num_threads()
+            status = self._process.status()
+        # 実行中タスクのRSSピーク計測にも使う
+        record_rss_sample(memory_info.rss)
+        
+        snapshot = {
+            "sampled_at": datetime.now().isoformat(),
+            "system": {
+                "cpu_percent": psutil.cpu_percent(interval=None),
+                "cpu_count": psutil.cpu_count(),
+                "memory_percent": memory.percent,
+                "memory_used_gb": memory.used / (1024**3),
+                "memory_total_gb": memory.total / (1024**3),
+                "disk_percent": self._slow.get("disk_percent", 0.0),
+                "disk_used_gb": self._slow.get("disk_used_gb", 0.0),
+                "disk_total_gb": self._slow.get("disk_total_gb", 0.0),
+                "network_bytes_sent": net_io.bytes_sent,
+                "network_bytes_recv": net_io.bytes_recv,
+                "network_sent_per_sec": sent_rate,
+                "network_recv_per_sec": recv_rate
+            },
+            "process": {
+                "pid": self._process.pid,
+                "cpu_percent": process_cpu,
+                "memory_mb": memory_info.rss / (1024**2),
+                "num_threads": num_threads,
+                "open_files": self._slow.get("open_files", 0),
+                "status": status
+            }
+        }
+        
+        # 参照の差し替えはアトミックなので読み手はロック不要
+        self._snapshot = snapshot
+        return snapshot
+    
+    def _sample_slow(self) -> Dict[str, Any]:
+        """重いプローブ（ディスク使用率・オープンファイル数）"""
+        result: Dict[str, Any] = {}
+        try:
+            disk = psutil.disk_usage(self.disk_path)
+            result.update({
+                "disk_percent": disk.percent,
+                "disk_used_gb": disk.used / (1024**3),
+                "disk_total_gb": disk.total / (1024**3)
+            })
+        except Exception as e:
+            logger.debug(f"ディスク使用率取得エラー: {e}")
+        
+        try:
+            result["open_files"] = len(self._process.open_files())
+        except Exception as e:
+            logger.debug(f"オープンファイル数取得エラー: {e}")
+        
+        return result
+
+
 class MonitoringAgent:
     """
     モニタリングエージェント
@@ -41,7 +196,9 @@ class MonitoringAgent:
         cpu_threshold: float = 80.0,  # %
         memory_threshold: float = 85.0,  # %
         disk_threshold: float = 90.0,  # %
-        error_rate_threshold: float = 0.3  # 30%
+        error_rate_threshold: float = 0.3,  # 30%
+        sample_interval: float = 1.0,  # 秒
+        slow_probe_interval: float = 30.0  # 秒
     ):
         """
         初期化
@@ -52,6 +209,8 @@ class MonitoringAgent:
             memory_threshold: メモリ使用率閾値
             disk_threshold: ディスク使用率閾値
             error_rate_threshold: エラー率閾値
+            sample_interval: バックグラウンド採取の間隔（秒）
+            slow_probe_interval: 重いプローブの採取間隔（秒）
         """
         self.check_interval = check_interval
         self.cpu_threshold = cpu_threshold
@@ -59,10 +218,19 @@ class MonitoringAgent:
         self.disk_threshold = disk_threshold
         self.error_rate_threshold = error_rate_threshold
         
-        # モニタリングデータ
-        self.metrics_history = []
+        # ヘルスチェックはサンプラーのスナップショットを読むだけにする
+        self.sampler = SystemSampler(
+            interval=sample_interval,
+            slow_interval=slow_probe_interval
+        )
+        
+        # モニタリングデータ（直近のチェック結果そのもの）
+        self.metrics_history: deque = deque(maxlen=100)
         self.alerts = []
         
+        # 数値メトリクスの時系列（生データ→1分→15分、メモリは固定）
+        self.timeseries = MetricsTimeSeriesStore()
+        
         # システム情報
         self.start_time = datetime.now()
         self.is_monitoring = False
@@ -88,6 +256,7 @@ class MonitoringAgent:
             return
         
         self.is_monitoring = True
+        self.sampler.start()
         self.monitoring_task = asyncio.create_task(self._monitoring_loop())
         
         logger.info(f"🔍 モニタリング開始 (間隔={self.check_interval}秒)")
@@ -103,6 +272,8 @@ class MonitoringAgent:
             except asyncio.CancelledError:
                 pass
         
+        await asyncio.to_thread(self.sampler.stop)
+        
         logger.info("⏹️ モニタリング停止")
     
     async def _monitoring_loop(self):
@@ -127,11 +298,12 @@ class MonitoringAgent:
             self.stats["health_checks"] += 1
             self.stats["total_checks"] += 1
             
-            # メトリクス収集
+            # メトリクス収集（サンプラーの最新スナップショットを参照）
+            snapshot = await self._get_snapshot()
             metrics = {
                 "timestamp": check_time.isoformat(),
-                "system": await self._collect_system_metrics(),
-                "process": await self._collect_process_metrics(),
+                "system": await self._collect_system_metrics(snapshot),
+                "process": await self._collect_process_metrics(snapshot),
                 "application": await self._collect_application_metrics()
             }
             
@@ -139,12 +311,12 @@ class MonitoringAgent:
             health_status = self._determine_health_status(metrics)
             metrics["health_status"] = health_status.value
             
-            # 履歴に追加
+            # 履歴に追加（deque なので古いものは自動で押し出される）
             self.metrics_history.append(metrics)
-            
-            # 古い履歴を削除（直近100件のみ保持）
-            if len(self.metrics_history) > 100:
-                self.metrics_history = self.metrics_history[-100:]
+            self.timeseries.record(
+                self._flatten_metrics(metrics),
+                timestamp=check_time.timestamp()
+            )
             
             # アラートチェック
             await self._check_and_issue_alerts(metrics, health_status)
@@ -171,59 +343,28 @@ class MonitoringAgent:
                 "error": str(e)
             }
     
-    async def _collect_system_metrics(self) -> Dict[str, Any]:
+    async def _get_snapshot(self) -> Dict[str, Any]:
+        """最新のスナップショットを取得（サンプラー停止中はその場で1回採取）"""
+        snapshot = self.sampler.latest()
+        if snapshot is None or not self.sampler.is_running:
+            snapshot = await asyncio.to_thread(self.sampler.sample_once)
+        return snapshot
+    
+    async def _collect_system_metrics(self, snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """システムメトリクスを収集"""
         try:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            
-            # メモリ使用率
-            memory = psutil.virtual_memory()
-            
-            # ディスク使用率
-            disk = psutil.disk_usage('/')
-            
-            # ネットワーク統計
-            net_io = psutil.net_io_counters()
-            
-            return {
-                "cpu_percent": cpu_percent,
-                "cpu_count": cpu_count,
-                "memory_percent": memory.percent,
-                "memory_used_gb": memory.used / (1024**3),
-                "memory_total_gb": memory.total / (1024**3),
-                "disk_percent": disk.percent,
-                "disk_used_gb": disk.used / (1024**3),
-                "disk_total_gb": disk.total / (1024**3),
-                "network_bytes_sent": net_io.bytes_sent,
-                "network_bytes_recv": net_io.bytes_recv
-            }
+            snapshot = snapshot or await self._get_snapshot()
+            return dict(snapshot["system"])
             
         except Exception as e:
             logger.error(f"❌ システムメトリクス収集エラー: {e}")
             return {}
     
-    async def _collect_process_metrics(self) -> Dict[str, Any]:
+    async def _collect_process_metrics(self, snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """プロセスメトリクスを収集"""
         try:
-            process = psutil.Process(os.getpid())
-            
-            # プロセス情報
-            with process.oneshot():
-                cpu_percent = process.cpu_percent()
-                memory_info = process.memory_info()
-                num_threads = process.num_threads()
-                open_files = len(process.open_files())
-                
-            return {
-                "pid": process.pid,
-                "cpu_percent": cpu_percent,
-                "memory_mb": memory_info.rss / (1024**2),
-                "num_threads": num_threads,
-                "open_files": open_files,
-                "status": process.status()
-            }
+            snapshot = snapshot or await self._get_snapshot()
+            return dict(snapshot["process"])
             
         except Exception as e:
             logger.error(f"❌ プロセスメトリクス収集エラー: {e}")
@@ -353,6 +494,48 @@ class MonitoringAgent:
         except Exception as e:
             logger.error(f"❌ 統計更新エラー: {e}")
     
+    @staticmethod
+    def _flatten_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """{"system": {"cpu_percent": ..}} → {"system.cpu_percent": ..}"""
+        flat = {}
+        for section in ("system", "process", "application"):
+            for key, value in (metrics.get(section) or {}).items():
+                flat[f"{section}.{key}"] = value
+        return flat
+    
+    def query_metrics(
+        self,
+        name: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        resolution: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        メトリクスの時系列を取得（ダッシュボード用）
+        
+        Args:
+            name: メトリクス名（例: "system.cpu_percent"）
+            start: 開始時刻
+            end: 終了時刻
+            resolution: 粒度秒（0=生データ, 60, 900。省略時は期間から自動選択）
+            
+        Returns:
+            Dict: {"name", "resolution", "points": [{"timestamp", "min", "max", "avg", "count"}]}
+        """
+        result = self.timeseries.query(
+            name,
+            start=start.timestamp() if start else None,
+            end=end.timestamp() if end else None,
+            resolution=resolution
+        )
+        for point in result["points"]:
+            point["timestamp"] = datetime.fromtimestamp(point["timestamp"]).isoformat()
+        return result
+    
+    def get_metric_names(self) -> List[str]:
+        """記録されているメトリクス名の一覧"""
+        return self.timeseries.names()
+    
     def get_current_status(self) -> Dict[str, Any]:
         """現在のステータスを取得"""
         if not self.metrics_history:
@@ -382,6 +565,7 @@ class MonitoringAgent:
             "uptime_hours": uptime / 3600,
             "is_monitoring": self.is_monitoring,
             "metrics_count": len(self.metrics_history),
+            "timeseries_bytes": self.timeseries.nbytes(),
             "alerts_count": len(self.alerts)
         }
     
@@ -7,8 +7,10 @@ Slack/メール/その他の通知管理
 import asyncio
 import logging
 import json
+import random
 import smtplib
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -16,6 +18,9 @@ from enum import Enum
 
 import aiohttp
 
+from tools.cloud_llm_client import TokenBucket
+from tools.notification_outbox import NotificationOutbox
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,6 +41,30 @@ class NotificationChannel(Enum):
     WEBHOOK = "webhook"
 
 
+# 通知レベルの優先度
+LEVEL_PRIORITY = {
+    NotificationLevel.INFO: 0,
+    NotificationLevel.SUCCESS: 1,
+    NotificationLevel.WARNING: 2,
+    NotificationLevel.ERROR: 3,
+    NotificationLevel.CRITICAL: 4
+}
+
+# チャネル別レート制限の既定値 (バースト数, 1秒あたりの補充数)
+DEFAULT_CHANNEL_RATE_LIMITS: Dict[NotificationChannel, Tuple[float, float]] = {
+    NotificationChannel.SLACK: (5, 1 / 12),
+    NotificationChannel.EMAIL: (3, 1 / 60),
+    NotificationChannel.DISCORD: (5, 1 / 12),
+    NotificationChannel.WEBHOOK: (10, 1.0)
+}
+
+# ダイジェストに本文を載せる最大件数
+MAX_DIGEST_ITEMS = 10
+
+# リトライ待機の上限（秒）
+MAX_RETRY_DELAY = 600.0
+
+
 class NotificationAgent:
     """
     通知エージェント
@@ -47,6 +76,15 @@ class NotificationAgent:
     - Webhook通知
     - 通知のフィルタリング
     - 通知テンプレート管理
+    - チャネルへの並行送信
+    - 永続アウトボックス（再起動後も未配信分を再送）とダイジェスト集約
+    - チャネル別レート制限
+    
+    enqueue_notification() はアウトボックスに1行書くだけで即座に戻り、
+    配信はチャネルごとのバックグラウンドワーカーが行う。同じレベル・
+    テンプレートの通知は digest_window 秒の間まとめて1通にし、レート制限で
+    待たされている間に溜まった通知も送信時に1通へまとめる。失敗した配信は
+    指数バックオフで再送予定を立て、max_retries を超えたら failed にする。
     """
     
     def __init__(
@@ -54,7 +92,14 @@ class NotificationAgent:
         slack_webhook_url: Optional[str] = None,
         email_config: Optional[Dict[str, str]] = None,
         discord_webhook_url: Optional[str] = None,
-        min_notification_level: NotificationLevel = NotificationLevel.WARNING
+        min_notification_level: NotificationLevel = NotificationLevel.WARNING,
+        digest_window: float = 10.0,
+        max_retries: int = 3,
+        retry_base_delay: float = 2.0,
+        channel_rate_limits: Optional[Dict[NotificationChannel, Tuple[float, float]]] = None,
+        send_timeout: float = 10.0,
+        outbox: Optional[NotificationOutbox] = None,
+        outbox_dir: str = ".notifications"
     ):
         """
         初期化
@@ -64,11 +109,34 @@ class NotificationAgent:
             email_config: メール設定（smtp_server, smtp_port, username, password, recipients）
             discord_webhook_url: Discord Webhook URL
             min_notification_level: 最小通知レベル
+            digest_window: ダイジェスト集約の時間窓（秒、0なら集約しない）
+            max_retries: 送信失敗時の最大リトライ回数
+            retry_base_delay: リトライ待機の基準秒数（指数バックオフ）
+            channel_rate_limits: チャネル別の (バースト数, 1秒あたりの補充数)
+            send_timeout: 1回の送信のタイムアウト（秒）
+            outbox: 通知アウトボックス（省略時は outbox_dir に作成）
+            outbox_dir: アウトボックスの保存先
         """
         self.slack_webhook_url = slack_webhook_url
         self.email_config = email_config or {}
         self.discord_webhook_url = discord_webhook_url
         self.min_notification_level = min_notification_level
+        self.digest_window = digest_window
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.send_timeout = send_timeout
+        
+        # チャネル別レート制限
+        limits = {**DEFAULT_CHANNEL_RATE_LIMITS, **(channel_rate_limits or {})}
+        self.rate_limiters: Dict[NotificationChannel, TokenBucket] = {
+            channel: TokenBucket(capacity, refill) for channel, (capacity, refill) in limits.items()
+        }
+        
+        # 永続アウトボックスとチャネル別ワーカー（start() でイベントループ上に作成）
+        self.outbox = outbox or NotificationOutbox(outbox_dir)
+        self._workers: Dict[NotificationChannel, asyncio.Task] = {}
+        self._wakeups: Dict[NotificationChannel, asyncio.Event] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
         
         # 通知履歴
         self.notification_history = []
@@ -79,7 +147,12 @@ class NotificationAgent:
             "slack_notifications": 0,
             "email_notifications": 0,
             "discord_notifications": 0,
-            "failed_notifications": 0
+            "failed_notifications": 0,
+            "queued_notifications": 0,
+            "digests_sent": 0,
+            "coalesced_notifications": 0,
+            "rate_limited": 0,
+            "retries": 0
         }
         
         # 通知テンプレート
@@ -163,40 +236,31 @@ class NotificationAgent:
                 metadata=metadata
             )
             
-            # 各チャネルに送信
+            # 各チャネルへ並行送信（レート制限中のチャネルは送信キューへ回す）
             results = {}
+            immediate = []
             
             for channel in channels:
-                try:
-                    if channel == NotificationChannel.SLACK:
-                        result = await self._send_slack_notification(notification)
-                        results["slack"] = result
-                        
-                    elif channel == NotificationChannel.EMAIL:
-                        result = await self._send_email_notification(notification)
-                        results["email"] = result
-                        
-                    elif channel == NotificationChannel.DISCORD:
-                        result = await self._send_discord_notification(notification)
-                        results["discord"] = result
-                        
-                except Exception as e:
-                    logger.error(f"❌ {channel.value}通知エラー: {e}")
-                    results[channel.value] = {"success": False, "error": str(e)}
-                    self.stats["failed_notifications"] += 1
+                if self.rate_limiters[channel].try_acquire(1) > 0:
+                    self.stats["rate_limited"] += 1
+                    self._enqueue(notification, [channel], digest_key=None, delay=0.0)
+                    results[channel.value] = {"success": True, "queued": True}
+                else:
+                    immediate.append(channel)
             
-            # 履歴に追加
-            self.notification_history.append({
-                "timestamp": datetime.now().isoformat(),
-                "message": message,
-                "level": level.value,
-                "channels": [c.value for c in channels],
-                "results": results
-            })
+            sent = await asyncio.gather(
+                *(self._send_to_channel(channel, notification) for channel in immediate)
+            )
+            for channel, result in zip(immediate, sent):
+                results[channel.value] = result
+                if not result.get("success"):
+                    # 失敗した配信はアウトボックスに回して再送する
+                    self.stats["retries"] += 1
+                    self._enqueue(notification, [channel], digest_key=None,
+                                  delay=self._retry_delay(1), attempts=1)
+                    result["retry_scheduled"] = True
             
-            # 古い履歴を削除（直近100件のみ）
-            if len(self.notification_history) > 100:
-                self.notification_history = self.notification_history[-100:]
+            self._add_history(notification, channels, results)
             
             logger.info(f"📤 通知送信完了: {message[:50]}...")
             
@@ -228,7 +292,7 @@ class NotificationAgent:
             f"信頼度: {confidence:.1%}"
         )
         
-        await self.send_notification(
+        await self.enqueue_notification(
             message=message,
             level=NotificationLevel.SUCCESS,
             template_name="fix_success",
@@ -237,7 +301,8 @@ class NotificationAgent:
                 "modified_files": modified_files,
                 "execution_time": execution_time,
                 "confidence": confidence
-            }
+            },
+            idempotency_key=f"fix_success:{task_id}"
         )
     
     async def notify_fix_failure(
@@ -252,7 +317,7 @@ class NotificationAgent:
             f"手動介入が必要です"
         )
         
-        await self.send_notification(
+        await self.enqueue_notification(
             message=message,
             level=NotificationLevel.ERROR,
             template_name="fix_failure",
@@ -270,7 +335,7 @@ class NotificationAgent:
         """システム警告の通知"""
         message = f"システム警告: {warning_type}\n詳細: {details}"
         
-        await self.send_notification(
+        await self.enqueue_notification(
             message=message,
             level=NotificationLevel.WARNING,
             template_name="system_warning",
@@ -293,7 +358,7 @@ class NotificationAgent:
             f"PR URL: {pr_url}"
         )
         
-        await self.send_notification(
+        await self.enqueue_notification(
             message=message,
             level=NotificationLevel.INFO,
             template_name="pr_created",
@@ -301,8 +366,244 @@ class NotificationAgent:
                 "task_id": task_id,
                 "pr_url": pr_url,
                 "branch_name": branch_name
-            }
+            },
+            idempotency_key=f"pr_created:{pr_url}"
+        )
+    
+    # ========================================
+    # 送信キュー（永続アウトボックス）
+    # ========================================
+    
+    async def enqueue_notification(
+        self,
+        message: str,
+        level: NotificationLevel = NotificationLevel.INFO,
+        channels: Optional[List[NotificationChannel]] = None,
+        template_name: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        通知をアウトボックスに登録（配信完了を待たない）
+        
+        Args:
+            send_notification と同じ
+            idempotency_key: 冪等キー（同じキーの通知は保持期間内に1回だけ配信）
+            
+        Returns:
+            Dict: {"success", "queued", "duplicate"} またはスキップ結果
+        """
+        if not self._should_notify(level):
+            logger.debug(f"通知スキップ: レベル={level.value}")
+            return {"success": True, "skipped": True}
+        
+        if channels is None:
+            channels = self._get_available_channels()
+        if not channels:
+            return {"success": True, "skipped": True}
+        
+        notification = self._build_notification(
+            message=message,
+            level=level,
+            template_name=template_name,
+            metadata=metadata
+        )
+        added = self._enqueue(
+            notification,
+            channels,
+            digest_key=f"{level.value}:{template_name or ''}",
+            delay=self.digest_window,
+            idempotency_key=idempotency_key
+        )
+        if not added:
+            return {"success": True, "queued": False, "duplicate": True}
+        
+        self.stats["total_notifications"] += 1
+        self.stats["queued_notifications"] += 1
+        return {"success": True, "queued": True, "duplicate": len(added) < len(channels)}
+    
+    def _enqueue(
+        self,
+        notification: Dict[str, Any],
+        channels: List[NotificationChannel],
+        digest_key: Optional[str],
+        delay: float,
+        idempotency_key: Optional[str] = None,
+        attempts: int = 0
+    ) -> List[NotificationChannel]:
+        """アウトボックスに書き、該当チャネルのワーカーを起こす"""
+        added = self.outbox.enqueue(
+            notification,
+            [channel.value for channel in channels],
+            idempotency_key=idempotency_key,
+            digest_key=digest_key,
+            delay=delay,
+            attempts=attempts
+        )
+        added_channels = [NotificationChannel(name) for name in added]
+        for channel in added_channels:
+            self._wake(channel)
+        return added_channels
+    
+    def _wake(self, channel: NotificationChannel):
+        """ワーカーを起こす（イベントループ外・起動前なら何もしない）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if channel not in self._workers:
+            self._start_worker(channel)
+        self._wakeups[channel].set()
+    
+    async def start(self):
+        """アウトボックスに残っている通知のワーカーを起動（前回の未配信分を再送）"""
+        for name in self.outbox.channels_with_pending():
+            channel = NotificationChannel(name)
+            if channel not in self._workers:
+                self._start_worker(channel)
+    
+    def _start_worker(self, channel: NotificationChannel):
+        self._wakeups[channel] = asyncio.Event()
+        self._workers[channel] = asyncio.create_task(self._channel_worker(channel))
+    
+    async def flush(self, timeout: Optional[float] = None):
+        """
+        ダイジェスト待ちの通知を前倒しし、未送信の通知がなくなるまで待つ
+        
+        リトライ待ちの通知はバックオフを守るため前倒しせず、アウトボックスに
+        残して次回の start() 以降に予定どおり再送する（短時間の障害中に
+        再試行回数を使い切らないため）
+        """
+        await self.start()
+        
+        async def drain():
+            while True:
+                self.outbox.expedite()
+                for channel in list(self._workers):
+                    self._wakeups[channel].set()
+                if not self.outbox.unsent_count():
+                    return
+                await asyncio.sleep(0.05)
+        
+        await asyncio.wait_for(drain(), timeout)
+    
+    async def stop(self, timeout: Optional[float] = 30.0):
+        """未送信の通知の配信を試みてからワーカーを停止（リトライ待ちはアウトボックスに残り次回再送）"""
+        if self._workers:
+            try:
+                await self.flush(timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ 通知の配信が時間内に終わりませんでした（次回起動時に再送）")
+        
+        # wait_for と同時に完了したキャンセルは握りつぶされることがあるので、止まるまで繰り返す
+        workers = set(self._workers.values())
+        while workers:
+            for task in workers:
+                task.cancel()
+            _, workers = await asyncio.wait(workers, timeout=1.0)
+        self._workers = {}
+        self._wakeups = {}
+        
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _channel_worker(self, channel: NotificationChannel):
+        """送信時刻に達した通知をレート制限を守って配信する"""
+        limiter = self.rate_limiters[channel]
+        wakeup = self._wakeups[channel]
+        
+        while True:
+            wakeup.clear()
+            due = self.outbox.next_due(channel.value)
+            if due is None:
+                await wakeup.wait()
+                continue
+            
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            # トークン待ちの間に溜まった通知も次の取り出しでまとめて送る
+            if limiter.try_acquire(1) > 0:
+                self.stats["rate_limited"] += 1
+                await limiter.acquire(1)
+            
+            rows = self.outbox.claim_due(channel.value)
+            if not rows:
+                continue
+            
+            ids = [row["id"] for row in rows]
+            try:
+                notification = self._merge_notifications([row["notification"] for row in rows])
+                result = await self._send_to_channel(channel, notification)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            
+            if result.get("success"):
+                self.outbox.mark_delivered(ids)
+                self._add_history(notification, [channel], {channel.value: result})
+                continue
+            
+            # 試行回数は行ごとに数える（ダイジェストに加わった新しい通知を巻き込まない）
+            error = str(result.get("error", "unknown error"))
+            failed_ids = []
+            for row in rows:
+                attempts = row["attempts"] + 1
+                if attempts > self.max_retries:
+                    failed_ids.append(row["id"])
+                else:
+                    self.outbox.mark_retry([row["id"]], error, self._retry_delay(attempts))
+                    self.stats["retries"] += 1
+            if failed_ids:
+                self.outbox.mark_failed(failed_ids, error)
+                self.stats["failed_notifications"] += len(failed_ids)
+                logger.error(
+                    f"❌ {channel.value}通知失敗（{len(failed_ids)}件、{self.max_retries + 1}回試行）: {error}"
+                )
+    
+    def _retry_delay(self, attempts: int) -> float:
+        """attempts 回失敗した後の再送待ち（指数バックオフ＋ジッター）"""
+        delay = min(MAX_RETRY_DELAY, self.retry_base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+    
+    def _merge_notifications(self, notifications: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """複数の通知を1通のダイジェストにまとめる"""
+        if len(notifications) == 1:
+            return notifications[0]
+        
+        count = sum(n.get("digest_count", 1) for n in notifications)
+        base = max(
+            notifications,
+            key=lambda n: LEVEL_PRIORITY.get(NotificationLevel(n["level"]), 0)
         )
+        
+        lines = []
+        for n in notifications[:MAX_DIGEST_ITEMS]:
+            lines.append(f"[{n['timestamp'][11:19]}] {n['message']}")
+        if len(notifications) > MAX_DIGEST_ITEMS:
+            lines.append(f"...ほか{len(notifications) - MAX_DIGEST_ITEMS}件")
+        
+        self.stats["digests_sent"] += 1
+        self.stats["coalesced_notifications"] += len(notifications) - 1
+        
+        title = base["title"].split(" (")[0]
+        return {
+            **base,
+            "title": f"{title} ({count}件)",
+            "message": "\n\n".join(lines),
+            "timestamp": notifications[-1]["timestamp"],
+            "metadata": {
+                "digest_count": count,
+                "first_timestamp": notifications[0]["timestamp"],
+                "last_timestamp": notifications[-1]["timestamp"]
+            },
+            "digest_count": count
+        }
     
     # ========================================
     # 内部メソッド
@@ -310,15 +611,44 @@ class NotificationAgent:
     
     def _should_notify(self, level: NotificationLevel) -> bool:
         """通知すべきかチェック"""
-        level_priority = {
-            NotificationLevel.INFO: 0,
-            NotificationLevel.SUCCESS: 1,
-            NotificationLevel.WARNING: 2,
-            NotificationLevel.ERROR: 3,
-            NotificationLevel.CRITICAL: 4
-        }
-        
-        return level_priority.get(level, 0) >= level_priority.get(self.min_notification_level, 0)
+        return LEVEL_PRIORITY.get(level, 0) >= LEVEL_PRIORITY.get(self.min_notification_level, 0)
+    
+    async def _send_to_channel(self, channel: NotificationChannel,
+                               notification: Dict[str, Any]) -> Dict[str, Any]:
+        """1チャネルに送信（例外は結果に変換）"""
+        try:
+            if channel == NotificationChannel.SLACK:
+                return await self._send_slack_notification(notification)
+            elif channel == NotificationChannel.EMAIL:
+                return await self._send_email_notification(notification)
+            elif channel == NotificationChannel.DISCORD:
+                return await self._send_discord_notification(notification)
+            return {"success": False, "error": f"Unsupported channel: {channel.value}"}
+        except Exception as e:
+            logger.error(f"❌ {channel.value}通知エラー: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _add_history(self, notification: Dict[str, Any], channels: List[NotificationChannel],
+                     results: Dict[str, Any]):
+        """履歴に追加（直近100件のみ）"""
+        self.notification_history.append({
+            "timestamp": datetime.now().isoformat(),
+            "message": notification["message"],
+            "level": notification["level"],
+            "channels": [c.value for c in channels],
+            "results": results,
+            "digest_count": notification.get("digest_count", 1)
+        })
+        if len(self.notification_history) > 100:
+            self.notification_history = self.notification_history[-100:]
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Webhook送信用の共有セッション"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.send_timeout)
+            )
+        return self._session
     
     def _get_available_channels(self) -> List[NotificationChannel]:
         """利用可能なチャネルを取得"""
@@ -384,18 +714,14 @@ class NotificationAgent:
                 payload["attachments"][0]["fields"] = fields
             
             # Webhook送信
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.slack_webhook_url,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        self.stats["slack_notifications"] += 1
-                        return {"success": True}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"HTTP {response.status}: {error_text}"}
+            session = await self._get_session()
+            async with session.post(self.slack_webhook_url, json=payload) as response:
+                if response.status == 200:
+                    self.stats["slack_notifications"] += 1
+                    return {"success": True}
+                else:
+                    error_text = await response.text()
+                    return {"success": False, "error": f"HTTP {response.status}: {error_text}"}
             
         except Exception as e:
             logger.error(f"❌ Slack通知エラー: {e}")
@@ -445,7 +771,8 @@ System: Hybrid Fix System
         """SMTP経由でメール送信（同期）"""
         server = smtplib.SMTP(
             self.email_config["smtp_server"],
-            int(self.email_config.get("smtp_port", 587))
+            int(self.email_config.get("smtp_port", 587)),
+            timeout=self.send_timeout
         )
         server.starttls()
         server.login(
@@ -486,18 +813,14 @@ System: Hybrid Fix System
                 payload["embeds"][0]["fields"] = fields
             
             # Webhook送信
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.discord_webhook_url,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status in [200, 204]:
-                        self.stats["discord_notifications"] += 1
-                        return {"success": True}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"HTTP {response.status}: {error_text}"}
+            session = await self._get_session()
+            async with session.post(self.discord_webhook_url, json=payload) as response:
+                if response.status in [200, 204]:
+                    self.stats["discord_notifications"] += 1
+                    return {"success": True}
+                else:
+                    error_text = await response.text()
+                    return {"success": False, "error": f"HTTP {response.status}: {error_text}"}
             
         except Exception as e:
             logger.error(f"❌ Discord通知エラー: {e}")
@@ -515,6 +838,10 @@ System: Hybrid Fix System
         return {
             **self.stats,
             "success_rate": success_rate,
+            "outbox": {
+                **self.outbox.counts(),
+                **{f"outbox_{key}": value for key, value in self.outbox.stats.items()}
+            },
             "recent_notifications": self.notification_history[-10:]
         }
     
@@ -531,5 +858,8 @@ System: Hybrid Fix System
         print(f"  Slack: {stats['slack_notifications']}回")
         print(f"  メール: {stats['email_notifications']}回")
         print(f"  Discord: {stats['discord_notifications']}回")
+        print(f"\nダイジェスト: {stats['digests_sent']}通（{stats['coalesced_notifications']}件を集約）")
+        print(f"レート制限: {stats['rate_limited']}回 / リトライ: {stats['retries']}回")
+        print(f"アウトボックス: 配信待ち {stats['outbox']['pending']}件 / 失敗 {stats['outbox']['failed']}件")
         print(f"\n失敗: {stats['failed_notifications']}回")
         print("=" * 80 + "\n")
\ No newline at end of file
@@ -7,12 +7,16 @@
 import asyncio
 import logging
 import difflib
-import hashlib
+import os
+import shutil
+import uuid
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 from enum import Enum
 
+from tools.delta_backup_store import DeltaBackupStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,6 +58,9 @@ class PatchManager:
         # バックアップディレクトリ作成
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
+        # 最新版＋逆差分で保持するバックアップストア
+        self.backup_store = DeltaBackupStore(self.backup_dir, max_versions=max_backups)
+        
         # パッチ履歴
         self.patch_history = []
         
@@ -62,7 +69,9 @@ class PatchManager:
             "total_patches": 0,
             "successful_patches": 0,
             "failed_patches": 0,
-            "rollbacks": 0
+            "rollbacks": 0,
+            "batch_patches": 0,
+            "batch_rollbacks": 0
         }
         
         logger.info(f"✅ PatchManager 初期化完了 (backup_dir={backup_dir})")
@@ -211,6 +220,141 @@ class PatchManager:
                 "error": str(e)
             }
     
+    async def apply_patches(
+        self,
+        patches: Dict[str, str],
+        verify: bool = True,
+        backup: bool = True
+    ) -> Dict[str, Any]:
+        """
+        複数ファイルのパッチをトランザクションとして適用
+        
+        全ファイルの新しい内容を一時ファイルへ並列に書き出して fsync し、
+        まとめて検証してから rename で確定する。いずれかが失敗した場合は
+        確定済みのファイルも含めて全て元の内容に戻す。
+        
+        Args:
+            patches: {ファイルパス: 新しい内容}
+            verify: 適用前の検証フラグ（Pythonファイルは一括でコンパイル）
+            backup: 変更前の内容をバックアップするか
+            
+        Returns:
+            Dict: 適用結果
+        """
+        start_time = datetime.now()
+        transaction_id = uuid.uuid4().hex[:8]
+        
+        logger.info(f"🔧 一括パッチ適用開始: {len(patches)}ファイル (tx={transaction_id})")
+        
+        self.stats["total_patches"] += 1
+        self.stats["batch_patches"] += 1
+        
+        # 1. 現在の内容を並列に読み込み、変更のあるファイルだけを対象にする
+        paths = [Path(p) for p in patches]
+        try:
+            old_contents = await asyncio.gather(
+                *(asyncio.to_thread(self._read_if_exists, path) for path in paths)
+            )
+        except Exception as e:
+            logger.error(f"❌ 対象ファイル読み込みエラー: {e}")
+            self.stats["failed_patches"] += 1
+            return {"success": False, "error": str(e)}
+        changes = [
+            (path, old, patches[str_path])
+            for path, old, str_path in zip(paths, old_contents, patches)
+            if old != patches[str_path]
+        ]
+        
+        if not changes:
+            logger.info("ℹ️ 内容に変更はありません")
+            self.stats["successful_patches"] += 1
+            return {"success": True, "changed": False, "changed_files": []}
+        
+        # 2. まとめて検証
+        if verify:
+            errors = await asyncio.to_thread(self._validate_batch, changes)
+            if errors:
+                self.stats["failed_patches"] += 1
+                return {
+                    "success": False,
+                    "error": "Validation failed: " + "; ".join(
+                        f"{path}: {reason}" for path, reason in errors.items()
+                    ),
+                    "validation_errors": errors
+                }
+        
+        # 3. 一時ファイルへ並列にステージング
+        staged: List[Tuple[Path, Optional[str], Path]] = []
+        try:
+            staged_paths = await asyncio.gather(
+                *(asyncio.to_thread(self._stage_file, path, new, transaction_id)
+                  for path, _, new in changes)
+            )
+            staged = [
+                (path, old, tmp_path)
+                for (path, old, _), tmp_path in zip(changes, staged_paths)
+            ]
+        except Exception as e:
+            await asyncio.to_thread(self._discard_staged, changes, transaction_id)
+            logger.error(f"❌ ステージング失敗: {e}")
+            self.stats["failed_patches"] += 1
+            return {"success": False, "error": f"Staging failed: {e}"}
+        
+        # 4. バックアップ
+        backup_paths: Dict[str, str] = {}
+        if backup:
+            for path, old, _ in staged:
+                if old is not None:
+                    backup_paths[str(path)] = await self._create_backup(str(path), old)
+        
+        # 5. rename で確定（失敗したら全体を元に戻す）
+        committed: List[Tuple[Path, Optional[str]]] = []
+        try:
+            for path, old, tmp_path in staged:
+                os.replace(tmp_path, path)
+                committed.append((path, old))
+            await asyncio.to_thread(self._fsync_directories, [path for path, _, _ in staged])
+            
+        except Exception as e:
+            logger.error(f"❌ 一括パッチ確定失敗、ロールバックします: {e}")
+            await asyncio.to_thread(self._discard_staged, changes, transaction_id)
+            await asyncio.to_thread(self._restore_contents, committed, transaction_id)
+            self.stats["failed_patches"] += 1
+            self.stats["batch_rollbacks"] += 1
+            return {
+                "success": False,
+                "error": f"Commit failed: {e}",
+                "rolled_back": [str(path) for path, _ in committed]
+            }
+        
+        self.stats["successful_patches"] += 1
+        
+        timestamp = datetime.now().isoformat()
+        diffs = {}
+        for path, old, new in changes:
+            diffs[str(path)] = self._generate_diff(old or "", new)
+            self.patch_history.append({
+                "file_path": str(path),
+                "timestamp": timestamp,
+                "strategy": PatchStrategy.REPLACE.value,
+                "backup_path": backup_paths.get(str(path)),
+                "transaction_id": transaction_id,
+                "success": True
+            })
+        
+        execution_time = (datetime.now() - start_time).total_seconds()
+        logger.info(f"✅ 一括パッチ適用成功: {len(changes)}ファイル ({execution_time:.2f}秒)")
+        
+        return {
+            "success": True,
+            "changed": True,
+            "transaction_id": transaction_id,
+            "changed_files": [str(path) for path, _, _ in changes],
+            "backup_paths": backup_paths,
+            "diffs": diffs,
+            "execution_time": execution_time
+        }
+    
     async def rollback(
         self,
         file_path: str,
@@ -239,16 +383,14 @@ class PatchManager:
                     "error": "No backup found"
                 }
             
-            backup_path_obj = Path(backup_path)
-            
-            if not backup_path_obj.exists():
+            if not self.backup_store.has(backup_path) and not Path(backup_path).exists():
                 return {
                     "success": False,
                     "error": f"Backup not found: {backup_path}"
                 }
             
             # バックアップから復元
-            result = await self._rollback_from_backup(file_path, backup_path_obj)
+            result = await self._rollback_from_backup(file_path, backup_path)
             
             if result["success"]:
                 self.stats["rollbacks"] += 1
@@ -386,6 +528,91 @@ class PatchManager:
             logger.error(f"❌ 安全挿入エラー: {e}")
             return {"success": False, "error": str(e)}
     
+    # ========================================
+    # 一括パッチ（トランザクション）
+    # ========================================
+    
+    @staticmethod
+    def _read_if_exists(path: Path) -> Optional[str]:
+        """現在の内容（存在しなければNone）"""
+        if not path.exists():
+            return None
+        return path.read_text(encoding='utf-8')
+    
+    @staticmethod
+    def _staging_path(path: Path, transaction_id: str) -> Path:
+        """rename がアトミックになるよう対象と同じディレクトリに置く"""
+        return path.with_name(f".{path.name}.patch-{transaction_id}")
+    
+    def _stage_file(self, path: Path, content: str, transaction_id: str) -> Path:
+        """新しい内容を一時ファイルに書き出して fsync"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._staging_path(path, transaction_id)
+        
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        if path.exists():
+            shutil.copymode(path, tmp_path)
+        return tmp_path
+    
+    def _discard_staged(self, changes: List[Tuple[Path, Optional[str], str]], transaction_id: str):
+        """未確定の一時ファイルを削除"""
+        for path, _, _ in changes:
+            self._staging_path(path, transaction_id).unlink(missing_ok=True)
+    
+    def _restore_contents(self, committed: List[Tuple[Path, Optional[str]]], transaction_id: str):
+        """確定済みのファイルを元の内容に戻す（新規作成分は削除）"""
+        for path, old in reversed(committed):
+            try:
+                if old is None:
+                    path.unlink(missing_ok=True)
+                    continue
+                tmp_path = self._stage_file(path, old, f"{transaction_id}-rollback")
+                os.replace(tmp_path, path)
+                logger.info(f"♻️ 復元成功: {path}")
+            except Exception as e:
+                logger.error(f"❌ 復元エラー: {path}: {e}")
+    
+    @staticmethod
+    def _fsync_directories(paths: List[Path]):
+        """rename をディスクに確定させるため親ディレクトリを fsync"""
+        if os.name != "posix":
+            return
+        for directory in {path.parent for path in paths}:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    
+    def _validate_batch(
+        self,
+        changes: List[Tuple[Path, Optional[str], str]]
+    ) -> Dict[str, str]:
+        """
+        変更対象を一括で検証（Pythonファイルはまとめてコンパイル）
+        
+        Returns:
+            {ファイルパス: 失敗理由}（問題がなければ空）
+        """
+        errors = {}
+        for path, old, new in changes:
+            if path.suffix != ".py":
+                continue
+            try:
+                compile(new, str(path), 'exec')
+            except SyntaxError as e:
+                errors[str(path)] = f"Syntax error: {e}"
+                continue
+            
+            if old is not None and abs(len(new) - len(old)) > len(old) * 2:
+                logger.warning(f"⚠️ 大幅なサイズ変更: {path}")
+        
+        return errors
+    
     # ========================================
     # 検証
     # ========================================
@@ -432,29 +659,20 @@ class PatchManager:
         self,
         file_path: str,
         content: str
-    ) -> Path:
-        """バックアップを作成"""
+    ) -> str:
+        """
+        バックアップを作成
+        
+        Returns:
+            バックアップ参照（上限を超えた古い版はストアが自動で削除する）
+        """
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_name = Path(file_path).name
-            
-            # ハッシュを生成（ファイル識別用）
-            content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
-            
-            backup_filename = f"{file_name}_{timestamp}_{content_hash}.bak"
-            backup_path = self.backup_dir / backup_filename
-            
-            await asyncio.to_thread(
-                backup_path.write_text,
-                content,
-                encoding='utf-8'
+            return await asyncio.to_thread(
+                self.backup_store.put,
+                file_path,
+                content.encode('utf-8')
             )
             
-            # 古いバックアップを削除
-            await self._cleanup_old_backups(file_name)
-            
-            return backup_path
-            
         except Exception as e:
             logger.error(f"❌ バックアップ作成エラー: {e}")
             raise
@@ -462,21 +680,23 @@ class PatchManager:
     async def _rollback_from_backup(
         self,
         file_path: str,
-        backup_path: Path
+        backup_path: str
     ) -> Dict[str, Any]:
         """バックアップから復元"""
         try:
-            content = await asyncio.to_thread(
-                backup_path.read_text,
-                encoding='utf-8'
-            )
-            
-            file_path_obj = Path(file_path)
-            await asyncio.to_thread(
-                file_path_obj.write_text,
-                content,
-                encoding='utf-8'
-            )
+            if self.backup_store.has(backup_path):
+                await asyncio.to_thread(self.backup_store.restore, backup_path, file_path)
+            else:
+                # 差分ストア導入前の .bak ファイル
+                content = await asyncio.to_thread(
+                    Path(backup_path).read_text,
+                    encoding='utf-8'
+                )
+                await asyncio.to_thread(
+                    Path(file_path).write_text,
+                    content,
+                    encoding='utf-8'
+                )
             
             logger.info(f"♻️ 復元成功: {file_path} ← {backup_path}")
             
@@ -487,42 +707,22 @@ class PatchManager:
             return {"success": False, "error": str(e)}
     
     async def _find_latest_backup(self, file_path: str) -> Optional[str]:
-        """最新のバックアップを検索"""
+        """最新のバックアップを検索（メモリ上のインデックスを参照）"""
+        latest = self.backup_store.latest(file_path)
+        if latest:
+            return latest
+        
         try:
-            file_name = Path(file_path).name
-            
-            # ファイル名でフィルタリング
-            backups = list(self.backup_dir.glob(f"{file_name}_*.bak"))
-            
+            # 差分ストア導入前の .bak ファイル
+            backups = list(self.backup_dir.glob(f"{Path(file_path).name}_*.bak"))
             if not backups:
                 return None
-            
-            # 最新のものを取得（タイムスタンプでソート）
-            latest_backup = max(backups, key=lambda p: p.stat().st_mtime)
-            
-            return str(latest_backup)
+            return str(max(backups, key=lambda p: p.stat().st_mtime))
             
         except Exception as e:
             logger.error(f"❌ バックアップ検索エラー: {e}")
             return None
     
-    async def _cleanup_old_backups(self, file_name: str):
-        """古いバックアップを削除"""
-        try:
-            backups = sorted(
-                self.backup_dir.glob(f"{file_name}_*.bak"),
-                key=lambda p: p.stat().st_mtime,
-                reverse=True
-            )
-            
-            # 上限を超えたバックアップを削除
-            for backup in backups[self.max_backups:]:
-                await asyncio.to_thread(backup.unlink)
-                logger.debug(f"🗑️ 古いバックアップを削除: {backup}")
-                
-        except Exception as e:
-            logger.warning(f"⚠️ バックアップクリーンアップエラー: {e}")
-    
     async def _create_new_file(
         self,
         file_path: str,
@@ -583,5 +783,6 @@ class PatchManager:
         
         return {
             **self.stats,
-            "success_rate": success_rate
+            "success_rate": success_rate,
+            "backup_store": self.backup_store.get_stats()
         }
\ No newline at end of file
@@ -6,7 +6,7 @@ AIからの修正コードを受け取り、ローカルファイルにパッチ
 import asyncio
 import logging
 import re
-import shutil
+import shlex
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Any
@@ -17,6 +17,10 @@ from data_models import (
     FixResult,
     ErrorSeverity
 )
+from tools.delta_backup_store import DeltaBackupStore
+from tools.llm_response_cache import LLMResponseCache, get_llm_response_cache
+from tools.prompt_budget import TokenBudgetPromptBuilder, error_context_pieces
+from tools.verification_engine import VerificationEngine
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +41,12 @@ class QuickFixAgent:
         self,
         browser_controller,
         command_monitor,
-        wp_tester=None
+        wp_tester=None,
+        response_cache: Optional[LLMResponseCache] = None,
+        bypass_response_cache: bool = False,
+        prompt_token_budget: int = 4000,
+        verification_engine: Optional[VerificationEngine] = None,
+        run_affected_tests: bool = True
     ):
         """
         初期化
@@ -46,14 +55,32 @@ class QuickFixAgent:
             browser_controller: BrowserController (AI対話用)
             command_monitor: CommandMonitorAgent (コマンド実行用)
             wp_tester: WordPressTester (WordPress関連テスト用)
+            response_cache: LLM応答キャッシュ（省略時はプロセス共有キャッシュ）
+            bypass_response_cache: 応答キャッシュを使わずに毎回AIへ問い合わせる
+            prompt_token_budget: 修正プロンプトのトークン予算
+            verification_engine: 修正検証エンジン（省略時はカレントディレクトリを対象に作成）
+            run_affected_tests: 変更モジュールに依存するテストを実行する
         """
         self.browser = browser_controller
         self.cmd_monitor = command_monitor
         self.wp_tester = wp_tester
         
+        # 応答キャッシュ
+        self.response_cache = response_cache or get_llm_response_cache()
+        self.bypass_response_cache = bypass_response_cache
+        
+        # プロンプトのトークン予算と累計削減量
+        self.prompt_token_budget = prompt_token_budget
+        self.prompt_tokens_saved = 0
+        
+        # 修正検証（構文はプロセス内、インポートは常駐ワーカーで確認）
+        self.verifier = verification_engine or VerificationEngine()
+        self.run_affected_tests = run_affected_tests
+        
         # バックアップディレクトリ
         self.backup_dir = Path("./backups/auto_fix")
         self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.backup_store = DeltaBackupStore(self.backup_dir)
         
         # 修正履歴
         self.fix_history: List[FixResult] = []
@@ -82,7 +109,10 @@ class QuickFixAgent:
             bug_fix_task.status = "in_progress"
             
             # 1. AI修正プロンプトを構築
-            fix_prompt = self._build_bug_fix_prompt(bug_fix_task.error_context)
+            fix_prompt = self._build_bug_fix_prompt(
+                bug_fix_task.error_context,
+                bug_fix_task.target_files
+            )
             bug_fix_task.fix_prompt = fix_prompt
             
             logger.info(f"📝 修正プロンプト構築完了 ({len(fix_prompt)}文字)")
@@ -107,6 +137,7 @@ class QuickFixAgent:
             )
             
             if not validation_result['valid']:
+                self.response_cache.invalidate(ai_result.get('cache_key'))
                 return self._create_failed_result(
                     task_id,
                     f"AI修正コード検証失敗: {validation_result['reason']}",
@@ -128,6 +159,7 @@ class QuickFixAgent:
             
             if not apply_result['success']:
                 self._restore_backups(backup_paths)
+                self.response_cache.invalidate(ai_result.get('cache_key'))
                 return self._create_failed_result(
                     task_id,
                     f"パッチ適用失敗: {apply_result.get('error')}",
@@ -143,6 +175,7 @@ class QuickFixAgent:
             if not test_result['success']:
                 logger.warning("⚠️ テスト失敗 - バックアップからロールバック")
                 self._restore_backups(backup_paths)
+                self.response_cache.invalidate(ai_result.get('cache_key'))
                 return self._create_failed_result(
                     task_id,
                     f"テスト失敗: {test_result.get('error')}",
@@ -188,97 +221,69 @@ class QuickFixAgent:
                 start_time
             )
     
-    def _build_bug_fix_prompt(self, error_context: ErrorContextModel) -> str:
+    def _build_bug_fix_prompt(
+        self,
+        error_context: ErrorContextModel,
+        target_files: Optional[List[str]] = None
+    ) -> str:
         """
         AI修正プロンプトを構築
         
+        コンテキスト要素を優先度順にトークン予算内へ詰める
+        
         Args:
             error_context: エラーコンテキスト
+            target_files: 修正対象ファイル（import抽出に使用）
             
         Returns:
             str: AI修正プロンプト
         """
-        prompt_parts = []
+        builder = TokenBudgetPromptBuilder(self.prompt_token_budget)
         
         # ヘッダー
-        prompt_parts.append("以下のPythonコードにエラーが発生しています。修正されたコードを生成してください。")
-        prompt_parts.append("")
-        
-        # エラー情報
-        prompt_parts.append("【エラー情報】")
-        prompt_parts.append(f"エラータイプ: {error_context.error_type}")
-        prompt_parts.append(f"エラーメッセージ: {error_context.error_message}")
-        prompt_parts.append(f"深刻度: {error_context.severity.value}")
-        prompt_parts.append("")
-        
-        # エラー発生位置
-        if error_context.error_location:
-            prompt_parts.append("【エラー発生位置】")
-            prompt_parts.append(f"ファイル: {error_context.error_location.file_path}")
-            prompt_parts.append(f"行番号: {error_context.error_location.line_number}")
-            if error_context.error_location.function_name:
-                prompt_parts.append(f"関数: {error_context.error_location.function_name}")
-            prompt_parts.append("")
-        
-        # 問題のあるコード
-        if error_context.problematic_code:
-            prompt_parts.append("【問題のある行】")
-            prompt_parts.append(f"```python")
-            prompt_parts.append(error_context.problematic_code)
-            prompt_parts.append(f"```")
-            prompt_parts.append("")
-        
-        # 周辺コード
-        if error_context.surrounding_code:
-            prompt_parts.append("【周辺コード(前後10行)】")
-            prompt_parts.append(f"```python")
-            prompt_parts.append(error_context.surrounding_code)
-            prompt_parts.append(f"```")
-            prompt_parts.append("")
-        
-        # スタックトレース(重要部分のみ)
-        if error_context.stack_frames:
-            prompt_parts.append("【スタックトレース】")
-            for i, frame in enumerate(error_context.stack_frames[-3:], 1):  # 最後の3フレーム
-                prompt_parts.append(f"{i}. {frame.file_path}:{frame.line_number} in {frame.function_name}")
-            prompt_parts.append("")
-        
-        # ローカル変数(重要なもののみ)
-        if error_context.local_variables:
-            prompt_parts.append("【ローカル変数の状態】")
-            for var_name, var_value in list(error_context.local_variables.items())[:5]:
-                prompt_parts.append(f"  {var_name} = {var_value}")
-            prompt_parts.append("")
-        
-        # タスク情報
-        if error_context.task_description:
-            prompt_parts.append("【実行中のタスク】")
-            prompt_parts.append(error_context.task_description)
-            prompt_parts.append("")
+        builder.add_header("以下のPythonコードにエラーが発生しています。修正されたコードを生成してください。")
+        builder.add_header("")
+        builder.add_header(f"深刻度: {error_context.severity.value}")
+        builder.add_header("")
+        
+        # エラー箇所・問題行・周辺コード・トレース・変数・import・タスク
+        builder.add_pieces(error_context_pieces(
+            error_context,
+            target_files,
+            max_local_variables=5
+        ))
         
         # 修正要件
-        prompt_parts.append("【修正要件】")
-        prompt_parts.append("1. エラーの根本原因を特定してください")
-        prompt_parts.append("2. 最小限の変更で修正してください")
-        prompt_parts.append("3. 修正後のコードは完全で、実行可能である必要があります")
-        prompt_parts.append("4. コメントで修正内容を説明してください")
-        prompt_parts.append("")
+        builder.add_footer("【修正要件】")
+        builder.add_footer("1. エラーの根本原因を特定してください")
+        builder.add_footer("2. 最小限の変更で修正してください")
+        builder.add_footer("3. 修正後のコードは完全で、実行可能である必要があります")
+        builder.add_footer("4. コメントで修正内容を説明してください")
+        builder.add_footer("")
         
         # 出力形式
-        prompt_parts.append("【出力形式】")
-        prompt_parts.append("以下の形式で出力してください:")
-        prompt_parts.append("")
-        prompt_parts.append("```python")
-        prompt_parts.append("# 修正されたコード全体をここに記述")
-        prompt_parts.append("# (周辺コードも含めて、置き換え可能な完全なコードを出力)")
-        prompt_parts.append("```")
-        prompt_parts.append("")
-        prompt_parts.append("【重要】")
-        prompt_parts.append("- コードブロックは必ず ```python ... ``` で囲んでください")
-        prompt_parts.append("- 不完全なコードや省略は避けてください")
-        prompt_parts.append("- インポート文も含めてください")
-        
-        return "\n".join(prompt_parts)
+        builder.add_footer("【出力形式】")
+        builder.add_footer("以下の形式で出力してください:")
+        builder.add_footer("")
+        builder.add_footer("```python")
+        builder.add_footer("# 修正されたコード全体をここに記述")
+        builder.add_footer("# (周辺コードも含めて、置き換え可能な完全なコードを出力)")
+        builder.add_footer("```")
+        builder.add_footer("")
+        builder.add_footer("【重要】")
+        builder.add_footer("- コードブロックは必ず ```python ... ``` で囲んでください")
+        builder.add_footer("- 不完全なコードや省略は避けてください")
+        builder.add_footer("- インポート文も含めてください")
+        
+        prompt, report = builder.build()
+        
+        self.prompt_tokens_saved += report["saved_tokens"]
+        logger.info(
+            f"📏 プロンプト予算: {report['used_tokens']}/{report['budget']}トークン "
+            f"(削減={report['saved_tokens']}, 切り詰め={report['truncated']}, 省略={report['dropped']})"
+        )
+        
+        return prompt
     
     async def _request_ai_fix(self, fix_prompt: str) -> Dict[str, Any]:
         """
@@ -291,6 +296,18 @@ class QuickFixAgent:
             Dict: AI応答結果
         """
         try:
+            # 同一プロンプトの応答がキャッシュにあれば再利用
+            cached = self.response_cache.get(
+                "browser", None, None, fix_prompt, bypass=self.bypass_response_cache
+            )
+            if cached is not None:
+                logger.info("⚡ AI応答キャッシュヒット")
+                return {
+                    **cached,
+                    'cache_hit': True,
+                    'cache_key': self.response_cache.make_key("browser", None, None, fix_prompt)
+                }
+            
             # AIにプロンプトを送信
             if not hasattr(self.browser, 'send_prompt_and_wait'):
                 return {
@@ -336,11 +353,17 @@ class QuickFixAgent:
             # 最大のコードブロックを採用
             generated_code = max(code_blocks, key=len)
             
-            return {
+            result = {
                 'success': True,
                 'generated_code': generated_code,
                 'full_response': response_text
             }
+            result['cache_key'] = self.response_cache.put(
+                "browser", None, None, fix_prompt, dict(result),
+                bypass=self.bypass_response_cache
+            )
+            
+            return result
             
         except Exception as e:
             logger.error(f"❌ AI修正依頼エラー: {e}")
@@ -425,10 +448,9 @@ class QuickFixAgent:
             file_paths: バックアップ対象ファイルパス
             
         Returns:
-            Dict: {元ファイル: バックアップパス}
+            Dict: {元ファイル: バックアップ参照}
         """
         backup_paths = {}
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         for file_path in file_paths:
             try:
@@ -437,13 +459,9 @@ class QuickFixAgent:
                     logger.warning(f"⚠️ バックアップ対象が存在しません: {file_path}")
                     continue
                 
-                # バックアップファイル名を生成
-                backup_name = f"{src.stem}_backup_{timestamp}{src.suffix}"
-                backup_path = self.backup_dir / backup_name
-                
-                # コピー
-                shutil.copy2(src, backup_path)
-                backup_paths[file_path] = str(backup_path)
+                # 直前の版との逆差分として保存
+                backup_path = self.backup_store.put(file_path, src.read_bytes())
+                backup_paths[file_path] = backup_path
                 
                 logger.info(f"💾 バックアップ: {file_path} → {backup_path}")
                 
@@ -456,7 +474,7 @@ class QuickFixAgent:
         """バックアップからファイルを復元"""
         for original_path, backup_path in backup_paths.items():
             try:
-                shutil.copy2(backup_path, original_path)
+                self.backup_store.restore(backup_path, original_path)
                 logger.info(f"♻️ 復元: {backup_path} → {original_path}")
             except Exception as e:
                 logger.error(f"❌ 復元失敗: {original_path} - {e}")
@@ -569,6 +587,11 @@ class QuickFixAgent:
         try:
             error_context = bug_fix_task.error_context
             
+            # Pythonファイルはサブプロセスを使わずにまとめて検証
+            python_files = self._collect_python_files(bug_fix_task)
+            if python_files and not error_context.wp_context:
+                return await self._verify_python_files(python_files)
+            
             # テストコマンドを決定
             test_command = self._determine_test_command(error_context)
             
@@ -611,6 +634,66 @@ class QuickFixAgent:
                 'errors': [str(e)]
             }
     
+    def _collect_python_files(self, bug_fix_task: BugFixTask) -> List[str]:
+        """検証対象のPythonファイル（修正対象＋エラー発生ファイル）"""
+        files = list(bug_fix_task.target_files or [])
+        location = bug_fix_task.error_context.error_location
+        if location:
+            files.append(location.file_path)
+        return [
+            f for f in dict.fromkeys(files)
+            if f.endswith('.py') and Path(f).is_file()
+        ]
+    
+    async def _verify_python_files(self, file_paths: List[str]) -> Dict[str, Any]:
+        """
+        構文・インポートをまとめて検証し、影響を受けるテストだけを実行
+        
+        Returns:
+            Dict: _run_automated_tests と同じ形式
+        """
+        logger.info(f"🧪 検証: {len(file_paths)}ファイル")
+        verification = await self.verifier.verify(
+            file_paths,
+            select_tests=self.run_affected_tests
+        )
+        
+        if not verification.success:
+            return {
+                'success': False,
+                'output': '',
+                'errors': verification.errors,
+                'error': f"検証失敗: {verification.errors[0]}"
+            }
+        
+        output = (
+            f"構文チェック: {len(verification.checked_files)}ファイル OK / "
+            f"インポート: {len(verification.imported_modules)}モジュール OK "
+            f"({verification.duration:.3f}秒)"
+        )
+        
+        if not verification.affected_tests:
+            return {'success': True, 'output': output, 'errors': []}
+        
+        # 影響テストを1回のpytest実行にまとめる
+        # シェル経由で実行されるのでパスはクォートする
+        test_command = "python -m pytest -q " + " ".join(shlex.quote(path) for path in verification.affected_tests)
+        logger.info(f"🧪 影響テスト実行: {len(verification.affected_tests)}ファイル")
+        result = await self.cmd_monitor.execute_command(test_command, timeout=300)
+        
+        if result['return_code'] == 0 and not result['has_errors']:
+            return {
+                'success': True,
+                'output': output + "\n" + result['stdout'],
+                'errors': []
+            }
+        return {
+            'success': False,
+            'output': output + "\n" + result['stdout'],
+            'errors': result['errors'],
+            'error': f"影響テスト失敗 (return_code={result['return_code']})"
+        }
+    
     def _determine_test_command(self, error_context: ErrorContextModel) -> Optional[str]:
         """エラーコンテキストから適切なテストコマンドを決定"""
         
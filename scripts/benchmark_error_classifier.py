@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+ErrorClassifier 分類ベンチマーク
+
+実際に例外を発生させて得たスタックトレースと周辺コードのコーパスを作り、
+次の3通りで1件あたりの分類時間を比較する。
+
+- 旧実装相当: キーワードごとにコードを小文字化して検索する（キャッシュなし）
+- classify(): 事前に組み立てた表による判定（メモ化なし / あり）
+- classify_batch(): 数百件を1回の呼び出しで分類
+
+コーパスは同じエラーが繰り返し発生する状況（エラーストーム）を想定し、
+--unique 種類のエラーを --errors 件に複製する。
+
+使用例:
+    python scripts/benchmark_error_classifier.py --errors 500 --unique 40
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import logging
+import random
+import re
+import statistics
+import time
+import traceback
+from typing import Callable, List, Tuple
+
+from fix_agents.error_classifier import ErrorClassifier, ErrorContextModel
+
+
+# 例外を発生させるコード片: (ファイル名, コード)
+# helpers.py の関数を経由するものは複数ファイルにまたがるスタックトレースになる
+HELPERS_SOURCE = '''
+import json
+
+def load_config(data):
+    return json.loads(data)["settings"]
+
+def fetch_user(users, user_id):
+    return users[user_id].name
+
+class Repository:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def query(self, sql):
+        return self.cursor.execute(sql)
+
+def recurse(n):
+    return recurse(n + 1)
+'''
+
+SNIPPETS: List[Tuple[str, str]] = [
+    ("app/config.py", "settings = load_config('{\"other\": 1}')\n"),
+    ("app/users.py", "users = {}\nname = fetch_user(users, 'u{n}')\n"),
+    ("app/db.py", "repo = Repository(None)\nrows = repo.query('SELECT * FROM posts WHERE id = {n}')\n"),
+    ("app/recursion.py", "recurse(0)\n"),
+    ("app/parse.py", "value = int('abc{n}')\n"),
+    ("app/names.py", "total = undefined_total_{n} + 1\n"),
+    ("app/types.py", "result = None\nresult.append({n})\n"),
+    ("app/index.py", "items = [1, 2, 3]\nitem = items[{n} + 10]\n"),
+    ("app/imports.py", "import missing_module_{n}\n"),
+    ("app/net.py", "import socket\nresponse = request_http_api(socket, 'https://example.com/{n}')\n"),
+    ("app/files.py", "with open('/nonexistent/{n}.txt') as f:\n    data = f.read()\n"),
+    ("app/threads.py", "import threading\nlock = threading.Lock()\nlock.release()\n"),
+    ("app/async_task.py", "async def main():\n    await asyncio.sleep({n})\nmain().send(None)\n"),
+    ("app/classes.py", "class Child(Base{n}):\n    def __init__(self):\n        super().__init__()\n"),
+    ("app/syntax.py", "exec(compile('def broken(:\\n    pass', 'app/generated.py', 'exec'))\n"),
+    ("app/assert.py", "assert {n} < 0, 'invariant violated'\n"),
+]
+
+
+def build_corpus(unique: int, total: int, seed: int = 0) -> List[ErrorContextModel]:
+    """実際の例外からエラーコンテキストを作り、total 件に複製して並べ替える"""
+    helpers = {}
+    exec(compile(HELPERS_SOURCE, "app/helpers.py", "exec"), helpers)
+
+    distinct: List[ErrorContextModel] = []
+    for n in range(unique):
+        filename, template = SNIPPETS[n % len(SNIPPETS)]
+        source = template.replace("{n}", str(n))
+        namespace = dict(helpers)
+        try:
+            exec(compile(source, filename, "exec"), namespace)
+        except BaseException as e:
+            distinct.append(ErrorContextModel(
+                error_type=type(e).__name__,
+                error_message=str(e),
+                surrounding_code=source,
+                full_traceback=traceback.format_exc()
+            ))
+
+    rng = random.Random(seed)
+    return [rng.choice(distinct) for _ in range(total)]
+
+
+# 旧実装相当の要因判定（キーワードごとにコード全体を小文字化）
+_LEGACY_FILE_RE = r'File "(.*?)"'
+
+
+def legacy_identify_factors(error_context: ErrorContextModel) -> list:
+    factors = []
+    code = error_context.surrounding_code or ""
+    traceback_text = error_context.full_traceback or ""
+    if "async " in code or "await " in code:
+        factors.append("async_code")
+    if "class " in code and "super()" in code:
+        factors.append("class_hierarchy")
+    if "import " in code or "from " in code:
+        factors.append("external_dependency")
+    if any(db in code.lower() for db in ["sql", "database", "db.", "cursor", "query"]):
+        factors.append("database_operation")
+    if any(net in code.lower() for net in ["http", "request", "socket", "api"]):
+        factors.append("network_operation")
+    if any(op in code.lower() for op in ["open(", "file", "read(", "write("]):
+        factors.append("file_operation")
+    if any(conc in code.lower() for conc in ["thread", "process", "lock", "queue"]):
+        factors.append("concurrency")
+    if traceback_text and len(set(re.findall(_LEGACY_FILE_RE, traceback_text))) > 1:
+        factors.append("multi_file")
+    return factors
+
+
+def time_per_item(func: Callable[[], None], items: int, repeat: int) -> List[float]:
+    """1件あたりの時間（マイクロ秒）を repeat 回計測"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) / items * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ErrorClassifier classification benchmark")
+    parser.add_argument("--errors", type=int, default=500, help="1回に分類するエラー数")
+    parser.add_argument("--unique", type=int, default=40, help="コーパス中のエラーの種類")
+    parser.add_argument("--repeat", type=int, default=20, help="計測回数")
+    args = parser.parse_args()
+
+    # 分類ごとのINFOログは計測対象から外す
+    logging.disable(logging.INFO)
+
+    corpus = build_corpus(args.unique, args.errors)
+
+    uncached = ErrorClassifier(cache_size=0)
+    memoized = ErrorClassifier()
+    batched = ErrorClassifier()
+
+    # 結果が旧実装と一致することを確認
+    for context in corpus:
+        assert uncached._identify_complexity_factors(context) == legacy_identify_factors(context)
+
+    def run_legacy_factors():
+        for context in corpus:
+            legacy_identify_factors(context)
+
+    def run_table_factors():
+        for context in corpus:
+            uncached._identify_complexity_factors(context)
+
+    def run_uncached():
+        for context in corpus:
+            uncached.classify(context)
+
+    def run_memoized():
+        for context in corpus:
+            memoized.classify(context)
+
+    def run_batch():
+        batched.classify_batch(corpus)
+
+    results = [
+        ("factors (legacy scan)", time_per_item(run_legacy_factors, len(corpus), args.repeat)),
+        ("factors (table)", time_per_item(run_table_factors, len(corpus), args.repeat)),
+        ("classify (no cache)", time_per_item(run_uncached, len(corpus), args.repeat)),
+        ("classify (memoized)", time_per_item(run_memoized, len(corpus), args.repeat)),
+        ("classify_batch", time_per_item(run_batch, len(corpus), args.repeat)),
+    ]
+
+    print("=" * 60)
+    print(f"Per-error time (microseconds), {len(corpus)} errors / {args.unique} unique")
+    print("=" * 60)
+    for label, values in results:
+        print(f"{label:24s} mean={statistics.mean(values):8.2f} "
+              f"median={statistics.median(values):8.2f} "
+              f"min={min(values):8.2f}")
+
+    baseline = statistics.median(results[2][1])
+    batch = statistics.median(results[4][1])
+    print(f"\nBatch speedup vs. uncached classify: {baseline / max(batch, 1e-9):.1f}x")
+    print(f"Memo stats: {batched.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+LocalLLMAgent プレフィックス再利用ベンチマーク
+
+Ollama互換のスタブサーバーをローカルに立て、修正プロンプトの
+time-to-first-token（TTFT）を prompt_cache 設定あり／なしで比較する。
+結果はスタブのコストモデルによる合成値で、実際のOllamaの計測値ではない。
+
+スタブのコストモデル（Ollamaの既定動作に合わせる）:
+- モデルは最後のリクエストから keep_alive の間メモリに残る
+  （指定が無ければ Ollama の既定値 5分、0 なら即アンロード、負数なら無期限）
+- ロード済みのモデルは keep_alive の指定に関係なく、直前のプロンプトとの
+  共通プレフィックス分の評価を省略する
+- プロンプト評価は未キャッシュ部分の文字数に比例して時間がかかる
+- リクエスト間の待ち時間（--idle）は実際には待たず、スタブの時計を進めて模擬する
+
+比較する2つの構成:
+- baseline: 変更前のプロンプト構成（可変のエラー情報が先頭、指示部が末尾）で、
+  keep_alive やキャッシュオプションを付けない
+- prefix reuse: 固定の指示部を先頭に置き、prompt_cache=True（keep_alive 付き＋warm_up）
+
+使用例:
+    python scripts/benchmark_local_llm_prefix.py --requests 10
+    python scripts/benchmark_local_llm_prefix.py --requests 10 --idle 600
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import statistics
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+from agents.local_llm_agent import LocalLLMAgent, LocalLLMConfig, LocalLLMProvider
+
+
+class BaselineLocalLLMAgent(LocalLLMAgent):
+    """変更前のプロンプト構成（可変部が先頭）でキャッシュオプションも付けないエージェント"""
+
+    def _build_fix_prompt(self,
+                          error_context: Dict[str, Any],
+                          file_content: str,
+                          file_path: str) -> str:
+        error_type = error_context.get("error_type", "Unknown")
+        error_message = error_context.get("error_message", "")
+        stack_trace = error_context.get("stack_trace", "")
+        line_number = error_context.get("line_number")
+
+        return f"""You are an expert code debugger. Fix the following error in the code.
+
+**Error Information:**
+- Type: {error_type}
+- Message: {error_message}
+- File: {file_path}
+{f"- Line: {line_number}" if line_number else ""}
+
+**Stack Trace:**
+```
+{stack_trace[:500] if stack_trace else "N/A"}
+```
+
+**Current Code:**
+```python
+{file_content}
+```
+
+**Instructions:**
+1. Analyze the error and identify the root cause
+2. Provide the complete fixed code
+3. Explain what was wrong and how you fixed it
+4. Rate your confidence in the fix (0.0-1.0)
+
+**Response Format (JSON):**
+```json
+{{
+  "analysis": "Root cause analysis",
+  "fixed_code": "Complete fixed code here",
+  "explanation": "What was changed and why",
+  "confidence": 0.8,
+  "changes": [
+    {{"line": 10, "old": "old code", "new": "new code", "reason": "why changed"}}
+  ]
+}}
+```
+
+Provide only the JSON response, no additional text."""
+
+    def _apply_cache_options(self, payload: Dict[str, Any]):
+        """keep_alive 等を付けず、サーバーの既定動作に任せる"""
+        return
+
+
+# Ollama の keep_alive 既定値（秒）
+OLLAMA_DEFAULT_KEEP_ALIVE = 5 * 60
+
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_keep_alive(value: Optional[Any]) -> float:
+    """Ollama の keep_alive（秒数または "30m" 形式）を秒に変換（負数は無期限）"""
+    if value is None or value == "":
+        return OLLAMA_DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        parts = re.findall(r"(-?[\d.]+)(ms|s|m|h)?", str(value))
+        if not parts:
+            return OLLAMA_DEFAULT_KEEP_ALIVE
+        seconds = sum(float(number) * _DURATION_UNITS[unit or "s"] for number, unit in parts)
+    return math.inf if seconds < 0 else seconds
+
+
+class StubOllamaServer:
+    """モデル常駐とプレフィックスキャッシュを模擬するOllama互換スタブ"""
+
+    def __init__(self,
+                 load_cost: float = 0.5,
+                 prefill_cost_per_char: float = 0.00005,
+                 token_interval: float = 0.005):
+        self.load_cost = load_cost
+        self.prefill_cost_per_char = prefill_cost_per_char
+        self.token_interval = token_interval
+
+        self.model_loaded = False
+        self.unload_at = 0.0
+        self.cached_prompt = ""
+        self.clock_offset = 0.0
+        self.loads = 0
+        self.port = None
+
+        self._loop = None
+        self._runner = None
+        self._ready = threading.Event()
+
+    async def _handle_tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": "stub"}]})
+
+    def now(self) -> float:
+        """スタブの時計（advance() で進めた待ち時間を含む）"""
+        return time.monotonic() + self.clock_offset
+
+    def advance(self, seconds: float):
+        """リクエスト間の待ち時間を模擬する"""
+        self.clock_offset += seconds
+
+    async def _handle_generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        prompt = payload.get("prompt", "")
+        keep_alive = parse_keep_alive(payload.get("keep_alive"))
+
+        # keep_alive が切れていればアンロード済み（KVキャッシュも消える）
+        if self.model_loaded and self.now() >= self.unload_at:
+            self.model_loaded = False
+            self.cached_prompt = ""
+
+        # モデルロード
+        if not self.model_loaded:
+            await asyncio.sleep(self.load_cost)
+            self.model_loaded = True
+            self.loads += 1
+
+        # 共通プレフィックス分は再評価しない
+        reused = len(os.path.commonprefix([self.cached_prompt, prompt]))
+        await asyncio.sleep((len(prompt) - reused) * self.prefill_cost_per_char)
+        self.cached_prompt = prompt
+
+        if keep_alive == 0:
+            self.model_loaded = False
+            self.cached_prompt = ""
+        else:
+            self.unload_at = self.now() + keep_alive
+
+        answer = json.dumps({
+            "fixed_code": "def f():\n    return 1\n",
+            "explanation": "stub",
+            "confidence": 0.9,
+            "changes": []
+        })
+
+        if not payload.get("stream"):
+            return web.json_response({"response": answer, "done": True})
+
+        response = web.StreamResponse()
+        response.content_type = "application/x-ndjson"
+        await response.prepare(request)
+
+        tokens = [answer[i:i + 8] for i in range(0, len(answer), 8)]
+        try:
+            for token in tokens:
+                await response.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+                await asyncio.sleep(self.token_interval)
+            await response.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+            await response.write_eof()
+        except ConnectionResetError:
+            # クライアントが完了検出で早期に切断した（正常系）
+            pass
+        return response
+
+    def start(self):
+        """別スレッドのイベントループでサーバーを起動"""
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        app = web.Application()
+        app.router.add_get("/api/tags", self._handle_tags)
+        app.router.add_post("/api/generate", self._handle_generate)
+
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        self._ready.set()
+        self._loop.run_forever()
+
+    def reset(self):
+        self.model_loaded = False
+        self.unload_at = 0.0
+        self.cached_prompt = ""
+        self.clock_offset = 0.0
+        self.loads = 0
+
+
+def build_error_contexts(count: int) -> List[Dict[str, Any]]:
+    """毎回異なるエラー情報（可変部）を生成"""
+    return [
+        {
+            "error_type": "NameError",
+            "error_message": f"name 'value_{i}' is not defined",
+            "line_number": 10 + i,
+            "stack_trace": f"Traceback (most recent call last):\n  File 'app.py', line {10 + i}, in run"
+        }
+        for i in range(count)
+    ]
+
+
+async def measure(server: StubOllamaServer, prompt_cache: bool, count: int, idle: float) -> List[float]:
+    """TTFT（最初のチャンク受信まで）を計測（prompt_cache=False は変更前の構成）"""
+    server.reset()
+
+    first_chunk_at: Dict[str, float] = {}
+
+    def on_progress(progress: Dict[str, Any]):
+        if progress["chunks"] >= 1 and "t" not in first_chunk_at:
+            first_chunk_at["t"] = time.perf_counter()
+
+    agent_class = LocalLLMAgent if prompt_cache else BaselineLocalLLMAgent
+    agent = agent_class(
+        config=LocalLLMConfig(
+            provider=LocalLLMProvider.OLLAMA,
+            model_name="stub",
+            endpoint=f"http://127.0.0.1:{server.port}",
+            stream=True,
+            prompt_cache=prompt_cache
+        ),
+        progress_callback=on_progress
+    )
+
+    if prompt_cache:
+        await agent.warm_up()
+
+    file_content = "\n".join(f"line_{i} = {i}" for i in range(200))
+    ttfts = []
+
+    for index, error_context in enumerate(build_error_contexts(count)):
+        if index:
+            server.advance(idle)
+        first_chunk_at.clear()
+        started = time.perf_counter()
+        result = await agent.generate_fix(error_context, file_content, "app.py")
+        if not result["success"]:
+            raise RuntimeError(result.get("error"))
+        ttfts.append(first_chunk_at["t"] - started)
+
+    await agent.close()
+    return ttfts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LocalLLMAgent prefix reuse benchmark")
+    parser.add_argument("--requests", type=int, default=10, help="計測するリクエスト数")
+    parser.add_argument("--idle", type=float, default=0.0,
+                        help="リクエスト間の待ち時間（秒、スタブの時計で模擬）")
+    args = parser.parse_args()
+
+    server = StubOllamaServer()
+    server.start()
+
+    async def run():
+        without = await measure(server, prompt_cache=False, count=args.requests, idle=args.idle)
+        without_loads = server.loads
+        with_cache = await measure(server, prompt_cache=True, count=args.requests, idle=args.idle)
+        return (without, without_loads), (with_cache, server.loads)
+
+    results = asyncio.run(run())
+
+    print("=" * 60)
+    print("Time-to-first-token (seconds) - SYNTHETIC")
+    print("=" * 60)
+    print("Stub server cost model, not a measurement of a real Ollama instance.")
+    print(f"Model residency follows Ollama's default keep_alive ({OLLAMA_DEFAULT_KEEP_ALIVE // 60}m) "
+          f"unless the request sets one; simulated idle between requests: {args.idle:g}s")
+    print("-" * 60)
+    labels = ("baseline", "prefix reuse")
+    for label, (values, loads) in zip(labels, results):
+        print(f"{label:22s} mean={statistics.mean(values):.3f} "
+              f"median={statistics.median(values):.3f} "
+              f"max={max(values):.3f} loads={loads}")
+
+    without, with_reuse = results[0][0], results[1][0]
+
+    speedup = statistics.mean(without) / max(statistics.mean(with_reuse), 1e-9)
+    print(f"\nSpeedup (synthetic): {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
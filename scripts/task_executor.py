@@ -39,6 +39,14 @@ except ImportError:
     HAS_TASK_ROUTER = False
     task_router = None
 
+# ===== メトリクス収集（オプション） =====
+try:
+    from agents.metrics_collector import MetricsCollectorAgent
+    HAS_METRICS_COLLECTOR = True
+except ImportError:
+    HAS_METRICS_COLLECTOR = False
+    MetricsCollectorAgent = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -49,7 +57,8 @@ class TaskExecutor:
         self, 
         sheets_manager: GoogleSheetsManager, 
         browser_controller=None, 
-        max_iterations: int = None
+        max_iterations: int = None,
+        metrics_collector=None
     ):
         """
         初期化
@@ -58,12 +67,21 @@ class TaskExecutor:
             sheets_manager: GoogleSheetsManager インスタンス
             browser_controller: BrowserController インスタンス(オプション)
             max_iterations: 最大反復回数
+            metrics_collector: MetricsCollectorAgent インスタンス(省略時は自動作成)
         """
         self.sheets_manager = sheets_manager
         self.browser = browser_controller
         self.agents = {}
         self.review_agent = None
         
+        # タスク単位のリソース計測（ロール別・タスクタイプ別）
+        if metrics_collector is None and HAS_METRICS_COLLECTOR:
+            try:
+                metrics_collector = MetricsCollectorAgent()
+            except Exception as e:
+                logger.warning(f"⚠️ MetricsCollectorAgent 初期化失敗: {e}")
+        self.metrics_collector = metrics_collector
+        
         if max_iterations is None:
             self.max_iterations = config.MAX_ITERATIONS
         else:
@@ -303,7 +321,58 @@ class TaskExecutor:
         self.review_agent = review_agent
         logger.info("レビューエージェントを登録しました")
 
+    def start_task_metrics(self, task: Dict) -> bool:
+        """
+        タスクの計測を開始（以降このタスク内の待ち時間・CPU時間を帰属させる）
+        
+        Returns:
+            bool: 計測を開始した（既に計測中・コレクタなしなら False）
+        """
+        if not self.metrics_collector:
+            return False
+        task_id = task.get('task_id', 'UNKNOWN')
+        if task_id in self.metrics_collector.active_tasks:
+            return False
+        
+        role = (task.get('required_role') or 'unknown').lower()
+        try:
+            self.metrics_collector.start_task(
+                task_id,
+                role,
+                task_type=self._determine_task_type_safe(task),
+                role=role
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ タスク計測開始エラー: {e}")
+            return False
+    
+    def end_task_metrics(self, task: Dict, success: bool, error_type: Optional[str] = None):
+        """start_task_metrics で開始した計測を終了"""
+        role = (task.get('required_role') or 'unknown').lower()
+        try:
+            self.metrics_collector.end_task(
+                task.get('task_id', 'UNKNOWN'), role, success, error_type=error_type
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ タスク計測終了エラー: {e}")
+    
     async def execute_task_with_extensions(self, task: Dict) -> bool:
+        """拡張モジュールを考慮したタスク実行（リソース計測付き）"""
+        tracking = self.start_task_metrics(task)
+        success = False
+        error_type = None
+        try:
+            success = await self._execute_task_with_extensions(task)
+            return success
+        except Exception as e:
+            error_type = type(e).__name__
+            raise
+        finally:
+            if tracking:
+                self.end_task_metrics(task, success, error_type)
+    
+    async def _execute_task_with_extensions(self, task: Dict) -> bool:
         """
         拡張モジュールを考慮したタスク実行
         
@@ -410,6 +479,21 @@ class TaskExecutor:
             logger.warning(f"⚠️ ステータス更新エラー: {e}")
     
     async def execute_task(self, task: Dict) -> bool:
+        """タスク実行（リソース計測付き）"""
+        tracking = self.start_task_metrics(task)
+        success = False
+        error_type = None
+        try:
+            success = await self._execute_task(task)
+            return success
+        except Exception as e:
+            error_type = type(e).__name__
+            raise
+        finally:
+            if tracking:
+                self.end_task_metrics(task, success, error_type)
+    
+    async def _execute_task(self, task: Dict) -> bool:
         """タスク実行（完全修正版）"""
         task_id = task.get('task_id', 'UNKNOWN')
         
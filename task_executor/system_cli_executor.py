@@ -6,6 +6,8 @@ WP-CLI、ACF、ファイル操作などのシステムタスクを担当
 import asyncio
 import subprocess
 import logging
+import time
+from collections import defaultdict
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 from datetime import datetime
@@ -15,6 +17,12 @@ from configuration.config_utils import ErrorHandler, config
 
 # データ管理
 from tools.sheets_manager import GoogleSheetsManager
+from tools.resource_accounting import (
+    WAIT_SUBPROCESS,
+    add_subprocess_cpu,
+    children_cpu_time,
+    track_wait,
+)
 
 # コマンド監視エージェント
 try:
@@ -63,6 +71,11 @@ class SystemCLIExecutor:
         # WP-CLI設定
         self.wp_cli_path = self._detect_wp_cli_path()
         
+        # CLIタイプ別のリソース消費量
+        self.resource_stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"runs": 0, "wall_time": 0.0, "subprocess_cpu": 0.0}
+        )
+        
         logger.info("✅ SystemCLIExecutor 初期化完了")
     
     def _detect_wp_cli_path(self) -> str:
@@ -111,18 +124,28 @@ class SystemCLIExecutor:
             cli_type = self._determine_cli_type(task)
             logger.info(f"CLIタイプ: {cli_type}")
             
-            # タイプ別実行
-            if cli_type == 'wp-cli':
-                result = await self._execute_wp_cli_task(task)
-            elif cli_type == 'acf':
-                result = await self._execute_acf_task(task)
-            elif cli_type == 'file':
-                result = await self._execute_file_operation_task(task)
-            elif cli_type == 'generic':
-                result = await self._execute_generic_command_task(task)
-            else:
-                logger.warning(f"⚠️ 未知のCLIタイプ: {cli_type}")
-                result = await self._execute_generic_command_task(task)
+            # タイプ別実行（子プロセスのCPU時間と待ち時間を計測）
+            wall_start = time.perf_counter()
+            children_start = children_cpu_time()
+            
+            with track_wait(WAIT_SUBPROCESS):
+                if cli_type == 'wp-cli':
+                    result = await self._execute_wp_cli_task(task)
+                elif cli_type == 'acf':
+                    result = await self._execute_acf_task(task)
+                elif cli_type == 'file':
+                    result = await self._execute_file_operation_task(task)
+                elif cli_type == 'generic':
+                    result = await self._execute_generic_command_task(task)
+                else:
+                    logger.warning(f"⚠️ 未知のCLIタイプ: {cli_type}")
+                    result = await self._execute_generic_command_task(task)
+            
+            result['resource_usage'] = self._record_resource_usage(
+                cli_type,
+                time.perf_counter() - wall_start,
+                children_cpu_time() - children_start
+            )
             
             if result.get('success'):
                 logger.info(f"✅ CLIタスク {task_id} 完了")
@@ -139,6 +162,38 @@ class SystemCLIExecutor:
                 'error': str(e)
             }
     
+    def _record_resource_usage(self, cli_type: str, wall_time: float, subprocess_cpu: float) -> Dict:
+        """
+        CLIタスクのリソース消費量を記録
+        
+        子プロセスCPUは回収済み子プロセスの累計差分なので、
+        同時に別のコマンドが終了した場合はその分も含まれる。
+        """
+        subprocess_cpu = max(0.0, subprocess_cpu)
+        stats = self.resource_stats[cli_type]
+        stats["runs"] += 1
+        stats["wall_time"] += wall_time
+        stats["subprocess_cpu"] += subprocess_cpu
+        
+        # 実行中タスク（MetricsCollectorAgent.start_task）へ帰属させる
+        add_subprocess_cpu(subprocess_cpu)
+        
+        return {
+            'cli_type': cli_type,
+            'wall_time': round(wall_time, 4),
+            'subprocess_cpu': round(subprocess_cpu, 4)
+        }
+    
+    def get_resource_stats(self) -> Dict[str, Dict[str, float]]:
+        """CLIタイプ別のリソース消費量を取得"""
+        return {
+            cli_type: {
+                **stats,
+                "avg_subprocess_cpu": stats["subprocess_cpu"] / stats["runs"] if stats["runs"] else 0.0
+            }
+            for cli_type, stats in self.resource_stats.items()
+        }
+    
     def _determine_cli_type(self, task: Dict) -> str:
         """
         CLIタスクのタイプを判定
@@ -194,7 +194,7 @@ class TaskCoordinator:
     
     async def execute_task_coordinated(self, task: Dict) -> Dict:
         """
-        タスクを適切な実行モジュールに振り分けて実行
+        タスクを適切な実行モジュールに振り分けて実行（リソース計測付き）
         
         Args:
             task: タスク情報辞書
@@ -202,6 +202,19 @@ class TaskCoordinator:
         Returns:
             Dict: 実行結果
         """
+        # 振り分け先の実行モジュールでの待ち時間・CPU時間もこのタスクに帰属させる
+        start_metrics = getattr(self.task_executor, 'start_task_metrics', None)
+        tracking = bool(start_metrics and start_metrics(task))
+        result = None
+        try:
+            result = await self._execute_task_coordinated(task)
+            return result
+        finally:
+            if tracking:
+                self.task_executor.end_task_metrics(task, bool(result and result.get('success')))
+    
+    async def _execute_task_coordinated(self, task: Dict) -> Dict:
+        """タスクを適切な実行モジュールに振り分けて実行"""
         task_id = task.get('task_id', 'UNKNOWN')
         self.stats['total_executed'] += 1
         
@@ -32,7 +32,8 @@ class WorkflowExecutor:
         self,
         task_executor: TaskExecutor,
         sheets_manager: GoogleSheetsManager,
-        browser_controller=None
+        browser_controller=None,
+        page_pool=None
     ):
         """
         初期化
@@ -41,10 +42,12 @@ class WorkflowExecutor:
             task_executor: 既存のTaskExecutorインスタンス
             sheets_manager: GoogleSheetsManagerインスタンス
             browser_controller: BrowserControllerインスタンス(オプション)
+            page_pool: BrowserPagePool（省略時は browser_controller のプールを使用）
         """
         self.task_executor = task_executor
         self.sheets_manager = sheets_manager
         self.browser = browser_controller
+        self.page_pool = page_pool
         
         # ワークフロー統計
         self.workflow_stats = {
@@ -579,7 +582,14 @@ class WorkflowExecutor:
             return {'success': False, 'error': '並列タスクが定義されていません'}
         
         try:
-            logger.info(f"⚡ 並列ワークフロー実行 ({len(parallel_tasks)}タスク)")
+            page_pool = self._get_page_pool()
+            if page_pool:
+                logger.info(
+                    f"⚡ 並列ワークフロー実行 ({len(parallel_tasks)}タスク, "
+                    f"同時実行上限={page_pool.max_pages}タブ)"
+                )
+            else:
+                logger.info(f"⚡ 並列ワークフロー実行 ({len(parallel_tasks)}タスク)")
             
             # 並列タスクリスト構築
             coroutines = []
@@ -590,7 +600,7 @@ class WorkflowExecutor:
                     'task_id': f"{task_id}_parallel{i}"
                 }
                 coroutines.append(
-                    self.task_executor.execute_task(parallel_task_config)
+                    self._execute_with_page(parallel_task_config, page_pool)
                 )
             
             # 並列実行
@@ -619,6 +629,32 @@ class WorkflowExecutor:
                 'error': str(e)
             }
     
+    def _get_page_pool(self):
+        """
+        並列タスクに1タブずつ貸し出すページプール
+        
+        プールがなければ全タスクが同じタブを共有する（従来の動作）
+        """
+        if self.page_pool is not None:
+            return self.page_pool
+        
+        browser = self.browser or getattr(self.task_executor, 'browser', None)
+        if browser is None or not hasattr(browser, 'get_page_pool') or not browser.context:
+            return None
+        try:
+            self.page_pool = browser.get_page_pool()
+        except Exception as e:
+            logger.warning(f"⚠️ ページプール作成失敗 - 単一タブで実行: {e}")
+            return None
+        return self.page_pool
+    
+    async def _execute_with_page(self, task: Dict, page_pool) -> Any:
+        """タブを借りてタスクを実行（借りている間はエージェントの操作がそのタブに向く）"""
+        if page_pool is None:
+            return await self.task_executor.execute_task(task)
+        async with page_pool.lease(task.get('task_id')):
+            return await self.task_executor.execute_task(task)
+    
     async def _execute_conditional_workflow(self, task: Dict) -> Dict:
         """
         条件分岐ワークフロー
@@ -701,4 +737,7 @@ class WorkflowExecutor:
     
     def get_workflow_stats(self) -> Dict:
         """ワークフロー統計情報を取得"""
-        return self.workflow_stats.copy()
\ No newline at end of file
+        stats = self.workflow_stats.copy()
+        if self.page_pool is not None:
+            stats['page_pool'] = self.page_pool.get_stats()
+        return stats
\ No newline at end of file
@@ -322,7 +322,7 @@ class IntegrationTestSuite:
         
         try:
             # モデル情報を取得
-            info = self.local_llm.get_model_info()
+            info = await self.local_llm.get_model_info()
             assert info["available"], "Model should be available"
             
             # 簡単な修正を生成
@@ -0,0 +1,56 @@
+"""CloudLLMClient のイベントループごとのセッション管理のテスト"""
+import asyncio
+
+from tools.cloud_llm_client import CloudLLMClient
+
+
+def test_session_is_shared_within_a_loop_and_closed_on_close():
+    client = CloudLLMClient()
+
+    async def scenario():
+        first = await client._get_session()
+        second = await client._get_session()
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first is second
+    assert first.closed
+    assert client._sessions == {}
+
+
+def test_sessions_of_closed_loops_are_dropped():
+    client = CloudLLMClient()
+    stale = []
+
+    # close() を呼ばずに終わった asyncio.run() のループを模擬
+    for _ in range(3):
+        loop = asyncio.new_event_loop()
+        stale.append(loop.run_until_complete(client._get_session()))
+        loop.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        current = loop.run_until_complete(client._get_session())
+
+        assert list(client._sessions.values()) == [current]
+        assert all(session.closed for session in stale)
+        assert not current.closed
+    finally:
+        loop.run_until_complete(client.close())
+        loop.close()
+
+    assert client._sessions == {}
+
+
+def test_close_drops_sessions_left_by_other_closed_loops():
+    client = CloudLLMClient()
+    abandoned = asyncio.new_event_loop()
+    session = abandoned.run_until_complete(client._get_session())
+    abandoned.close()
+
+    asyncio.run(client.close())
+
+    assert session.closed
+    assert client._sessions == {}
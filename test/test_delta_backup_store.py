@@ -0,0 +1,77 @@
+"""DeltaBackupStore のテスト（逆差分の往復・版数上限・再読み込み）"""
+import pytest
+
+from tools.delta_backup_store import DeltaBackupStore, apply_reverse_delta, make_reverse_delta
+
+
+def _version(i: int) -> bytes:
+    lines = [f"line {n}\n" for n in range(50)]
+    lines[i % 50] = f"changed in version {i}\n"
+    lines.append(f"# footer {i}\n")
+    return "".join(lines).encode("utf-8")
+
+
+@pytest.mark.parametrize("newer, older", [
+    (b"a\nb\nc\n", b"a\nB\nc\n"),
+    (b"a\nb\nc\n", b""),
+    (b"", b"x\ny"),
+    (b"keep\nno newline", b"keep\nno newline\nadded\n"),
+    (b"\xff\xfe binary\n", b"\x00\x01 other\n\xff"),
+])
+def test_reverse_delta_round_trip(newer, older):
+    assert apply_reverse_delta(newer, make_reverse_delta(newer, older)) == older
+
+
+def test_every_version_round_trips(tmp_path):
+    store = DeltaBackupStore(tmp_path / "backups", max_versions=20)
+    target = tmp_path / "app.py"
+
+    refs = [store.put(target, _version(i)) for i in range(8)]
+
+    for i, ref in enumerate(refs):
+        assert store.get(ref) == _version(i)
+    assert store.latest(target) == refs[-1]
+    # 古い版は差分で保存されるので、丸ごと保存より小さい
+    deltas = list((tmp_path / "backups").glob("*/v*.delta"))
+    assert len(deltas) == 7
+    assert all(delta.read_bytes()[:1] == b"D" for delta in deltas)
+    assert sum(delta.stat().st_size for delta in deltas) < sum(len(_version(i)) for i in range(7)) / 4
+
+
+def test_unchanged_content_is_deduplicated(tmp_path):
+    store = DeltaBackupStore(tmp_path / "backups")
+    target = tmp_path / "app.py"
+
+    first = store.put(target, b"same\n")
+    second = store.put(target, b"same\n")
+
+    assert first == second
+    assert len(store.versions(target)) == 1
+    assert store.get_stats()["deduplicated"] == 1
+
+
+def test_oldest_versions_are_dropped_beyond_limit(tmp_path):
+    store = DeltaBackupStore(tmp_path / "backups", max_versions=3)
+    target = tmp_path / "app.py"
+
+    refs = [store.put(target, _version(i)) for i in range(5)]
+
+    assert [v["ref"] for v in store.versions(target)] == refs[2:]
+    assert not store.has(refs[0])
+    with pytest.raises(FileNotFoundError):
+        store.get(refs[1])
+    assert store.get(refs[2]) == _version(2)
+    assert len(list((tmp_path / "backups").glob("*/v*.delta"))) == 2
+
+
+def test_index_is_reloaded_and_restore_writes_file(tmp_path):
+    root = tmp_path / "backups"
+    target = tmp_path / "app.py"
+    first = DeltaBackupStore(root).put(target, _version(0))
+    second = DeltaBackupStore(root).put(target, _version(1))
+
+    reopened = DeltaBackupStore(root)
+    assert reopened.latest(target) == second
+
+    reopened.restore(first, target)
+    assert target.read_bytes() == _version(0)
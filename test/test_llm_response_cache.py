@@ -0,0 +1,128 @@
+"""LLMResponseCache のテスト（TTL・LRU削除・無効化）"""
+import pytest
+
+from tools import llm_response_cache
+from tools.llm_response_cache import LLMResponseCache
+
+
+class FakeClock:
+    """time.time() の代わりに進められる時計"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_response_cache.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path, clock, monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_BYPASS", raising=False)
+    instance = LLMResponseCache(cache_dir=str(tmp_path), ttl_seconds=60, max_entries=3, memory_entries=2)
+    yield instance
+    instance.close()
+
+
+def test_hit_after_put_with_normalized_prompt(cache):
+    key = cache.put("ollama", "m", 0, "fix this\r\n\n\n\ncode  ", {"fixed_code": "x"})
+
+    assert cache.get("ollama", "m", 0, "fix this\n\ncode") == {"fixed_code": "x"}
+    assert key == cache.make_key("ollama", "m", 0, "fix this\n\ncode")
+    # モデル・温度が違えば別のキー
+    assert cache.get("ollama", "other", 0, "fix this\n\ncode") is None
+    assert cache.make_key("ollama", "m", 0.7, "fix this\n\ncode") != key
+
+
+def test_nonzero_temperature_is_not_cached_by_default(cache):
+    assert cache.put("ollama", "m", 0.7, "prompt", "sampled") is None
+    assert cache.get("ollama", "m", 0.7, "prompt") is None
+    assert cache.get_stats()["entries"] == 0
+    assert cache.stats["uncacheable"] == 1
+
+
+def test_nonzero_temperature_caching_is_opt_in(tmp_path, clock):
+    opted_in = LLMResponseCache(cache_dir=str(tmp_path), cache_nonzero_temperature=True)
+    try:
+        key = opted_in.put("cloud", "m", 0.3, "prompt", "sampled")
+        assert key is not None
+        assert opted_in.get("cloud", "m", 0.3, "prompt") == "sampled"
+    finally:
+        opted_in.close()
+
+
+def test_entry_expires_after_ttl(cache, clock):
+    cache.put("ollama", "m", None, "prompt", "answer")
+    clock.now += 59
+    assert cache.get("ollama", "m", None, "prompt") == "answer"
+
+    clock.now += 2
+    assert cache.get("ollama", "m", None, "prompt") is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_individual_ttl_and_cleanup(cache, clock):
+    cache.put("ollama", "m", None, "short", "a", ttl_seconds=5)
+    cache.put("ollama", "m", None, "long", "b")
+    clock.now += 10
+
+    assert cache.cleanup_expired() == 1
+    assert cache.get("ollama", "m", None, "short") is None
+    assert cache.get("ollama", "m", None, "long") == "b"
+
+
+def test_least_recently_used_entry_is_evicted(cache, clock):
+    for name in ("a", "b", "c"):
+        cache.put("ollama", "m", None, name, name)
+        clock.now += 1
+
+    # a を参照して最終アクセスを更新（メモリ層から外れていても永続層で更新される）
+    cache._memory.clear()
+    assert cache.get("ollama", "m", None, "a") == "a"
+    clock.now += 1
+
+    cache.put("ollama", "m", None, "d", "d")
+
+    assert cache.get("ollama", "m", None, "b") is None
+    assert cache.get("ollama", "m", None, "a") == "a"
+    assert cache.get("ollama", "m", None, "d") == "d"
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_invalidate_removes_memory_and_disk_entry(cache):
+    key = cache.put("ollama", "m", None, "prompt", {"fixed_code": "bad"})
+
+    assert cache.invalidate(key) is True
+    assert cache.get("ollama", "m", None, "prompt") is None
+    assert cache.get_by_key(key) is None
+    # 2回目・キーなしは何もしない
+    assert cache.invalidate(key) is False
+    assert cache.invalidate(None) is False
+
+
+def test_persisted_entries_survive_reopen(tmp_path, clock):
+    first = LLMResponseCache(cache_dir=str(tmp_path), ttl_seconds=60)
+    first.put("cloud", "m", None, "prompt", [1, 2])
+    first.close()
+
+    second = LLMResponseCache(cache_dir=str(tmp_path), ttl_seconds=60)
+    try:
+        assert second.get("cloud", "m", None, "prompt") == [1, 2]
+    finally:
+        second.close()
+
+
+def test_bypass_flag_and_environment(cache, monkeypatch):
+    assert cache.put("ollama", "m", None, "prompt", "a", bypass=True) is None
+    assert cache.get("ollama", "m", None, "prompt") is None
+
+    cache.put("ollama", "m", None, "prompt", "a")
+    monkeypatch.setenv("LLM_CACHE_BYPASS", "1")
+    assert cache.get("ollama", "m", None, "prompt") is None
+    assert cache.get_stats()["bypassed"] == 1
@@ -0,0 +1,84 @@
+"""LocalLLMAgent のリクエストキャンセルのテスト（子タスクのみをキャンセルする）"""
+import asyncio
+
+import pytest
+
+from agents.local_llm_agent import (
+    LLMRequestCancelled,
+    LocalLLMAgent,
+    LocalLLMConfig,
+    LocalLLMProvider,
+)
+from tools.llm_response_cache import LLMResponseCache
+
+
+@pytest.fixture
+def agent(tmp_path):
+    cache = LLMResponseCache(cache_dir=str(tmp_path))
+    instance = LocalLLMAgent(
+        config=LocalLLMConfig(provider=LocalLLMProvider.CUSTOM, model_name="stub", endpoint="http://127.0.0.1:9"),
+        response_cache=cache
+    )
+
+    async def hang(method, path, payload, timeout):
+        await asyncio.sleep(3600)
+
+    instance._send_json = hang
+    yield instance
+    cache.close()
+
+
+async def _wait_inflight(agent):
+    while not agent._inflight:
+        await asyncio.sleep(0)
+
+
+def test_cancel_pending_raises_to_caller_and_keeps_workflow_running(agent):
+    async def workflow():
+        try:
+            await agent._request_json("POST", "/api/generate", {})
+        except LLMRequestCancelled:
+            await asyncio.sleep(0)  # キャンセルされていなければ続行できる
+            return "continued"
+
+    async def scenario():
+        task = asyncio.create_task(workflow())
+        await _wait_inflight(agent)
+        assert agent.cancel_pending() == 1
+        return await task, task
+
+    result, task = asyncio.run(scenario())
+
+    assert result == "continued"
+    assert not task.cancelled()
+    assert not agent._inflight
+
+
+def test_close_cancels_requests_but_not_the_waiting_task(agent):
+    async def scenario():
+        task = asyncio.create_task(agent._request_json("POST", "/api/generate", {}))
+        await _wait_inflight(agent)
+        await agent.close()
+        with pytest.raises(LLMRequestCancelled):
+            await task
+        return task
+
+    task = asyncio.run(scenario())
+
+    assert not task.cancelled()
+
+
+def test_cancelling_the_caller_cancels_its_request(agent):
+    async def scenario():
+        task = asyncio.create_task(agent._request_json("POST", "/api/generate", {}))
+        await _wait_inflight(agent)
+        [child] = agent._inflight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return child
+
+    child = asyncio.run(scenario())
+
+    assert child.cancelled()
+    assert not agent._inflight
@@ -0,0 +1,65 @@
+"""メトリクス時系列（リングバッファ・ダウンサンプリング）のテスト"""
+import pytest
+
+from tools.metrics_timeseries import AggregateRing, MetricsTimeSeriesStore, TimeSeries
+
+
+def test_ring_overwrites_oldest_slots():
+    ring = AggregateRing(3)
+    for ts in range(5):
+        ring.append(float(ts), ts, ts, ts, 1)
+
+    assert len(ring) == 3
+    assert ring.oldest_timestamp() == 2.0
+    assert [row[0] for row in ring.iter_range(float("-inf"), float("inf"))] == [2.0, 3.0, 4.0]
+    assert [row[0] for row in ring.iter_range(3.0, 3.5)] == [3.0]
+
+
+def test_samples_are_downsampled_into_min_max_avg_buckets():
+    series = TimeSeries("cpu", raw_capacity=100, levels=((60, 10),))
+    # 1分目: 10, 20, 30 / 2分目: 5
+    for ts, value in ((0, 10), (20, 20), (40, 30), (60, 5)):
+        series.add(value, ts)
+
+    points = series.query(resolution=60)["points"]
+
+    assert [p["timestamp"] for p in points] == [0, 60]
+    assert points[0] == {"timestamp": 0, "min": 10.0, "max": 30.0, "avg": 20.0, "count": 3}
+    # 集計中のバケットも返す
+    assert points[1]["count"] == 1 and points[1]["avg"] == 5.0
+
+
+def test_each_level_keeps_fixed_memory():
+    series = TimeSeries("mem", raw_capacity=10, levels=((60, 5), (300, 4)))
+    before = series.nbytes()
+
+    for ts in range(0, 3600, 10):
+        series.add(ts, ts)
+
+    assert series.nbytes() == before
+    assert len(series.raw) == 10
+    assert len(series.levels[0][1]) == 5
+    assert len(series.levels[1][1]) == 4
+
+
+def test_query_chooses_finest_resolution_covering_range():
+    series = TimeSeries("mem", raw_capacity=10, levels=((60, 30), (600, 10)))
+    for ts in range(0, 3600, 10):
+        series.add(1.0, ts)
+
+    assert series.query(start=3550)["resolution"] == 0
+    assert series.query(start=3600 - 25 * 60)["resolution"] == 60
+    assert series.query(start=0)["resolution"] == 600
+    with pytest.raises(ValueError):
+        series.query(resolution=15)
+
+
+def test_store_records_only_numeric_values():
+    store = MetricsTimeSeriesStore(raw_capacity=5, levels=((60, 5),))
+    store.record({"cpu": 12.5, "ok": True, "status": "running", "tasks": 3}, timestamp=100.0)
+    store.record({"cpu": 7.5}, timestamp=110.0)
+
+    assert store.names() == ["cpu", "tasks"]
+    assert store.latest() == {"cpu": 7.5, "tasks": 3.0}
+    assert store.query("cpu", resolution=60)["points"][0]["avg"] == 10.0
+    assert store.query("missing")["points"] == []
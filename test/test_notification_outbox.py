@@ -0,0 +1,117 @@
+"""NotificationOutbox のテスト（冪等性・リトライ・ダイジェスト・復旧）"""
+import pytest
+
+from tools import notification_outbox
+from tools.notification_outbox import NotificationOutbox
+
+
+class FakeClock:
+    def __init__(self, now: float = 10_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(notification_outbox.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def outbox(tmp_path, clock):
+    instance = NotificationOutbox(outbox_dir=str(tmp_path))
+    yield instance
+    instance.close()
+
+
+def _ids(rows):
+    return [row["id"] for row in rows]
+
+
+def test_idempotency_key_registers_each_channel_once(outbox):
+    first = outbox.enqueue({"message": "a"}, ["slack", "email"], idempotency_key="err-1")
+    second = outbox.enqueue({"message": "a"}, ["slack", "email", "discord"], idempotency_key="err-1")
+
+    assert first == ["slack", "email"]
+    assert second == ["discord"]
+    assert outbox.stats["duplicates"] == 2
+    assert outbox.counts()["pending"] == 3
+
+
+def test_delivered_rows_are_not_claimed_again(outbox):
+    outbox.enqueue({"message": "a"}, ["slack"], idempotency_key="k")
+    rows = outbox.claim_due("slack")
+    outbox.mark_delivered(_ids(rows))
+
+    assert outbox.claim_due("slack") == []
+    assert outbox.enqueue({"message": "a"}, ["slack"], idempotency_key="k") == []
+    assert outbox.counts()["delivered"] == 1
+
+
+def test_retry_waits_for_backoff_and_counts_attempts_per_row(outbox, clock):
+    outbox.enqueue({"message": "old"}, ["slack"])
+    [row] = outbox.claim_due("slack")
+    outbox.mark_retry([row["id"]], "timeout", delay=30)
+
+    # バックオフ中は取り出されない
+    assert outbox.claim_due("slack") == []
+    assert outbox.next_due("slack") == clock.now + 30
+
+    outbox.enqueue({"message": "new"}, ["slack"])
+    clock.now += 31
+    rows = outbox.claim_due("slack")
+
+    assert {r["notification"]["message"]: r["attempts"] for r in rows} == {"old": 1, "new": 0}
+
+
+def test_failed_rows_are_kept_until_retention(outbox, clock):
+    outbox.enqueue({"message": "a"}, ["slack"], idempotency_key="k")
+    outbox.mark_failed(_ids(outbox.claim_due("slack")), "gave up")
+
+    assert outbox.claim_due("slack") == []
+    assert outbox.recent()[-1]["error"] == "gave up"
+
+    clock.now += outbox.retention_seconds + 1
+    assert outbox.purge() == 1
+    # 保持期間後は冪等キーも解放される
+    assert outbox.enqueue({"message": "a"}, ["slack"], idempotency_key="k") == ["slack"]
+
+
+def test_digest_peers_are_claimed_together(outbox, clock):
+    outbox.enqueue({"message": "first"}, ["slack"], digest_key="disk", delay=0)
+    outbox.enqueue({"message": "second"}, ["slack"], digest_key="disk", delay=60)
+    outbox.enqueue({"message": "other"}, ["slack"], digest_key="cpu", delay=60)
+
+    rows = outbox.claim_due("slack")
+
+    assert [r["notification"]["message"] for r in rows] == ["first", "second"]
+
+
+def test_expedite_keeps_retry_backoff_by_default(outbox, clock):
+    outbox.enqueue({"message": "retrying"}, ["slack"])
+    outbox.mark_retry(_ids(outbox.claim_due("slack")), "timeout", delay=300)
+    outbox.enqueue({"message": "digest"}, ["slack"], digest_key="d", delay=300)
+
+    assert outbox.unsent_count() == 1
+    assert outbox.expedite() == 1
+    assert [r["notification"]["message"] for r in outbox.claim_due("slack")] == ["digest"]
+
+    assert outbox.expedite(include_retries=True) == 1
+    assert [r["notification"]["message"] for r in outbox.claim_due("slack")] == ["retrying"]
+
+
+def test_rows_left_sending_are_recovered_on_restart(tmp_path, clock):
+    first = NotificationOutbox(outbox_dir=str(tmp_path))
+    first.enqueue({"message": "a"}, ["slack"])
+    assert len(first.claim_due("slack")) == 1
+    first.close()
+
+    second = NotificationOutbox(outbox_dir=str(tmp_path))
+    try:
+        assert second.stats["recovered"] == 1
+        assert len(second.claim_due("slack")) == 1
+    finally:
+        second.close()
@@ -0,0 +1,90 @@
+"""PatchManager.apply_patches のトランザクションのテスト（検証失敗・確定途中の失敗）"""
+import asyncio
+
+import pytest
+
+from fix_agents import patch_manager
+from fix_agents.patch_manager import PatchManager
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    files = {
+        src / "a.py": "A = 1\n",
+        src / "b.py": "B = 1\n",
+        src / "c.txt": "c\n",
+    }
+    for path, content in files.items():
+        path.write_text(content, encoding="utf-8")
+    return src, files
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return PatchManager(backup_dir=str(tmp_path / "backups"))
+
+
+def _snapshot(directory):
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(directory.iterdir())}
+
+
+def test_all_files_are_committed_together(workspace, manager):
+    src, files = workspace
+    patches = {str(path): content.replace("1", "2") for path, content in files.items()}
+    patches[str(src / "new.py")] = "NEW = 1\n"
+
+    result = asyncio.run(manager.apply_patches(patches))
+
+    assert result["success"]
+    assert _snapshot(src) == {"a.py": "A = 2\n", "b.py": "B = 2\n", "c.txt": "c\n", "new.py": "NEW = 1\n"}
+
+
+def test_verification_failure_in_one_file_changes_nothing(workspace, manager):
+    src, files = workspace
+    before = _snapshot(src)
+    patches = {
+        str(src / "a.py"): "A = 2\n",
+        str(src / "b.py"): "def broken(:\n",
+        str(src / "new.py"): "NEW = 1\n",
+    }
+
+    result = asyncio.run(manager.apply_patches(patches))
+
+    assert not result["success"]
+    assert list(result["validation_errors"]) == [str(src / "b.py")]
+    # 検証済みのファイルも書き換えず、一時ファイルも作らない
+    assert _snapshot(src) == before
+
+
+def test_rename_failure_midway_restores_every_file(workspace, manager, monkeypatch):
+    src, files = workspace
+    before = _snapshot(src)
+    failing_target = src / "c.txt"
+    real_replace = patch_manager.os.replace
+    tripped = []
+
+    def flaky_replace(source, destination):
+        # 確定時の c.txt への rename だけ失敗させる（復元時の rename は通す）
+        if str(destination) == str(failing_target) and "rollback" not in str(source) and not tripped:
+            tripped.append(source)
+            raise OSError("simulated rename failure")
+        return real_replace(source, destination)
+
+    monkeypatch.setattr(patch_manager.os, "replace", flaky_replace)
+    patches = {
+        str(src / "a.py"): "A = 2\n",
+        str(src / "b.py"): "B = 2\n",
+        str(src / "new.py"): "NEW = 1\n",
+        str(failing_target): "changed\n",
+    }
+
+    result = asyncio.run(manager.apply_patches(patches))
+
+    assert tripped
+    assert not result["success"]
+    assert sorted(result["rolled_back"]) == sorted([str(src / "a.py"), str(src / "b.py"), str(src / "new.py")])
+    assert manager.stats["batch_rollbacks"] == 1
+    # 確定済みのファイルは元に戻り、新規ファイルは消え、一時ファイルも残らない
+    assert _snapshot(src) == before
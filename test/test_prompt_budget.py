@@ -0,0 +1,112 @@
+"""TokenBudgetPromptBuilder とトレースバック整形のテスト"""
+from tools.prompt_budget import (
+    ContextPiece,
+    TokenBudgetPromptBuilder,
+    dedupe_traceback,
+    estimate_tokens,
+    extract_imports,
+)
+
+
+def _lines(prefix: str, count: int) -> str:
+    return "\n".join(f"{prefix}_{i} = compute_value({i})" for i in range(count))
+
+
+def test_estimate_tokens_counts_non_ascii_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("エラー") == 3
+
+
+def test_everything_fits_within_budget():
+    builder = TokenBudgetPromptBuilder(budget_tokens=1000)
+    builder.add_header("HEADER")
+    builder.add_piece(ContextPiece("low", "【低】", "low body", 10))
+    builder.add_piece(ContextPiece("high", "【高】", "high body", 90))
+    builder.add_footer("FOOTER")
+
+    prompt, report = builder.build()
+
+    # 出力は追加順を保つ
+    assert prompt.index("【低】") < prompt.index("【高】")
+    assert prompt.startswith("HEADER") and prompt.endswith("FOOTER")
+    assert sorted(report["included"]) == ["high", "low"]
+    assert report["dropped"] == [] and report["truncated"] == []
+    assert report["saved_tokens"] == 0
+
+
+def test_low_priority_pieces_are_dropped_first():
+    builder = TokenBudgetPromptBuilder(budget_tokens=200)
+    builder.add_piece(ContextPiece("history", "【履歴】", _lines("h", 40), 10, truncate="none"))
+    builder.add_piece(ContextPiece("frame", "【エラー】", "NameError: x", 100))
+
+    prompt, report = builder.build()
+
+    assert report["included"] == ["frame"]
+    assert report["dropped"] == ["history"]
+    assert "【履歴】" not in prompt
+    assert report["used_tokens"] <= 200
+    assert report["saved_tokens"] > 0
+
+
+def test_truncation_modes_keep_the_right_end():
+    content = _lines("v", 100)
+
+    head = TokenBudgetPromptBuilder._truncate(content, 60, "head")
+    tail = TokenBudgetPromptBuilder._truncate(content, 60, "tail")
+    center = TokenBudgetPromptBuilder._truncate(content, 60, "center")
+
+    assert head.startswith("v_0 ") and head.endswith("... (省略)")
+    assert tail.startswith("... (省略)") and tail.endswith("v_99 = compute_value(99)")
+    assert center.startswith("... (省略)") and center.endswith("... (省略)")
+    assert "v_50 " in center
+    for text in (head, tail, center):
+        assert estimate_tokens(text) <= 60 + len(text.splitlines())
+
+
+def test_partially_fitting_piece_is_truncated():
+    builder = TokenBudgetPromptBuilder(budget_tokens=300)
+    builder.add_piece(ContextPiece("code", "【周辺コード】", _lines("c", 200), 80, fence="python", truncate="center"))
+
+    prompt, report = builder.build()
+
+    assert report["truncated"] == ["code"]
+    assert "```python" in prompt and "... (省略)" in prompt
+    assert report["used_tokens"] <= 300
+
+
+def test_dedupe_traceback_collapses_recursion_and_chained_frames():
+    frame = '  File "app.py", line 10, in recurse\n    return recurse(n - 1)'
+    traceback_text = "\n".join(
+        ["Traceback (most recent call last):"]
+        + [frame] * 5
+        + ['  File "app.py", line 20, in main', "    recurse(5)",
+           "RecursionError: maximum recursion depth exceeded",
+           "",
+           "During handling of the above exception, another exception occurred:",
+           "",
+           "Traceback (most recent call last):",
+           '  File "app.py", line 20, in main',
+           "    recurse(5)",
+           "RuntimeError: wrapped"]
+    )
+
+    result = dedupe_traceback(traceback_text)
+
+    assert result.count('line 10, in recurse') == 1
+    assert "[上記1フレームが4回繰り返し]" in result
+    assert result.count('line 20, in main') == 1
+    assert "[既出の1フレームを省略]" in result
+    assert result.rstrip().endswith("RuntimeError: wrapped")
+
+
+def test_extract_imports_reads_only_import_lines(tmp_path):
+    module = tmp_path / "mod.py"
+    module.write_text("import os\nfrom pathlib import Path\n\nx = 1\n", encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("import nothing\n", encoding="utf-8")
+
+    result = extract_imports([str(module), str(module), str(tmp_path / "notes.txt")])
+
+    assert result == f"# {module}\nimport os\nfrom pathlib import Path"
@@ -0,0 +1,146 @@
+"""ResponseExtractor のテスト（候補の選択・記録した戦略の扱い・ページ内スクリプト）"""
+import asyncio
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from browser_control.response_extractor import (
+    _EXTRACT_SCRIPT,
+    ExtractionStrategy,
+    ResponseExtractor,
+    select_longest,
+)
+
+
+STRATEGIES = [
+    ExtractionStrategy("method1", "div.first"),
+    ExtractionStrategy("method2", "div.second"),
+    ExtractionStrategy("method3", "div.third"),
+]
+
+
+class FakePage:
+    """戦略名 -> テキストを返すページ（_EXTRACT_SCRIPT の先取り動作を再現）"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.calls = []
+
+    async def evaluate(self, script, args):
+        self.calls.append(args["preferred"])
+
+        def run(strategy):
+            text = self.texts.get(strategy["name"], "")
+            return {"name": strategy["name"], "selector": strategy["selector"],
+                    "text": text, "length": len(text), "matched": 1 if text else 0, "error": None}
+
+        if args["preferred"]:
+            preferred = next(s for s in args["strategies"] if s["name"] == args["preferred"])
+            result = run(preferred)
+            if result["length"] >= args["preferredMinLength"]:
+                return {"cached": True, "candidates": [result]}
+        return {"cached": False, "candidates": [run(s) for s in args["strategies"]]}
+
+
+def _extract(extractor, page, *args, **kwargs):
+    return asyncio.run(extractor.extract(page, *args, **kwargs))
+
+
+def test_longest_candidate_wins_and_is_remembered():
+    extractor = ResponseExtractor(STRATEGIES, cache_min_length=10)
+    page = FakePage({"method1": "a" * 50, "method2": "b" * 200, "method3": "c" * 120})
+
+    result = _extract(extractor, page, select_longest(100))
+
+    assert result.winner.name == "method2"
+    assert not result.from_cache and result.round_trips == 1
+    assert extractor.preferred == "method2"
+    assert [c.length for c in result.candidates] == [50, 200, 120]
+
+
+def test_remembered_strategy_short_circuits_next_extraction():
+    extractor = ResponseExtractor(STRATEGIES, cache_min_length=10)
+    page = FakePage({"method1": "a" * 50, "method2": "b" * 200})
+    _extract(extractor, page, select_longest(100))
+
+    result = _extract(extractor, page, select_longest(100))
+
+    assert result.from_cache
+    assert page.calls == [None, "method2"]
+    assert extractor.get_stats()["cache_hits"] == 1
+
+
+def test_rejected_remembered_candidate_falls_back_to_all_strategies():
+    extractor = ResponseExtractor(STRATEGIES, cache_min_length=10)
+    extractor.preferred = "method1"
+    page = FakePage({"method1": "short answer", "method3": "c" * 300})
+
+    result = _extract(extractor, page, select_longest(100))
+
+    assert result.winner.name == "method3"
+    assert result.round_trips == 2
+    assert page.calls == ["method1", None]
+    assert extractor.preferred == "method3"
+
+
+def test_use_preferred_false_always_compares_every_strategy():
+    extractor = ResponseExtractor(STRATEGIES, cache_min_length=10)
+    extractor.preferred = "method1"
+    page = FakePage({"method1": "a" * 150, "method2": "b" * 400})
+
+    result = _extract(extractor, page, select_longest(100), use_preferred=False)
+
+    assert result.winner.name == "method2"
+    assert page.calls == [None]
+
+
+def test_custom_chooser_keeps_priority_order():
+    extractor = ResponseExtractor(STRATEGIES)
+    page = FakePage({"method1": "", "method2": "prompt echo " * 20, "method3": "answer " * 20})
+
+    def first_without_prompt(candidates):
+        return next((c for c in candidates if c.text and "prompt" not in c.text), None)
+
+    assert _extract(extractor, page, first_without_prompt).winner.name == "method3"
+
+
+def test_no_usable_candidate_is_reported_as_failure():
+    extractor = ResponseExtractor(STRATEGIES)
+
+    result = _extract(extractor, FakePage({"method1": "tiny"}), select_longest(100))
+
+    assert result.winner is None and result.text is None
+    assert extractor.preferred is None
+    assert extractor.get_stats()["failures"] == 1
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_page_script_filters_and_picks_nodes():
+    strategies = [
+        ExtractionStrategy("last", "div", min_length=5),
+        ExtractionStrategy("longest", "div", pick="longest"),
+        ExtractionStrategy("exclude", "div", min_length=5, exclude=("model-response",)),
+        ExtractionStrategy("exclude_ci", "div", min_length=5, exclude=("model-response",), ignore_case=True),
+    ]
+    texts = ["a much longer first answer", "second", "Has MODEL-RESPONSE inside", "tiny"]
+    script = (
+        f"const nodes = {json.dumps([{'innerText': t} for t in texts])};\n"
+        "global.document = {querySelectorAll: () => nodes};\n"
+        f"const extract = {_EXTRACT_SCRIPT};\n"
+        "const args = " + json.dumps({
+            "strategies": [s.to_js() for s in strategies], "preferred": None, "preferredMinLength": 0
+        }) + ";\n"
+        "console.log(JSON.stringify(extract(args)));\n"
+    )
+
+    output = json.loads(subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout)
+
+    picked = {c["name"]: c["text"] for c in output["candidates"]}
+    assert picked == {
+        "last": "Has MODEL-RESPONSE inside",
+        "longest": "a much longer first answer",
+        "exclude": "Has MODEL-RESPONSE inside",
+        "exclude_ci": "second",
+    }
@@ -0,0 +1,140 @@
+"""RollbackAgent のブロブストアとジャーナルのテスト"""
+import json
+import os
+
+import pytest
+
+from agents.rollback_agent import BlobStore, RollbackAgent
+
+
+def _journal_ops(agent: RollbackAgent):
+    with open(agent.journal_file, "r", encoding="utf-8") as f:
+        return [json.loads(line)["op"] for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_blob_store_deduplicates_and_counts_references(tmp_path, compress):
+    store = BlobStore(tmp_path / "blobs", compress=compress)
+
+    first = store.put(b"same content")
+    second = store.put(b"same content")
+    store.incref(first)
+    store.incref(second)
+
+    assert first == second
+    assert store.read(first) == b"same content"
+    assert store.decref(first) is False
+    assert store.has(first)
+    assert store.decref(first) is True
+    assert not store.has(first)
+
+
+def test_blob_store_put_file_and_materialize(tmp_path):
+    store = BlobStore(tmp_path / "blobs", compress=True)
+    source = tmp_path / "big.bin"
+    source.write_bytes(bytes(range(256)) * 8192)  # CHUNK_SIZE を超える
+
+    content_hash, size = store.put_file(source)
+    store.materialize(content_hash, tmp_path / "copy.bin")
+
+    assert size == source.stat().st_size
+    assert (tmp_path / "copy.bin").read_bytes() == source.read_bytes()
+
+
+def test_snapshot_and_rollback_restore_content(tmp_path):
+    target = tmp_path / "app.py"
+    target.write_text("version = 1\n", encoding="utf-8")
+    agent = RollbackAgent(backup_dir=str(tmp_path / "backup"))
+
+    point_id = agent.create_snapshot([str(target)], description="before fix")
+    target.write_text("version = 2\n", encoding="utf-8")
+    result = agent.rollback(point_id)
+
+    assert result.success
+    assert target.read_text(encoding="utf-8") == "version = 1\n"
+
+
+def test_journal_is_compacted_and_replayed(tmp_path):
+    target = tmp_path / "app.py"
+    backup_dir = tmp_path / "backup"
+    agent = RollbackAgent(backup_dir=str(backup_dir), max_snapshots=3, journal_compact_threshold=4)
+
+    point_ids = []
+    for i in range(6):
+        target.write_text(f"version = {i}\n", encoding="utf-8")
+        point_ids.append(agent.create_snapshot([str(target)], tags=["auto"]))
+
+    # 古いポイントは削除され、ジャーナルは追記し続けずに書き直される
+    assert set(agent.rollback_points) == set(point_ids[-3:])
+    # 追記だけなら add_point 6件 + delete_point 3件
+    assert len(_journal_ops(agent)) < 9
+
+    reopened = RollbackAgent(backup_dir=str(backup_dir), max_snapshots=3, journal_compact_threshold=4)
+    assert set(reopened.rollback_points) == set(point_ids[-3:])
+    assert [p["id"] for p in reopened.list_rollback_points(tags=["auto"])] == point_ids[-3:][::-1]
+    # 参照カウントも生きているポイントから復元される
+    assert sum(reopened.blob_store.refcounts.values()) == 3
+
+
+def test_explicit_compaction_keeps_only_live_points(tmp_path):
+    target = tmp_path / "app.py"
+    target.write_text("x = 1\n", encoding="utf-8")
+    agent = RollbackAgent(backup_dir=str(tmp_path / "backup"))
+
+    kept = agent.create_snapshot([str(target)])
+    dropped = agent.create_snapshot([str(target)])
+    agent.delete_rollback_point(dropped)
+    assert _journal_ops(agent) == ["add_point", "add_point", "delete_point"]
+
+    agent.compact_journal()
+
+    assert _journal_ops(agent) == ["add_point"]
+    assert set(RollbackAgent(backup_dir=str(tmp_path / "backup")).rollback_points) == {kept}
+
+
+def test_broken_journal_tail_is_skipped_and_rewritten(tmp_path):
+    target = tmp_path / "app.py"
+    target.write_text("x = 1\n", encoding="utf-8")
+    backup_dir = tmp_path / "backup"
+    agent = RollbackAgent(backup_dir=str(backup_dir))
+    point_id = agent.create_snapshot([str(target)])
+
+    with open(agent.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "add_point", "point": {"id": "trunc')
+
+    reopened = RollbackAgent(backup_dir=str(backup_dir))
+
+    assert set(reopened.rollback_points) == {point_id}
+    assert _journal_ops(reopened) == ["add_point"]
+
+
+def test_rollback_restores_same_size_edit_with_unchanged_mtime(tmp_path):
+    target = tmp_path / "f.py"
+    target.write_text("x = 1\n", encoding="utf-8")
+    agent = RollbackAgent(backup_dir=str(tmp_path / "backup"))
+    point_id = agent.create_snapshot([str(target)])
+
+    # 同じサイズの編集で mtime も元に戻す（粒度の粗いファイルシステムと同じ状況）
+    original = target.stat()
+    target.write_text("x = 2\n", encoding="utf-8")
+    os.utime(target, ns=(original.st_atime_ns, original.st_mtime_ns))
+
+    assert agent.rollback(point_id, dry_run=True).files_restored == [str(target)]
+    result = agent.rollback(point_id)
+
+    assert result.success
+    assert target.read_text(encoding="utf-8") == "x = 1\n"
+
+
+def test_snapshot_rereads_recently_modified_file_with_same_stat(tmp_path):
+    target = tmp_path / "f.py"
+    target.write_text("x = 1\n", encoding="utf-8")
+    agent = RollbackAgent(backup_dir=str(tmp_path / "backup"))
+    agent.create_snapshot([str(target)])
+
+    original = target.stat()
+    target.write_text("x = 2\n", encoding="utf-8")
+    os.utime(target, ns=(original.st_atime_ns, original.st_mtime_ns))
+    point_id = agent.create_snapshot([str(target)])
+
+    assert agent.rollback_points[point_id].snapshots[0].read_bytes() == b"x = 2\n"
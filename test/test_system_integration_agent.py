@@ -0,0 +1,142 @@
+"""SystemIntegrationAgent のエラーラッパーのテスト（重複排除・ストーム・バックオフ）"""
+import asyncio
+
+from core_agents.system_integration_agent import SystemIntegrationAgent
+
+
+class FakeHybridSystem:
+    """handle_error の呼び出し回数を数える修正システム"""
+
+    def __init__(self, success: bool = True, duration: float = 0.0, on_fix=None):
+        self.success = success
+        self.duration = duration
+        self.on_fix = on_fix
+        self.calls = 0
+
+    async def handle_error(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.duration)
+        if self.on_fix:
+            self.on_fix()
+        return {"success": self.success}
+
+
+def _agent(hybrid, **kwargs):
+    options = dict(retry_base_delay=0.001, retry_max_delay=0.005, max_retry_attempts=3)
+    options.update(kwargs)
+    return SystemIntegrationAgent(hybrid_fix_system=hybrid, **options)
+
+
+def _failing(counter):
+    async def run_task(task_id):
+        counter.append(task_id)
+        raise RuntimeError("still broken")
+    return run_task
+
+
+async def _call(wrapped, *args):
+    try:
+        return await wrapped(*args)
+    except RuntimeError:
+        return None
+
+
+def test_retries_of_one_error_share_a_fingerprint_and_one_fix():
+    hybrid = FakeHybridSystem(success=False)
+    agent = _agent(hybrid)
+    calls = []
+    wrapped = agent._wrap_with_error_handler(_failing(calls), "run_task")
+
+    asyncio.run(_call(wrapped, "t1"))
+
+    assert len(calls) == 4
+    assert len({entry["fingerprint"] for entry in agent.error_history}) == 1
+    assert hybrid.calls == 1
+    assert agent.stats["auto_fix_deduplicated"] == 3
+
+
+def test_retry_waits_for_running_fix_beyond_backoff():
+    state = {"fixed": False}
+    hybrid = FakeHybridSystem(duration=0.2, on_fix=lambda: state.update(fixed=True))
+    agent = _agent(hybrid, fix_timeout=5)
+
+    async def run_task(task_id):
+        if not state["fixed"]:
+            raise RuntimeError("broken until fixed")
+        return "ok"
+
+    wrapped = agent._wrap_with_error_handler(run_task, "run_task")
+
+    assert asyncio.run(wrapped("t1")) == "ok"
+    assert agent.stats["retry_successes"] == 1
+    assert agent.stats["auto_fixed_errors"] == 1
+
+
+def test_backoff_is_skipped_only_for_first_retry_after_fix():
+    hybrid = FakeHybridSystem(success=True)
+    agent = _agent(hybrid, fix_cooldown=300)
+    delays = []
+    original_delay = agent._retry_delay
+
+    def record_delay(retry_count, fingerprint):
+        delays.append(retry_count)
+        return original_delay(retry_count, fingerprint)
+
+    agent._retry_delay = record_delay
+    calls = []
+    wrapped = agent._wrap_with_error_handler(_failing(calls), "run_task")
+
+    async def scenario():
+        await _call(wrapped, "t1")  # 修正を待ち、成功直後の1回は待たない
+        first = list(delays)
+        await _call(wrapped, "t2")  # 修正済みでも失敗し続けるならバックオフ
+        return first
+
+    first = asyncio.run(scenario())
+
+    assert first == [2, 3]
+    assert delays == [2, 3, 1, 2, 3]
+
+
+def test_storm_fast_fails_even_after_successful_fix():
+    hybrid = FakeHybridSystem(success=True)
+    agent = _agent(hybrid, storm_threshold=20, fix_cooldown=300)
+    calls = []
+    wrapped = agent._wrap_with_error_handler(_failing(calls), "run_task")
+
+    async def scenario():
+        for i in range(30):
+            await _call(wrapped, f"t{i}")
+
+    asyncio.run(scenario())
+
+    assert hybrid.calls == 1
+    assert agent.stats["storm_fast_failures"] > 0
+    assert len(calls) < 30 * 4
+
+
+def test_retry_delay_uses_full_jitter_with_growing_ceiling():
+    agent = _agent(None, retry_base_delay=1.0, retry_max_delay=30.0)
+
+    samples = [agent._retry_delay(3, "fp") for _ in range(200)]
+
+    assert all(0 <= delay <= 4.0 for delay in samples)
+    assert min(samples) < 1.0
+    assert all(agent._retry_delay(10, "fp") <= 30.0 for _ in range(50))
+
+
+def test_sync_methods_record_and_reraise():
+    agent = _agent(None)
+
+    def broken():
+        raise ValueError("bad")
+
+    wrapped = agent._wrap_with_error_handler(broken, "broken")
+
+    try:
+        wrapped()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError was not re-raised")
+    assert agent.stats["total_errors_caught"] == 1
@@ -0,0 +1,600 @@
+# cloud_llm_client.py
+"""
+クラウドLLMクライアント
+OpenAI / Anthropic / Google Gemini を単一の非同期インターフェースで扱い、
+レート制限・接続再利用・リトライ・メトリクス記録を共有する
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from tools.prompt_budget import estimate_tokens
+from tools.resource_accounting import WAIT_LLM, waits_on
+
+logger = logging.getLogger(__name__)
+
+
+# リトライ対象のHTTPステータス（529はAnthropicの過負荷）
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# 1Mトークンあたりの概算価格 (input, output) USD。前方一致で参照する
+DEFAULT_PRICING: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-opus": (15.00, 75.00),
+    "claude-sonnet": (3.00, 15.00),
+    "claude-haiku": (0.80, 4.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+API_KEY_ENV = {
+    "openai": ["OPENAI_API_KEY"],
+    "anthropic": ["ANTHROPIC_API_KEY"],
+    "google": ["GOOGLE_API_KEY", "GEMINI_API_KEY"],
+}
+
+
+class CloudLLMError(Exception):
+    """クラウドLLM呼び出しエラー"""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+@dataclass
+class ProviderLimits:
+    """プロバイダーごとのレート制限"""
+    requests_per_minute: float = 50
+    tokens_per_minute: float = 40000
+
+
+@dataclass
+class LLMResponse:
+    """LLM応答"""
+    text: str
+    provider: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+    cost: float = 0.0
+    attempts: int = 1
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    threading.Lockで保護し、待機はasyncio.sleepで行うため、
+    複数のイベントループ・スレッドから共有できる
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.refill_per_second
+        )
+        self._updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        取得を試みる
+
+        Returns:
+            0なら取得成功、正の値なら次に試すまでの待機秒数
+        """
+        # バケット容量を超える要求は満杯になれば通す
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.refill_per_second
+
+    async def acquire(self, amount: float = 1.0):
+        """取得できるまで待機"""
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def debit(self, amount: float):
+        """事後精算（負の残高を許容し、後続の要求を待たせる）"""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+class CloudLLMClient:
+    """
+    プロバイダー非依存の非同期クラウドLLMクライアント
+
+    機能:
+    - OpenAI / Anthropic / Google のREST APIを共有aiohttpセッションで呼び出し
+    - プロバイダー別のリクエスト数/分・トークン数/分のトークンバケット
+    - 429/5xx/通信エラーに対するdecorrelated jitter付きリトライ
+    - レイテンシ・トークン数・コストのメトリクス記録
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ProviderLimits]] = None,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        timeout: float = 120.0,
+        max_connections_per_host: int = 8,
+        pricing: Optional[Dict[str, Tuple[float, float]]] = None
+    ):
+        """
+        初期化
+
+        Args:
+            limits: プロバイダー別レート制限
+            max_retries: 最大リトライ回数
+            base_delay: リトライ待機の下限（秒）
+            max_delay: リトライ待機の上限（秒）
+            timeout: リクエストタイムアウト（秒）
+            max_connections_per_host: ホストごとの最大同時接続数
+            pricing: モデル名前方一致 -> (input, output) の1Mトークン単価
+        """
+        self.limits = {
+            "openai": ProviderLimits(requests_per_minute=500, tokens_per_minute=30000),
+            "anthropic": ProviderLimits(requests_per_minute=50, tokens_per_minute=40000),
+            "google": ProviderLimits(requests_per_minute=60, tokens_per_minute=100000),
+        }
+        if limits:
+            self.limits.update(limits)
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.max_connections_per_host = max_connections_per_host
+        self.pricing = pricing or DEFAULT_PRICING
+
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        self._token_buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+
+        # イベントループごとの共有セッション
+        # セッションがループを強参照するため弱参照辞書では消えない。閉じたループの分は明示的に破棄する
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._sessions_lock = threading.Lock()
+
+        # 同期呼び出し用のバックグラウンドループ
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_lock = threading.Lock()
+
+        # メトリクス
+        self._metrics_lock = threading.Lock()
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    # ========================================
+    # 公開API
+    # ========================================
+
+    @waits_on(WAIT_LLM)
+    async def complete(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        system: Optional[str] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 4096,
+        json_mode: bool = False,
+        api_key: Optional[str] = None
+    ) -> LLMResponse:
+        """
+        プロンプトを送信して応答を取得
+
+        Args:
+            provider: openai / anthropic / google
+            model: モデル名
+            prompt: ユーザープロンプト
+            system: システムプロンプト
+            temperature: 温度
+            max_tokens: 最大出力トークン数
+            json_mode: JSON出力を要求する
+            api_key: APIキー（省略時は環境変数）
+
+        Returns:
+            LLMResponse
+
+        Raises:
+            CloudLLMError: リトライ上限到達または非リトライ対象のエラー
+        """
+        if provider not in API_KEY_ENV:
+            raise CloudLLMError(f"未サポートのプロバイダー: {provider}")
+
+        api_key = api_key or self._api_key_from_env(provider)
+        if not api_key:
+            raise CloudLLMError(f"{provider} のAPIキーが設定されていません")
+
+        url, headers, payload = self._build_request(
+            provider, model, prompt, system, temperature, max_tokens, json_mode, api_key
+        )
+
+        estimated_tokens = self.estimate_tokens(prompt) + self.estimate_tokens(system or "")
+        request_bucket, token_bucket = self._buckets(provider)
+
+        delay = self.base_delay
+        attempt = 0
+
+        while True:
+            attempt += 1
+            await request_bucket.acquire(1)
+            await token_bucket.acquire(estimated_tokens)
+
+            started = time.perf_counter()
+            try:
+                data = await self._post(url, headers, payload)
+                text, input_tokens, output_tokens = self._parse_response(provider, data)
+            except CloudLLMError as e:
+                if not e.retryable or attempt > self.max_retries:
+                    self._record_failure(provider)
+                    raise
+                delay = self._next_delay(delay, e.retry_after)
+                self._record_retry(provider)
+                logger.warning(f"⚠️ {provider} リトライ {attempt}/{self.max_retries} "
+                               f"({delay:.1f}秒後): {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            latency = time.perf_counter() - started
+
+            # 推定と実績の差分をトークンバケットで精算
+            if input_tokens or output_tokens:
+                token_bucket.debit(input_tokens + output_tokens - estimated_tokens)
+
+            response = LLMResponse(
+                text=text,
+                provider=provider,
+                model=model,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                latency=latency,
+                cost=self.estimate_cost(model, input_tokens, output_tokens),
+                attempts=attempt,
+                raw=data
+            )
+            self._record_success(response)
+            return response
+
+    def complete_sync(self, *args, **kwargs) -> LLMResponse:
+        """
+        同期コードから complete() を呼び出す
+
+        専用のバックグラウンドループで実行するため、接続は呼び出し間で再利用される
+        """
+        loop = self._get_sync_loop()
+        future = asyncio.run_coroutine_threadsafe(self.complete(*args, **kwargs), loop)
+        return future.result()
+
+    async def close(self):
+        """現在のイベントループのセッションを閉じ、閉じたループのセッションを破棄する"""
+        with self._sessions_lock:
+            session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+        self._drop_closed_loop_sessions()
+
+    # ========================================
+    # リクエスト構築・解析
+    # ========================================
+
+    def _build_request(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        system: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool,
+        api_key: str
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """プロバイダー別のURL・ヘッダー・ボディを構築"""
+        if provider == "openai":
+            messages = []
+            if system:
+                messages.append({"role": "system", "content": system})
+            messages.append({"role": "user", "content": prompt})
+
+            payload: Dict[str, Any] = {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            }
+            if json_mode:
+                payload["response_format"] = {"type": "json_object"}
+
+            return (
+                "https://api.openai.com/v1/chat/completions",
+                {"Authorization": f"Bearer {api_key}"},
+                payload
+            )
+
+        if provider == "anthropic":
+            payload = {
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "messages": [{"role": "user", "content": prompt}],
+            }
+            if system:
+                payload["system"] = system
+
+            return (
+                "https://api.anthropic.com/v1/messages",
+                {"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+                payload
+            )
+
+        # google
+        generation_config: Dict[str, Any] = {
+            "temperature": temperature,
+            "maxOutputTokens": max_tokens,
+        }
+        if json_mode:
+            generation_config["responseMimeType"] = "application/json"
+
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config,
+        }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+
+        return (
+            f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent",
+            {"x-goog-api-key": api_key},
+            payload
+        )
+
+    def _parse_response(self, provider: str, data: Dict[str, Any]) -> Tuple[str, int, int]:
+        """(テキスト, 入力トークン, 出力トークン) を取り出す"""
+        try:
+            if provider == "openai":
+                usage = data.get("usage", {})
+                return (
+                    data["choices"][0]["message"]["content"] or "",
+                    usage.get("prompt_tokens", 0),
+                    usage.get("completion_tokens", 0)
+                )
+
+            if provider == "anthropic":
+                usage = data.get("usage", {})
+                text = "".join(
+                    block.get("text", "") for block in data.get("content", [])
+                    if block.get("type") == "text"
+                )
+                return text, usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+            usage = data.get("usageMetadata", {})
+            parts = data["candidates"][0]["content"].get("parts", [])
+            text = "".join(part.get("text", "") for part in parts)
+            return (
+                text,
+                usage.get("promptTokenCount", 0),
+                usage.get("candidatesTokenCount", 0)
+            )
+
+        except (KeyError, IndexError, TypeError) as e:
+            raise CloudLLMError(f"{provider} 応答の解析に失敗: {e}")
+
+    async def _post(self, url: str, headers: Dict[str, str],
+                    payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POSTしてJSONを返す（エラーはCloudLLMErrorに変換）"""
+        session = await self._get_session()
+        try:
+            async with session.post(url, headers=headers, json=payload) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+
+                body = await response.text()
+                raise CloudLLMError(
+                    f"HTTP {response.status}: {body[:300]}",
+                    status=response.status,
+                    retryable=response.status in RETRYABLE_STATUS,
+                    retry_after=self._parse_retry_after(response.headers.get("retry-after"))
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise CloudLLMError(f"通信エラー: {e!r}", retryable=True)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """イベントループごとの共有セッションを取得"""
+        loop = asyncio.get_running_loop()
+        self._drop_closed_loop_sessions()
+
+        with self._sessions_lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit_per_host=self.max_connections_per_host,
+                        keepalive_timeout=60
+                    ),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)
+                )
+                self._sessions[loop] = session
+        return session
+
+    def _drop_closed_loop_sessions(self) -> int:
+        """
+        閉じたイベントループに属するセッションを破棄
+
+        ループが閉じていると await session.close() は実行できないため、
+        セッションからコネクタを切り離して閉じた状態にし、辞書から外す。
+
+        Returns:
+            破棄したセッション数
+        """
+        with self._sessions_lock:
+            stale = [loop for loop in self._sessions if loop.is_closed()]
+            sessions = [self._sessions.pop(loop) for loop in stale]
+
+        for session in sessions:
+            if not session.closed:
+                session.detach()
+        return len(sessions)
+
+    def _get_sync_loop(self) -> asyncio.AbstractEventLoop:
+        with self._sync_lock:
+            if self._sync_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="cloud-llm-client", daemon=True
+                )
+                thread.start()
+                self._sync_loop = loop
+            return self._sync_loop
+
+    # ========================================
+    # レート制限・リトライ
+    # ========================================
+
+    def _buckets(self, provider: str) -> Tuple[TokenBucket, TokenBucket]:
+        with self._buckets_lock:
+            if provider not in self._request_buckets:
+                limits = self.limits.get(provider, ProviderLimits())
+                self._request_buckets[provider] = TokenBucket(
+                    limits.requests_per_minute, limits.requests_per_minute / 60.0
+                )
+                self._token_buckets[provider] = TokenBucket(
+                    limits.tokens_per_minute, limits.tokens_per_minute / 60.0
+                )
+            return self._request_buckets[provider], self._token_buckets[provider]
+
+    def _next_delay(self, previous: float, retry_after: Optional[float]) -> float:
+        """decorrelated jitter: min(cap, uniform(base, previous * 3))"""
+        delay = min(self.max_delay, random.uniform(self.base_delay, previous * 3))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _api_key_from_env(provider: str) -> Optional[str]:
+        for name in API_KEY_ENV.get(provider, []):
+            value = os.getenv(name)
+            if value:
+                return value
+        return None
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """トークン数の概算（レート制限の事前予約に使用）"""
+        return estimate_tokens(text)
+
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """コストの概算（USD）"""
+        for prefix in sorted(self.pricing, key=len, reverse=True):
+            if model.startswith(prefix):
+                input_price, output_price = self.pricing[prefix]
+                return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        return 0.0
+
+    # ========================================
+    # メトリクス
+    # ========================================
+
+    def _provider_metrics(self, provider: str) -> Dict[str, Any]:
+        if provider not in self.metrics:
+            self.metrics[provider] = {
+                "requests": 0,
+                "failures": 0,
+                "retries": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cost": 0.0,
+                "latencies": deque(maxlen=500),
+            }
+        return self.metrics[provider]
+
+    def _record_success(self, response: LLMResponse):
+        with self._metrics_lock:
+            m = self._provider_metrics(response.provider)
+            m["requests"] += 1
+            m["input_tokens"] += response.input_tokens
+            m["output_tokens"] += response.output_tokens
+            m["cost"] += response.cost
+            m["latencies"].append(response.latency)
+
+    def _record_failure(self, provider: str):
+        with self._metrics_lock:
+            self._provider_metrics(provider)["failures"] += 1
+
+    def _record_retry(self, provider: str):
+        with self._metrics_lock:
+            self._provider_metrics(provider)["retries"] += 1
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """プロバイダー別メトリクスを取得"""
+        result = {}
+        with self._metrics_lock:
+            for provider, m in self.metrics.items():
+                latencies: List[float] = sorted(m["latencies"])
+                result[provider] = {
+                    key: value for key, value in m.items() if key != "latencies"
+                }
+                if latencies:
+                    result[provider]["latency_avg"] = sum(latencies) / len(latencies)
+                    result[provider]["latency_p50"] = latencies[len(latencies) // 2]
+                    result[provider]["latency_p95"] = latencies[
+                        min(len(latencies) - 1, int(len(latencies) * 0.95))
+                    ]
+        return result
+
+
+_shared_client: Optional[CloudLLMClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_cloud_llm_client() -> CloudLLMClient:
+    """プロセス共有のクラウドLLMクライアントを取得（レート制限も共有される）"""
+    global _shared_client
+
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = CloudLLMClient()
+        return _shared_client
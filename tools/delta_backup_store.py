@@ -0,0 +1,305 @@
+# delta_backup_store.py
+"""
+差分圧縮バックアップストア
+ファイルごとに最新版を1つだけ丸ごと保持し、それより古い版は
+「新しい版から古い版を復元する」逆差分として保存する
+"""
+
+import difflib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+# 差分ファイルの先頭1バイト（F: 丸ごと, D: 逆差分）
+_FULL = b"F"
+_DELTA = b"D"
+
+
+def _split_lines(data: bytes) -> List[bytes]:
+    return data.splitlines(keepends=True)
+
+
+def _encode_lines(lines: List[bytes]) -> str:
+    # 非UTF-8のバイト列も往復できるよう surrogateescape で文字列化する
+    return b"".join(lines).decode("utf-8", errors="surrogateescape")
+
+
+def make_reverse_delta(newer: bytes, older: bytes) -> List[Any]:
+    """
+    newer から older を復元する行単位の差分を生成
+
+    Returns:
+        [i1, i2]（newer の i1〜i2 行をコピー）または 文字列（挿入）のリスト
+    """
+    newer_lines = _split_lines(newer)
+    older_lines = _split_lines(older)
+    matcher = difflib.SequenceMatcher(None, newer_lines, older_lines, autojunk=False)
+
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(_encode_lines(older_lines[j1:j2]))
+    return ops
+
+
+def apply_reverse_delta(newer: bytes, ops: List[Any]) -> bytes:
+    """make_reverse_delta の差分を適用して古い版を復元"""
+    newer_lines = _split_lines(newer)
+    parts: List[bytes] = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op.encode("utf-8", errors="surrogateescape"))
+        else:
+            parts.extend(newer_lines[op[0]:op[1]])
+    return b"".join(parts)
+
+
+class DeltaBackupStore:
+    """
+    逆差分方式のバックアップストア
+
+    レイアウト:
+        root/<パスのハッシュ>/meta.json    版の一覧
+        root/<パスのハッシュ>/base.v<N>    最新版 N の内容（zlib圧縮）
+        root/<パスのハッシュ>/v<k>.delta   版 k+1 から版 k を復元する差分
+
+    - 最新版の取得・最新バックアップの検索はメモリ上のインデックスでO(1)
+    - 古い版は最新版から逆差分を順に適用して復元する
+    - 版数の上限を超えたら最も古い差分を削除するだけでよい
+    - バックアップ参照は "root/<ハッシュ>/v<k>" 形式の文字列
+    """
+
+    def __init__(self, root: Union[str, Path], max_versions: int = 10, compress_level: int = 6):
+        """
+        初期化
+
+        Args:
+            root: 保存先ディレクトリ
+            max_versions: ファイルごとに保持する最大版数
+            compress_level: zlib圧縮レベル
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_versions = max_versions
+        self.compress_level = compress_level
+
+        # パスのハッシュ -> meta（path, latest, versions）
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "backups": 0,
+            "deduplicated": 0,
+            "bytes_in": 0,
+            "bytes_stored": 0,
+            "restores": 0
+        }
+
+        self._load_index()
+
+    # ========================================
+    # キー・参照
+    # ========================================
+
+    @staticmethod
+    def _key(file_path: Union[str, Path]) -> str:
+        resolved = str(Path(file_path).resolve())
+        return hashlib.sha1(resolved.encode("utf-8")).hexdigest()[:16]
+
+    def _ref(self, key: str, version: int) -> str:
+        return str(self.root / key / f"v{version}")
+
+    def _parse_ref(self, ref: Union[str, Path]) -> Optional[tuple]:
+        ref_path = Path(ref)
+        if ref_path.parent.parent != self.root or not ref_path.name.startswith("v"):
+            return None
+        try:
+            return ref_path.parent.name, int(ref_path.name[1:])
+        except ValueError:
+            return None
+
+    def _load_index(self):
+        """起動時に各ファイルの meta.json を読み込む"""
+        for meta_path in self.root.glob("*/meta.json"):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    self._index[meta_path.parent.name] = json.load(f)
+            except Exception as e:
+                logger.warning(f"⚠️ バックアップメタデータ読み込み失敗: {meta_path} - {e}")
+
+    # ========================================
+    # 保存
+    # ========================================
+
+    def put(self, file_path: Union[str, Path], content: bytes) -> str:
+        """
+        バックアップを追加
+
+        Args:
+            file_path: 元ファイルのパス
+            content: バックアップする内容
+
+        Returns:
+            バックアップ参照（最新版と同じ内容なら既存の参照）
+        """
+        key = self._key(file_path)
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            self.stats["bytes_in"] += len(content)
+            meta = self._index.get(key)
+
+            if meta and meta["versions"] and meta["versions"][-1]["hash"] == content_hash:
+                self.stats["deduplicated"] += 1
+                return self._ref(key, meta["latest"])
+
+            directory = self.root / key
+            directory.mkdir(exist_ok=True)
+
+            if meta is None:
+                meta = {"path": str(Path(file_path).resolve()), "latest": 0, "versions": []}
+                previous = None
+            else:
+                previous = meta["latest"]
+
+            version = (previous or 0) + 1
+
+            # 1. 旧最新版を逆差分に変換（新しい版から復元できる形）
+            if previous is not None:
+                older = self._read_base(directory, previous)
+                self._write_delta(directory, previous, content, older)
+
+            # 2. 新しい最新版を書き込み、メタデータを切り替える
+            self._write_atomic(directory / f"base.v{version}",
+                               zlib.compress(content, self.compress_level))
+            meta["latest"] = version
+            meta["versions"].append({
+                "version": version,
+                "timestamp": datetime.now().isoformat(),
+                "hash": content_hash,
+                "size": len(content)
+            })
+            dropped = meta["versions"][:-self.max_versions] if self.max_versions > 0 else []
+            meta["versions"] = meta["versions"][len(dropped):]
+            self._write_atomic(directory / "meta.json",
+                               json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            self._index[key] = meta
+
+            # 3. 不要になったファイルを削除（メタデータ切替後なので途中で落ちても整合する）
+            if previous is not None:
+                (directory / f"base.v{previous}").unlink(missing_ok=True)
+            for entry in dropped:
+                (directory / f"v{entry['version']}.delta").unlink(missing_ok=True)
+
+            self.stats["backups"] += 1
+            return self._ref(key, version)
+
+    def _write_delta(self, directory: Path, version: int, newer: bytes, older: bytes):
+        """版 version を newer から復元する差分を書き込む（差分の方が大きければ丸ごと）"""
+        delta = zlib.compress(
+            json.dumps(make_reverse_delta(newer, older)).encode("utf-8"),
+            self.compress_level
+        )
+        full = zlib.compress(older, self.compress_level)
+        payload = _DELTA + delta if len(delta) < len(full) else _FULL + full
+        self._write_atomic(directory / f"v{version}.delta", payload)
+
+    def _write_atomic(self, path: Path, data: bytes):
+        tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.stats["bytes_stored"] += len(data)
+
+    # ========================================
+    # 取得・復元
+    # ========================================
+
+    def latest(self, file_path: Union[str, Path]) -> Optional[str]:
+        """最新バックアップの参照（O(1)）"""
+        key = self._key(file_path)
+        meta = self._index.get(key)
+        if not meta or not meta["versions"]:
+            return None
+        return self._ref(key, meta["latest"])
+
+    def has(self, ref: Union[str, Path]) -> bool:
+        parsed = self._parse_ref(ref)
+        if parsed is None:
+            return False
+        key, version = parsed
+        meta = self._index.get(key)
+        return bool(meta) and any(v["version"] == version for v in meta["versions"])
+
+    def versions(self, file_path: Union[str, Path]) -> List[Dict[str, Any]]:
+        """保持している版の一覧（古い順）"""
+        key = self._key(file_path)
+        meta = self._index.get(key)
+        if not meta:
+            return []
+        return [{**v, "ref": self._ref(key, v["version"])} for v in meta["versions"]]
+
+    def get(self, ref: Union[str, Path]) -> bytes:
+        """バックアップ内容を復元（最新版から逆差分を順に適用）"""
+        parsed = self._parse_ref(ref)
+        if parsed is None or not self.has(ref):
+            raise FileNotFoundError(f"Backup not found: {ref}")
+
+        key, version = parsed
+        directory = self.root / key
+
+        with self._lock:
+            latest = self._index[key]["latest"]
+            content = self._read_base(directory, latest)
+            for step in range(latest - 1, version - 1, -1):
+                with open(directory / f"v{step}.delta", "rb") as f:
+                    payload = f.read()
+                if payload[:1] == _FULL:
+                    content = zlib.decompress(payload[1:])
+                else:
+                    ops = json.loads(zlib.decompress(payload[1:]))
+                    content = apply_reverse_delta(content, ops)
+
+        return content
+
+    def restore(self, ref: Union[str, Path], dest: Union[str, Path]):
+        """バックアップ内容を dest にアトミックに書き戻す"""
+        content = self.get(ref)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = dest.with_name(f".{dest.name}.restore{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        if dest.exists():
+            shutil.copymode(dest, tmp_path)
+        os.replace(tmp_path, dest)
+        self.stats["restores"] += 1
+
+    @staticmethod
+    def _read_base(directory: Path, version: int) -> bytes:
+        with open(directory / f"base.v{version}", "rb") as f:
+            return zlib.decompress(f.read())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        return {
+            **self.stats,
+            "tracked_files": len(self._index),
+            "compression_ratio": (
+                self.stats["bytes_stored"] / self.stats["bytes_in"]
+                if self.stats["bytes_in"] else 0.0
+            )
+        }
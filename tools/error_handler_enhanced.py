@@ -7,6 +7,11 @@ import logging
 import traceback
 import sys
 import inspect
+import hashlib
+import linecache
+import re
+import time
+from collections import OrderedDict, deque
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 from pathlib import Path
@@ -56,9 +61,22 @@ class StackTraceFrame:
     local_variables: Optional[Dict[str, Any]] = None
 
 
+@dataclass
+class _DeferredErrorDetails:
+    """遅延抽出用に捕捉時点で保持しておく生の情報"""
+    handler: "EnhancedErrorHandler"
+    traceback_exception: traceback.TracebackException
+    local_values: Dict[str, Any]
+
+
 @dataclass
 class ErrorContextModel:
-    """エラーコンテキストモデル"""
+    """
+    エラーコンテキストモデル
+    
+    遅延モードで捕捉した場合、スタックトレース文字列・コードスニペット・
+    ローカル変数は enrich() を呼ぶまで空のまま。
+    """
     error_id: str
     timestamp: datetime
     task_id: str
@@ -74,6 +92,79 @@ class ErrorContextModel:
     severity: ErrorSeverity = ErrorSeverity.MEDIUM
     task_description: Optional[str] = None
     task_parameters: Optional[Dict[str, Any]] = None
+    fingerprint: Optional[str] = None
+    sampled_out: bool = False
+    _deferred: Optional[_DeferredErrorDetails] = field(default=None, repr=False, compare=False)
+    
+    @property
+    def is_enriched(self) -> bool:
+        return self._deferred is None
+    
+    def enrich(self) -> "ErrorContextModel":
+        """保留していた詳細情報（トレースバック・コード・ローカル変数）を抽出"""
+        deferred, self._deferred = self._deferred, None
+        if deferred is not None:
+            deferred.handler._enrich(self, deferred)
+        return self
+
+
+_HEX_PATTERN = re.compile(r"0x[0-9a-fA-F]+")
+_QUOTED_PATTERN = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def normalize_error_message(message: str) -> str:
+    """アドレス・数値・引用文字列を伏せて、同種のエラーメッセージを同一視する"""
+    message = _HEX_PATTERN.sub("0x?", message)
+    message = _QUOTED_PATTERN.sub("'?'", message)
+    return _NUMBER_PATTERN.sub("N", message)
+
+
+def compute_fingerprint(
+    error_type: str,
+    error_message: str,
+    stack: traceback.StackSummary,
+    max_frames: int = 5
+) -> str:
+    """
+    エラーのフィンガープリントを計算（ソースは読まない）
+    
+    例外型・正規化したメッセージ・末尾のフレーム位置から算出する
+    """
+    frames = "|".join(
+        f"{frame.filename}:{frame.lineno}:{frame.name}"
+        for frame in list(stack)[-max_frames:]
+    )
+    raw = f"{error_type}|{normalize_error_message(error_message)}|{frames}"
+    return hashlib.sha1(raw.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+
+@dataclass
+class ErrorGroup:
+    """同一フィンガープリントのエラーの集約"""
+    fingerprint: str
+    error_type: str
+    error_message: str
+    first_seen: datetime
+    last_seen: datetime
+    count: int = 0
+    sample_task_ids: List[str] = field(default_factory=list)
+    samples: deque = field(default_factory=lambda: deque(maxlen=5))
+    
+    @property
+    def latest(self) -> Optional[ErrorContextModel]:
+        return self.samples[-1] if self.samples else None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "error_type": self.error_type,
+            "error_message": self.error_message,
+            "first_seen": self.first_seen.isoformat(),
+            "last_seen": self.last_seen.isoformat(),
+            "count": self.count,
+            "sample_task_ids": list(self.sample_task_ids)
+        }
 
 
 @dataclass
@@ -88,6 +179,8 @@ class BugFixTask:
     status: str = "pending"
     created_at: datetime = field(default_factory=datetime.now)
     assigned_agent: Optional[str] = None
+    fingerprint: Optional[str] = None
+    occurrence_count: int = 1
 
 
 class EnhancedErrorHandler:
@@ -101,15 +194,50 @@ class EnhancedErrorHandler:
     4. バグ修正タスクの自動生成
     """
     
-    def __init__(self):
-        """初期化"""
-        # メモリバッファ(最新100件のエラーを保持)
-        self.error_buffer: List[ErrorContextModel] = []
+    def __init__(
+        self,
+        lazy_enrichment: bool = True,
+        storm_threshold: int = 20,
+        storm_window: float = 10.0,
+        storm_sample_rate: int = 50
+    ):
+        """
+        初期化
+        
+        Args:
+            lazy_enrichment: コードスニペット・ローカル変数の抽出を enrich() まで遅らせる
+            storm_threshold: 同一フィンガープリントをウィンドウ内で全件記録する上限
+            storm_window: エラーストーム判定のウィンドウ（秒）
+            storm_sample_rate: 上限超過後は N 件に1件だけ記録する
+        """
+        # フィンガープリント単位のバッファ(最新100種類のエラーを保持)
+        self.error_groups: "OrderedDict[str, ErrorGroup]" = OrderedDict()
         self.max_buffer_size = 100
+        self.max_sample_task_ids = 10
+        
+        # エラーID -> 保持中のサンプル
+        self._errors_by_id: Dict[str, ErrorContextModel] = {}
         
         # エラーカウンタ
         self.error_counter = 0
         
+        # 遅延抽出・ストーム時のサンプリング設定
+        self.lazy_enrichment = lazy_enrichment
+        self.storm_threshold = storm_threshold
+        self.storm_window = storm_window
+        self.storm_sample_rate = max(1, storm_sample_rate)
+        
+        # フィンガープリント -> [ウィンドウ開始時刻, ウィンドウ内件数, 未記録件数]
+        self._storm_state: Dict[str, List[float]] = {}
+        
+        # 統計情報
+        self.stats = {
+            "captured": 0,
+            "recorded": 0,
+            "sampled_out": 0,
+            "enriched": 0
+        }
+        
         logger.info("✅ EnhancedErrorHandler 初期化完了")
     
     def capture_error(
@@ -132,36 +260,51 @@ class EnhancedErrorHandler:
             ErrorContextModel: 構造化されたエラーコンテキスト
         """
         try:
-            # エラーIDを生成
-            self.error_counter += 1
-            error_id = f"ERROR_{task_id or 'UNKNOWN'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.error_counter}"
+            self.stats["captured"] += 1
             
             # エラー型とメッセージ
             error_type = type(exception).__name__
             error_message = str(exception)
             
-            # スタックトレースの取得
-            exc_type, exc_value, exc_tb = sys.exc_info()
-            full_traceback = ''.join(traceback.format_exception(exc_type, exc_value, exc_tb))
-            
-            # スタックフレームの構造化
-            stack_frames = self._extract_stack_frames(exc_tb) if exc_tb else []
+            # 生のトレースバック（ソース行は読まない）とフィンガープリント
+            exc_tb = exception.__traceback__ or sys.exc_info()[2]
+            traceback_exception = traceback.TracebackException(
+                type(exception), exception, exc_tb,
+                lookup_lines=False, capture_locals=False
+            )
+            fingerprint = compute_fingerprint(error_type, error_message, traceback_exception.stack)
             
-            # エラー発生位置の特定
-            error_location = self._extract_error_location(exc_tb) if exc_tb else None
+            # 発生回数は間引きに関係なく全件数える
+            self._record_occurrence(fingerprint, error_type, error_message, task_id or "UNKNOWN")
             
-            # 問題のあるコードスニペットを取得
-            problematic_code, surrounding_code = self._extract_code_snippets(
-                error_location.file_path if error_location else None,
-                error_location.line_number if error_location else None
-            )
+            # エラーストーム中は同一フィンガープリントを間引く
+            record, suppressed = self._sample(fingerprint)
             
-            # ローカル変数の取得
-            local_vars = self._extract_local_variables(exc_tb) if exc_tb else {}
+            # エラーIDを生成
+            self.error_counter += 1
+            error_id = f"ERROR_{task_id or 'UNKNOWN'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.error_counter}"
             
             # 深刻度を判定
             severity = self._determine_severity(error_type, error_message)
             
+            # エラー発生位置（最後のフレーム）
+            error_location = None
+            if traceback_exception.stack:
+                last_frame = traceback_exception.stack[-1]
+                error_location = CodeLocation(
+                    file_path=last_frame.filename,
+                    line_number=last_frame.lineno,
+                    function_name=last_frame.name
+                )
+            
+            # ローカル変数は参照だけ控えておき、文字列化は enrich() 時に行う
+            local_values = {}
+            if exc_tb is not None:
+                innermost = exc_tb
+                while innermost.tb_next is not None:
+                    innermost = innermost.tb_next
+                local_values = dict(innermost.tb_frame.f_locals)
+            
             # ErrorContextModelを構築
             error_context = ErrorContextModel(
                 error_id=error_id,
@@ -170,19 +313,25 @@ class EnhancedErrorHandler:
                 agent_name=agent_name,
                 error_type=error_type,
                 error_message=error_message,
-                full_traceback=full_traceback,
-                stack_frames=stack_frames,
                 error_location=error_location,
-                problematic_code=problematic_code,
-                surrounding_code=surrounding_code,
-                local_variables=local_vars,
                 severity=severity,
                 task_description=task_context.get('description') if task_context else None,
-                task_parameters=task_context.get('parameters') if task_context else None
+                task_parameters=task_context.get('parameters') if task_context else None,
+                fingerprint=fingerprint,
+                sampled_out=not record,
+                _deferred=_DeferredErrorDetails(self, traceback_exception, local_values)
             )
             
+            if not record:
+                self.stats["sampled_out"] += 1
+                return error_context
+            
+            if not self.lazy_enrichment:
+                error_context.enrich()
+            
             # バッファに追加
             self._add_to_buffer(error_context)
+            self.stats["recorded"] += 1
             
             # ログ出力
             logger.error(f"❌ エラー捕捉: {error_id}")
@@ -192,6 +341,8 @@ class EnhancedErrorHandler:
             
             if error_location:
                 logger.error(f"   場所: {error_location.file_path}:{error_location.line_number}")
+            if suppressed:
+                logger.error(f"   同一エラーを{suppressed}件間引きました (fingerprint={fingerprint})")
             
             return error_context
             
@@ -200,14 +351,69 @@ class EnhancedErrorHandler:
             # フォールバック: 最小限のエラーコンテキスト
             return self._create_minimal_error_context(exception, task_id, agent_name)
     
-    def _extract_stack_frames(self, traceback_obj) -> List[StackTraceFrame]:
+    def _sample(self, fingerprint: str) -> Tuple[bool, int]:
+        """
+        エラーストーム時のサンプリング判定
+        
+        Returns:
+            (記録するか, 前回記録以降に間引いた件数)
+        """
+        now = time.monotonic()
+        state = self._storm_state.get(fingerprint)
+        
+        if state is None or now - state[0] > self.storm_window:
+            if len(self._storm_state) > 1000:
+                self._storm_state = {
+                    fp: st for fp, st in self._storm_state.items()
+                    if now - st[0] <= self.storm_window
+                }
+            state = [now, 0, 0]
+            self._storm_state[fingerprint] = state
+        
+        state[1] += 1
+        count = state[1]
+        if count <= self.storm_threshold or (count - self.storm_threshold) % self.storm_sample_rate == 0:
+            suppressed = int(state[2])
+            state[2] = 0
+            return True, suppressed
+        
+        state[2] += 1
+        return False, 0
+    
+    def enrich(self, error_context: ErrorContextModel) -> ErrorContextModel:
+        """遅延していた詳細情報を抽出（修正エージェントに渡す直前に呼ぶ）"""
+        return error_context.enrich()
+    
+    def _enrich(self, error_context: ErrorContextModel, deferred: _DeferredErrorDetails):
+        """保留情報からトレースバック・コード・ローカル変数を構築"""
+        try:
+            self.stats["enriched"] += 1
+            traceback_exception = deferred.traceback_exception
+            
+            # 修正でファイルが書き換わっていることがあるので鮮度を確認してから読む
+            for frame_summary in traceback_exception.stack:
+                linecache.checkcache(frame_summary.filename)
+            
+            error_context.full_traceback = ''.join(traceback_exception.format())
+            error_context.stack_frames = self._extract_stack_frames(traceback_exception.stack)
+            
+            location = error_context.error_location
+            error_context.problematic_code, error_context.surrounding_code = self._extract_code_snippets(
+                location.file_path if location else None,
+                location.line_number if location else None
+            )
+            
+            error_context.local_variables = self._extract_local_variables(deferred.local_values)
+            
+        except Exception as e:
+            logger.warning(f"⚠️ エラー詳細抽出エラー: {e}")
+    
+    def _extract_stack_frames(self, stack: traceback.StackSummary) -> List[StackTraceFrame]:
         """スタックトレースからフレーム情報を抽出"""
         frames = []
         
         try:
-            tb_list = traceback.extract_tb(traceback_obj)
-            
-            for frame_summary in tb_list:
+            for frame_summary in stack:
                 # コード文脈を取得(前後1行)
                 code_context = self._get_code_context(
                     frame_summary.filename,
@@ -228,27 +434,6 @@ class EnhancedErrorHandler:
         
         return frames
     
-    def _extract_error_location(self, traceback_obj) -> Optional[CodeLocation]:
-        """エラー発生位置を抽出"""
-        try:
-            tb_list = traceback.extract_tb(traceback_obj)
-            
-            if not tb_list:
-                return None
-            
-            # 最後のフレーム(エラー発生箇所)を取得
-            last_frame = tb_list[-1]
-            
-            return CodeLocation(
-                file_path=last_frame.filename,
-                line_number=last_frame.lineno,
-                function_name=last_frame.name
-            )
-        
-        except Exception as e:
-            logger.warning(f"⚠️ エラー位置抽出エラー: {e}")
-            return None
-    
     def _extract_code_snippets(
         self, 
         file_path: Optional[str], 
@@ -259,8 +444,10 @@ class EnhancedErrorHandler:
             return None, None
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # linecache はプロセス内で共有されるのでファイルを毎回読み直さない
+            lines = linecache.getlines(file_path)
+            if not lines:
+                return None, None
             
             # 問題のある行(1行)
             if 1 <= line_number <= len(lines):
@@ -293,8 +480,7 @@ class EnhancedErrorHandler:
     ) -> Optional[str]:
         """指定行の前後のコードコンテキストを取得"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            lines = linecache.getlines(file_path)
             
             start = max(0, line_number - context_lines - 1)
             end = min(len(lines), line_number + context_lines)
@@ -305,14 +491,12 @@ class EnhancedErrorHandler:
         except:
             return None
     
-    def _extract_local_variables(self, traceback_obj) -> Dict[str, Any]:
+    def _extract_local_variables(self, local_values: Dict[str, Any]) -> Dict[str, Any]:
         """ローカル変数の状態を抽出(安全に)"""
         local_vars = {}
         
         try:
-            frame = traceback_obj.tb_frame
-            
-            for var_name, var_value in frame.f_locals.items():
+            for var_name, var_value in local_values.items():
                 try:
                     # シリアライズ可能な値のみ保存
                     if isinstance(var_value, (str, int, float, bool, type(None))):
@@ -357,13 +541,55 @@ class EnhancedErrorHandler:
         # LOW: 軽微な問題
         return ErrorSeverity.LOW
     
+    def _record_occurrence(
+        self,
+        fingerprint: str,
+        error_type: str,
+        error_message: str,
+        task_id: str
+    ) -> ErrorGroup:
+        """フィンガープリントごとの発生回数・時刻・タスクIDを更新"""
+        now = datetime.now()
+        group = self.error_groups.get(fingerprint)
+        
+        if group is None:
+            group = ErrorGroup(
+                fingerprint=fingerprint,
+                error_type=error_type,
+                error_message=error_message,
+                first_seen=now,
+                last_seen=now
+            )
+            self.error_groups[fingerprint] = group
+            
+            # バッファサイズ制限(最も長く発生していないエラーを削除)
+            while len(self.error_groups) > self.max_buffer_size:
+                _, evicted = self.error_groups.popitem(last=False)
+                for sample in evicted.samples:
+                    self._errors_by_id.pop(sample.error_id, None)
+        else:
+            self.error_groups.move_to_end(fingerprint)
+        
+        group.count += 1
+        group.last_seen = now
+        if task_id not in group.sample_task_ids and len(group.sample_task_ids) < self.max_sample_task_ids:
+            group.sample_task_ids.append(task_id)
+        
+        return group
+    
     def _add_to_buffer(self, error_context: ErrorContextModel):
-        """エラーコンテキストをバッファに追加"""
-        self.error_buffer.append(error_context)
+        """エラーコンテキストを該当グループのサンプルとして追加"""
+        group = self.error_groups.get(error_context.fingerprint)
+        if group is None:
+            group = self._record_occurrence(
+                error_context.fingerprint, error_context.error_type,
+                error_context.error_message or "", error_context.task_id
+            )
         
-        # バッファサイズ制限
-        if len(self.error_buffer) > self.max_buffer_size:
-            self.error_buffer.pop(0)  # 最古のエラーを削除
+        if len(group.samples) == group.samples.maxlen:
+            self._errors_by_id.pop(group.samples[0].error_id, None)
+        group.samples.append(error_context)
+        self._errors_by_id[error_context.error_id] = error_context
     
     def _create_minimal_error_context(
         self,
@@ -383,20 +609,32 @@ class EnhancedErrorHandler:
             severity=ErrorSeverity.MEDIUM
         )
     
+    @property
+    def error_buffer(self) -> List[ErrorContextModel]:
+        """保持中のサンプル(古い順)"""
+        return sorted(self._errors_by_id.values(), key=lambda e: e.timestamp)
+    
     def get_recent_errors(self, count: int = 10) -> List[ErrorContextModel]:
         """最近のエラーを取得"""
         return self.error_buffer[-count:]
     
     def get_error_by_id(self, error_id: str) -> Optional[ErrorContextModel]:
         """IDでエラーを検索"""
-        for error in reversed(self.error_buffer):
-            if error.error_id == error_id:
-                return error
-        return None
+        return self._errors_by_id.get(error_id)
+    
+    def get_error_group(self, fingerprint: str) -> Optional[ErrorGroup]:
+        """フィンガープリントでエラーグループを取得"""
+        return self.error_groups.get(fingerprint)
+    
+    def get_error_groups(self, limit: Optional[int] = None) -> List[ErrorGroup]:
+        """エラーグループを最終発生の新しい順に取得"""
+        groups = list(reversed(self.error_groups.values()))
+        return groups[:limit] if limit else groups
     
     def clear_buffer(self):
         """バッファをクリア"""
-        self.error_buffer.clear()
+        self.error_groups.clear()
+        self._errors_by_id.clear()
         logger.info("🧹 エラーバッファをクリアしました")
 
 
@@ -405,15 +643,20 @@ class TaskErrorHandler:
     タスク実行用エラーハンドラ - バグ修正タスク生成機能付き
     """
     
-    def __init__(self, error_handler: EnhancedErrorHandler):
+    def __init__(self, error_handler: EnhancedErrorHandler, fix_task_window: float = 300.0):
         """
         初期化
         
         Args:
             error_handler: EnhancedErrorHandlerインスタンス
+            fix_task_window: 同一フィンガープリントの修正タスクを1件にまとめる期間（秒）
         """
         self.error_handler = error_handler
         self.bug_fix_tasks: List[BugFixTask] = []
+        self.fix_task_window = fix_task_window
+        
+        # フィンガープリント -> (生成時刻, 修正タスク)
+        self._fix_tasks_by_fingerprint: Dict[str, Tuple[float, BugFixTask]] = {}
         
         logger.info("✅ TaskErrorHandler 初期化完了")
     
@@ -447,13 +690,18 @@ class TaskErrorHandler:
                 task_context=task
             )
             
-            # 自動修正が不要な場合は終了
-            if not auto_generate_fix_task:
+            # 既存の修正タスクの発生回数を更新（間引かれたエラーも数える）
+            self._refresh_occurrence_count(error_context.fingerprint)
+            
+            # 自動修正が不要な場合、ストーム中に間引かれた場合は終了
+            if not auto_generate_fix_task or error_context.sampled_out:
                 return None
             
             # 致命的なエラーのみバグ修正タスクを生成
             if error_context.severity in [ErrorSeverity.CRITICAL, ErrorSeverity.HIGH]:
                 bug_fix_task = self._generate_bug_fix_task(error_context, task)
+                if bug_fix_task is None:
+                    return None
                 self.bug_fix_tasks.append(bug_fix_task)
                 
                 logger.info(f"🔧 バグ修正タスク生成: {bug_fix_task.task_id}")
@@ -469,8 +717,29 @@ class TaskErrorHandler:
         self,
         error_context: ErrorContextModel,
         original_task: Dict[str, Any]
-    ) -> BugFixTask:
-        """バグ修正タスクを生成"""
+    ) -> Optional[BugFixTask]:
+        """
+        バグ修正タスクを生成
+        
+        同一フィンガープリントの修正タスクがウィンドウ内に既にあれば、
+        そのタスクの発生回数を更新して None を返す。
+        """
+        fingerprint = error_context.fingerprint
+        group = self.error_handler.get_error_group(fingerprint) if fingerprint else None
+        now = time.monotonic()
+        
+        if fingerprint:
+            existing = self._fix_tasks_by_fingerprint.get(fingerprint)
+            if existing and now - existing[0] <= self.fix_task_window:
+                existing_task = existing[1]
+                logger.debug(
+                    f"修正タスク生成をスキップ(既存: {existing_task.task_id}, "
+                    f"発生回数: {existing_task.occurrence_count})"
+                )
+                return None
+        
+        # 修正エージェントに渡すので、遅延していた詳細情報をここで抽出
+        error_context.enrich()
         
         # バグ修正タスクIDを生成
         fix_task_id = f"FIX_BUG_{error_context.task_id}_{datetime.now().strftime('%H%M%S')}"
@@ -487,11 +756,28 @@ class TaskErrorHandler:
             priority="critical" if error_context.severity == ErrorSeverity.CRITICAL else "high",
             required_role="quick_fix",
             target_files=target_files,
-            status="pending"
+            status="pending",
+            fingerprint=fingerprint,
+            occurrence_count=group.count if group else 1
         )
         
+        if fingerprint:
+            # 期限切れのエントリを掃除してから登録
+            self._fix_tasks_by_fingerprint = {
+                fp: entry for fp, entry in self._fix_tasks_by_fingerprint.items()
+                if now - entry[0] <= self.fix_task_window
+            }
+            self._fix_tasks_by_fingerprint[fingerprint] = (now, bug_fix_task)
+        
         return bug_fix_task
     
+    def _refresh_occurrence_count(self, fingerprint: Optional[str]):
+        """フィンガープリントに対応する修正タスクの発生回数をグループの値に合わせる"""
+        existing = self._fix_tasks_by_fingerprint.get(fingerprint) if fingerprint else None
+        group = self.error_handler.get_error_group(fingerprint) if existing else None
+        if group:
+            existing[1].occurrence_count = group.count
+    
     def get_pending_fix_tasks(self) -> List[BugFixTask]:
         """未処理のバグ修正タスクを取得"""
         return [task for task in self.bug_fix_tasks if task.status == "pending"]
@@ -0,0 +1,365 @@
+# llm_response_cache.py
+"""
+LLM応答キャッシュ
+(provider, model, temperature, 正規化プロンプトのハッシュ) をキーに
+LLM応答を永続化し、同一プロンプトの再送信を省略する
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    コンテンツアドレス型のLLM応答キャッシュ
+
+    機能:
+    - SQLiteによる永続化（プロセス再起動後も有効）
+    - メモリ上のLRU層による高速ヒット
+    - TTLによる有効期限管理
+    - エントリ数上限によるLRU削除
+    - バイパスフラグ（引数 or 環境変数 LLM_CACHE_BYPASS=1）
+    - temperature が 0 以外の呼び出しは既定でキャッシュしない
+      （サンプリング結果を固定してしまうため。cache_nonzero_temperature=True で明示的に許可）
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".cache/llm_responses",
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        memory_entries: int = 500,
+        enabled: bool = True,
+        cache_nonzero_temperature: bool = False
+    ):
+        """
+        初期化
+
+        Args:
+            cache_dir: キャッシュディレクトリ
+            ttl_seconds: 有効期限（秒）
+            max_entries: 永続キャッシュの最大エントリ数
+            memory_entries: メモリ上に保持する最大エントリ数
+            enabled: キャッシュ有効フラグ
+            cache_nonzero_temperature: temperature が 0 以外の応答もキャッシュする
+                （temperature=None は呼び出し側がサンプリングを制御しない経路として扱う）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "responses.sqlite3"
+
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+
+        # メモリLRU層: key -> (expires_at, value)
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)"
+        )
+        self._conn.commit()
+
+        # 統計情報
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "bypassed": 0,
+            "uncacheable": 0
+        }
+
+        logger.info(f"✅ LLMResponseCache 初期化完了 (db={self.db_path})")
+
+    # ========================================
+    # キー生成
+    # ========================================
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """改行コード・行末空白・連続空行の差異を吸収する"""
+        text = prompt.replace("\r\n", "\n").replace("\r", "\n")
+        text = "\n".join(line.rstrip() for line in text.split("\n"))
+        text = re.sub(r"\n{3,}", "\n\n", text)
+        return text.strip()
+
+    def make_key(
+        self,
+        provider: str,
+        model: Optional[str],
+        temperature: Optional[float],
+        prompt: str
+    ) -> str:
+        """キャッシュキーを生成"""
+        prompt_hash = hashlib.sha256(
+            self.normalize_prompt(prompt).encode("utf-8")
+        ).hexdigest()
+        temp = "none" if temperature is None else f"{float(temperature):.3f}"
+        raw = f"{provider}|{model or ''}|{temp}|{prompt_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _is_bypassed(self, bypass: bool) -> bool:
+        if bypass or not self.enabled:
+            return True
+        return os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+    def is_cacheable(self, temperature: Optional[float]) -> bool:
+        """temperature の設定でキャッシュしてよいか判定"""
+        if temperature is None or self.cache_nonzero_temperature:
+            return True
+        return float(temperature) == 0.0
+
+    # ========================================
+    # 取得・保存
+    # ========================================
+
+    def get(
+        self,
+        provider: str,
+        model: Optional[str],
+        temperature: Optional[float],
+        prompt: str,
+        bypass: bool = False
+    ) -> Optional[Any]:
+        """
+        キャッシュから応答を取得
+
+        Returns:
+            キャッシュされた応答（なければNone）
+        """
+        if self._is_bypassed(bypass):
+            self.stats["bypassed"] += 1
+            return None
+        if not self.is_cacheable(temperature):
+            self.stats["uncacheable"] += 1
+            return None
+
+        return self.get_by_key(self.make_key(provider, model, temperature, prompt))
+
+    def get_by_key(self, key: str) -> Optional[Any]:
+        """キーを指定して応答を取得"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            raw_value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                (now, key)
+            )
+            self._conn.commit()
+
+            value = json.loads(raw_value)
+            self._remember(key, expires_at, value)
+            self.stats["hits"] += 1
+            return value
+
+    def put(
+        self,
+        provider: str,
+        model: Optional[str],
+        temperature: Optional[float],
+        prompt: str,
+        value: Any,
+        ttl_seconds: Optional[float] = None,
+        bypass: bool = False
+    ) -> Optional[str]:
+        """
+        応答をキャッシュに保存
+
+        Args:
+            value: JSONシリアライズ可能な応答
+            ttl_seconds: 個別の有効期限（省略時はデフォルト）
+
+        Returns:
+            キャッシュキー（バイパス時・キャッシュ対象外の temperature の場合はNone）
+        """
+        if self._is_bypassed(bypass) or not self.is_cacheable(temperature):
+            return None
+
+        key = self.make_key(provider, model, temperature, prompt)
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, provider, model, value, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, provider, model, json.dumps(value, ensure_ascii=False),
+                 now, expires_at, now)
+            )
+            self._remember(key, expires_at, value)
+            self.stats["stores"] += 1
+            self._enforce_size_limit()
+            self._conn.commit()
+
+        return key
+
+    def invalidate(self, key: Optional[str]) -> bool:
+        """
+        エントリを無効化（修正が検証に失敗した場合など）
+
+        Returns:
+            削除したかどうか
+        """
+        if not key:
+            return False
+
+        with self._lock:
+            self._memory.pop(key, None)
+            cursor = self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        """メモリLRU層に追加（ロック保持中に呼ぶ）"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _enforce_size_limit(self):
+        """最大エントリ数を超えた分を最終アクセスの古い順に削除（ロック保持中に呼ぶ）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+
+        victims = [
+            row[0] for row in self._conn.execute(
+                "SELECT key FROM responses ORDER BY last_access ASC LIMIT ?",
+                (overflow,)
+            )
+        ]
+        self._conn.executemany(
+            "DELETE FROM responses WHERE key = ?",
+            [(key,) for key in victims]
+        )
+        for key in victims:
+            self._memory.pop(key, None)
+        self.stats["evictions"] += len(victims)
+
+    def cleanup_expired(self) -> int:
+        """期限切れエントリを削除"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE expires_at <= ?", (now,)
+            )
+            self._conn.commit()
+            expired_keys = [k for k, (exp, _) in self._memory.items() if exp <= now]
+            for key in expired_keys:
+                del self._memory[key]
+
+        removed = cursor.rowcount
+        self.stats["expired"] += removed
+        return removed
+
+    def clear(self):
+        """キャッシュを全削除"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        return {
+            **self.stats,
+            "entries": entries,
+            "memory_entries": len(self._memory),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        """DB接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+_shared_cache: Optional[LLMResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """
+    プロセス共有のLLM応答キャッシュを取得
+
+    環境変数 LLM_CACHE_DIR でキャッシュディレクトリを変更できる
+    環境変数 LLM_CACHE_NONZERO_TEMPERATURE=1 で temperature が 0 以外の応答もキャッシュする
+    """
+    global _shared_cache
+
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache(
+                cache_dir=os.getenv("LLM_CACHE_DIR", ".cache/llm_responses"),
+                cache_nonzero_temperature=os.getenv(
+                    "LLM_CACHE_NONZERO_TEMPERATURE", ""
+                ).lower() in ("1", "true", "yes")
+            )
+        return _shared_cache
@@ -0,0 +1,253 @@
+# metrics_timeseries.py
+"""
+メトリクス時系列ストア
+メトリクスごとに固定長のリングバッファを持ち、生データを
+1分・15分の粒度へダウンサンプリングして min/max/avg を保持する
+"""
+
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# (粒度秒, 保持バケット数) 既定: 1分×24時間, 15分×7日
+DEFAULT_LEVELS: Tuple[Tuple[int, int], ...] = ((60, 1440), (900, 672))
+
+
+class AggregateRing:
+    """
+    固定長リングバッファ（型付き配列）
+
+    1スロットごとに (時刻, 最小, 最大, 合計, 件数) を保持する。
+    生データは件数1のバケットとして格納する。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._timestamps = array("d", [0.0]) * capacity
+        self._mins = array("d", [0.0]) * capacity
+        self._maxs = array("d", [0.0]) * capacity
+        self._sums = array("d", [0.0]) * capacity
+        self._counts = array("L", [0]) * capacity
+        self._head = 0  # 次に書き込む位置
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, vmin: float, vmax: float, vsum: float, count: int):
+        i = self._head
+        self._timestamps[i] = timestamp
+        self._mins[i] = vmin
+        self._maxs[i] = vmax
+        self._sums[i] = vsum
+        self._counts[i] = count
+        self._head = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def oldest_timestamp(self) -> Optional[float]:
+        if not self._size:
+            return None
+        return self._timestamps[(self._head - self._size) % self.capacity]
+
+    def iter_range(self, start: float, end: float) -> Iterable[Tuple[float, float, float, float, int]]:
+        """start <= 時刻 <= end のスロットを古い順に返す"""
+        first = (self._head - self._size) % self.capacity
+        for offset in range(self._size):
+            i = (first + offset) % self.capacity
+            ts = self._timestamps[i]
+            if ts < start:
+                continue
+            if ts > end:
+                break
+            yield ts, self._mins[i], self._maxs[i], self._sums[i], self._counts[i]
+
+    def nbytes(self) -> int:
+        return sum(
+            a.itemsize * len(a)
+            for a in (self._timestamps, self._mins, self._maxs, self._sums, self._counts)
+        )
+
+
+class TimeSeries:
+    """
+    多段解像度の時系列
+
+    raw → 各粒度へ集約し、各レベルは固定長なので稼働時間に関係なくメモリは一定。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        raw_capacity: int = 720,
+        levels: Tuple[Tuple[int, int], ...] = DEFAULT_LEVELS
+    ):
+        """
+        初期化
+
+        Args:
+            name: メトリクス名
+            raw_capacity: 生データの保持件数
+            levels: (粒度秒, 保持バケット数) のタプル（細かい順）
+        """
+        self.name = name
+        self.raw = AggregateRing(raw_capacity)
+        self.levels: List[Tuple[int, AggregateRing]] = [
+            (resolution, AggregateRing(capacity)) for resolution, capacity in levels
+        ]
+        # 各レベルの集計中バケット: [開始時刻, 最小, 最大, 合計, 件数]
+        self._open: List[Optional[List[float]]] = [None] * len(self.levels)
+        self._last_value: Optional[float] = None
+
+    def add(self, value: float, timestamp: Optional[float] = None):
+        """値を追加"""
+        timestamp = time.time() if timestamp is None else timestamp
+        value = float(value)
+        self._last_value = value
+
+        self.raw.append(timestamp, value, value, value, 1)
+
+        for index, (resolution, ring) in enumerate(self.levels):
+            bucket_start = math.floor(timestamp / resolution) * resolution
+            bucket = self._open[index]
+
+            if bucket is not None and bucket[0] != bucket_start:
+                ring.append(bucket[0], bucket[1], bucket[2], bucket[3], int(bucket[4]))
+                bucket = None
+
+            if bucket is None:
+                self._open[index] = [bucket_start, value, value, value, 1]
+            else:
+                bucket[1] = min(bucket[1], value)
+                bucket[2] = max(bucket[2], value)
+                bucket[3] += value
+                bucket[4] += 1
+
+    @property
+    def last_value(self) -> Optional[float]:
+        return self._last_value
+
+    def resolutions(self) -> List[int]:
+        """利用できる粒度（0 は生データ）"""
+        return [0] + [resolution for resolution, _ in self.levels]
+
+    def _choose_resolution(self, start: float) -> int:
+        """start まで遡れる最も細かい粒度を選ぶ"""
+        oldest = self.raw.oldest_timestamp()
+        if oldest is not None and oldest <= start:
+            return 0
+        for resolution, ring in self.levels:
+            oldest = ring.oldest_timestamp()
+            if oldest is not None and oldest <= start:
+                return resolution
+        return self.levels[-1][0] if self.levels else 0
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        期間を指定して取得
+
+        Args:
+            start: 開始時刻（UNIX秒、省略時は全期間）
+            end: 終了時刻（UNIX秒、省略時は現在）
+            resolution: 粒度秒（0 は生データ、省略時は期間から自動選択）
+
+        Returns:
+            {"name", "resolution", "points": [{"timestamp", "min", "max", "avg", "count"}]}
+        """
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        if resolution is None:
+            resolution = self._choose_resolution(start)
+
+        if resolution == 0:
+            rows = list(self.raw.iter_range(start, end))
+        else:
+            level = next(
+                ((index, ring) for index, (res, ring) in enumerate(self.levels) if res == resolution),
+                None
+            )
+            if level is None:
+                raise ValueError(f"Unsupported resolution: {resolution}")
+            index, ring = level
+            rows = list(ring.iter_range(start, end))
+            bucket = self._open[index]
+            if bucket is not None and start <= bucket[0] <= end:
+                rows.append((bucket[0], bucket[1], bucket[2], bucket[3], int(bucket[4])))
+
+        return {
+            "name": self.name,
+            "resolution": resolution,
+            "points": [
+                {
+                    "timestamp": ts,
+                    "min": vmin,
+                    "max": vmax,
+                    "avg": vsum / count if count else 0.0,
+                    "count": count
+                }
+                for ts, vmin, vmax, vsum, count in rows
+            ]
+        }
+
+    def nbytes(self) -> int:
+        return self.raw.nbytes() + sum(ring.nbytes() for _, ring in self.levels)
+
+
+class MetricsTimeSeriesStore:
+    """メトリクス名ごとの TimeSeries をまとめて管理"""
+
+    def __init__(
+        self,
+        raw_capacity: int = 720,
+        levels: Tuple[Tuple[int, int], ...] = DEFAULT_LEVELS
+    ):
+        self.raw_capacity = raw_capacity
+        self.levels = levels
+        self._series: Dict[str, TimeSeries] = {}
+        self._lock = threading.Lock()
+
+    def record(self, values: Dict[str, Any], timestamp: Optional[float] = None):
+        """数値メトリクスをまとめて記録（数値以外は無視）"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for name, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                series = self._series.get(name)
+                if series is None:
+                    series = TimeSeries(name, self.raw_capacity, self.levels)
+                    self._series[name] = series
+                series.add(value, timestamp)
+
+    def query(
+        self,
+        name: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """メトリクスを期間指定で取得"""
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                return {"name": name, "resolution": resolution, "points": []}
+            return series.query(start, end, resolution)
+
+    def names(self) -> List[str]:
+        return sorted(self._series)
+
+    def latest(self) -> Dict[str, float]:
+        """各メトリクスの最新値"""
+        with self._lock:
+            return {name: series.last_value for name, series in self._series.items()}
+
+    def nbytes(self) -> int:
+        """リングバッファが確保しているメモリ量（バイト）"""
+        return sum(series.nbytes() for series in self._series.values())
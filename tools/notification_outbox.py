@@ -0,0 +1,342 @@
+# notification_outbox.py
+"""
+通知アウトボックス
+送信待ちの通知を SQLite に永続化し、配信状態・リトライ予定・冪等キーを管理する。
+プロセスが再起動しても未配信の通知は失われない。
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 配信状態
+STATE_PENDING = "pending"      # 配信待ち（next_attempt_at 以降に送信）
+STATE_SENDING = "sending"      # 送信中（クラッシュ時は起動時に pending へ戻す）
+STATE_DELIVERED = "delivered"  # 配信済み
+STATE_FAILED = "failed"        # リトライ上限に達した
+
+
+class NotificationOutbox:
+    """
+    SQLite による通知アウトボックス
+
+    1通知 × 1チャネルを1行として保持する。
+    - enqueue は1行 INSERT のみ（WAL + synchronous=NORMAL）
+    - (idempotency_key, channel) の一意制約で二重登録を防ぐ
+    - 同じ digest_key の行は、どれか1行が送信時刻に達した時点でまとめて取り出す
+    """
+
+    def __init__(self, outbox_dir: str = ".notifications", retention_seconds: float = 7 * 24 * 3600):
+        """
+        初期化
+
+        Args:
+            outbox_dir: 保存先ディレクトリ
+            retention_seconds: 配信済み・失敗行の保持期間（秒）
+        """
+        self.outbox_dir = Path(outbox_dir)
+        self.outbox_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.outbox_dir / "outbox.sqlite3"
+        self.retention_seconds = retention_seconds
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                digest_key TEXT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT,
+                UNIQUE (idempotency_key, channel)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_due ON deliveries(channel, state, next_attempt_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_updated ON deliveries(state, updated_at)"
+        )
+        self._conn.commit()
+
+        self.stats = {
+            "enqueued": 0,
+            "duplicates": 0,
+            "delivered": 0,
+            "retried": 0,
+            "failed": 0,
+            "recovered": 0
+        }
+
+        self._recover()
+        self.purge()
+
+        logger.info(f"✅ NotificationOutbox 初期化完了 (db={self.db_path})")
+
+    def _recover(self):
+        """前回送信中のまま終了した行を配信待ちへ戻す"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE deliveries SET state = ?, updated_at = ? WHERE state = ?",
+                (STATE_PENDING, time.time(), STATE_SENDING)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            self.stats["recovered"] += cursor.rowcount
+            logger.info(f"📤 未配信の通知を復旧: {cursor.rowcount}件")
+
+    # ========================================
+    # 登録
+    # ========================================
+
+    def enqueue(
+        self,
+        notification: Dict[str, Any],
+        channels: Iterable[str],
+        idempotency_key: Optional[str] = None,
+        digest_key: Optional[str] = None,
+        delay: float = 0.0,
+        attempts: int = 0
+    ) -> List[str]:
+        """
+        通知を登録
+
+        Args:
+            notification: 通知内容
+            channels: 配信チャネル名
+            idempotency_key: 冪等キー（同じキー・チャネルは1回だけ登録）
+            digest_key: ダイジェスト集約のキー
+            delay: 送信までの待ち時間（秒）
+            attempts: 既に試行した回数（直接送信の失敗を引き継ぐ場合）
+
+        Returns:
+            新たに登録したチャネル名（重複したチャネルは含まない）
+        """
+        key = idempotency_key or uuid.uuid4().hex
+        payload = json.dumps(notification, ensure_ascii=False, default=str)
+        now = time.time()
+
+        added = []
+        with self._lock:
+            for channel in channels:
+                cursor = self._conn.execute(
+                    """
+                    INSERT OR IGNORE INTO deliveries
+                        (idempotency_key, channel, digest_key, payload, state,
+                         attempts, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (key, channel, digest_key, payload, STATE_PENDING,
+                     attempts, now + delay, now, now)
+                )
+                if cursor.rowcount:
+                    added.append(channel)
+                else:
+                    self.stats["duplicates"] += 1
+            self._conn.commit()
+
+        self.stats["enqueued"] += len(added)
+        return added
+
+    # ========================================
+    # 取り出し・状態遷移
+    # ========================================
+
+    def next_due(self, channel: str) -> Optional[float]:
+        """チャネルで次に送信時刻を迎える時刻（UNIX秒）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM deliveries WHERE channel = ? AND state = ?",
+                (channel, STATE_PENDING)
+            ).fetchone()
+        return row[0] if row else None
+
+    def claim_due(self, channel: str, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        送信時刻に達した行を取り出して送信中にする
+
+        送信時刻に達した行と同じ digest_key を持つ配信待ちの行も一緒に取り出す。
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT id, idempotency_key, digest_key, payload, attempts FROM deliveries
+                WHERE channel = ? AND state = ? AND (
+                    next_attempt_at <= ?
+                    OR (attempts = 0 AND digest_key IN (
+                        SELECT digest_key FROM deliveries
+                        WHERE channel = ? AND state = ? AND next_attempt_at <= ?
+                              AND digest_key IS NOT NULL
+                    ))
+                )
+                ORDER BY id
+                LIMIT ?
+                """,
+                (channel, STATE_PENDING, now, channel, STATE_PENDING, now, limit)
+            ).fetchall()
+
+            if rows:
+                self._conn.executemany(
+                    "UPDATE deliveries SET state = ?, updated_at = ? WHERE id = ?",
+                    [(STATE_SENDING, now, row[0]) for row in rows]
+                )
+                self._conn.commit()
+
+        return [
+            {
+                "id": row[0],
+                "idempotency_key": row[1],
+                "digest_key": row[2],
+                "notification": json.loads(row[3]),
+                "attempts": row[4]
+            }
+            for row in rows
+        ]
+
+    def mark_delivered(self, ids: List[int]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE deliveries SET state = ?, attempts = attempts + 1, updated_at = ?, "
+                "last_error = NULL WHERE id = ?",
+                [(STATE_DELIVERED, now, i) for i in ids]
+            )
+            self._conn.commit()
+        self.stats["delivered"] += len(ids)
+
+    def mark_retry(self, ids: List[int], error: str, delay: float):
+        """送信失敗: delay 秒後に再送"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE deliveries SET state = ?, attempts = attempts + 1, next_attempt_at = ?, "
+                "updated_at = ?, last_error = ? WHERE id = ?",
+                [(STATE_PENDING, now + delay, now, error, i) for i in ids]
+            )
+            self._conn.commit()
+        self.stats["retried"] += len(ids)
+
+    def mark_failed(self, ids: List[int], error: str):
+        """リトライ上限: これ以上送信しない"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE deliveries SET state = ?, attempts = attempts + 1, updated_at = ?, "
+                "last_error = ? WHERE id = ?",
+                [(STATE_FAILED, now, error, i) for i in ids]
+            )
+            self._conn.commit()
+        self.stats["failed"] += len(ids)
+
+    def expedite(self, channel: Optional[str] = None, include_retries: bool = False) -> int:
+        """
+        配信待ちの行を今すぐ送信対象にする
+
+        Args:
+            channel: 対象チャネル（None なら全チャネル）
+            include_retries: リトライ待ちの行（attempts > 0）も前倒しする。
+                False ならダイジェスト待ちの未送信行だけを前倒しし、
+                リトライ待ちの行はバックオフどおりの時刻に残す
+        """
+        now = time.time()
+        query = "UPDATE deliveries SET next_attempt_at = ? WHERE state = ? AND next_attempt_at > ?"
+        params: List[Any] = [now, STATE_PENDING, now]
+        if not include_retries:
+            query += " AND attempts = 0"
+        if channel is not None:
+            query += " AND channel = ?"
+            params.append(channel)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+        return cursor.rowcount
+
+    # ========================================
+    # 参照・保守
+    # ========================================
+
+    def channels_with_pending(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT channel FROM deliveries WHERE state IN (?, ?)",
+                (STATE_PENDING, STATE_SENDING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def unsent_count(self) -> int:
+        """まだ1回も送信していない配信待ち行と送信中の行の数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM deliveries WHERE (state = ? AND attempts = 0) OR state = ?",
+                (STATE_PENDING, STATE_SENDING)
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        """状態別の行数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM deliveries GROUP BY state"
+            ).fetchall()
+        counts = {state: 0 for state in (STATE_PENDING, STATE_SENDING, STATE_DELIVERED, STATE_FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """最近更新された行"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT channel, state, attempts, payload, updated_at, last_error
+                FROM deliveries ORDER BY updated_at DESC, id DESC LIMIT ?
+                """,
+                (limit,)
+            ).fetchall()
+        history = []
+        for channel, state, attempts, payload, updated_at, last_error in reversed(rows):
+            notification = json.loads(payload)
+            history.append({
+                "timestamp": notification.get("timestamp"),
+                "message": notification.get("message"),
+                "level": notification.get("level"),
+                "channel": channel,
+                "state": state,
+                "attempts": attempts,
+                "updated_at": updated_at,
+                "error": last_error
+            })
+        return history
+
+    def purge(self) -> int:
+        """保持期間を過ぎた配信済み・失敗行を削除（冪等キーも解放される）"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM deliveries WHERE state IN (?, ?) AND updated_at < ?",
+                (STATE_DELIVERED, STATE_FAILED, cutoff)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,366 @@
+# prompt_budget.py
+"""
+トークン予算付きプロンプトビルダー
+エラーコンテキストの各要素に優先度を付け、予算内に収まる分だけを
+価値の高い順に詰めてプロンプトを構築する
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 優先度（大きいほど先に予算を割り当てる）
+PRIORITY_ERROR_FRAME = 100
+PRIORITY_PROBLEMATIC_CODE = 90
+PRIORITY_SURROUNDING_CODE = 80
+PRIORITY_TRACEBACK = 70
+PRIORITY_LOCAL_VARIABLES = 50
+PRIORITY_IMPORTS = 40
+PRIORITY_TASK_CONTEXT = 30
+PRIORITY_HISTORY = 10
+
+# これより小さい残予算では切り詰めて入れる意味がない
+MIN_TRUNCATED_TOKENS = 48
+
+_FRAME_LINE = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+), in (?P<func>.+)$')
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    トークン数の概算
+
+    ASCIIは約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとみなす
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+@dataclass
+class ContextPiece:
+    """プロンプトに入れる候補要素"""
+    name: str
+    title: str
+    content: str
+    priority: int
+    fence: Optional[str] = None  # コードブロックの言語（Noneならフェンスなし）
+    truncate: str = "head"  # head / tail / center / none
+
+    def render(self, content: Optional[str] = None) -> str:
+        body = self.content if content is None else content
+        if self.fence is not None:
+            body = f"```{self.fence}\n{body}\n```"
+        return f"{self.title}\n{body}\n" if self.title else f"{body}\n"
+
+
+class TokenBudgetPromptBuilder:
+    """
+    トークン予算付きプロンプトビルダー
+
+    固定部（指示・出力形式）は常に含め、残りの予算を優先度順に
+    コンテキスト要素へ割り当てる。入り切らない要素は切り詰めるか省略する。
+    出力は追加した順序を保つ。
+    """
+
+    def __init__(self, budget_tokens: int):
+        self.budget_tokens = budget_tokens
+        self._header: List[str] = []
+        self._footer: List[str] = []
+        self._pieces: List[ContextPiece] = []
+
+    def add_header(self, text: str):
+        self._header.append(text)
+
+    def add_footer(self, text: str):
+        self._footer.append(text)
+
+    def add_piece(self, piece: Optional[ContextPiece]):
+        if piece is not None and piece.content and piece.content.strip():
+            self._pieces.append(piece)
+
+    def add_pieces(self, pieces: Iterable[ContextPiece]):
+        for piece in pieces:
+            self.add_piece(piece)
+
+    def build(self) -> Tuple[str, Dict[str, Any]]:
+        """
+        プロンプトを構築
+
+        Returns:
+            (プロンプト, レポート)
+            レポート: budget, used_tokens, original_tokens, saved_tokens,
+                      included, truncated, dropped
+        """
+        fixed_text = "\n".join(self._header + self._footer)
+        remaining = self.budget_tokens - estimate_tokens(fixed_text)
+
+        rendered: Dict[int, str] = {}
+        report = {
+            "budget": self.budget_tokens,
+            "included": [],
+            "truncated": [],
+            "dropped": [],
+        }
+
+        order = sorted(range(len(self._pieces)), key=lambda i: -self._pieces[i].priority)
+        for index in order:
+            piece = self._pieces[index]
+            full = piece.render()
+            cost = estimate_tokens(full)
+
+            if cost <= remaining:
+                rendered[index] = full
+                remaining -= cost
+                report["included"].append(piece.name)
+                continue
+
+            if piece.truncate != "none" and remaining >= MIN_TRUNCATED_TOKENS:
+                overhead = estimate_tokens(piece.render(""))
+                content = self._truncate(piece.content, remaining - overhead, piece.truncate)
+                if content:
+                    text = piece.render(content)
+                    rendered[index] = text
+                    remaining -= estimate_tokens(text)
+                    report["truncated"].append(piece.name)
+                    continue
+
+            report["dropped"].append(piece.name)
+
+        parts = list(self._header)
+        parts.extend(rendered[i] for i in sorted(rendered))
+        parts.extend(self._footer)
+        prompt = "\n".join(parts)
+
+        original = "\n".join(
+            self._header + [piece.render() for piece in self._pieces] + self._footer
+        )
+        report["used_tokens"] = estimate_tokens(prompt)
+        report["original_tokens"] = estimate_tokens(original)
+        report["saved_tokens"] = max(0, report["original_tokens"] - report["used_tokens"])
+
+        return prompt, report
+
+    @staticmethod
+    def _truncate(content: str, max_tokens: int, mode: str) -> str:
+        """行単位で予算内に切り詰める"""
+        if max_tokens <= 0:
+            return ""
+
+        lines = content.splitlines()
+        marker = "... (省略)"
+        budget = max_tokens - estimate_tokens(marker)
+
+        def take(seq: Iterable[str], limit: int) -> List[str]:
+            taken, used = [], 0
+            for line in seq:
+                cost = estimate_tokens(line) + 1
+                if used + cost > limit:
+                    break
+                taken.append(line)
+                used += cost
+            return taken
+
+        if mode == "tail":
+            kept = take(reversed(lines), budget)[::-1]
+            return "\n".join([marker] + kept) if kept else ""
+
+        if mode == "center":
+            middle = len(lines) // 2
+            before = take(reversed(lines[:middle]), budget // 2)[::-1]
+            after = take(lines[middle:], budget - sum(estimate_tokens(l) + 1 for l in before))
+            kept = before + after
+            if not kept:
+                return ""
+            result = []
+            if len(before) < middle:
+                result.append(marker)
+            result.extend(kept)
+            if len(after) < len(lines) - middle:
+                result.append(marker)
+            return "\n".join(result)
+
+        kept = take(lines, budget)
+        return "\n".join(kept + [marker]) if kept else ""
+
+
+# ========================================
+# エラーコンテキスト用ヘルパー
+# ========================================
+
+def dedupe_traceback(traceback_text: str) -> str:
+    """
+    トレースバックの重複フレームを除去
+
+    - 連続して繰り返すフレーム列（再帰など）を1回分＋回数表示にまとめる
+    - 例外チェーンで既に表示したフレームは省略する
+    """
+    if not traceback_text:
+        return traceback_text
+
+    # 行を「フレーム（File行＋コード行）」と「その他の行」に分割
+    blocks: List[Tuple[Optional[str], List[str]]] = []
+    for line in traceback_text.splitlines():
+        if _FRAME_LINE.match(line):
+            blocks.append((line.strip(), [line]))
+        elif blocks and blocks[-1][0] is not None and line.startswith("    ") \
+                and len(blocks[-1][1]) < 4:
+            blocks[-1][1].append(line)
+        else:
+            blocks.append((None, [line]))
+
+    # 連続して繰り返すフレーム列（周期1〜4）を圧縮
+    collapsed: List[Tuple[Optional[str], List[str]]] = []
+    i = 0
+    while i < len(blocks):
+        compressed = False
+        for period in range(1, 5):
+            cycle = blocks[i:i + period]
+            if len(cycle) < period or any(key is None for key, _ in cycle):
+                break
+            keys = [key for key, _ in cycle]
+            repeats = 1
+            while [k for k, _ in blocks[i + repeats * period:i + (repeats + 1) * period]] == keys:
+                repeats += 1
+            if repeats > 1:
+                collapsed.extend(cycle)
+                collapsed.append((None, [f"  [上記{period}フレームが{repeats - 1}回繰り返し]"]))
+                i += repeats * period
+                compressed = True
+                break
+        if not compressed:
+            collapsed.append(blocks[i])
+            i += 1
+
+    # 例外チェーンで既出のフレームを省略
+    seen = set()
+    output: List[str] = []
+    skipped = 0
+    for key, lines in collapsed:
+        if key is not None and key in seen:
+            skipped += 1
+            continue
+        if skipped:
+            output.append(f"  [既出の{skipped}フレームを省略]")
+            skipped = 0
+        if key is not None:
+            seen.add(key)
+        output.extend(lines)
+    if skipped:
+        output.append(f"  [既出の{skipped}フレームを省略]")
+
+    return "\n".join(output)
+
+
+def extract_imports(file_paths: Iterable[str], max_lines_per_file: int = 40) -> str:
+    """対象ファイルのimport文を抽出"""
+    sections = []
+    for file_path in dict.fromkeys(p for p in file_paths if p):
+        path = Path(file_path)
+        if path.suffix != ".py" or not path.is_file():
+            continue
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                imports = [
+                    line.rstrip() for line in f
+                    if line.startswith(("import ", "from "))
+                ][:max_lines_per_file]
+        except OSError:
+            continue
+        if imports:
+            sections.append(f"# {file_path}\n" + "\n".join(imports))
+    return "\n\n".join(sections)
+
+
+def _short_repr(value: Any, limit: int = 200) -> str:
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def error_context_pieces(
+    error_context,
+    target_files: Optional[List[str]] = None,
+    max_local_variables: Optional[int] = None
+) -> List[ContextPiece]:
+    """
+    ErrorContextModel から優先度付きのコンテキスト要素を生成
+
+    Args:
+        error_context: ErrorContextModel
+        target_files: import抽出の対象とする修正対象ファイル
+        max_local_variables: ローカル変数の最大件数（Noneなら全件）
+    """
+    pieces: List[ContextPiece] = []
+    location = error_context.error_location
+
+    # エラー発生フレーム
+    frame_lines = [
+        f"エラータイプ: {error_context.error_type}",
+        f"エラーメッセージ: {error_context.error_message}",
+    ]
+    if location:
+        frame_lines.append(f"ファイル: {location.file_path}:{location.line_number}")
+        if location.function_name:
+            frame_lines.append(f"関数: {location.function_name}")
+    if error_context.stack_frames and error_context.stack_frames[-1].code_context:
+        frame_lines.append(error_context.stack_frames[-1].code_context)
+    pieces.append(ContextPiece(
+        "error_frame", "【エラー発生箇所】", "\n".join(frame_lines),
+        PRIORITY_ERROR_FRAME, truncate="head"
+    ))
+
+    if error_context.problematic_code:
+        pieces.append(ContextPiece(
+            "problematic_code", "【問題のある行】", error_context.problematic_code,
+            PRIORITY_PROBLEMATIC_CODE, fence="python", truncate="center"
+        ))
+
+    if error_context.surrounding_code:
+        pieces.append(ContextPiece(
+            "surrounding_code", "【周辺コード】", error_context.surrounding_code,
+            PRIORITY_SURROUNDING_CODE, fence="python", truncate="center"
+        ))
+
+    if error_context.full_traceback:
+        pieces.append(ContextPiece(
+            "traceback", "【スタックトレース】", dedupe_traceback(error_context.full_traceback),
+            PRIORITY_TRACEBACK, fence="", truncate="tail"
+        ))
+
+    if error_context.local_variables:
+        items = list(error_context.local_variables.items())
+        if max_local_variables is not None:
+            items = items[:max_local_variables]
+        pieces.append(ContextPiece(
+            "local_variables", "【ローカル変数の状態】",
+            "\n".join(f"{name} = {_short_repr(value)}" for name, value in items),
+            PRIORITY_LOCAL_VARIABLES, fence="python", truncate="head"
+        ))
+
+    files = list(target_files or [])
+    if location:
+        files.insert(0, location.file_path)
+    imports = extract_imports(files)
+    if imports:
+        pieces.append(ContextPiece(
+            "imports", "【対象ファイルのimport】", imports,
+            PRIORITY_IMPORTS, fence="python", truncate="head"
+        ))
+
+    task_lines = []
+    if error_context.task_description:
+        task_lines.append(error_context.task_description)
+    for key, value in (getattr(error_context, "context_info", None) or {}).items():
+        task_lines.append(f"- {key}: {_short_repr(value)}")
+    if task_lines:
+        pieces.append(ContextPiece(
+            "task_context", "【実行中のタスク】", "\n".join(task_lines),
+            PRIORITY_TASK_CONTEXT, truncate="head"
+        ))
+
+    return pieces
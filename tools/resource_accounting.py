@@ -0,0 +1,226 @@
+# resource_accounting.py
+"""
+タスク単位のリソース計測
+タスク開始時にCPU時間・RSS・子プロセスCPUの基準値を取り、終了時の差分を
+そのタスクの消費量とする。RSSのピークは開始・終了時と、SystemSampler などが
+record_rss_sample() で渡すサンプルから求める。ブラウザ・Sheets・LLM などの待ち時間は
+track_wait() で囲んだ区間を、実行中のタスクへ自動で帰属させる。
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 待ち時間のカテゴリ
+WAIT_BROWSER = "browser"
+WAIT_SHEETS = "sheets"
+WAIT_LLM = "llm"
+WAIT_SUBPROCESS = "subprocess"
+
+def _current_rss() -> Optional[int]:
+    """現在のRSS（バイト、取得できなければ None）"""
+    if psutil is not None:
+        try:
+            return psutil.Process().memory_info().rss
+        except Exception:
+            return None
+    return None
+
+
+def children_cpu_time() -> float:
+    """回収済みの子プロセスが消費したCPU時間の累計（user + sys 秒）"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@dataclass
+class TaskResourceUsage:
+    """1タスクのリソース消費量"""
+    task_id: str
+    role: str
+    task_type: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    rss_delta: Optional[int] = None
+    peak_rss_delta: int = 0  # タスク中に観測したRSSの最大値 - 開始時のRSS（サンプリング間隔より短い山は見えない）
+    subprocess_cpu: float = 0.0
+    waits: Dict[str, float] = field(default_factory=dict)
+    overlapped: bool = False  # 他タスクと並行実行されていた（CPU時間は按分されていない）
+
+    @property
+    def wait_time(self) -> float:
+        return sum(self.waits.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["wait_time"] = self.wait_time
+        return data
+
+
+class TaskResourceTracker:
+    """
+    実行中タスクの計測状態
+
+    CPU時間はプロセス全体の値の差分なので、同時に複数タスクが走っていた
+    場合は overlapped=True として区別する。開始時に他のタスクが実行中だった
+    場合に加え、実行中に別のタスクが開始した場合（開始から終了まで自分の
+    区間の内側で走ったタスクを含む）も overlapped とする。
+    """
+
+    _active = 0
+    _started = 0  # これまでに開始したタスク数（実行中に他タスクが始まったかの判定用）
+    _live: Set["TaskResourceTracker"] = set()
+    _active_lock = threading.Lock()
+
+    def __init__(self, task_id: str, role: str, task_type: str):
+        self.usage = TaskResourceUsage(task_id=task_id, role=role, task_type=task_type)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._rss_start = _current_rss()
+        self._rss_peak = self._rss_start
+        self._children_start = children_cpu_time()
+        self._finished = False
+
+        with TaskResourceTracker._active_lock:
+            TaskResourceTracker._active += 1
+            TaskResourceTracker._started += 1
+            self._started_snapshot = TaskResourceTracker._started
+            TaskResourceTracker._live.add(self)
+            if TaskResourceTracker._active > 1:
+                self.usage.overlapped = True
+
+    def observe_rss(self, rss: int):
+        if self._rss_peak is None or rss > self._rss_peak:
+            self._rss_peak = rss
+
+    def add_wait(self, category: str, seconds: float):
+        self.usage.waits[category] = self.usage.waits.get(category, 0.0) + seconds
+
+    def finish(self) -> TaskResourceUsage:
+        """計測を終了して消費量を確定"""
+        if self._finished:
+            return self.usage
+        self._finished = True
+
+        with TaskResourceTracker._active_lock:
+            if (TaskResourceTracker._active > 1
+                    or TaskResourceTracker._started != self._started_snapshot):
+                self.usage.overlapped = True
+            TaskResourceTracker._active -= 1
+            TaskResourceTracker._live.discard(self)
+
+        usage = self.usage
+        usage.wall_time = time.perf_counter() - self._wall_start
+        usage.cpu_time = time.process_time() - self._cpu_start
+        rss_end = _current_rss()
+        if rss_end is not None:
+            self.observe_rss(rss_end)
+            if self._rss_start is not None:
+                usage.rss_delta = rss_end - self._rss_start
+        if self._rss_peak is not None and self._rss_start is not None:
+            usage.peak_rss_delta = max(0, self._rss_peak - self._rss_start)
+        # 子プロセスCPUは SystemCLIExecutor などが明示的に加算した分を優先する
+        if not usage.subprocess_cpu:
+            usage.subprocess_cpu = max(0.0, children_cpu_time() - self._children_start)
+        return usage
+
+
+def record_rss_sample(rss: int):
+    """
+    プロセスのRSSのサンプルを実行中の全タスクに反映（任意のスレッドから呼べる）
+
+    SystemSampler の採取ごとに呼ばれ、タスクのRSSピークの材料になる。
+    """
+    with TaskResourceTracker._active_lock:
+        trackers = list(TaskResourceTracker._live)
+    for tracker in trackers:
+        tracker.observe_rss(rss)
+
+
+# 現在のタスクの計測状態（asyncio のタスクごとに独立）
+_current_tracker: contextvars.ContextVar[Optional[TaskResourceTracker]] = \
+    contextvars.ContextVar("current_resource_tracker", default=None)
+# 計測中の待ち区間（入れ子は外側だけを数える）
+_in_wait: contextvars.ContextVar[bool] = contextvars.ContextVar("in_resource_wait", default=False)
+
+
+def current_tracker() -> Optional[TaskResourceTracker]:
+    return _current_tracker.get()
+
+
+def activate_tracker(tracker: Optional[TaskResourceTracker]) -> contextvars.Token:
+    """現在のコンテキストの計測対象を設定"""
+    return _current_tracker.set(tracker)
+
+
+def deactivate_tracker(token: contextvars.Token):
+    try:
+        _current_tracker.reset(token)
+    except ValueError:
+        # 別コンテキストで作られたトークン（start/end が別タスクで呼ばれた）
+        _current_tracker.set(None)
+
+
+@contextmanager
+def track_wait(category: str) -> Iterator[None]:
+    """
+    待ち時間を現在のタスクに帰属させる
+
+    計測中のタスクがなければ何もしない。入れ子になった場合は外側の
+    カテゴリだけを数える（send_prompt_and_wait → send_prompt など）。
+    """
+    tracker = _current_tracker.get()
+    if tracker is None or _in_wait.get():
+        yield
+        return
+
+    token = _in_wait.set(True)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracker.add_wait(category, time.perf_counter() - start)
+        _in_wait.reset(token)
+
+
+def waits_on(category: str) -> Callable:
+    """関数全体の実行時間を待ち時間として計測するデコレータ（同期・非同期両対応）"""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_wait(category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_wait(category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_subprocess_cpu(seconds: float):
+    """子プロセスのCPU時間を現在のタスクに加算"""
+    tracker = _current_tracker.get()
+    if tracker is not None and seconds > 0:
+        tracker.usage.subprocess_cpu += seconds
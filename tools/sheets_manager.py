@@ -10,6 +10,7 @@ import logging
 import re
 
 from configuration.config_utils import config, ErrorHandler
+from tools.resource_accounting import WAIT_SHEETS, waits_on
 
 logger = logging.getLogger(__name__)
 
@@ -85,6 +86,7 @@ class GoogleSheetsManager:
         if not self.gc:
             raise Exception("Google Sheets クライアントが初期化されていません。サービスアカウントファイルを設定してください。")
     
+    @waits_on(WAIT_SHEETS)
     async def update_task_status(self, task_id: int, status: str, sheet_name: str = "pm_tasks") -> bool:
         """
         タスクのステータスを更新（ロバスト性向上版 + 超詳細ログ）
@@ -258,6 +260,7 @@ class GoogleSheetsManager:
             logger.error(traceback.format_exc())
             return False
 
+    @waits_on(WAIT_SHEETS)
     async def find_available_task_id(self) -> Optional[str]:
         """利用可能なタスクIDを検索（ログ削減版）"""
         try:
@@ -305,6 +308,7 @@ class GoogleSheetsManager:
         except Exception as e:
             return []
 
+    @waits_on(WAIT_SHEETS)
     async def load_tasks_from_sheet(self, sheet_name: str = "pm_tasks") -> List[Dict]:
         """指定されたシートからタスクを読み込む（エラー修正版）"""
         try:
@@ -403,6 +407,7 @@ class GoogleSheetsManager:
             logger.error(f"❌ タスク読み込みエラー（シート: {sheet_name}）: {e}")
             return []
 
+    @waits_on(WAIT_SHEETS)
     async def save_task_output(self, output_data: Dict):
         """タスクの出力を保存"""
         try:
@@ -441,6 +446,7 @@ class GoogleSheetsManager:
             ErrorHandler.log_error(e, "タスク出力保存")
             return False
     
+    @waits_on(WAIT_SHEETS)
     def save_result_to_sheet(self, results: List[Dict], mode: str = "text") -> None:
         """
         結果をスプレッドシートに保存
@@ -517,6 +523,7 @@ class GoogleSheetsManager:
         logger.warning(f"⚠️ URLからファイルIDを抽出できませんでした: {url}")
         return None
     
+    @waits_on(WAIT_SHEETS)
     def read_file_from_drive(self, file_id_or_url: str) -> Optional[str]:
         """
         Google Driveからファイルをダウンロードして読み込む（超詳細ログ版）
@@ -662,6 +669,7 @@ class GoogleSheetsManager:
             logger.warning("⚠️ PC_IDの読み取りに失敗しました。デフォルト値1を使用します")
             return 1
     
+    @waits_on(WAIT_SHEETS)
     def load_pc_settings(self, pc_id: int = 1) -> Dict[str, str]:
         """PC固有の設定をsettingシートから読み込み"""
         try:
@@ -738,6 +746,7 @@ class GoogleSheetsManager:
             col_index //= 26
         return result
     
+    @waits_on(WAIT_SHEETS)
     def load_credentials_from_sheet(self, pc_id: int = 1) -> Dict[str, str]:
         """認証情報を読み込み(PC_ID対応版)"""
         try:
@@ -759,6 +768,7 @@ class GoogleSheetsManager:
     
     # sheets_manager.py に以下のメソッドを追加
 
+    @waits_on(WAIT_SHEETS)
     async def verify_task_exists(self, task_id: int, sheet_name: str = "pm_tasks") -> bool:
         """タスクがシートに存在するか検証（追加）"""
         try:
@@ -0,0 +1,679 @@
+# verification_engine.py
+"""
+修正検証エンジン
+パッチ適用後の確認をサブプロセス起動なしで行う:
+- 構文チェック: 変更ファイルをまとめて compile()（プロセス内）
+- インポートチェック: 起動済みのワーカープロセス（新しいインタプリタ）で import
+- 影響テスト: import グラフを逆にたどり、変更モジュールに依存するテストだけを選ぶ
+- 修正候補の検証: 作業ツリーに書かずに一時ディレクトリのコピーで同じ検査を行う
+"""
+
+import ast
+import asyncio
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# このパッケージのルート（ワーカーが tools.verification_engine を読み込むため）
+_PACKAGE_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+# import グラフの走査から除外するディレクトリ
+DEFAULT_EXCLUDE_DIRS = {
+    "__pycache__", "node_modules", "venv", ".venv", "env",
+    "backups", "backup_files", "archive", "wp-content", "browser_data"
+}
+
+# テストファイルとみなすディレクトリ名
+DEFAULT_TEST_DIRS = ("test", "tests")
+
+
+@dataclass
+class VerificationResult:
+    """検証結果"""
+    success: bool
+    checked_files: List[str] = field(default_factory=list)
+    imported_modules: List[str] = field(default_factory=list)
+    affected_tests: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    duration: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "success": self.success,
+            "checked_files": self.checked_files,
+            "imported_modules": self.imported_modules,
+            "affected_tests": self.affected_tests,
+            "errors": self.errors,
+            "duration": self.duration
+        }
+
+
+class ImportGraph:
+    """
+    プロジェクト内モジュールの import グラフ
+
+    ファイルの mtime をキーに解析結果をキャッシュし、再構築時は
+    変更されたファイルだけを再解析する。
+    """
+
+    def __init__(self, project_root: Path, exclude_dirs: Optional[Set[str]] = None):
+        self.project_root = project_root
+        self.exclude_dirs = exclude_dirs or DEFAULT_EXCLUDE_DIRS
+        # パス -> (mtime, モジュール名, import先モジュール名)
+        self._parsed: Dict[str, Tuple[float, str, Set[str]]] = {}
+        self._module_files: Dict[str, str] = {}
+        self._importers: Dict[str, Set[str]] = {}
+
+    def module_name(self, path: Path) -> Optional[str]:
+        """ファイルパスからモジュール名を求める（プロジェクト外なら None）"""
+        try:
+            relative = path.resolve().relative_to(self.project_root)
+        except ValueError:
+            return None
+        parts = list(relative.with_suffix("").parts)
+        if parts and parts[-1] == "__init__":
+            parts.pop()
+        if not parts or not all(part.isidentifier() for part in parts):
+            return None
+        return ".".join(parts)
+
+    def module_file(self, module: str) -> Optional[str]:
+        return self._module_files.get(module)
+
+    def refresh(self):
+        """変更されたファイルだけ再解析してグラフを作り直す"""
+        seen = set()
+        for directory, dirnames, filenames in os.walk(self.project_root):
+            dirnames[:] = [
+                d for d in dirnames
+                if d not in self.exclude_dirs and not d.startswith(".")
+            ]
+            for filename in filenames:
+                if not filename.endswith(".py"):
+                    continue
+                path = os.path.join(directory, filename)
+                seen.add(path)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                cached = self._parsed.get(path)
+                if cached is not None and cached[0] == mtime:
+                    continue
+                module = self.module_name(Path(path))
+                if module is None:
+                    continue
+                self._parsed[path] = (mtime, module, self._parse_imports(path, module))
+
+        for path in set(self._parsed) - seen:
+            del self._parsed[path]
+
+        self._module_files = {module: path for path, (_, module, _) in self._parsed.items()}
+        importers: Dict[str, Set[str]] = {}
+        for _, module, imports in self._parsed.values():
+            for imported in imports:
+                # "a.b.c" の import は a.b.c と親パッケージ a.b・a への依存とみなす
+                target = imported
+                while target:
+                    if target in self._module_files:
+                        importers.setdefault(target, set()).add(module)
+                        break
+                    target = target.rpartition(".")[0]
+        self._importers = importers
+
+    @staticmethod
+    def _parse_imports(path: str, module: str) -> Set[str]:
+        try:
+            with open(path, "rb") as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (SyntaxError, ValueError, OSError):
+            return set()
+
+        is_package = path.endswith("__init__.py")
+        package_parts = module.split(".") if is_package else module.split(".")[:-1]
+
+        imports: Set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imports.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base_parts = package_parts[:len(package_parts) - node.level + 1]
+                    base = ".".join(base_parts + ([node.module] if node.module else []))
+                else:
+                    base = node.module or ""
+                if not base:
+                    continue
+                imports.add(base)
+                # from pkg import submodule の形も拾う
+                imports.update(f"{base}.{alias.name}" for alias in node.names)
+        return imports
+
+    def dependents(self, modules: Iterable[str]) -> Set[str]:
+        """modules と、それらに（推移的に）依存するモジュール"""
+        result = set(modules)
+        stack = list(result)
+        while stack:
+            for importer in self._importers.get(stack.pop(), ()):
+                if importer not in result:
+                    result.add(importer)
+                    stack.append(importer)
+        return result
+
+
+class VerificationEngine:
+    """
+    修正検証エンジン
+
+    verify() に変更ファイルをまとめて渡すと、構文チェック → インポート
+    チェック → 影響テストの選定 を行う。構文チェックは同一プロセス、
+    インポートは新しいインタプリタとして起動しておいたワーカープロセスで行う。ワーカーは
+    使い回すのでサードパーティのimportは2回目以降済んでおり、Pythonの
+    起動コストも払わない（親プロセスのスレッドやロックは引き継がない）。
+    ワーカーが使えない環境では1回のサブプロセスにまとめて実行する。
+    """
+
+    def __init__(
+        self,
+        project_root: str = ".",
+        test_dirs: Tuple[str, ...] = DEFAULT_TEST_DIRS,
+        import_timeout: float = 30.0,
+        import_workers: int = 2
+    ):
+        """
+        初期化
+
+        Args:
+            project_root: プロジェクトルート（import グラフの範囲）
+            test_dirs: テストファイルを置くディレクトリ名
+            import_timeout: インポートチェックのタイムアウト（秒）
+            import_workers: インポートチェック用ワーカープロセスの上限
+        """
+        self.project_root = Path(project_root).resolve()
+        self.test_dirs = test_dirs
+        self.import_timeout = import_timeout
+        self.graph = ImportGraph(self.project_root)
+        self._import_pool = _ImportWorkerPool(self.project_root, import_workers)
+
+        self.stats = {
+            "verifications": 0,
+            "files_compiled": 0,
+            "modules_imported": 0,
+            "affected_tests_selected": 0,
+            "worker_checks": 0,
+            "subprocess_checks": 0,
+            "candidates_verified": 0
+        }
+
+    # ========================================
+    # 公開API
+    # ========================================
+
+    async def verify(
+        self,
+        file_paths: Iterable[str],
+        check_imports: bool = True,
+        select_tests: bool = True
+    ) -> VerificationResult:
+        """
+        変更ファイルをまとめて検証
+
+        Args:
+            file_paths: 変更されたファイル
+            check_imports: インポートチェックを行う
+            select_tests: 影響を受けるテストを選定する
+
+        Returns:
+            VerificationResult（affected_tests は実行していない候補）
+        """
+        start = time.perf_counter()
+        self.stats["verifications"] += 1
+
+        files = [str(Path(p)) for p in dict.fromkeys(file_paths) if p and str(p).endswith(".py")]
+        result = VerificationResult(success=True, checked_files=files)
+
+        # 1. 構文チェック（プロセス内）
+        result.errors.extend(self.check_syntax(files))
+
+        modules = [
+            m for m in (self.graph.module_name(Path(p)) for p in files) if m is not None
+        ]
+
+        # 2. インポートチェック（構文エラーがなければ）
+        if check_imports and modules and not result.errors:
+            import_errors = await self.check_imports(modules)
+            result.imported_modules = modules
+            result.errors.extend(import_errors)
+
+        # 3. 影響テストの選定
+        if select_tests and modules:
+            result.affected_tests = await asyncio.to_thread(self.affected_tests, modules)
+            self.stats["affected_tests_selected"] += len(result.affected_tests)
+
+        result.success = not result.errors
+        result.duration = time.perf_counter() - start
+        return result
+
+    def check_syntax(self, file_paths: Iterable[str]) -> List[str]:
+        """ファイルをまとめて compile() し、エラーを返す"""
+        errors = []
+        for path in file_paths:
+            try:
+                with open(path, "rb") as f:
+                    source = f.read()
+                compile(source, path, "exec", dont_inherit=True)
+                self.stats["files_compiled"] += 1
+            except SyntaxError as e:
+                errors.append(f"{path}:{e.lineno}: SyntaxError: {e.msg}")
+            except (OSError, ValueError) as e:
+                errors.append(f"{path}: {type(e).__name__}: {e}")
+        return errors
+
+    async def verify_candidate(
+        self,
+        files: Dict[str, str],
+        check_imports: bool = True
+    ) -> VerificationResult:
+        """
+        修正候補（パス -> 新しい内容）を作業ツリーに書かずに検証
+
+        一時ディレクトリにコピーを作り、インポートチェックではそのコピーを
+        元のモジュール名で読み込ませる。複数候補を同時に検証してよい。
+        """
+        start = time.perf_counter()
+        self.stats["candidates_verified"] += 1
+        sandbox = Path(tempfile.mkdtemp(prefix="fix-sandbox-"))
+
+        try:
+            # 元パス -> サンドボックス内のパス
+            copies: Dict[str, str] = {}
+            for index, (path, content) in enumerate(files.items()):
+                try:
+                    relative = Path(path).resolve().relative_to(self.project_root)
+                except ValueError:
+                    relative = Path(f"_external{index}") / Path(path).name
+                copy = sandbox / relative
+                copy.parent.mkdir(parents=True, exist_ok=True)
+                copy.write_text(content, encoding="utf-8")
+                copies[path] = str(copy)
+
+            python_files = [p for p in files if p.endswith(".py")]
+            result = VerificationResult(success=True, checked_files=python_files)
+
+            errors = self.check_syntax(copies[p] for p in python_files)
+            # エラーメッセージのパスを元のパスに戻す
+            reverse = {copy: path for path, copy in copies.items()}
+            for error in errors:
+                for copy, path in reverse.items():
+                    error = error.replace(copy, path)
+                result.errors.append(error)
+
+            overlay = {}
+            for path in python_files:
+                module = self.graph.module_name(Path(path))
+                if module is not None:
+                    overlay[module] = copies[path]
+
+            if check_imports and overlay and not result.errors:
+                result.imported_modules = list(overlay)
+                result.errors.extend(await self.check_imports(list(overlay), overlay))
+
+            result.success = not result.errors
+            result.duration = time.perf_counter() - start
+            return result
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+    async def check_imports(
+        self,
+        modules: List[str],
+        overlay: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """
+        モジュールをまとめて import できるか確認
+
+        Args:
+            modules: モジュール名
+            overlay: モジュール名 -> 代わりに読み込むファイル
+        """
+        self.stats["modules_imported"] += len(modules)
+        if self._import_pool.available:
+            errors = await asyncio.to_thread(
+                self._import_pool.check, modules, overlay, self.import_timeout
+            )
+            if errors is not None:
+                self.stats["worker_checks"] += 1
+                return errors
+        self.stats["subprocess_checks"] += 1
+        return await asyncio.to_thread(self._subprocess_import_check, modules, overlay)
+
+    def affected_tests(self, modules: Iterable[str]) -> List[str]:
+        """変更モジュールに依存するテストファイル"""
+        self.graph.refresh()
+        tests = []
+        for module in sorted(self.graph.dependents(modules)):
+            path = self.graph.module_file(module)
+            if path and self._is_test_file(Path(path)):
+                tests.append(path)
+        return tests
+
+    # ========================================
+    # 内部メソッド
+    # ========================================
+
+    def _is_test_file(self, path: Path) -> bool:
+        name = path.name
+        if not (name.startswith("test_") or name.endswith("_test.py")):
+            return False
+        try:
+            parts = path.resolve().relative_to(self.project_root).parts
+        except ValueError:
+            return False
+        return any(part in self.test_dirs for part in parts[:-1]) or len(parts) == 1
+
+    def _subprocess_import_check(self, modules: List[str], overlay: Optional[Dict[str, str]] = None) -> List[str]:
+        """ワーカーが使えない環境向け: 1回のサブプロセスでまとめて import"""
+        code = (
+            "import json, sys\n"
+            f"sys.path.insert(0, {str(self.project_root)!r})\n"
+            "from tools.verification_engine import _import_modules\n"
+            f"print(json.dumps(_import_modules({modules!r}, {overlay!r})))\n"
+        )
+        try:
+            completed = subprocess.run(
+                [sys.executable, "-c", code],
+                capture_output=True,
+                text=True,
+                timeout=self.import_timeout,
+                cwd=str(self.project_root)
+            )
+        except subprocess.TimeoutExpired:
+            return [f"インポートチェックがタイムアウトしました ({self.import_timeout}秒)"]
+        try:
+            return json.loads(completed.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            return [completed.stderr.strip() or "インポートチェックに失敗しました"]
+
+    def warm_up(self, workers: Optional[int] = None):
+        """インポートチェック用ワーカーを先に起動しておく（省略時は上限まで）"""
+        self._import_pool.warm_up(workers or self._import_pool.max_workers)
+
+    def close(self):
+        """インポートチェック用ワーカーを終了"""
+        self._import_pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "import_workers": self._import_pool.get_stats()}
+
+
+class _ImportWorker:
+    """
+    インポートチェック用の常駐プロセス（新しいインタプリタ）
+
+    fork ではなく新しい python プロセスとして起動するので、親プロセスの
+    スレッドが握っていたロックを引き継がない。multiprocessing の spawn と
+    違い親の __main__ を読み直さないので、起動スクリプトが再実行されない。
+    依頼・結果は標準入出力の JSON 1行でやり取りする。
+    """
+
+    def __init__(self, project_root: str):
+        code = (
+            "import sys\n"
+            f"sys.path.insert(0, {_PACKAGE_ROOT!r})\n"
+            "from tools.verification_engine import _import_worker_main\n"
+            f"_import_worker_main({project_root!r})\n"
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", code],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=project_root,
+            text=True,
+            encoding="utf-8"
+        )
+        # 読み取りは専用スレッドで行い、check() はキューをタイムアウト付きで待つ
+        self._responses: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._reader = threading.Thread(target=self._read_responses, name="import-check-reader", daemon=True)
+        self._reader.start()
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            self._responses.put(line)
+        self._responses.put(None)
+
+    def check(self, modules: List[str], overlay: Optional[Dict[str, str]], timeout: float) -> Optional[List[str]]:
+        """インポートエラーを返す。タイムアウト・異常終了なら None（このワーカーは再利用しない）"""
+        try:
+            self.process.stdin.write(json.dumps({"modules": modules, "overlay": overlay}) + "\n")
+            self.process.stdin.flush()
+            line = self._responses.get(timeout=timeout)
+        except (OSError, ValueError, queue.Empty):
+            return None
+        if line is None:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self, kill: bool = False):
+        try:
+            if not kill and self.alive:
+                self.process.stdin.close()
+                self.process.wait(1.0)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+        if self.alive:
+            self.process.kill()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+
+
+class _ImportWorkerPool:
+    """
+    インポートチェック用ワーカープロセスのプール
+
+    ワーカーは新しいインタプリタとして起動するので、親プロセスの他スレッドが
+    握っていた import ロックやログのロックを引き継がない（fork と違いデッドロックしない）。
+    1回目のチェックで読み込んだサードパーティモジュールはワーカーに残り、
+    プロジェクト内のモジュールだけを毎回読み直す。
+    タイムアウトしたワーカーは強制終了し、次のチェックで作り直す。
+    """
+
+    def __init__(self, project_root: Path, max_workers: int = 2):
+        self.project_root = str(project_root)
+        self.max_workers = max(1, max_workers)
+        self._idle: List[_ImportWorker] = []
+        self._created = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self.available = True
+        self.stats = {"started": 0, "reused": 0, "killed": 0}
+
+    def check(
+        self,
+        modules: List[str],
+        overlay: Optional[Dict[str, str]],
+        timeout: float
+    ) -> Optional[List[str]]:
+        """インポートエラーを返す（ワーカーを起動できない場合は None）"""
+        worker = self._acquire()
+        if worker is None:
+            return None
+
+        errors = worker.check(modules, overlay, timeout)
+        if errors is not None:
+            self._release(worker, healthy=True)
+            return errors
+
+        crashed = not worker.alive
+        self.stats["killed"] += 1
+        self._release(worker, healthy=False)
+        if crashed:
+            return ["インポートチェック用プロセスが異常終了しました"]
+        return [f"インポートチェックがタイムアウトしました ({timeout}秒)"]
+
+    def _acquire(self) -> Optional[_ImportWorker]:
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive:
+                        self.stats["reused"] += 1
+                        return worker
+                    worker.stop(kill=True)
+                    self._created -= 1
+                if self._created < self.max_workers:
+                    self._created += 1
+                    break
+                self._condition.wait()
+
+        try:
+            worker = _ImportWorker(self.project_root)
+        except Exception as e:
+            logger.warning(f"⚠️ インポートチェック用ワーカーを起動できません - サブプロセスで代替: {e}")
+            with self._condition:
+                self._created -= 1
+                self.available = False
+                self._condition.notify()
+            return None
+        self.stats["started"] += 1
+        return worker
+
+    def warm_up(self, count: int):
+        """ワーカーを count 個（上限まで）先に起動しておく（インタプリタの起動は子プロセス側で並行して進む）"""
+        target = min(count, self.max_workers)
+        while True:
+            with self._condition:
+                if self._closed or not self.available or self._created >= target:
+                    return
+                self._created += 1
+            try:
+                worker = _ImportWorker(self.project_root)
+            except Exception as e:
+                logger.warning(f"⚠️ インポートチェック用ワーカーを起動できません - サブプロセスで代替: {e}")
+                with self._condition:
+                    self._created -= 1
+                    self.available = False
+                    self._condition.notify()
+                return
+            self.stats["started"] += 1
+            self._release(worker, healthy=True)
+
+    def _release(self, worker: _ImportWorker, healthy: bool):
+        with self._condition:
+            if healthy and not self._closed:
+                self._idle.append(worker)
+            else:
+                worker.stop(kill=not healthy)
+                self._created -= 1
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "max_workers": self.max_workers, "idle": len(self._idle)}
+
+
+def _import_worker_main(project_root: str):
+    """ワーカープロセス本体: 依頼ごとにプロジェクト内モジュールを捨てて import"""
+    # 結果用に標準出力を確保し、読み込むモジュールの print は標準エラーへ流す
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    sandbox_root = tempfile.gettempdir()
+
+    for line in sys.stdin:
+        request = json.loads(line)
+
+        # 前回読み込んだプロジェクト内・サンドボックスのモジュールを捨てる
+        for name, module in list(sys.modules.items()):
+            module_file = getattr(module, "__file__", None) or ""
+            if module_file.startswith(project_root) or module_file.startswith(sandbox_root):
+                del sys.modules[name]
+        importlib.invalidate_caches()
+
+        errors = _import_modules(request["modules"], request["overlay"])
+        channel.write(json.dumps(errors) + "\n")
+        channel.flush()
+
+
+class _OverlayFinder(importlib.abc.MetaPathFinder):
+    """指定したモジュールだけ別のファイルから読み込ませる"""
+
+    def __init__(self, overlay: Dict[str, str]):
+        self.overlay = overlay
+
+    def find_spec(self, fullname, path=None, target=None):
+        location = self.overlay.get(fullname)
+        if location is None:
+            return None
+        search = None
+        if os.path.basename(location) == "__init__.py":
+            # パッケージ自体を差し替える場合も、他のサブモジュールは元の場所から読む
+            original = importlib.machinery.PathFinder.find_spec(fullname, path)
+            search = [os.path.dirname(location)]
+            if original is not None and original.submodule_search_locations:
+                search.extend(original.submodule_search_locations)
+        return importlib.util.spec_from_file_location(
+            fullname, location, submodule_search_locations=search
+        )
+
+
+def _import_modules(modules: List[str], overlay: Optional[Dict[str, str]] = None) -> List[str]:
+    """モジュールを import し、失敗したものをエラー文字列で返す"""
+    import importlib
+
+    finder = _OverlayFinder(overlay) if overlay else None
+    if finder is not None:
+        sys.meta_path.insert(0, finder)
+
+    errors = []
+    try:
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except BaseException as e:  # SystemExit なども検証失敗として扱う
+                errors.append(f"{module}: {type(e).__name__}: {e}")
+    finally:
+        # ワーカーは使い回すので、次のチェックに差し替えを残さない
+        if finder is not None:
+            sys.meta_path.remove(finder)
+    return errors